@@ -46,12 +46,6 @@ from    koko.fab.asdf   import ASDF
 
 _startup_status('[|||||||||-]    reticulating splines')
 
-# Dummy imports so that py2app includes these files
-import koko.lib.shapes
-import koko.lib.shapes2d
-import koko.lib.shapes3d
-import koko.lib.text
-
 ################################################################################
 
 class App(wx.App):
@@ -381,6 +375,19 @@ If it is an example file, the 'kokopelli/examples' folder may include an updated
         ''' Mark that the design needs to be re-evaluated and re-rendered.'''
         self.reeval_required = True
 
+    def use_worker(self, event):
+        ''' Switches between running scripts in a worker process
+            and on a thread in this one.'''
+        koko.TASKS.use_worker(event.IsChecked())
+        self.mark_changed_design()
+
+    def shading_mode(self, event):
+        ''' Redraws the 3D view in a new shading mode, re-rendering
+            if it needs a traced preview or meshes that aren't loaded. '''
+        koko.FRAME.Refresh()
+        if koko.GLCANVAS.shading == 'Traced' or not koko.GLCANVAS.loaded:
+            self.mark_changed_view()
+
     def mark_changed_view(self, event=None):
         ''' Mark that the design needs to be re-rendered
             (usually because of a view change) '''
@@ -546,9 +553,9 @@ If it is an example file, the 'kokopelli/examples' folder may include an updated
             key = 'make_heightmap'
         elif filetype == '.svg':
             dlg = dialogs.ResolutionDialog(
-                10, '.svg export', cad
+                10, '.svg export', cad, 'Relative path commands'
             )
-            key = None
+            key = 'svg_relative'
         elif filetype == '.dot':
             dlg = dialogs.CheckDialog('.dot export', 'Packed arrays')
             key = 'dot_arrays'
@@ -0,0 +1,184 @@
+"""Headless rendering and export of design scripts.
+
+Used by the ``kokopelli render`` and ``kokopelli export`` subcommands.  Nothing
+here imports wx, so it runs on machines without a display.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import time
+
+FORMATS = ("png", "svg", "stl", "asdf", "dot")
+
+GEOMETRY_HEADER = "##    Geometry header    ##"
+
+
+def load_script(filename: str, source: str | None = None, params: dict | None = None):
+    """Evaluates a design script, returning its FabVars structure.
+
+    source overrides the file's contents, and params are added to the
+    script's namespace before it runs (for rendering parameter variants).
+    """
+    from koko.fab.fabvars import FabVars
+
+    if source is None:
+        source = Path(filename).read_text()
+    namespace: dict = {}
+
+    # Scripts saved with interactive geometry start with a header that
+    # rebuilds their primitives (which are defined with wx)
+    if source.startswith(GEOMETRY_HEADER):
+        import koko
+        from koko.prims.core import PrimSet
+
+        lines = source.splitlines()
+        koko.PRIMS = PrimSet()
+        koko.PRIMS.reconstruct(eval(lines[1], {"koko": koko}))
+        namespace.update(koko.PRIMS.dict)
+        source = "\n".join(lines[3:])
+
+    namespace.update(params or {})
+    namespace["cad"] = FabVars()
+    exec(compile(source, filename, "exec"), namespace)
+
+    cad = namespace["cad"]
+    if not cad.shapes:
+        raise ValueError("no shape defined")
+    return cad
+
+
+def check_bounds(cad, fmt: str) -> None:
+    """Raises ValueError if a design can't be exported in a given format."""
+    axes = ["xmin", "xmax", "ymin", "ymax"]
+    if fmt in ("stl", "asdf"):
+        axes += ["zmin", "zmax"]
+    if fmt != "dot" and any(getattr(cad, a) is None for a in axes):
+        raise ValueError(f"design needs to be bounded on {', '.join(axes)} to export .{fmt}")
+    if fmt == "svg" and cad.zmin is not None:
+        raise ValueError("design must be flat (without z bounds) to export .svg")
+
+
+def export(filename: str, fmt: str, output: str | None = None, **options) -> str:
+    """Evaluates a design script and exports it, returning the output filename.
+
+    options are passed to CadExporter (e.g. resolution, make_heightmap,
+    use_cms, svg_relative, dot_arrays, affine).
+    """
+    from koko.exporter import CadExporter
+
+    if output is None:
+        output = os.fspath(Path(filename).with_suffix("." + fmt))
+
+    cad = load_script(filename)
+    check_bounds(cad, fmt)
+    CadExporter(output, cad, **options).run()
+    return output
+
+
+def _job(job: tuple) -> tuple:
+    """Runs one export in a worker, returning (input, output, seconds, error)."""
+    filename, fmt, output, options = job
+    start = time.perf_counter()
+    try:
+        output = export(filename, fmt, output, **options)
+    except Exception as exc:
+        return filename, output, time.perf_counter() - start, f"{type(exc).__name__}: {exc}"
+    return filename, output, time.perf_counter() - start, None
+
+
+def parser(command: str) -> argparse.ArgumentParser:
+    render = command == "render"
+    parser = argparse.ArgumentParser(
+        prog=f"kokopelli {command}",
+        description=(
+            "Render design scripts to images without opening the GUI."
+            if render
+            else "Export design scripts to fabrication files without opening the GUI."
+        ),
+    )
+    parser.add_argument("files", nargs="+", help="design scripts (.ko)")
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=FORMATS,
+        default="png" if render else None,
+        help="output format (default: %s)"
+        % ("png" if render else "taken from --output, otherwise required"),
+    )
+    parser.add_argument(
+        "--resolution", "-r", type=float, default=10, help="resolution in pixels per mm (default: 10)"
+    )
+    parser.add_argument("--output", "-o", help="output file (with a single input)")
+    parser.add_argument("--output-dir", "-d", help="directory for output files (default: next to each input)")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1, help="number of files to process in parallel (default: 1)"
+    )
+    parser.add_argument(
+        "--color", action="store_true", help="png: render each shape in its own color instead of a heightmap"
+    )
+    parser.add_argument("--watertight", action="store_true", help="stl: triangulate with a watertight mesher")
+    parser.add_argument("--relative", action="store_true", help="svg: use relative path commands")
+    parser.add_argument("--packed", action="store_true", help="dot: show packed arrays")
+    parser.add_argument(
+        "--affine", action="store_true", help="bound regions with affine rather than interval arithmetic"
+    )
+    return parser
+
+
+def main(argv: list[str]) -> int:
+    command, argv = argv[0], argv[1:]
+    p = parser(command)
+    args = p.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None and args.output:
+        fmt = Path(args.output).suffix.lstrip(".")
+    if fmt not in FORMATS:
+        p.error("choose an output format with --format")
+    if args.output and len(args.files) > 1:
+        p.error("--output can only be used with a single input file")
+    if args.jobs < 1:
+        p.error("--jobs must be at least 1")
+
+    options = {
+        "resolution": args.resolution,
+        "make_heightmap": not args.color,
+        "use_cms": args.watertight,
+        "svg_relative": args.relative,
+        "dot_arrays": args.packed,
+        "affine": args.affine,
+    }
+
+    jobs = []
+    for filename in args.files:
+        output = args.output
+        if output is None and args.output_dir:
+            output = os.path.join(args.output_dir, Path(filename).stem + "." + fmt)
+        jobs.append((filename, fmt, output, options))
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def report(results) -> int:
+        failed = 0
+        for filename, output, seconds, error in results:
+            if error:
+                failed += 1
+                print(f"{filename}: {error}", file=sys.stderr)
+            else:
+                print(f"{filename} -> {output} ({seconds:.2f} s)")
+        return failed
+
+    if args.jobs == 1 or len(jobs) == 1:
+        failed = report(map(_job, jobs))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as pool:
+            failed = report(pool.map(_job, jobs))
+
+    return 1 if failed else 0
@@ -0,0 +1,63 @@
+import ctypes
+
+from koko.c.vec3f import Vec3f
+
+
+class Camera(ctypes.Structure):
+    """ @class Camera
+        @brief Pinhole camera used to trace rays through a tree.
+        @details Replicates C Camera struct.  The ray through the center of
+        pixel (i, j) is eye + t*(corner + (i+0.5)*right + (j+0.5)*up),
+        for near <= t <= far.
+    """
+    _fields_ = [('eye', Vec3f),
+                ('corner', Vec3f),
+                ('right', Vec3f),
+                ('up', Vec3f),
+                ('near', ctypes.c_float),
+                ('far', ctypes.c_float)]
+
+    @classmethod
+    def view(cls, alpha, beta, scale, center, width, height):
+        """ @brief Makes a camera matching the 3D canvas's perspective view.
+            @details The canvas looks at center from 5 units away (in
+            view coordinates, after scaling), with a frustum spanning
+            depths 1 to 9.  Ray parameters are depths in view coordinates.
+            @param alpha Rotation about z axis
+            @param beta Rotation about x axis
+            @param scale View scale
+            @param center View center (Vec3f)
+            @param width Image width in pixels
+            @param height Image height in pixels
+            @returns A Camera
+        """
+        aspect = width / float(height)
+        if aspect > 1:  sx, sy = aspect, 1
+        else:           sx, sy = 1, 1/aspect
+
+        def world(x, y, z):
+            return Vec3f(x, y, z).deproject(alpha, beta) / scale
+
+        return cls(center + world(0, 0, 5), world(-sx, -sy, -1),
+                   world(2.*sx/width, 0, 0), world(0, 2.*sy/height, 0),
+                   1, 9)
+
+    def clip(self, bounds):
+        """ @brief Narrows the range of ray parameters to a bounding box
+            @param bounds [xmin, xmax, ymin, ymax, zmin, zmax] list
+            @returns A new Camera (or None if the box is behind the camera)
+        """
+        # Rays reach each plane facing the camera at the same parameter,
+        # which is the distance along the plane's normal n divided by
+        # the rays' (shared) component along n.
+        r, u, c = self.right, self.up, self.corner
+        n = (r.y*u.z - r.z*u.y, r.z*u.x - r.x*u.z, r.x*u.y - r.y*u.x)
+        scale = n[0]*c.x + n[1]*c.y + n[2]*c.z
+
+        ts = [((x - self.eye.x)*n[0] + (y - self.eye.y)*n[1] +
+               (z - self.eye.z)*n[2]) / scale
+              for x in bounds[0:2] for y in bounds[2:4] for z in bounds[4:6]]
+
+        near, far = max(self.near, min(ts)), min(self.far, max(ts))
+        if near > far:  return None
+        return Camera(self.eye, self.corner, self.right, self.up, near, far)
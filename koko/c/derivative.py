@@ -0,0 +1,23 @@
+import ctypes
+
+class Derivative(ctypes.Structure):
+    """ @class Derivative
+        @brief Value and gradient from forward-mode differentiation
+    """
+    _fields_ = [('v', ctypes.c_float),
+                ('dx', ctypes.c_float),
+                ('dy', ctypes.c_float),
+                ('dz', ctypes.c_float)]
+
+    @property
+    def gradient(self):
+        """ @returns Gradient as an (x, y, z) tuple
+        """
+        return (self.dx, self.dy, self.dz)
+
+    def __str__(self):
+        return "%g (%g, %g, %g)" % (self.v, self.dx, self.dy, self.dz)
+    def __repr__(self):
+        return "Derivative(%g, %g, %g, %g)" % (
+            self.v, self.dx, self.dy, self.dz
+        )
@@ -1,7 +1,6 @@
 """ Module to import the libfab shared C library. """
 
 import ctypes
-import ctypes.util
 import os
 
 import koko
@@ -10,16 +9,24 @@ import koko
 default_base = os.path.join(os.path.dirname(__file__), '..', '..')
 base = os.path.abspath(getattr(koko, 'BASE_DIR', default_base))
 
+def find_library():
+    # ctypes.util is slow to import and runs external tools, so it's
+    # only used if libfab isn't in one of the usual places
+    import ctypes.util
+    return ctypes.util.find_library('fab')
+
 libname = 'libfab' + ('.dylib' if 'Darwin' in os.uname() else '.so')
 filenames =[
     os.path.join(base, 'libfab/', libname),
     os.path.join(base, '../lib/', libname),
     os.path.join(base, '../Frameworks/', libname),
-    ctypes.util.find_library('fab'),
+    find_library,
     libname
 ]
 
-for filename in filenames:
+for i, filename in enumerate(filenames):
+    if callable(filename):
+        filename = filenames[i] = filename()
     if not filename:
         continue
     try:
@@ -115,10 +122,14 @@ libfab.make_packed.restype  =  PackedTreeP
 
 libfab.free_packed.argtypes = [PackedTreeP]
 
+libfab.set_affine.argtypes = [PackedTreeP, ctypes.c_bool]
+libfab.get_counts.argtypes = [PackedTreeP] + [p(ctypes.c_uint64)]*2
+
 # tree/eval.h
 from .interval import Interval
 
-for name in ('add_i', 'sub_i', 'mul_i', 'div_i', 'min_i', 'max_i', 'pow_i'):
+for name in ('add_i', 'sub_i', 'mul_i', 'div_i', 'min_i', 'max_i', 'pow_i',
+             'mod_i', 'atan2_i'):
     function = getattr(libfab, name)
     function.argtypes = [Interval, Interval]
     function.restype = Interval
@@ -134,10 +145,29 @@ for name in (
 libfab.eval_i.argtypes = [PackedTreeP, Interval, Interval, Interval]
 libfab.eval_i.restype  =  Interval
 
+libfab.eval_a.argtypes = [PackedTreeP, Interval, Interval, Interval]
+libfab.eval_a.restype  =  Interval
+
+from .derivative import Derivative
+
+libfab.eval_g.argtypes = [PackedTreeP] + [ctypes.c_float]*3
+libfab.eval_g.restype  =  Derivative
+
+# tree/trace.h
+from .camera import Camera
+
+libfab.trace.argtypes = [
+    PackedTreeP, Camera, Region, pp(ctypes.c_float),
+    pp(ctypes.c_float*3), p(ctypes.c_int)
+]
+
 # tree/parser.h
 libfab.parse.argtypes = [CString]
 libfab.parse.restype  =  MathTreeP
 
+libfab.simplify_tree.argtypes = [MathTreeP, Interval, Interval, Interval]
+libfab.simplify_tree.restype  = ctypes.c_int
+
 ################################################################################
 
 # asdf/asdf.h
@@ -276,6 +306,11 @@ libfab.distance_transform1.argtypes = (
     [pp(ctypes.c_uint8), pp(ctypes.c_uint32)]
 )
 
+libfab.distance_transform1_16.argtypes = (
+    [ctypes.c_int]*4 +
+    [pp(ctypes.c_uint16), ctypes.c_uint16, pp(ctypes.c_uint32)]
+)
+
 libfab.distance_transform2.argtypes = (
     [ctypes.c_int]*3 +
     [ctypes.c_float, pp(ctypes.c_uint32), pp(ctypes.c_float)]
@@ -320,6 +355,9 @@ libfab.load_mesh.restype = p(Mesh)
 libfab.merge_meshes.argtypes = [ctypes.c_uint32, pp(Mesh)]
 libfab.merge_meshes.restype = p(Mesh)
 
+# tree/normals.h
+libfab.mesh_normals.argtypes = [PackedTreeP, p(Mesh), ctypes.c_float]
+
 # formats/stl.c
 libfab.save_stl.argtypes = [p(Mesh), CString]
 
@@ -344,5 +382,16 @@ libfab.finish_cut.argtypes = (
     [ctypes.c_int]*2+[pp(ctypes.c_uint16)]+[ctypes.c_float]*4+
     [ctypes.c_int, p(pp(Path))]
 )
+libfab.finish_cut_lines.argtypes = (
+    [ctypes.c_int]+[ctypes.c_float]*3+[p(ctypes.c_int)]
+)
+libfab.finish_cut_heights.argtypes = (
+    [ctypes.c_int]*2+[pp(ctypes.c_uint16)]+[ctypes.c_float]*3+
+    [ctypes.c_int]*3+[p(ctypes.c_int), p(ctypes.c_float)]
+)
+libfab.simulate_cut.argtypes = (
+    [ctypes.c_int]*2+[pp(ctypes.c_float)]+[ctypes.c_float]*3+
+    [ctypes.c_int]*2+[p(ctypes.c_float)]
+)
 
 del p, pp
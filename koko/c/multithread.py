@@ -1,3 +1,5 @@
+import os
+import queue
 import threading
 from _thread import LockType
 
@@ -64,6 +66,44 @@ def monothread(target, args, interrupt=None, halt=None):
 
     return result
 
+def threadmap(target, items, threads=None, progress=None):
+    """ @brief Applies a function to each item of a list on a pool of threads.
+        @details Items are handed out in order as threads become free.  The first exception raised by target stops the pool and is re-raised here.
+        @param target Callable function (taking a single item)
+        @param items List of items
+        @param threads Number of threads (default is one per core)
+        @param progress Callback, invoked as progress(done, total)
+        @returns List of results (in the same order as items)
+    """
+    if threads is None:     threads = os.cpu_count() or 1
+
+    results = [None]*len(items)
+    errors = []
+    done = [0]
+    lock = threading.Lock()
+
+    todo = queue.Queue()
+    for i in range(len(items)):  todo.put(i)
+
+    def worker():
+        while not errors:
+            try:                i = todo.get_nowait()
+            except queue.Empty: return
+            try:
+                results[i] = target(items[i])
+            except Exception as e:
+                errors.append(e)
+                return
+            with lock:
+                done[0] += 1
+                if progress:    progress(done[0], len(items))
+
+    multithread(worker, [()]*max(1, min(threads, len(items))))
+    if errors:  raise errors[0]
+
+    return results
+
+
 def threadsafe(f):
     ''' A decorator that locks the arguments to a function,
         invokes the function, then unlocks the arguments and
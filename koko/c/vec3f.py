@@ -1,6 +1,7 @@
 import ctypes
 from math import sin, cos, radians, sqrt
 
+
 class Vec3f(ctypes.Structure):
     """ @class Vec3f
         @brief Three-element vector with overloaded arithmetic operators.
@@ -59,6 +60,26 @@ class Vec3f(ctypes.Structure):
         """
         return libfab.deproject(self, self.M(alpha, beta))
 
+    @classmethod
+    def deproject_array(cls, points, alpha, beta):
+        """ @brief Transforms an array of points from view frame to cell frame.
+            @details Matches deproject (including its single-precision arithmetic), but works on every point at once.
+            @param points n x 3 array of points
+            @param alpha Rotation about z axis
+            @param beta Rotation about x axis.
+            @returns n x 3 array of deprojected points (as float32)
+        """
+        import numpy as np
+
+        ca, sa, cb, sb = np.array(cls.M(alpha, beta), dtype=np.float32)
+        p = np.asarray(points)[:,:3].astype(np.float32)
+
+        x_ = p[:,0]
+        y_ = cb*p[:,1] - sb*p[:,2]
+        z_ = cb*p[:,2] + sb*p[:,1]
+
+        return np.column_stack((ca*x_ + sa*y_, ca*y_ - sa*x_, z_))
+
     def __iter__(self):
         """ @brief Iterates over (x, y, z) list
         """
@@ -0,0 +1,214 @@
+"""
+@namespace estimate
+@brief Machining time estimates for toolpaths, independent of the UI.
+
+@details Paths are treated the way the program writers emit them: a rapid
+move at the jog height to the start of each path, a plunge, a chain of
+cutting moves (simplified and arc-fitted as in Path.runs), and a retract
+back to the jog height at the cut speed.  Pass the paths returned by the
+writer's write method, which are in the order and direction they were
+written.  Each move follows a trapezoidal velocity profile with constant
+acceleration.  Within a chain of cutting moves, the machine is allowed to
+carry speed through corners (limited by a junction deviation model, as in
+most motion controllers), and arcs are split into short chords the way
+controllers execute them; every other move starts and ends at rest.
+"""
+
+import  math
+
+import  numpy as np
+
+from    koko.struct import Struct
+
+
+def trapezoid_time(length, speed, accel, v0=0, v1=0):
+    """ @brief Time taken to travel along straight moves with a trapezoidal velocity profile
+        @param length Array of move lengths (mm)
+        @param speed Cruise speed (mm/s)
+        @param accel Acceleration (mm/s^2)
+        @param v0 Entry speed of each move (mm/s)
+        @param v1 Exit speed of each move (mm/s)
+        @returns Array of move times (s)
+        @details Entry and exit speeds must be reachable within each move
+        (at most sqrt(v^2 + 2 a L) apart).  If a move is too short to reach
+        the cruise speed, it accelerates to a lower peak and then slows down.
+    """
+    length = np.asarray(length, dtype=np.float64)
+    v0 = np.broadcast_to(np.asarray(v0, dtype=np.float64), length.shape)
+    v1 = np.broadcast_to(np.asarray(v1, dtype=np.float64), length.shape)
+
+    # Peak speed reached on each move
+    peak = np.minimum(speed,
+                      np.sqrt(accel*length + (v0*v0 + v1*v1)/2))
+    peak = np.maximum(peak, np.maximum(v0, v1))
+
+    ramp = (2*peak*peak - v0*v0 - v1*v1) / (2*accel)
+    cruise = np.maximum(length - ramp, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peak > 0,
+                        (2*peak - v0 - v1)/accel + cruise/peak, 0)
+
+
+## @var ARC_TOLERANCE
+# Maximum distance (mm) between an arc and the chords it is split into
+ARC_TOLERANCE = 0.002
+
+
+def arc_points(start, end, offset, ccw, tolerance=ARC_TOLERANCE):
+    """ @brief Splits an arc move into chords
+        @param start Start point of the arc
+        @param end End point of the arc
+        @param offset (dx, dy) from the start point to the arc's center
+        @param ccw True for counter-clockwise arcs
+        @param tolerance Maximum distance between the arc and its chords
+        @returns n x 3 array of chord endpoints, excluding the start point
+        @details Arcs that end where they start are full circles.  Z is
+        interpolated linearly, as in a helical move.
+    """
+    cx, cy = start[0] + offset[0], start[1] + offset[1]
+    r = math.hypot(offset[0], offset[1])
+    a0 = math.atan2(start[1] - cy, start[0] - cx)
+    a1 = math.atan2(end[1] - cy, end[0] - cx)
+
+    sweep = ((a1 - a0) if ccw else (a0 - a1)) % (2*math.pi)
+    if sweep == 0:  sweep = 2*math.pi
+
+    step = 2*math.acos(1 - tolerance/r) if r > tolerance else math.pi
+    n = max(1, int(math.ceil(sweep / step)))
+
+    t = np.linspace(0, 1, n + 1)[1:]
+    a = a0 + (sweep if ccw else -sweep)*t
+    points = np.empty((n, 3))
+    points[:,0] = cx + r*np.cos(a)
+    points[:,1] = cy + r*np.sin(a)
+    points[:,2] = start[2] + (end[2] - start[2])*t
+    points[-1] = end
+    return points
+
+
+def junction_speeds(points, feed, accel, deviation):
+    """ @brief Finds the speed at each point of a chain of cutting moves
+        @param points n x 3 array of points
+        @param feed Cut speed (mm/s)
+        @param accel Acceleration (mm/s^2)
+        @param deviation Junction deviation (mm)
+        @returns (lengths, speeds) arrays for the n-1 moves and n points
+        @details The chain starts and ends at rest.  Corner speeds are
+        limited by the angle between neighbouring moves, then the forward
+        and backward acceleration limits are applied as running minima of
+        squared speed against cumulative distance.
+    """
+    d = np.diff(points, axis=0)
+    lengths = np.sqrt((d*d).sum(axis=1))
+
+    # Drop zero-length moves, which have no direction
+    keep = lengths > 0
+    d, lengths = d[keep], lengths[keep]
+    n = len(lengths)
+
+    limit = np.zeros(n + 1)
+    if n > 1:
+        u = d / lengths[:,None]
+        cos = np.clip(-(u[:-1]*u[1:]).sum(axis=1), -1, 1)
+        sin_half = np.sqrt((1 - cos)/2)
+        with np.errstate(divide='ignore'):
+            v2 = accel*deviation*sin_half/(1 - sin_half)
+        limit[1:-1] = np.minimum(v2, feed*feed)
+
+    # Forward pass: v[i]^2 <= v[k]^2 + 2 a (D[i] - D[k]) for all k <= i
+    reach = np.concatenate([[0], np.cumsum(2*accel*lengths)])
+    v2 = reach + np.minimum.accumulate(limit - reach)
+
+    # Backward pass, measured from the end of the chain
+    back = reach[-1] - reach
+    v2 = np.minimum(
+        v2, back + np.minimum.accumulate((v2 - back)[::-1])[::-1]
+    )
+    return lengths, np.sqrt(np.maximum(v2, 0))
+
+
+def cut_points(path, tolerance=0, arcs=False):
+    """ @brief Finds the points that a machine visits while cutting a path
+        @param path Path to cut
+        @param tolerance Path simplification tolerance (mm), as used by the writers
+        @param arcs Boolean determining whether the writer fits arcs
+        @returns n x 3 array of points, with arc moves split into chords
+    """
+    chain = []
+    for points, arc in path.runs(tolerance, arcs):
+        points = points.astype(np.float64)
+        if arc is not None:
+            start = chain[-1][-1] if chain else path.points[0][:3]
+            points = arc_points(start, points[0], arc[:2], arc[2])
+        chain.append(points)
+    return np.concatenate(chain)
+
+
+def estimate(paths, feed, plunge, jog, rapid=None, accel=500.,
+             deviation=0.02, tolerance=0, arcs=False):
+    """ @brief Estimates machining time for a list of paths
+        @param paths List of Paths, in the order and direction they are written
+        @param feed Cut speed (mm/s), also used for retracts
+        @param plunge Plunge rate (mm/s)
+        @param jog Jog height (mm)
+        @param rapid Speed of moves at the jog height (mm/s).  If None, the machine's rapid rate is unknown: these moves are timed at the cut speed and the result is marked as approximate.
+        @param accel Machine acceleration (mm/s^2)
+        @param deviation Junction deviation (mm), controlling cornering speed
+        @param tolerance Path simplification tolerance (mm), as used by the writers
+        @param arcs Boolean determining whether the writer fits arcs
+        @returns A Struct with time, cut_time, plunge_time, rapid_time (s), cut, plunge, rapid distances (mm) and an approximate flag
+    """
+    approximate = rapid is None
+    if approximate:     rapid = feed
+
+    result = Struct(time=0., cut_time=0., plunge_time=0., rapid_time=0.,
+                    cut=0., plunge=0., rapid=0., approximate=approximate)
+    paths = [p for p in paths if len(p.points)]
+    if not paths:   return result
+
+    # Cutting moves, carrying speed through corners
+    starts, ends = [], []
+    for p in paths:
+        points = cut_points(p, tolerance, arcs)
+        starts.append(points[0])
+        ends.append(points[-1])
+
+        lengths, v = junction_speeds(points, feed, accel, deviation)
+        result.cut += lengths.sum()
+        result.cut_time += trapezoid_time(
+            lengths, feed, accel, v[:-1], v[1:]
+        ).sum()
+
+    starts, ends = np.array(starts), np.array(ends)
+
+    # Plunges from the jog height to the start of each path
+    drop = np.abs(jog - starts[:,2])
+    result.plunge = drop.sum()
+    result.plunge_time = trapezoid_time(drop, plunge, accel).sum()
+
+    # Retracts (at the cut speed), then moves at the jog height
+    # to the next path
+    lift = np.abs(jog - ends[:,2])
+    d = starts[1:,:2] - ends[:-1,:2]
+    travel = np.sqrt((d*d).sum(axis=1))
+    result.rapid = lift.sum() + travel.sum()
+    result.rapid_time = (trapezoid_time(lift, feed, accel).sum() +
+                         trapezoid_time(travel, rapid, accel).sum())
+
+    result.time = result.cut_time + result.plunge_time + result.rapid_time
+    for k in ('time', 'cut_time', 'plunge_time', 'rapid_time',
+              'cut', 'plunge', 'rapid'):
+        setattr(result, k, float(getattr(result, k)))
+    return result
+
+
+def describe(result):
+    """ @brief Formats an estimate as a one-line summary
+        @param result Struct returned by estimate
+    """
+    t = int(round(result.time))
+    return '%s time %d:%02d:%02d (cut %.0f mm, rapid %.0f mm%s)' % (
+        'Approximate' if result.approximate else 'Estimated',
+        t // 3600, (t // 60) % 60, t % 60, result.cut, result.rapid,
+        ', rapids timed at the cut speed' if result.approximate else ''
+    )
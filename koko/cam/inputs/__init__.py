@@ -3,7 +3,27 @@
     Each input module must define TYPE (the python type of the desired input)
     and WORKFLOWS (a dictionary mapping different panel types to workflows
     that lead to that type of panel).
+
+    Input modules are imported when an input of their type is first loaded.
+    MODULES maps the name of each TYPE to the module that handles it.
 """
-from . import asdf, cad, image
+import importlib
+
+MODULES = {'ASDF': 'asdf', 'FabVars': 'cad', 'Image': 'image'}
+
+def load(input):
+    """ Imports the input module that handles a given input data structure.
+    """
+    module = importlib.import_module(
+        '.' + MODULES[type(input).__name__], __name__
+    )
+    if module.TYPE is not type(input):
+        raise TypeError('No input module for %s' % type(input))
+    return module
 
-INPUTS = [asdf, cad, image]
+def __getattr__(name):
+    # INPUTS (every input module) is only built if someone asks for it
+    if name == 'INPUTS':
+        return [importlib.import_module('.' + m, __name__)
+                for m in ('asdf', 'cad', 'image')]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
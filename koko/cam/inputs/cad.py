@@ -6,6 +6,7 @@ import  koko
 from    koko.struct     import Struct
 from    koko.dialogs    import error
 from    koko.fab.image  import Image
+from    koko.fab.cache  import default_cache
 from    koko.c.region   import Region
 
 from    koko.cam.panel  import FabPanel
@@ -131,8 +132,12 @@ class CadImgPanel(FabPanel):
                           zmax+border*dz),
                           values['res']*cad.mm_per_unit)
 
-        self.img = expr.render(region=region,
-                               mm_per_unit=cad.mm_per_unit)
+        # Reuse an earlier render of the same expression if possible
+        self.img = default_cache().fetch(
+            'image', lambda: expr.render(region=region,
+                                         mm_per_unit=cad.mm_per_unit),
+            expr, region, mm_per_unit=cad.mm_per_unit
+        )
         koko.FRAME.status = ''
 
         return {'img': self.img}
@@ -199,8 +204,10 @@ class CadASDFPanel(FabPanel):
                           zmax+border*dz),
                           values['res']*cad.mm_per_unit)
 
-        self.asdf = expr.asdf(
-            region=region, mm_per_unit=cad.mm_per_unit
+        self.asdf = default_cache().fetch(
+            'asdf', lambda: expr.asdf(region=region,
+                                      mm_per_unit=cad.mm_per_unit),
+            expr, region, mm_per_unit=cad.mm_per_unit
         )
 
         koko.FRAME.status = ''
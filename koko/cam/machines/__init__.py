@@ -3,8 +3,33 @@
 @brief Module containing output machines
 
 @details  Each input module must define NAME, INPUT, PANEL, and DEFAULTS (a list of tuples, each containing a default name and a dictionary which defines defaults for each potential panel).
+
+Machine modules are imported when they are first selected, since each one
+pulls in its UI panels and writers.  NAMES lists them in menu order, with
+display names that match each module's NAME.
 """
 
-from . import modela, epilog, universal, null, shopbot, gcode, shopbot5
+import importlib
+
+NAMES = [
+    ('null',      '<None>'),
+    ('modela',    'Roland Modela'),
+    ('epilog',    'Epilog'),
+    ('universal', 'Universal laser cutter'),
+    ('shopbot',   'Shopbot'),
+    ('gcode',     'G-code'),
+    ('shopbot5',  '5-Axis Shopbot'),
+]
+
+def load(index):
+    """ @brief Imports a machine module
+        @param index Position of the machine in NAMES
+        @returns The machine module
+    """
+    return importlib.import_module('.' + NAMES[index][0], __name__)
 
-MACHINES = [null, modela, epilog, universal, shopbot, gcode, shopbot5]
+def __getattr__(name):
+    # MACHINES (every machine module) is only built if someone asks for it
+    if name == 'MACHINES':
+        return [load(i) for i in range(len(NAMES))]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -11,6 +11,7 @@ import  subprocess
 
 import  koko
 from    koko.cam.panel import OutputPanel
+from    koko.cam.writers import EpilogWriter
 
 class EpilogOutput(OutputPanel):
     """ @class EpilogOutput UI Panel for Epilog laser
@@ -29,7 +30,8 @@ class EpilogOutput(OutputPanel):
             ('Rate','rate', int, lambda f: f > 0),
             ('xmin (mm)', 'xmin', float, lambda f: f >= 0),
             ('ymin (mm)', 'ymin', float, lambda f: f >= 0),
-            ('autofocus', 'autofocus', bool)
+            ('autofocus', 'autofocus', bool),
+            ('Tolerance (mm)', 'tolerance', float, lambda f: f >= 0)
         ], start=True)
 
 
@@ -42,26 +44,9 @@ class EpilogOutput(OutputPanel):
 
         koko.FRAME.status = 'Converting to .epi file'
 
-        self.file = tempfile.NamedTemporaryFile(suffix=self.extension)
+        self.file = tempfile.NamedTemporaryFile(mode='w', suffix=self.extension)
         job_name = koko.APP.filename if koko.APP.filename else 'untitled'
-
-        self.file.write("%%-12345X@PJL JOB NAME=%s\r\nE@PJL ENTER LANGUAGE=PCL\r\n&y%iA&l0U&l0Z&u600D*p0X*p0Y*t600R*r0F&y50P&z50S*r6600T*r5100S*r1A*rC%%1BIN;XR%d;YP%d;ZS%d;\n" %
-            (job_name, 1 if values['autofocus'] else 0,
-             values['rate'], values['power'], values['speed']))
-
-        scale = 600/25.4 # The laser's tick is 600 DPI
-        xoffset = values['xmin']*scale
-        yoffset = values['ymin']*scale
-        xy = lambda x,y: (xoffset + scale*x, yoffset + scale*y)
-
-        for path in paths:
-            self.file.write("PU%d,%d;" % xy(*path.points[0][0:2]))
-            for pt in path.points[1:]:
-                self.file.write("PD%d,%d;" % xy(*pt[0:2]))
-            self.file.write("\n")
-
-        self.file.write("%%0B%%1BPUtE%%-12345X@PJL EOJ \r\n")
-        self.file.flush()
+        EpilogWriter(self.file, job_name=job_name, **values).write(paths)
 
         koko.FRAME.status = ''
 
@@ -90,7 +75,8 @@ DEFAULTS = [
         {CadImgPanel:  [('res',5)],
          ContourPanel: [('diameter', 0.25)],
          EpilogOutput: [('power', 25), ('speed', 75),
-                        ('rate', 500), ('xmin', 0), ('ymin', 0)]
+                        ('rate', 500), ('xmin', 0), ('ymin', 0),
+                        ('tolerance', 0.02)]
         }
     )
 ]
@@ -7,7 +7,8 @@ import  tempfile
 import  wx
 
 import  koko
-from    koko.fab.path   import Path
+from    koko.cam.writers import GCodeWriter
+from    koko.cam.estimate import estimate, describe
 
 from    koko.cam.panel  import FabPanel, OutputPanel
 
@@ -25,7 +26,9 @@ class GCodeOutput(OutputPanel):
             ('Jog height (mm)', 'jog', float, lambda f: f > 0),
             ('Cut type', 'type', ['Conventional', 'Climb']),
             ('Tool number', 'tool', int, lambda f: f > 0),
-            ('Coolant', 'coolant', bool)
+            ('Coolant', 'coolant', bool),
+            ('Tolerance (mm)', 'tolerance', float, lambda f: f >= 0),
+            ('Arc fitting (G2/G3)', 'arcs', bool)
         ])
 
         self.construct()
@@ -40,77 +43,14 @@ class GCodeOutput(OutputPanel):
         values = self.get_values()
         if not values:  return False
 
-        # Reverse direction for climb cutting
-        if values['type']:
-            paths = Path.sort([p.reverse() for p in paths])
+        # Create a temporary file to store the g-code instructions
+        self.file = tempfile.NamedTemporaryFile(mode='w', suffix=self.extension)
+        paths = GCodeWriter(self.file, **values).write(paths)
 
-
-        # Check to see if all of the z values are the same.  If so,
-        # we can use 2D cutting commands; if not, we'll need
-        # to do full three-axis motion control
-        zmin = paths[0].points[0][2]
-        flat = True
-        for p in paths:
-            if not all(pt[2] == zmin for pt in p.points):
-                flat = False
-
-        # Create a temporary file to store the .sbp instructions
-        self.file = tempfile.NamedTemporaryFile(suffix=self.extension)
-
-        self.file.write("%%\n")     # tape start
-        self.file.write("G17\n")    # XY plane
-        self.file.write("G20\n")    # Inch mode
-        self.file.write("G40\n")    # Cancel tool diameter compensation
-        self.file.write("G49\n")    # Cancel tool length offset
-        self.file.write("G54\n")    # Coordinate system 1
-        self.file.write("G80\n")    # Cancel motion
-        self.file.write("G90\n")    # Absolute programming
-        self.file.write("G94\n")    # Feedrate is per minute
-
-        scale = 1/25.4 # inch units
-
-        self.file.write("T%dM06\n" % values['tool']) # Tool selection + change
-        self.file.write("F%0.4f\n" % (60*scale*values['feed']))  # Feed rate
-        self.file.write("S%0.4f\n" % values['spindle']) # spindle speed
-        if values['coolant']:   self.file.write("M08\n") # coolant on
-
-        # Move up before starting spindle
-        self.file.write("G00Z%0.4f\n" % (scale*values['jog']))
-        self.file.write("M03\n") # spindle on (clockwise)
-        self.file.write("G04 P1\n") # pause one second to spin up spindle
-
-        xy  = lambda x,y:   (scale*x, scale*y)
-        xyz = lambda x,y,z: (scale*x, scale*y, scale*z)
-
-
-        for p in paths:
-
-            # Move to the start of this path at the jog height
-            self.file.write("G00X%0.4fY%0.4fZ%0.4f\n" %
-                            xyz(p.points[0][0], p.points[0][1], values['jog']))
-
-            # Plunge to the desired depth
-            self.file.write("G01Z%0.4f F%0.4f\n" %
-                            (p.points[0][2]*scale, 60*scale*values['plunge']))
-
-            # Restore XY feed rate
-            self.file.write("F%0.4f\n" % (60*scale*values['feed']))
-
-            # Cut each point in the segment
-            for pt in p.points:
-                if flat:    self.file.write("X%0.4fY%0.4f\n" % xy(*pt[0:2]))
-                else:       self.file.write("X%0.4fY%0.4fZ%0.4f\n" % xyz(*pt))
-
-            # Lift the bit up to the jog height at the end of the segment
-            self.file.write("Z%0.4f\n" % (scale*values['jog']))
-
-        self.file.write("M05\n") # spindle stop
-        if values['coolant']:   self.file.write("M09\n") # coolant off
-        self.file.write("M30\n") # program end and reset
-        self.file.write("%%\n")  # tape end
-        self.file.flush()
-
-        koko.FRAME.status = ''
+        # G00 moves run at the machine's rapid rate, which isn't known here
+        koko.FRAME.status = describe(estimate(
+            paths, values['feed'], values['plunge'], values['jog'],
+            tolerance=values['tolerance'], arcs=values['arcs']))
         return True
 
 
@@ -146,7 +86,9 @@ DEFAULTS = [
          ('spindle', 10000),
          ('jog', 5),
          ('tool', 1),
-         ('coolant', False)]
+         ('coolant', False),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 ),
 
@@ -168,7 +110,9 @@ DEFAULTS = [
          ('spindle', 10000),
          ('jog', 5),
          ('tool', 1),
-         ('coolant', False)]
+         ('coolant', False),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 ),
 
@@ -190,7 +134,9 @@ DEFAULTS = [
          ('spindle', 10000),
          ('jog', 5),
          ('tool', 1),
-         ('coolant', False)]
+         ('coolant', False),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 )
 ]
@@ -8,6 +8,7 @@ import  wx
 
 import  koko
 from    koko.cam.panel import FabPanel, OutputPanel
+from    koko.cam.writers import ModelaWriter
 
 class ModelaOutput(OutputPanel):
 
@@ -21,7 +22,8 @@ class ModelaOutput(OutputPanel):
             ('Speed (mm/s)', 'speed', float, lambda f: f > 0),
             ('Jog height (mm)', 'jog', float, lambda f: f > 0),
             ('xmin (mm)', 'xmin', float, lambda f: f > 0),
-            ('ymin (mm)', 'ymin', float, lambda f: f > 0)
+            ('ymin (mm)', 'ymin', float, lambda f: f > 0),
+            ('Tolerance (mm)', 'tolerance', float, lambda f: f >= 0)
             ])
 
         sizer = self.GetSizer()
@@ -44,51 +46,9 @@ class ModelaOutput(OutputPanel):
         values = self.get_values()
         if not values:  return False
 
-        # Check to see if all of the z values are the same.  If so,
-        # we can use pen up / pen down commands; if not, we'll need
-        # to do full three-axis motion control
-        zmin = paths[0].points[0][2]
-        flat = True
-        for p in paths:
-            if not all(pt[2] == zmin for pt in p.points):
-                flat = False
-
-
-        scale = 40.
-        xoffset = values['xmin']*scale
-        yoffset = values['ymin']*scale
-
-        xy  = lambda x,y:   (xoffset + scale*x, yoffset + scale*y)
-        xyz = lambda x,y,z: (xoffset + scale*x, yoffset + scale*y, scale*z)
-
         # Create a temporary file to store the .rml stuff
-        self.file = tempfile.NamedTemporaryFile(suffix=self.extension)
-        self.file.write("PA;PA;")   # plot absolute
-
-        # Set speeds
-        self.file.write("VS%.1f;!VZ%.1f" % (values['speed'], values['speed']))
-
-        # Set z1 to the cut depth (only relevant for a 2D cut)
-        # and z2 to the jog height (used in both 2D and 3D)
-        self.file.write("!PZ%d,%d;" % (zmin*scale, values['jog']*scale))
-
-        self.file.write("!MC1;\n")  # turn the motor on
-
-        for p in paths:
-            # Move to the start of this path with the pen up
-            self.file.write("PU%d,%d;" % xy(*p.points[0][0:2]))
-
-            # Cut each point in the segment
-            for pt in p.points:
-                if flat:    self.file.write("PD%d,%d;"   % (xy(*pt[0:2])))
-                else:       self.file.write("Z%d,%d,%d;" % (xyz(*pt)))
-
-            # Lift then pen up at the end of the segment
-            self.file.write("PU%d,%d;" % xy(*p.points[-1][0:2]))
-
-        self.file.write("!MC0;"*1000) # Modela buffering bug workaround
-        self.file.write("\nH;\n")
-        self.file.flush()
+        self.file = tempfile.NamedTemporaryFile(mode='w', suffix=self.extension)
+        ModelaWriter(self.file, **values).write(paths)
 
         koko.FRAME.status = ''
         return True
@@ -143,7 +103,8 @@ DEFAULTS = [
         [('speed', 29),
          ('jog', 1.0),
          ('xmin', 20),
-         ('ymin', 20)]
+         ('ymin', 20),
+         ('tolerance', 0.025)]
     }
 ),
 
@@ -163,7 +124,8 @@ DEFAULTS = [
         [('speed', 20),
          ('jog', 1.0),
          ('xmin', 20),
-         ('ymin', 20)]
+         ('ymin', 20),
+         ('tolerance', 0.025)]
     }
 ),
 
@@ -183,7 +145,8 @@ DEFAULTS = [
         [('speed', 4),
          ('jog', 1.0),
          ('xmin', 20),
-         ('ymin', 20)]
+         ('ymin', 20),
+         ('tolerance', 0.025)]
     }),
 
 ('Mill traces (0.010")', {
@@ -202,7 +165,8 @@ DEFAULTS = [
         [('speed', 2),
          ('jog', 1.0),
          ('xmin', 20),
-         ('ymin', 20)]
+         ('ymin', 20),
+         ('tolerance', 0.025)]
     }),
 
 ('Cut out board (1/32")',
@@ -222,7 +186,8 @@ DEFAULTS = [
         [('speed', 4),
          ('jog', 1.0),
          ('xmin', 20),
-         ('ymin', 20)]
+         ('ymin', 20),
+         ('tolerance', 0.025)]
     }
 )
 ]
@@ -7,7 +7,8 @@ import  tempfile
 import  wx
 
 import  koko
-from    koko.fab.path   import Path
+from    koko.cam.writers import ShopbotWriter
+from    koko.cam.estimate import estimate, describe
 from    koko.cam.panel  import FabPanel, OutputPanel
 
 class ShopbotOutput(OutputPanel):
@@ -28,7 +29,9 @@ class ShopbotOutput(OutputPanel):
             ('Spindle speed (RPM)', 'spindle', float, lambda f: f > 0),
             ('Jog height (mm)', 'jog', float, lambda f: f > 0),
             ('Cut type', 'type', ['Conventional', 'Climb']),
-            ('File units', 'units', ['inches', 'mm'])
+            ('File units', 'units', ['inches', 'mm']),
+            ('Tolerance (mm)', 'tolerance', float, lambda f: f >= 0),
+            ('Arc fitting (CG)', 'arcs', bool)
         ])
 
         self.construct()
@@ -44,64 +47,18 @@ class ShopbotOutput(OutputPanel):
         values = self.get_values()
         if not values:  return False
 
-        # Reverse direction for climb cutting
-        if values['type']:
-            paths = Path.sort([p.reverse() for p in paths])
-
-        # Check to see if all of the z values are the same.  If so,
-        # we can use 2D cutting commands; if not, we'll need
-        # to do full three-axis motion control
-        zmin = paths[0].points[0][2]
-        flat = True
-        for p in paths:
-            if not all(pt[2] == zmin for pt in p.points):
-                flat = False
-
         ## @var file
         # tempfile.NamedTemporaryFile to store OpenSBP commands
-        self.file = tempfile.NamedTemporaryFile(suffix=self.extension)
-
-        self.file.write("SA\r\n")   # plot absolute
-        self.file.write("TR,%s,1,\r\n" % values['spindle']) # spindle speed
-        self.file.write("SO,1,1\r\n") # set output number 1 to on
-        self.file.write("pause,2,\r\n") # pause for spindle to spin up
-
-        scale = 1 if values['units'] else 1/25.4 # mm vs inch units
-
-        # Cut and jog speeds
-        self.file.write("MS,%f,%f\r\n" %
-            (values['cut_speed']*scale, values['cut_speed']*scale))
-        self.file.write("JS,%f,%f\r\n" %
-            (values['jog_speed']*scale, values['jog_speed']*scale))
-
-        self.file.write("JZ,%f\r\n" % (values['jog']*scale)) # Move up
-
-        xy  = lambda x,y:   (scale*x, scale*y)
-        xyz = lambda x,y,z: (scale*x, scale*y, scale*z)
-
-
-        for p in paths:
-
-            # Move to the start of this path with the pen up
-            self.file.write("J2,%f,%f\r\n" % xy(*p.points[0][0:2]))
-
-            if flat:    self.file.write("MZ,%f\r\n" % (zmin*scale))
-            else:       self.file.write("M3,%f,%f,%f\r\n" % xyz(*p.points[0]))
-
-            # Cut each point in the segment
-            for pt in p.points:
-                if flat:    self.file.write("M2,%f,%f\r\n" % xy(*pt[0:2]))
-                else:       self.file.write("M3,%f,%f,%f\r\n" % xyz(*pt))
-
-            # Lift then pen up at the end of the segment
-            self.file.write("MZ,%f\r\n" % (values['jog']*scale))
-
-        self.file.flush()
-
-        koko.FRAME.status = ''
+        self.file = tempfile.NamedTemporaryFile(mode='w', suffix=self.extension)
+        paths = ShopbotWriter(self.file, **values).write(paths)
+
+        # Plunges and retracts use the move speed; jogs use the jog speed
+        koko.FRAME.status = describe(estimate(
+            paths, values['cut_speed'], values['cut_speed'], values['jog'],
+            rapid=values['jog_speed'], tolerance=values['tolerance'],
+            arcs=values['arcs']))
         return True
 
-
 ################################################################################
 
 from koko.cam.path_panels   import PathPanel
@@ -132,7 +89,9 @@ DEFAULTS = [
         [('cut_speed', 20),
          ('jog_speed', 5.0),
          ('spindle', 10000),
-         ('jog', 5)]
+         ('jog', 5),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 ),
 
@@ -152,7 +111,9 @@ DEFAULTS = [
         [('cut_speed', 20),
          ('jog_speed', 5.0),
          ('spindle', 10000),
-         ('jog', 5)]
+         ('jog', 5),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 ),
 
@@ -172,7 +133,9 @@ DEFAULTS = [
         [('cut_speed', 20),
          ('jog_speed', 5.0),
          ('spindle', 10000),
-         ('jog', 5)]
+         ('jog', 5),
+         ('tolerance', 0.01),
+         ('arcs', True)]
     }
 )
 ]
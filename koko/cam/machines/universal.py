@@ -5,6 +5,7 @@ import  subprocess
 
 import  koko
 from    koko.cam.panel import OutputPanel
+from    koko.cam.writers import UniversalWriter
 
 class UniversalOutput(OutputPanel):
 
@@ -23,48 +24,23 @@ class UniversalOutput(OutputPanel):
 
 
     def run(self, paths):
-        ''' Convert the path from the previous panel into an epilog
-            laser file (with .epi suffix).
+        ''' Convert the path from the previous panel into a universal
+            laser file (with .uni suffix).
         '''
         values = self.get_values()
         if not values:  return False
 
         koko.FRAME.status = 'Converting to .uni file'
 
-        self.file = tempfile.NamedTemporaryFile(suffix=self.extension)
+        # Speed and power are written as raw bytes
+        self.file = tempfile.NamedTemporaryFile(
+            mode='w', suffix=self.extension,
+            encoding=UniversalWriter.encoding
+        )
         job_name = koko.APP.filename if koko.APP.filename else 'untitled'
-
-        self.file.write("Z") # initialize
-        self.file.write("t%s~;" % job_name) # job name
-        self.file.write("IN;DF;PS0;DT~") # initialize
-        self.file.write("s%c" % (values['rate']/10)) # ppi
-
-        speed_hi = chr((648*values['speed']) / 256)
-        speed_lo = chr((648*values['speed']) % 256)
-        self.file.write("v%c%c" % (speed_hi, speed_lo))
-
-        power_hi = chr((320*values['power']) / 256)
-        power_lo = chr((320*values['power']) % 256)
-        self.file.write("p%c%c" % (power_hi, power_lo))
-
-        self.file.write("a%c" % 2) # air assist on high
-
-        scale = 1000/25.4 # The laser's tick is 1000 DPI
-        xoffset = values['xmin']*scale
-        yoffset = values['ymin']*scale
-        xy = lambda x,y: (xoffset + scale*x, yoffset + scale*y)
-
-        for path in paths:
-            self.file.write("PU;PA%d,%d;PD;" % xy(*path.points[0][0:2]))
-            for pt in path.points[1:]:
-                self.file.write("PA%d,%d;" % xy(*pt[0:2]))
-            self.file.write("\n")
-
-        self.file.write("e") # end of file
-        self.file.flush()
+        UniversalWriter(self.file, job_name=job_name, **values).write(paths)
 
         koko.FRAME.status = ''
-
         return True
 
 
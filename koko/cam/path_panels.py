@@ -1,4 +1,5 @@
 import operator
+import os
 
 import wx
 
@@ -8,6 +9,7 @@ from    koko.cam.panel  import FabPanel
 from    koko.fab.path   import Path
 
 from    koko.c.vec3f    import Vec3f
+from    koko.c.multithread import threadmap
 import  numpy as np
 from functools import reduce
 
@@ -64,8 +66,15 @@ class PathPanel(FabPanel):
             ('Step height (mm)','step', float, lambda f: f > 0),
             ('Path type', 'type', ['XY','XZ + YZ']),
             ('Tool type', 'tool', ['Flat','Ball']),
+            ('Rest machining', 'rest', bool),
+            ('Rest tolerance (mm)', 'rest_tolerance', float,
+                lambda f: f >= 0),
             ])
 
+        ## @var rough
+        # Settings of the last rough cut (replayed for rest machining)
+        self.rough = None
+
         # This panel is a bit special, because modifying the checkbox
         # can actually change the panel's layout (different labels are
         # shown or hidden depending on the path type)
@@ -77,6 +86,10 @@ class PathPanel(FabPanel):
             wx.EVT_CHOICE,
             lambda e: (self.parent.update(), self.parent.invalidate())
         )
+        self.rest.Bind(
+            wx.EVT_CHECKBOX,
+            lambda e: (self.parent.update(), self.parent.invalidate())
+        )
 
     def update(self, threeD):
         """ @brief Modifies visible controls based on the situation
@@ -104,12 +117,16 @@ class PathPanel(FabPanel):
                 hide(6)
 
             # Number of offsets only matters for xy cuts;
-            # mill bit selection only matters for finish cuts
+            # mill bit selection and rest machining only matter
+            # for finish cuts
             if self.type.GetSelection() == 1:   hide(1)
-            else:                               hide(9)
+            else:
+                for i in range(9, 11):  hide(i)
+            if self.type.GetSelection() != 1 or not self.rest.IsChecked():
+                hide(11)
 
         else:
-            for i in range(5, 10):   hide(i)
+            for i in range(5, 12):   hide(i)
 
         self.parent.Layout()
         return {}
@@ -165,33 +182,24 @@ class PathPanel(FabPanel):
             heights.append(heights[-1]-values['step'])
         heights[-1] = values['bottom']
 
-        # Loop over z values, accumulating samples
-        i = 0
-
-        self.paths = []
-        last_image = None
-        last_paths = []
-        for z in heights:
-            i += 1
-            koko.FRAME.status = 'Calculating level %i/%i' % (i, len(heights))
-
-            L = img.threshold(z)
-            L.array *= 100
+        # Contour every z value (slices are computed in parallel, and
+        # repeated slices share their contours)
+        koko.FRAME.status = 'Calculating levels'
+        def progress(i, n):
+            koko.FRAME.status = 'Calculating level %i/%i' % (i, n)
 
-            if last_image is not None and L == last_image:
-                paths = [p.copy() for p in last_paths]
-            else:
-                distance = L.distance()
-                paths = distance.contour(
-                    values['diameter'], values['offsets'], values['overlap']
-                )
+        layers = img.contour_layers(
+            heights, values['diameter'], values['offsets'],
+            values['overlap'], progress=progress
+        )
 
+        self.paths = []
+        for z, paths in zip(heights, layers):
             for p in paths:    p.set_z(z-values['top'])
-
-            last_paths = paths
-            last_image = L
             self.paths += paths
 
+        self.rough = values
+
         # Path offsets (to match image / mesh position)
         self.xmin = img.xmin
         self.ymin = img.ymin
@@ -220,11 +228,11 @@ class PathPanel(FabPanel):
         old_zvals = img.zmin, img.zmax
 
         if img.zmin is not None and img.zmax is not None and img.dz:
-            values = self.get_values(['diameter','overlap','tool'])
+            values = self.get_values(['diameter','overlap','tool','rest'])
             if not values:  return False
         else:
             values = self.get_values(['diameter','overlap',
-                                      'top','bottom','tool'])
+                                      'top','bottom','tool','rest'])
             if not values:  return False
             img.zmin = values['bottom']
             img.zmax = values['top']
@@ -232,6 +240,28 @@ class PathPanel(FabPanel):
         self.paths = img.finish_cut(
             values['diameter'], values['overlap'], values['tool']
         )
+
+        # Only finish where the last rough cut leaves material
+        if values['rest']:
+            v = self.get_values(['rest_tolerance'])
+            if not v or self.rough is None:
+                if v:
+                    koko.FRAME.status = (
+                        'Rest machining needs a rough cut (XY path type) first'
+                    )
+                img.zmin, img.zmax = old_zvals
+                return False
+
+            koko.FRAME.status = 'Simulating rough cut'
+            r = self.rough
+            stock = img.rough_stock(
+                r['diameter'], r['step'], r['overlap'], count=r['offsets'],
+                top=r['top'], bottom=r['bottom']
+            )
+            self.paths = img.rest_paths(
+                self.paths, stock, values['diameter'], v['rest_tolerance']
+            )
+
         for p in self.paths:
             p.offset_z(img.zmin-img.zmax)
 
@@ -450,7 +480,14 @@ class MultiPathPanel(FabPanel):
                 for b in betas:
                     target_planes.append( (a, b, '%g, %g' % (a, b)) )
 
-        for a, b, axis in target_planes:
+        # Planes run in parallel, and each plane's renders and cuts are
+        # multithreaded too, so the cores are divided between them.
+        cores = os.cpu_count() or 1
+        outer = max(1, min(cores, len(target_planes)))
+        inner = max(1, cores // outer)
+
+        def cut_plane(plane):
+            a, b, axis = plane
             koko.FRAME.status = 'Rendering ASDF on %s axis' % axis
 
             # Find endmill pointing vector
@@ -458,7 +495,7 @@ class MultiPathPanel(FabPanel):
 
             # Render the ASDF to a bitmap at the appropriate resolution
             img = asdf.render_multi(
-                resolution=values['res'], alpha=a, beta=b
+                resolution=values['res'], alpha=a, beta=b, threads=inner
             )[0]
 
             # Find transformed ADSF bounds
@@ -469,52 +506,41 @@ class MultiPathPanel(FabPanel):
             if values['cut'] in [0, 2]:
                 paths += self.rough_cut(
                     img, values['diameter'], values['stepover_r'],
-                    values['step'], bounds, axis
+                    values['step'], bounds, axis, threads=inner
                 )
 
 
             if values['cut'] in [1,2]:
                 paths += self.finish_cut(
                     img, values['diameter'], values['stepover_f'],
-                    values['tool'], bounds, axis
+                    values['tool'], bounds, axis, threads=inner
                 )
 
 
-
-            # Helper function to decide whether a path is inside the
+            # Bounds for deciding whether a point is inside the
             # ASDF's bounding box
-            def inside(pt, asdf=asdf):
-                d = values['diameter']
-                return (
-                    pt[0] >= -2*d and
-                    pt[0] <= asdf.X.upper - asdf.X.lower + 2*d and
-                    pt[1] >= -2*d and
-                    pt[1] <= asdf.Y.upper - asdf.Y.lower + 2*d and
-                    pt[2] <= 2*d and
-                    pt[2] >= -(asdf.Z.upper - asdf.Z.lower)
-                )
-
-
+            d = values['diameter']
+            lower = [-2*d, -2*d, -(asdf.Z.upper - asdf.Z.lower)]
+            upper = [asdf.X.upper - asdf.X.lower + 2*d,
+                     asdf.Y.upper - asdf.Y.lower + 2*d, 2*d]
+            offset = [asdf.xmin, asdf.ymin, asdf.zmax]
+
+            # Move paths back into the ASDF's frame, tag each point with
+            # the endmill vector, and split them where they leave the box
             culled = []
             for p in paths:
-                for i in range(len(p.points)):
-                    p.points[i,:] = list(Vec3f(p.points[i,:]).deproject(a, b))
-                    p.points[i,:] -= [asdf.xmin, asdf.ymin, asdf.zmax]
+                points = Vec3f.deproject_array(p.points, a, b) - offset
+                inside = np.all((points >= lower) & (points <= upper), axis=1)
                 p.points = np.hstack(
-                    (p.points, np.array([list(v)]*p.points.shape[0]))
+                    (points, np.tile(list(v), (len(points), 1)))
                 )
-                current_path = []
-                for pt in p.points:
-                    if inside(pt):
-                        current_path.append(pt)
-                    elif current_path:
-                        culled.append(Path(np.vstack(current_path)))
-                        current_path = []
-                if current_path:
-                    culled.append(Path(np.vstack(current_path)))
-
-            self.planes.append(culled)
-            self.axis_names.append(axis)
+                culled += p.split(inside)
+            return culled
+
+        # Planes are independent, so they're cut in parallel on a shared
+        # (read-only) ASDF, then assembled in order.
+        self.planes = threadmap(cut_plane, target_planes, threads=outer)
+        self.axis_names = [axis for a, b, axis in target_planes]
 
         paths = reduce(operator.add, self.planes)
         koko.GLCANVAS.load_paths(
@@ -525,7 +551,8 @@ class MultiPathPanel(FabPanel):
 
 
 
-    def rough_cut(self, img, diameter, stepover, step, bounds, axis=''):
+    def rough_cut(self, img, diameter, stepover, step, bounds, axis='',
+                  threads=None):
         """ @brief Calculates a rough cut
             @param img Image to cut
             @param diameter Endmill diameter
@@ -533,6 +560,7 @@ class MultiPathPanel(FabPanel):
             @param step Z step amount
             @param bounds Image bounds
             @param axis Name of target axis
+            @param threads Number of threads (default is one per core)
             @returns A list of cut paths
         """
 
@@ -541,26 +569,19 @@ class MultiPathPanel(FabPanel):
             heights.append(heights[-1]-step)
         heights[-1] = img.zmin
 
-        # Loop over z values, accumulating samples
-        i = 0
-        total = []
-        for z in heights:
-            i += 1
+        def progress(i, n):
             if axis:
                 koko.FRAME.status = (
-                    'Calculating level %i/%i on %s axis'
-                    % (i, len(heights), axis)
+                    'Calculating level %i/%i on %s axis' % (i, n, axis)
                 )
             else:
-                koko.FRAME.status = (
-                    'Calculating level %i/%i on %s axis'
-                    % (i, len(heights))
-                )
+                koko.FRAME.status = 'Calculating level %i/%i' % (i, n)
 
-            L = img.threshold(z)
-            distance = L.distance()
-            paths = distance.contour(diameter, -1, stepover)
+        layers = img.contour_layers(heights, diameter, -1, stepover,
+                                    threads=threads, progress=progress)
 
+        total = []
+        for z, paths in zip(heights, layers):
             for p in paths:
                 p.points[:,0] += bounds.xmin
                 p.points[:,1] += bounds.ymin
@@ -570,7 +591,8 @@ class MultiPathPanel(FabPanel):
         return total
 
 
-    def finish_cut(self, img, diameter, stepover, tool, bounds, axis=''):
+    def finish_cut(self, img, diameter, stepover, tool, bounds, axis='',
+                   threads=None):
         """ @brief Calculates a finish cut on a single image.
             @param img Image to cut
             @param diameter Endmill diameter
@@ -578,10 +600,11 @@ class MultiPathPanel(FabPanel):
             @param tool Tool type (0 for flat-end, 1 for ball-end)
             @param bounds Image bounds
             @param axis Name of target axis
+            @param threads Number of threads (default is one per core)
             @returns A list of cut paths
         """
         koko.FRAME.status = 'Making finish cut on %s axis' % axis
-        finish = img.finish_cut(diameter, stepover, tool)
+        finish = img.finish_cut(diameter, stepover, tool, threads=threads)
 
         # Special case to make sure that the safe plane
         # for the finish cut is good.
@@ -7,8 +7,7 @@ import wx.lib.stattext
 
 import koko
 
-from koko.cam.inputs    import INPUTS
-from koko.cam.machines  import MACHINES
+from koko.cam           import inputs, machines
 
 from koko.cam.panel     import OutputPanel
 
@@ -31,10 +30,8 @@ class OutputSelector(wx.Panel):
         title.header = True
         sizer.Add(title, flag=wx.EXPAND|wx.TOP|wx.LEFT|wx.RIGHT, border=5)
 
-        self.machines = MACHINES
-
         menu = wx.Choice(self, wx.ID_ANY,
-                         choices=[m.NAME for m in self.machines])
+                         choices=[name for module, name in machines.NAMES])
         self.Bind(wx.EVT_CHOICE, self.choice)
         sizer.Add(menu, flag=wx.CENTER|wx.TOP, border=5)
 
@@ -44,7 +41,7 @@ class OutputSelector(wx.Panel):
         """ Regenerates CAM workflow UI based on the selected machine
             @param event wx.Event for choice selection
         """
-        self.parent.set_output(self.machines[event.GetSelection()])
+        self.parent.set_output(machines.load(event.GetSelection()))
 
 ################################################################################
 
@@ -107,7 +104,7 @@ class FabWorkflowPanel(wx.Panel):
         @var defaults   DefaultSelector panel
         """
         self.input      = None
-        self.output     = MACHINES[0]
+        self.output     = machines.load(0)
         self.panels     = []
         self.defaults   = None
 
@@ -117,7 +114,7 @@ class FabWorkflowPanel(wx.Panel):
             @param output   Output module
         """
 
-        self.input = [i for i in INPUTS if i.TYPE == type(input)][0]
+        self.input = inputs.load(input)
 
         # Make sure we can find a path from the start panel to
         # the desired path panel.
@@ -126,7 +123,7 @@ class FabWorkflowPanel(wx.Panel):
 
         # If that fails, then load the None machine as our output
         else:
-            self.output = MACHINES[0]
+            self.output = machines.load(0)
 
         for p in self.panels:   p.Destroy()
         if self.defaults:       self.defaults.Destroy()
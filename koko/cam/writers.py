@@ -0,0 +1,554 @@
+"""
+@namespace writers
+@brief Machine program writers, independent of the UI.
+
+@details Each writer turns a list of Paths into a machine program,
+formatting whole arrays of points at a time and writing them through one
+buffered stream.  The output panels in koko.cam.machines are thin wrappers
+around these classes, which can also be used from scripts.
+"""
+
+from    math import atan2, sqrt, degrees
+
+import  numpy as np
+
+from    koko.fab.path   import Path
+
+
+def format_rows(fmt, rows, chunk=1 << 16):
+    """ @brief Formats each row of a 2D array with a printf-style template.
+        @param fmt Template for a single row (one % field per column)
+        @param rows 2D array of values
+        @param chunk Number of rows formatted per operation
+        @returns The formatted rows, joined into a single string
+    """
+    rows = np.asarray(rows)
+    return ''.join(
+        (fmt*len(block)) % tuple(block.ravel().tolist())
+        for block in (rows[i:i+chunk] for i in range(0, len(rows), chunk))
+    )
+
+
+def is_flat(paths):
+    """ @brief Checks whether every point in a list of paths is at the same z height
+        @param paths List of Paths
+    """
+    zmin = paths[0].points[0][2]
+    return all(np.all(p.points[:,2] == zmin) for p in paths)
+
+
+class ProgramWriter(object):
+    """ @class ProgramWriter
+        @brief Base class for machine program writers.
+        @details Subclasses define path(path), which returns the program
+        text for a single Path, and may override header(paths) and footer()
+        (which return strings) and prepare(paths).  Writers whose programs
+        aren't a sequence of paths (like Shopbot5Writer) override write
+        instead.  Use as a context manager or call close() when finished.
+    """
+
+    ## @var extension
+    # File extension for this program type
+    extension = ''
+
+    ## @var encoding
+    # Text encoding used when opening a file by name
+    encoding = 'utf-8'
+
+    def __init__(self, file, buffering=1 << 20):
+        """ @brief Prepares to write a program
+            @param file Filename or open text stream
+            @param buffering Output buffer size (in bytes) when opening a file by name
+        """
+        if isinstance(file, str):
+            self.file = open(file, 'w', encoding=self.encoding,
+                             newline='', buffering=buffering)
+            self._owned = True
+        else:
+            self.file = file
+            self._owned = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def prepare(self, paths):
+        """ @brief Adjusts the list of paths before writing (e.g. reordering)
+        """
+        return paths
+
+    def header(self, paths):
+        return ''
+
+    def footer(self):
+        return ''
+
+    def write(self, paths):
+        """ @brief Writes a complete program
+            @param paths List of Paths
+            @returns The paths in the order and direction they were written
+        """
+        paths = self.prepare(paths)
+        self.flat = is_flat(paths)
+
+        self.file.write(self.header(paths))
+        for p in paths:
+            self.file.write(self.path(p))
+        self.file.write(self.footer())
+        self.file.flush()
+        return paths
+
+    def close(self):
+        """ @brief Closes the stream (if it was opened here) or flushes it
+        """
+        if self._owned:     self.file.close()
+        else:               self.file.flush()
+
+
+class GCodeWriter(ProgramWriter):
+    """ @class GCodeWriter
+        @brief Writes G-code programs (in inch units).
+    """
+
+    extension = '.g'
+    scale = 1/25.4 # inch units
+
+    def __init__(self, file, feed, plunge, spindle, jog, type=0, tool=1,
+                 coolant=False, tolerance=0, arcs=False, **kwargs):
+        """ @brief Prepares to write a G-code program
+            @param file Filename or open text stream
+            @param feed Cut speed (mm/s)
+            @param plunge Plunge rate (mm/s)
+            @param spindle Spindle speed (RPM)
+            @param jog Jog height (mm)
+            @param type 0 for conventional cutting, 1 for climb cutting
+            @param tool Tool number
+            @param coolant Boolean determining whether coolant is turned on
+            @param tolerance Path simplification tolerance (mm)
+            @param arcs Boolean determining whether arcs are fit as G2/G3 moves
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.feed, self.plunge, self.spindle = feed, plunge, spindle
+        self.jog, self.type, self.tool = jog, type, tool
+        self.coolant, self.tolerance, self.arcs = coolant, tolerance, arcs
+
+    def prepare(self, paths):
+        # Reverse direction for climb cutting
+        if self.type:   return Path.sort([p.reverse() for p in paths])
+        else:           return paths
+
+    def header(self, paths):
+        scale = self.scale
+        return ''.join([
+            "%\n",      # tape start
+            "G17\n",    # XY plane
+            "G20\n",    # Inch mode
+            "G40\n",    # Cancel tool diameter compensation
+            "G49\n",    # Cancel tool length offset
+            "G54\n",    # Coordinate system 1
+            "G80\n",    # Cancel motion
+            "G90\n",    # Absolute programming
+            "G94\n",    # Feedrate is per minute
+            "T%dM06\n" % self.tool,             # Tool selection + change
+            "F%0.4f\n" % (60*scale*self.feed),  # Feed rate
+            "S%0.4f\n" % self.spindle,          # spindle speed
+            "M08\n" if self.coolant else "",    # coolant on
+            "G00Z%0.4f\n" % (scale*self.jog),   # Move up before starting spindle
+            "M03\n",    # spindle on (clockwise)
+            "G04 P1\n", # pause one second to spin up spindle
+        ])
+
+    def path(self, p):
+        scale = self.scale
+        out = [
+            # Move to the start of this path at the jog height
+            "G00X%0.4fY%0.4fZ%0.4f\n" % (scale*p.points[0][0],
+                                         scale*p.points[0][1],
+                                         scale*self.jog),
+            # Plunge to the desired depth
+            "G01Z%0.4f F%0.4f\n" % (p.points[0][2]*scale,
+                                    60*scale*self.plunge),
+            # Restore XY feed rate
+            "F%0.4f\n" % (60*scale*self.feed)
+        ]
+
+        # Cut each move in the segment (simplified to the given
+        # tolerance, with circular runs replaced by G2/G3 arcs)
+        arc_mode = False
+        for points, arc in p.runs(self.tolerance, self.arcs):
+            if arc is not None:
+                out.append("G%02dX%0.4fY%0.4fI%0.4fJ%0.4f\n" % (
+                    3 if arc[2] else 2,
+                    scale*points[0][0], scale*points[0][1],
+                    scale*arc[0], scale*arc[1]))
+                arc_mode = True
+                continue
+            if arc_mode:
+                out.append("G01")
+                arc_mode = False
+            if self.flat:
+                out.append(format_rows("X%0.4fY%0.4f\n", scale*points[:,:2]))
+            else:
+                out.append(format_rows("X%0.4fY%0.4fZ%0.4f\n", scale*points))
+
+        # Return to linear interpolation before lifting
+        if arc_mode:    out.append("G01")
+
+        # Lift the bit up to the jog height at the end of the segment
+        out.append("Z%0.4f\n" % (scale*self.jog))
+        return ''.join(out)
+
+    def footer(self):
+        return ''.join([
+            "M05\n",                            # spindle stop
+            "M09\n" if self.coolant else "",    # coolant off
+            "M30\n",                            # program end and reset
+            "%\n",                              # tape end
+        ])
+
+
+class ShopbotWriter(ProgramWriter):
+    """ @class ShopbotWriter
+        @brief Writes three-axis OpenSBP programs.
+    """
+
+    extension = '.sbp'
+
+    def __init__(self, file, cut_speed, jog_speed, spindle, jog, type=0,
+                 units=0, tolerance=0, arcs=False, **kwargs):
+        """ @brief Prepares to write an OpenSBP program
+            @param file Filename or open text stream
+            @param cut_speed Cut speed (mm/s)
+            @param jog_speed Jog speed (mm/s)
+            @param spindle Spindle speed (RPM)
+            @param jog Jog height (mm)
+            @param type 0 for conventional cutting, 1 for climb cutting
+            @param units 0 for inches, 1 for mm
+            @param tolerance Path simplification tolerance (mm)
+            @param arcs Boolean determining whether arcs are fit as CG moves
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.cut_speed, self.jog_speed = cut_speed, jog_speed
+        self.spindle, self.jog, self.type = spindle, jog, type
+        self.tolerance, self.arcs = tolerance, arcs
+        self.scale = 1 if units else 1/25.4 # mm vs inch units
+
+    def prepare(self, paths):
+        # Reverse direction for climb cutting
+        if self.type:   return Path.sort([p.reverse() for p in paths])
+        else:           return paths
+
+    def header(self, paths):
+        scale = self.scale
+        self.zmin = paths[0].points[0][2]
+        return ''.join([
+            "SA\r\n",                           # plot absolute
+            "TR,%s,1,\r\n" % self.spindle,      # spindle speed
+            "SO,1,1\r\n",                       # set output number 1 to on
+            "pause,2,\r\n",                     # pause for spindle to spin up
+            # Cut and jog speeds
+            "MS,%f,%f\r\n" % (self.cut_speed*scale, self.cut_speed*scale),
+            "JS,%f,%f\r\n" % (self.jog_speed*scale, self.jog_speed*scale),
+            "JZ,%f\r\n" % (self.jog*scale),     # Move up
+        ])
+
+    def path(self, p):
+        scale = self.scale
+
+        # Move to the start of this path with the pen up
+        out = ["J2,%f,%f\r\n" % (scale*p.points[0][0], scale*p.points[0][1])]
+        if self.flat:
+            out.append("MZ,%f\r\n" % (self.zmin*scale))
+        else:
+            out.append("M3,%f,%f,%f\r\n" % tuple(scale*p.points[0][0:3]))
+
+        # Cut each move in the segment (simplified to the given
+        # tolerance, with circular runs replaced by CG arcs)
+        for points, arc in p.runs(self.tolerance, self.arcs):
+            if arc is not None:
+                out.append("CG,,%f,%f,%f,%f,T,%i\r\n" % (
+                    scale*points[0][0], scale*points[0][1],
+                    scale*arc[0], scale*arc[1], -1 if arc[2] else 1))
+            elif self.flat:
+                out.append(format_rows("M2,%f,%f\r\n", scale*points[:,:2]))
+            else:
+                out.append(format_rows("M3,%f,%f,%f\r\n", scale*points))
+
+        # Lift then pen up at the end of the segment
+        out.append("MZ,%f\r\n" % (self.jog*scale))
+        return ''.join(out)
+
+
+class Shopbot5Writer(ProgramWriter):
+    """ @class Shopbot5Writer
+        @brief Writes five-axis OpenSBP programs.
+        @details Compensates for angles and adds safe traverses between paths.
+    """
+
+    extension = '.sbp'
+    scale = 1/25.4 # inch units
+
+    def __init__(self, file, cut_speed, spindle, jog, bit, gauge, **kwargs):
+        """ @brief Prepares to write a five-axis OpenSBP program
+            @param file Filename or open text stream
+            @param cut_speed Cut and jog speed (mm/s)
+            @param spindle Spindle speed (RPM)
+            @param jog Jog height (mm)
+            @param bit Bit length (mm)
+            @param gauge Gauge length (mm)
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.cut_speed, self.spindle, self.jog = cut_speed, spindle, jog
+        self.bit, self.gauge = bit, gauge
+
+    def M3(self, points):
+        """ @brief Formats an array of points as M3 moves
+        """
+        points = np.atleast_2d(points)
+        return format_rows(
+            "M3,%f,%f,%f\r\n",
+            np.column_stack((points[:,0]*self.scale, points[:,1]*self.scale,
+                             (points[:,2] - self.offset)*self.scale))
+        )
+
+    def write(self, planes, axis_names):
+        """ @brief Writes a complete program
+            @param planes List of lists of paths.  Each interior list should be of paths on a single plane.
+            @param axis_names List of names for each axis.
+        """
+        self.offset = offset = self.gauge + self.bit
+        jog = self.jog
+        scale = self.scale
+
+        out = [
+            "'This is a 5-axis Shopbot file created by kokopelli.\r\n",
+            "'The bit should be zeroed so that when pointing down,\r\n",
+            "'it touches the material at xmin, ymin, zmax.\r\n",
+            "SA\r\n",                           # plot absolute
+            "TR,%s,1,\r\n" % self.spindle,      # spindle speed
+            "SO,1,1\r\n",                       # set output number 1 to on
+            "pause,2,\r\n",                     # pause for spindle to spin up
+            # Cut and jog speeds
+            "MS,%f,%f\r\n" % (self.cut_speed*scale, self.cut_speed*scale),
+            # Make sure the head is neutrally positioned
+            "M5,,,,0,0\r\n",
+            # Move up.
+            self.M3([0, 0, jog+offset]),
+        ]
+        self.file.write(''.join(out))
+
+        for plane, axis_name in zip(planes, axis_names):
+            self.file.write(self.plane(plane, axis_name))
+        self.file.flush()
+
+    def plane(self, plane, axis_name):
+        """ @brief Formats the cuts on a single plane
+        """
+        offset, jog = self.offset, self.jog
+        out = ["'Beginning of %s plane\r\n" % axis_name]
+
+        v = plane[0][0][3:6]
+        cut_offset = offset * plane[0][0][3:6]
+        jog_offset = (offset+jog) * plane[0][0][3:6]
+
+        # Take the first point of the path and subtract the endmill
+        # length plus the jog distance.
+        origin = plane[0][0][0:3] - jog_offset
+
+        # Travel to the correct xy coordinates
+        out.append(self.M3([origin[0], origin[1], jog+offset]))
+
+        # We can rotate the B axis in two possible directions,
+        # which gives two different possible A rotations
+        aM = atan2( v[1],  v[0])
+        aP = atan2(-v[1], -v[0])
+
+        # Pick whichever A rotation is smaller
+        b = atan2(sqrt(v[0]**2 + v[1]**2), -v[2])
+        if (abs(aM) < abs(aP)):
+            a = aM
+            b = -b
+        else:
+            a = aP
+
+        out.append("M5,,,,%f,%f\r\n" % (degrees(a), degrees(b)))
+
+        for path in plane:
+            # Move to this path's start coordinates
+            pos = path[0][0:3]
+            start = pos - v*np.dot(pos - origin, v)
+
+            # Clamp every point to the bit's reach
+            pos = path.points[:,0:3] - cut_offset
+            depth = (pos - origin).dot(v)
+            deep = depth > self.bit
+            pos[deep] -= v*(depth[deep] - self.bit)[:,np.newaxis]
+
+            # Back off to the safe cut plane
+            stop = pos[-1] - v*np.dot(pos[-1] - origin, v)
+
+            out += [self.M3(start), self.M3(pos), self.M3(stop)]
+
+        # Pull up to above the top of the model
+        out.append(self.M3([stop[0], stop[1], jog+offset]))
+
+        # Rotate the head back to neutral
+        out.append("M5,,,,0,0\r\n")
+        return ''.join(out)
+
+
+class ModelaWriter(ProgramWriter):
+    """ @class ModelaWriter
+        @brief Writes Roland Modela (.rml) programs.
+    """
+
+    extension = '.rml'
+    scale = 40.
+
+    def __init__(self, file, speed, jog, xmin, ymin, tolerance=0, **kwargs):
+        """ @brief Prepares to write a Roland Modela program
+            @param file Filename or open text stream
+            @param speed Speed (mm/s)
+            @param jog Jog height (mm)
+            @param xmin Machine x offset (mm)
+            @param ymin Machine y offset (mm)
+            @param tolerance Path simplification tolerance (mm)
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.speed, self.jog, self.tolerance = speed, jog, tolerance
+        self.xoffset = xmin*self.scale
+        self.yoffset = ymin*self.scale
+
+    def header(self, paths):
+        zmin = paths[0].points[0][2]
+        return ''.join([
+            "PA;PA;",   # plot absolute
+            # Set speeds
+            "VS%.1f;!VZ%.1f" % (self.speed, self.speed),
+            # Set z1 to the cut depth (only relevant for a 2D cut)
+            # and z2 to the jog height (used in both 2D and 3D)
+            "!PZ%d,%d;" % (zmin*self.scale, self.jog*self.scale),
+            "!MC1;\n",  # turn the motor on
+        ])
+
+    def xy(self, points):
+        points = np.atleast_2d(points)
+        return np.column_stack((self.xoffset + self.scale*points[:,0],
+                                self.yoffset + self.scale*points[:,1]))
+
+    def path(self, p):
+        # Move to the start of this path with the pen up
+        out = [format_rows("PU%d,%d;", self.xy(p.points[0]))]
+
+        # Cut each point in the segment
+        for points, _ in p.runs(self.tolerance):
+            if self.flat:
+                out.append(format_rows("PD%d,%d;", self.xy(points)))
+            else:
+                out.append(format_rows("Z%d,%d,%d;", np.column_stack(
+                    (self.xy(points), self.scale*points[:,2]))))
+
+        # Lift then pen up at the end of the segment
+        out.append(format_rows("PU%d,%d;", self.xy(p.points[-1])))
+        return ''.join(out)
+
+    def footer(self):
+        return "!MC0;"*1000 + "\nH;\n" # Modela buffering bug workaround
+
+
+class EpilogWriter(ProgramWriter):
+    """ @class EpilogWriter
+        @brief Writes Epilog laser cutter (.epi) programs.
+    """
+
+    extension = '.epi'
+    scale = 600/25.4 # The laser's tick is 600 DPI
+
+    def __init__(self, file, power, speed, rate, xmin, ymin, autofocus=False,
+                 tolerance=0, job_name='untitled', **kwargs):
+        """ @brief Prepares to write an Epilog laser program
+            @param file Filename or open text stream
+            @param power Power (percent)
+            @param speed Speed (percent)
+            @param rate Pulse rate
+            @param xmin Machine x offset (mm)
+            @param ymin Machine y offset (mm)
+            @param autofocus Boolean determining whether autofocus is used
+            @param tolerance Path simplification tolerance (mm)
+            @param job_name Name of the print job
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.power, self.speed, self.rate = power, speed, rate
+        self.autofocus, self.tolerance = autofocus, tolerance
+        self.job_name = job_name
+        self.xoffset = xmin*self.scale
+        self.yoffset = ymin*self.scale
+
+    def header(self, paths):
+        return ("\x1b%%-12345X@PJL JOB NAME=%s\r\n\x1bE@PJL ENTER LANGUAGE=PCL\r\n"
+                "\x1b&y%iA\x1b&l0U\x1b&l0Z\x1b&u600D\x1b*p0X\x1b*p0Y\x1b*t600R\x1b*r0F"
+                "\x1b&y50P\x1b&z50S\x1b*r6600T\x1b*r5100S\x1b*r1A\x1b*rC"
+                "\x1b%%1BIN;XR%d;YP%d;ZS%d;\n" %
+            (self.job_name, 1 if self.autofocus else 0,
+             self.rate, self.power, self.speed))
+
+    def path(self, p):
+        points = np.vstack([run for run, _ in p.runs(self.tolerance)])
+        xy = np.column_stack((self.xoffset + self.scale*points[:,0],
+                              self.yoffset + self.scale*points[:,1]))
+        return (format_rows("PU%d,%d;", xy[:1]) +
+                format_rows("PD%d,%d;", xy[1:]) + "\n")
+
+    def footer(self):
+        return "\x1b%%0B\x1b%%1BPUtE\x1b%%-12345X@PJL EOJ \r\n"
+
+
+class UniversalWriter(ProgramWriter):
+    """ @class UniversalWriter
+        @brief Writes Universal laser cutter (.uni) programs.
+        @details Speed and power are written as raw bytes, so the stream
+        should use the latin-1 encoding.
+    """
+
+    extension = '.uni'
+    scale = 1000/25.4 # The laser's tick is 1000 DPI
+    encoding = 'latin-1'
+
+    def __init__(self, file, power, speed, rate, xmin, ymin,
+                 job_name='untitled', **kwargs):
+        """ @brief Prepares to write a Universal laser program
+            @param file Filename or open text stream
+            @param power Power (percent)
+            @param speed Speed (percent)
+            @param rate Pulse rate
+            @param xmin Machine x offset (mm)
+            @param ymin Machine y offset (mm)
+            @param job_name Name of the print job
+        """
+        ProgramWriter.__init__(self, file, **kwargs)
+        self.power, self.speed, self.rate = power, speed, rate
+        self.job_name = job_name
+        self.xoffset = xmin*self.scale
+        self.yoffset = ymin*self.scale
+
+    def header(self, paths):
+        return ''.join([
+            "\x1bZ",                                    # initialize
+            "\x1bt%s~;" % self.job_name,                # job name
+            "IN;DF;PS0;DT~",                            # initialize
+            "\x1bs%c" % (self.rate//10),                # ppi
+            "\x1bv%c%c" % divmod(648*self.speed, 256),  # speed (hi, lo)
+            "\x1bp%c%c" % divmod(320*self.power, 256),  # power (hi, lo)
+            "\x1ba%c" % 2,                              # air assist on high
+        ])
+
+    def path(self, p):
+        xy = np.column_stack((self.xoffset + self.scale*p.points[:,0],
+                              self.yoffset + self.scale*p.points[:,1]))
+        return (format_rows("PU;PA%d,%d;PD;", xy[:1]) +
+                format_rows("PA%d,%d;", xy[1:]) + "\n")
+
+    def footer(self):
+        return "\x1be" # end of file
@@ -21,6 +21,12 @@ def _parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="kokopelli",
         description="Script-based CAD/CAM using Python as a design language.",
+        epilog=(
+            "batch commands (no GUI): kokopelli render|export FILE... "
+            "[--format png|svg|stl|asdf|dot] [--resolution R] [--jobs N]; "
+            "run `kokopelli export --help` for details.  "
+            "render daemon: kokopelli serve, then kokopelli submit FILE..."
+        ),
     )
     parser.add_argument("filename", nargs="?", help="design or model to open")
     parser.add_argument("--version", action="version", version=f"%(prog)s {koko.VERSION}")
@@ -55,13 +61,33 @@ def runtime_check() -> int:
     return 0
 
 
+BATCH_COMMANDS = ("render", "export")
+
+
 def main(argv: list[str] | None = None) -> int:
-    args = _parser().parse_args(argv)
+    if argv is None:
+        argv = sys.argv[1:]
 
     root = _project_root()
     koko.BASE_DIR = os.fspath(root) + os.sep
     koko.BUNDLED = bool(getattr(sys, "frozen", False))
 
+    # Batch commands never import the GUI
+    if argv and argv[0] in BATCH_COMMANDS:
+        from koko.batch import main as batch_main
+
+        return batch_main(argv)
+    if argv and argv[0] == "serve":
+        from koko.server import serve_main
+
+        return serve_main(argv[1:])
+    if argv and argv[0] == "submit":
+        from koko.server import submit_main
+
+        return submit_main(argv[1:])
+
+    args = _parser().parse_args(argv)
+
     if args.check:
         return runtime_check()
 
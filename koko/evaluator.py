@@ -0,0 +1,352 @@
+"""
+@namespace evaluator
+@brief Incremental execution of design scripts.
+
+@details A script is split into its top-level statements, and the namespace
+is snapshotted after each one.  When the script is edited, statements before
+the first change are skipped by restoring the matching snapshot, so their
+objects (including already-parsed math trees) are reused.
+
+Reuse is limited by what later statements did to those objects.  For each
+statement we record the names it reads and binds, and the names whose
+objects it modifies in place (through attribute or item assignment, or by
+calling a method as a bare statement, like cad.shapes.append(s)).  If a
+statement modified an object, the run restarts from the statement that
+created that object (or, for objects supplied in the initial namespace,
+like cad, from the first statement that used it), so that no restored
+object carries changes from the previous run.  Other bare function calls
+(besides print) may do anything, so they force a full re-run.
+
+A name bound from an expression that loads other names (like b = a,
+b = a.shapes, segs = [pts] or p = Path(pts)), or a loop or with target, may
+hold those names' objects, so it is an alias of all of them and its origin
+is the earliest of theirs.  Statements are otherwise assumed to only change
+the names they bind: a function that modifies its arguments or globals
+isn't detected.
+"""
+
+import ast
+import io
+import sys
+import threading
+
+
+class Statement(object):
+    """ @class Statement
+        @brief A top-level statement, with the names it uses
+    """
+    def __init__(self, node, source):
+        """ @brief Analyzes a statement
+            @param node ast statement node
+            @param source Source lines of the script
+        """
+        first = min([node.lineno] +
+                    [d.lineno for d in getattr(node, 'decorator_list', [])])
+
+        ## @var key
+        # Starting line and source text (which identify the statement)
+        self.key = (first, '\n'.join(source[first - 1:node.end_lineno]))
+
+        ## @var node
+        # ast statement node
+        self.node = node
+
+        ## @var reads
+        # Names whose values are used
+        self.reads = set()
+
+        ## @var writes
+        # Names that are bound
+        self.writes = set()
+
+        ## @var mutates
+        # Names whose objects are modified in place
+        self.mutates = set()
+
+        ## @var aliases
+        # Bound names mapped to the set of names whose objects they may hold
+        self.aliases = {}
+
+        ## @var star
+        # True if this is a star import (which binds unknown names)
+        self.star = False
+
+        ## @var barrier
+        # True if the statement may have arbitrary side effects
+        self.barrier = False
+
+        self.visit(node)
+
+        ## @var snapshot
+        # Namespace after this statement ran
+        self.snapshot = None
+
+        ## @var output
+        # Text printed by this statement
+        self.output = ''
+
+
+    def visit(self, node):
+        """ @brief Walks a statement or expression, collecting names
+            @details Function and class bodies and comprehensions have their
+            own scopes, so only the names that they read are collected.
+        """
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            self.writes.add(node.name)
+            for n in ast.walk(node):
+                if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+                    self.reads.add(n.id)
+                elif isinstance(n, (ast.Global, ast.Nonlocal)):
+                    self.barrier = True
+            return
+        elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp,
+                               ast.DictComp, ast.GeneratorExp)):
+            for n in ast.walk(node):
+                if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+                    self.reads.add(n.id)
+            return
+
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):  self.reads.add(node.id)
+            else:                               self.writes.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for a in node.names:
+                if a.name == '*':   self.star = True
+                else:   self.writes.add((a.asname or a.name).split('.')[0])
+        elif isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign,
+                               ast.Delete, ast.For, ast.With)):
+            for t in self.targets(node):
+                if isinstance(t, (ast.Attribute, ast.Subscript)):
+                    self.mutate(t)
+                elif isinstance(node, ast.AugAssign):
+                    self.mutate(t)
+                elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                    if node.value is not None:  self.alias(t, node.value)
+                elif isinstance(node, ast.For):
+                    self.alias(t, node.iter)
+            if isinstance(node, ast.With):
+                for i in node.items:
+                    if i.optional_vars:
+                        self.alias(i.optional_vars, i.context_expr)
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            f = node.value.func
+            if isinstance(f, ast.Attribute):
+                self.mutate(f.value)
+            elif not (isinstance(f, ast.Name) and f.id == 'print'):
+                self.barrier = True
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            self.barrier = True
+
+        for child in ast.iter_child_nodes(node):
+            self.visit(child)
+
+
+    def mutate(self, target):
+        """ @brief Records the name at the root of an attribute or item chain
+        """
+        while isinstance(target, (ast.Attribute, ast.Subscript)):
+            target = target.value
+        if isinstance(target, ast.Name):
+            self.mutates.add(target.id)
+        else:
+            self.barrier = True
+
+    def alias(self, target, value):
+        """ @brief Records names bound from values that may hold other names' objects
+            @details Any name loaded in the value (other than a called
+            function) may end up inside the bound object, e.g. in a list,
+            dict or call argument, so the target aliases all of them.
+        """
+        if isinstance(target, (ast.Tuple, ast.List)):
+            if (isinstance(value, (ast.Tuple, ast.List)) and
+                    len(value.elts) == len(target.elts)):
+                for t, v in zip(target.elts, value.elts):
+                    self.alias(t, v)
+                return
+        called = set(id(n.func) for n in ast.walk(value)
+                     if isinstance(n, ast.Call))
+        names = set(n.id for n in ast.walk(value)
+                    if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+                    and id(n) not in called)
+        if not names:   return
+        for t in ast.walk(target):
+            if isinstance(t, ast.Name):
+                self.aliases[t.id] = self.aliases.get(t.id, set()) | names
+
+    @staticmethod
+    def targets(node):
+        if isinstance(node, (ast.Assign, ast.Delete)):
+            return node.targets
+        elif isinstance(node, ast.With):
+            return [i.optional_vars for i in node.items if i.optional_vars]
+        return [node.target]
+
+################################################################################
+
+class ScriptEvaluator(object):
+    """ @class ScriptEvaluator
+        @brief Runs design scripts, reusing work from the previous run
+    """
+
+    def __init__(self):
+        ## @var statements
+        # Statements that completed in the previous run
+        self.statements = []
+
+        ## @var namespace
+        # Global namespace of the most recent run
+        self.namespace = {}
+
+        ## @var env
+        # Environment key of the previous run
+        self.env = None
+
+        ## @var initial
+        # Set of initial names in the previous run
+        self.initial = None
+
+        ## @var reused
+        # Number of statements skipped in the most recent run
+        self.reused = 0
+
+        ## @var executed
+        # Number of statements executed in the most recent run
+        self.executed = 0
+
+        self.lock = threading.Lock()
+
+
+    def reset(self):
+        """ @brief Forgets the previous run
+            @details Doesn't wait for a run in progress, which keeps its
+            own references and won't be reused.
+        """
+        self.statements = []
+        self.namespace = {}
+        self.env = None
+        self.initial = None
+
+
+    def run(self, script, initial, env=None, interrupt=None):
+        """ @brief Runs a script
+            @param script Script text
+            @param initial Dictionary of initial names (e.g. cad)
+            @param env Key describing anything else the initial names depend on (statements that read them are re-run when it changes)
+            @param interrupt threading.Event that stops execution between statements
+            @returns The script's namespace, or None if interrupted
+            @details Output is written to sys.stdout, with the output of reused statements replayed.  Errors propagate with their script frames intact.
+        """
+        with self.lock:
+            return self._run(script, initial, env, interrupt)
+
+
+    def _run(self, script, initial, env, interrupt):
+        source = script.split('\n')
+        statements = [Statement(n, source)
+                      for n in ast.parse(script, '<string>').body]
+
+        start = self.resume(statements, initial, env)
+        self.reused = start
+        self.executed = 0
+
+        ns = self.namespace
+        ns.clear()
+        if start:
+            ns.update(self.statements[start - 1].snapshot)
+            read = set.union(*[s.reads | s.mutates
+                               for s in self.statements[:start]])
+            for k in initial:
+                if k not in read:   ns[k] = initial[k]
+            statements[:start] = self.statements[:start]
+        else:
+            ns.update(initial)
+
+        self.env = env
+        self.initial = set(initial)
+        self.statements = done = statements[:start]
+
+        for s in done:
+            sys.stdout.write(s.output)
+
+        for s in statements[start:]:
+            if interrupt is not None and interrupt.is_set():
+                return None
+
+            code = compile(ast.Module([s.node], []), '<string>', 'exec')
+            stdout = sys.stdout
+            sys.stdout = buffer = io.StringIO()
+            try:
+                exec(code, ns)
+            finally:
+                sys.stdout = stdout
+                s.output = buffer.getvalue()
+                stdout.write(s.output)
+
+            s.snapshot = dict(ns)
+            done.append(s)
+            self.executed += 1
+
+        return ns
+
+
+    def resume(self, statements, initial, env):
+        """ @brief Finds how many leading statements can be reused
+        """
+        previous = self.statements
+        if set(initial) != self.initial:    return 0
+
+        # Longest matching prefix
+        start = 0
+        for old, new in zip(previous, statements):
+            if old.key != new.key:  break
+            start += 1
+
+        # If the environment changed, re-run from the first statement
+        # that reads an initial name
+        if env != self.env:
+            start = min([start] + [i for i, s in enumerate(previous)
+                                   if (s.reads | s.mutates) & self.initial])
+
+        # Back up past anything the rest of the last run modified
+        changed = True
+        cache = {}
+        while changed and start:
+            changed = False
+            for k in range(start, len(previous)):
+                if previous[k].barrier:
+                    return 0
+                for name in previous[k].mutates:
+                    # A loop or with target may hold objects from earlier
+                    names = previous[k].aliases.get(name, set()) | {name}
+                    origin = min(self.origin(previous, n, k, cache)
+                                 for n in names)
+                    if origin < start:
+                        start, changed = origin, True
+        return start
+
+
+    def origin(self, statements, name, k, cache=None):
+        """ @brief Finds where the object behind a name came from
+            @param cache Dictionary of origins already found, keyed by (name, k)
+            @returns Index of the last statement before k that bound the
+            name (or, for an alias, where the aliased objects came from, if
+            that's earlier), or (for initial names and names from star
+            imports) of the first statement that used it (or the star import).
+        """
+        if cache is None:   cache = {}
+        if (name, k) in cache:  return cache[name, k]
+        cache[name, k] = self._origin(statements, name, k, cache)
+        return cache[name, k]
+
+    def _origin(self, statements, name, k, cache):
+        for i in range(k - 1, -1, -1):
+            if name in statements[i].writes:
+                return min([i] + [self.origin(statements, a, i, cache)
+                                  for a in statements[i].aliases.get(name, ())])
+        star = name not in self.initial
+        for i in range(k):
+            s = statements[i]
+            if name in s.reads or name in s.mutates or (star and s.star):
+                return i
+        return k
@@ -0,0 +1,430 @@
+"""
+@namespace exporter
+@brief Export tasks that run without a GUI.
+
+@details These classes hold the export pipelines for cad structures and
+ASDFs.  koko.export wraps them with a progress window and a background
+thread; scripts and the command-line interface use them directly.
+"""
+
+import os
+import queue
+import threading
+from    contextlib        import contextmanager
+
+from    koko.struct       import Struct
+from    koko.c.region     import Region
+
+from    koko.fab.path     import SVGWriter
+from    koko.fab.image    import Image
+from    koko.fab.mesh     import STLWriter
+
+def pipeline(items, stages, event, progress=None, weights=None, depth=1):
+    ''' Streams items through a sequence of stages, with one thread per
+        stage and bounded queues between them, so that item i+1 can be
+        in the first stage while item i is in the second.
+
+        Each stage is called as stage(value, interrupt), where value is
+        the item (for the first stage) or the previous stage's result,
+        and interrupt is a threading.Event owned by that stage (which
+        can be passed to multithread-based functions; sharing one event
+        between concurrent stages would let one stage's cleanup halt
+        another).  Setting event stops the pipeline and interrupts every
+        stage.
+
+        progress is called as progress(fraction) after each step, with
+        steps weighted by stage (equal weights by default).
+
+        Returns a list of results from the final stage (in order), or
+        None if the pipeline was interrupted.  The first exception raised
+        by a stage is re-raised here.
+    '''
+    if weights is None: weights = [1]*len(stages)
+    total = float(sum(weights)*len(items)) or 1
+
+    done = [0]
+    errors = []
+    results = []
+    lock = threading.Lock()
+    interrupts = [threading.Event() for s in stages]
+    queues = [queue.Queue(maxsize=depth) for s in stages[1:]]
+    end = object()
+
+    def stopped():
+        return event.is_set() or bool(errors)
+
+    def feed(stage, get, put, weight, interrupt, last):
+        while True:
+            value = get()
+            if value is end:    break
+            if stopped():       continue
+            try:
+                result = stage(value, interrupt)
+            except Exception as e:
+                errors.append(e)
+                continue
+            if stopped():       continue
+            put(result)
+            with lock:
+                done[0] += weight
+                if progress:    progress(done[0]/total)
+        if not last:    put(end)
+
+    sources = [iter(list(items) + [end]).__next__] + [q.get for q in queues]
+    sinks = [q.put for q in queues] + [results.append]
+    threads = [threading.Thread(target=feed, args=a) for a in
+               zip(stages, sources, sinks, weights, interrupts,
+                   [False]*(len(stages) - 1) + [True])]
+
+    # Fan cancellation out to every stage's interrupt
+    def monitor():
+        while any(t.is_alive() for t in threads):
+            if event.wait(0.05):
+                for i in interrupts:    i.set()
+                break
+
+    for t in threads:   t.daemon = True
+    for t in threads:   t.start()
+    m = threading.Thread(target=monitor)
+    m.daemon = True
+    m.start()
+    for t in threads:   t.join()
+    m.join()
+
+    if errors:  raise errors[0]
+    return None if event.is_set() else results
+
+################################################################################
+
+class CadExporter(object):
+    ''' A class representing a FabVars export task.
+
+        Requires a filename and cad structure,
+        plus optional supporting arguments.
+    '''
+
+    ## @var resolution
+    # Export resolution (in pixels per unit)
+    resolution = 10
+
+    ## @var make_heightmap
+    # Boolean determining whether png exports are heightmaps (or colored)
+    make_heightmap = True
+
+    ## @var use_cms
+    # Boolean determining whether stl exports are watertight
+    use_cms = False
+
+    ## @var svg_relative
+    # Boolean determining whether svg exports use relative path commands
+    svg_relative = False
+
+    ## @var dot_arrays
+    # Boolean determining whether dot exports show packed arrays
+    dot_arrays = False
+
+    ## @var affine
+    # Boolean determining whether renders bound regions with affine arithmetic
+    affine = False
+
+    ## @var cache
+    # DiskCache consulted before rendering with libfab (or None)
+    cache = None
+
+    def __init__(self, filename, cad, window=None, **kwargs):
+        ''' Prepares an export.  window is an object with a
+            progress attribute (0 to 100), which is updated as the
+            export runs.
+        '''
+        self.filename   = filename
+        self.extension  = self.filename.split('.')[-1]
+        self.cad        = cad
+        for k in kwargs:    setattr(self, k, kwargs[k])
+
+        self.event   = threading.Event()
+        self.c_event = threading.Event()
+
+        self.window = Struct(progress=0) if window is None else window
+
+
+    @contextmanager
+    def partial_output(self):
+        ''' Removes the output file if the export is cancelled
+            (or fails) while it is being written.
+        '''
+        try:
+            yield
+        except BaseException:
+            self.remove_output()
+            raise
+        if self.event.is_set():     self.remove_output()
+
+
+    def remove_output(self):
+        ''' Removes a partially written output file.
+        '''
+        try:                        os.remove(self.filename)
+        except FileNotFoundError:   pass
+
+
+    def export_png(self):
+        ''' Exports a png using libtree.
+        '''
+
+        if self.make_heightmap:
+            out = self.make_image(self.cad.shape)
+        else:
+            i = 0
+            imgs = []
+            for e in self.cad.shapes:
+                if self.event.is_set(): return
+                img = self.make_image(e)
+                if img is not None: imgs.append(img)
+                i += 1
+                self.window.progress = i*90/len(self.cad.shapes)
+            out = Image.merge(imgs)
+
+        if self.event.is_set(): return
+
+        self.window.progress = 90
+        out.save(self.filename)
+        self.window.progress = 100
+
+
+
+    def make_image(self, expr):
+        ''' Renders a single expression, returning the image
+        '''
+        zmin = self.cad.zmin if self.cad.zmin else 0
+        zmax = self.cad.zmax if self.cad.zmax else 0
+
+        region = Region(
+            (self.cad.xmin, self.cad.ymin, zmin),
+            (self.cad.xmax, self.cad.ymax, zmax),
+            self.resolution*self.cad.mm_per_unit
+        )
+
+        img = self.cached('image', lambda: expr.render(
+            region, mm_per_unit=self.cad.mm_per_unit, interrupt=self.c_event,
+            affine=self.affine
+        ), expr, region, self.c_event)
+
+        img.color = expr.color
+        return img
+
+
+    def export_asdf(self):
+        ''' Exports an ASDF file.
+        '''
+        asdf = self.make_asdf(self.cad.shape)
+        self.window.progress = 50
+        if self.event.is_set(): return
+        asdf.save(self.filename)
+        self.window.progress = 100
+
+
+    def export_svg(self):
+        ''' Exports an svg file at 90 DPI with per-object colors.
+        '''
+        xmin = self.cad.xmin*self.cad.mm_per_unit
+        dx = (self.cad.xmax - self.cad.xmin)*self.cad.mm_per_unit
+        ymax = self.cad.ymax*self.cad.mm_per_unit
+        dy = (self.cad.ymax - self.cad.ymin)*self.cad.mm_per_unit
+        stroke = max(dx, dy)/100.
+
+
+        # Don't leave a partial file behind if the export is cancelled
+        with self.partial_output(), SVGWriter(
+                self.filename, dx, dy, relative=self.svg_relative) as svg:
+            # Build ASDFs, find their contours, and write them out to the
+            # SVG file, with each shape in a different stage at once
+            def write(job, interrupt):
+                expr, contours = job
+                svg.write_paths(
+                    contours, xmin, ymax, stroke=stroke,
+                    color=expr.color if expr.color else (0,0,0)
+                )
+
+            pipeline(self.cad.shapes, [
+                lambda expr, i: (expr, self.make_asdf(expr, True, i)),
+                lambda job, i: (job[0], self.make_contour(job[1], i)),
+                write,
+            ], self.event, self.set_progress, weights=[1, 2, 0])
+
+
+    def export_stl(self):
+        ''' Exports an stl, using an asdf as intermediary.
+        '''
+        # Build ASDFs, triangulate them, and stream the meshes to disk,
+        # with each shape in a different stage at once (and don't leave
+        # a partial file behind if the export is cancelled or fails)
+        with self.partial_output(), STLWriter(self.filename) as stl:
+            # Meshes found in the cache skip both rendering stages
+            def build(expr, interrupt):
+                key = None
+                if self.cache is not None:
+                    key = self.cache.key(
+                        'mesh', expr, self.make_region(expr),
+                        mm_per_unit=self.cad.mm_per_unit, cms=self.use_cms
+                    )
+                    mesh = self.cache.get('mesh', key)
+                    if mesh is not None:    return mesh, None, None
+                return None, key, self.make_asdf(expr, interrupt=interrupt)
+
+            def triangulate(job, interrupt):
+                mesh, key, asdf = job
+                if mesh is None and asdf is not None:
+                    mesh = self.make_mesh(asdf, interrupt)
+                    if key is not None and not interrupt.is_set():
+                        self.cache.put('mesh', key, mesh)
+                return mesh
+
+            def write(mesh, interrupt):
+                if mesh is not None:    stl.write(mesh)
+
+            pipeline(self.cad.shapes, [build, triangulate, write],
+                     self.event, self.set_progress, weights=[1, 2, 0])
+
+
+    def set_progress(self, fraction):
+        ''' Updates the progress bar from a fraction of the work done.
+        '''
+        self.window.progress = fraction*100
+
+
+    def cached(self, kind, make, expr, region, interrupt, **params):
+        ''' Calls make to render an expression, going through the
+            cache if there is one.
+        '''
+        if self.cache is None:  return make()
+        return self.cache.fetch(
+            kind, make, expr, region, interrupt,
+            mm_per_unit=self.cad.mm_per_unit, **params
+        )
+
+
+    def make_region(self, expr, flat=False):
+        ''' Returns the region in which an expression is rendered
+            to an ASDF (with a border around the expression's bounds)
+        '''
+        if flat:
+            region = Region(
+                (expr.xmin - self.cad.border*expr.dx,
+                 expr.ymin - self.cad.border*expr.dy,
+                 0),
+                (expr.xmax + self.cad.border*expr.dx,
+                 expr.ymax + self.cad.border*expr.dy,
+                 0),
+                 self.resolution * self.cad.mm_per_unit
+            )
+        else:
+            region = Region(
+                (expr.xmin - self.cad.border*expr.dx,
+                 expr.ymin - self.cad.border*expr.dy,
+                 expr.zmin - self.cad.border*expr.dz),
+                (expr.xmax + self.cad.border*expr.dx,
+                 expr.ymax + self.cad.border*expr.dy,
+                 expr.zmax + self.cad.border*expr.dz),
+                 self.resolution * self.cad.mm_per_unit
+            )
+        return region
+
+
+    def make_asdf(self, expr, flat=False, interrupt=None):
+        ''' Renders an expression to an ASDF '''
+        region = self.make_region(expr, flat)
+        if interrupt is None:   interrupt = self.c_event
+        asdf = self.cached('asdf', lambda: expr.asdf(
+            region=region, mm_per_unit=self.cad.mm_per_unit,
+            interrupt=interrupt, affine=self.affine
+        ), expr, region, interrupt)
+        return asdf
+
+
+    def make_contour(self, asdf, interrupt=None):
+        contour = asdf.contour(
+            interrupt=self.c_event if interrupt is None else interrupt
+        )
+        return contour
+
+
+    def make_mesh(self, asdf, interrupt=None):
+        ''' Renders an ASDF to a mesh '''
+        if self.use_cms:
+            return asdf.triangulate_cms()
+        else:
+            return asdf.triangulate(
+                interrupt=self.c_event if interrupt is None else interrupt
+            )
+
+
+    def export_dot(self):
+        ''' Saves a math tree as a .dot file. '''
+
+        # Make the cad function and C data structure
+        expr = self.cad.shape
+        expr.ptr
+        self.window.progress = 25
+
+        # Save as a dot file
+        expr.save_dot(self.filename, self.dot_arrays)
+        self.window.progress = 100
+
+
+    def run(self):
+        ''' Runs the export that matches the filename's extension.
+        '''
+        getattr(self, 'export_%s' % self.extension)()
+
+################################################################################
+
+class AsdfExporter(object):
+    ''' A class representing an ASDF export task.
+    '''
+
+    ## @var resolution
+    # Export resolution (in pixels per unit)
+    resolution = 10
+
+    ## @var alpha
+    # Rotation about the z axis (in degrees) for png exports
+    alpha = 0
+
+    ## @var beta
+    # Rotation about the x axis (in degrees) for png exports
+    beta = 0
+
+    def __init__(self, filename, asdf, window=None, **kwargs):
+        self.filename = filename
+        self.extension = self.filename.split('.')[-1]
+        self.asdf = asdf
+
+        for k in kwargs:    setattr(self, k, kwargs[k])
+
+        self.event = threading.Event()
+        self.c_event = threading.Event()
+
+        self.window = Struct(progress=0) if window is None else window
+
+    def export_png(self):
+        img = self.asdf.render(
+            alpha=self.alpha, beta=self.beta, resolution=self.resolution
+        )
+        self.window.progress = 90
+        img.save(self.filename)
+        self.window.progress = 100
+
+    def export_stl(self):
+        mesh = self.asdf.triangulate_cms()
+        self.window.progress = 60
+        mesh.save_stl(self.filename)
+        self.window.progress = 100
+
+    def export_asdf(self):
+        self.asdf.save(self.filename)
+        self.window.progress = 100
+
+    def run(self):
+        ''' Runs the export that matches the filename's extension.
+        '''
+        getattr(self, 'export_%s' % self.extension)()
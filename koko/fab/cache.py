@@ -0,0 +1,309 @@
+""" Module defining a persistent, content-addressed cache of render results.
+
+Rendered images, ASDFs and meshes are keyed by a hash of the math string,
+the render region (bounds and lattice size), the kind of result and any
+other options that change it, so reopening a design or undoing an edit finds
+the earlier results.  Each entry is a single file, written to a temporary
+name and renamed into place, so readers (including other kokopelli
+processes) never see a partial entry.  When the cache grows past its size
+limit, the least recently used entries are deleted.
+
+The cache fails soft: entries that can't be read are misses, and entries
+that can't be written are skipped, so a full disk or an unwritable cache
+directory never loses a result that was already made.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+## @var VERSION
+# Cache format version (part of every key, so that changing it
+# invalidates old entries)
+VERSION = 2
+
+class DiskCache(object):
+    """ @class DiskCache
+        @brief Size-limited cache directory of render results
+    """
+
+    ## @var SUFFIXES
+    # File extension for each kind of entry
+    SUFFIXES = {'image': '.npz', 'asdf': '.asdf', 'mesh': '.mesh'}
+
+    ## @var TEMPORARY
+    # File extensions of files being written or read
+    TEMPORARY = ('.tmp', '.read')
+
+    ## @var STALE
+    # Age in seconds after which temporary files are assumed to be left
+    # over from a crashed process, and deleted
+    STALE = 3600
+
+    def __init__(self, directory, limit=2**30):
+        """ @brief Opens (or creates) a cache directory
+            @param directory Cache directory
+            @param limit Size limit in bytes (0 disables the cache)
+        """
+        ## @var directory
+        # Directory holding cache entries
+        self.directory = directory
+
+        ## @var limit
+        # Size limit in bytes
+        self.limit = limit
+
+        ## @var size
+        # Total size of entries in bytes (None until first counted)
+        self.size = None
+
+        ## @var hits
+        # Number of lookups that found an entry
+        self.hits = 0
+
+        ## @var misses
+        # Number of lookups that didn't
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def key(kind, expr, region, **params):
+        """ @brief Finds the key for a render result
+            @param kind Kind of result ('image', 'asdf', or 'mesh')
+            @param expr MathTree being rendered
+            @param region Render region
+            @param params Other options that affect the result
+            @returns Hex digest string
+        """
+        lattice = (
+            region.ni, region.nj, region.nk,
+            region.X[0], region.X[region.ni],
+            region.Y[0], region.Y[region.nj],
+            region.Z[0], region.Z[region.nk],
+        )
+        text = '%i %s %s %r %r' % (
+            VERSION, kind, expr.math, lattice, sorted(params.items())
+        )
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+    def path(self, kind, key):
+        """ @brief Returns the filename of an entry
+        """
+        return os.path.join(self.directory, key[:2], key + self.SUFFIXES[kind])
+
+
+    def get(self, kind, key):
+        """ @brief Loads an entry
+            @returns The cached object, or None if not found
+        """
+        if not self.limit:  return None
+
+        path = self.path(kind, key)
+
+        # Read through a private hard link, so that the entry can't be
+        # evicted (by this or another process) halfway through loading.
+        link = '%s.%i.%i.read' % (path, os.getpid(), threading.get_ident())
+        try:
+            os.link(path, link)
+        except OSError:
+            self.misses += 1
+            return None
+
+        # Entries that can't be loaded (truncated or corrupted by something
+        # outside the cache) are deleted and treated as misses.
+        try:
+            out = getattr(self, 'load_' + kind)(link)
+        except Exception:
+            out = None
+            try:                os.remove(path)
+            except OSError:     pass
+        finally:
+            try:                os.remove(link)
+            except OSError:     pass
+        if out is None:
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used
+        try:                os.utime(path)
+        except OSError:     pass
+
+        self.hits += 1
+        return out
+
+
+    def put(self, kind, key, value):
+        """ @brief Stores an entry, evicting old ones if the cache is full
+            @returns True if the entry was stored
+        """
+        if not self.limit:  return False
+
+        path = self.path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.tmp',
+                                       dir=os.path.dirname(path))
+            os.close(fd)
+        except OSError:
+            return False
+
+        try:
+            getattr(self, 'save_' + kind)(value, tmp)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError:
+            try:                os.remove(tmp)
+            except OSError:     pass
+            return False
+
+        with self.lock:
+            if self.size is None:   self.size = self.count()
+            else:                   self.size += size
+            if self.size > self.limit:
+                self.evict()
+        return True
+
+
+    def fetch(self, kind, make, expr, region, interrupt=None, **params):
+        """ @brief Looks up a render result, making and storing it if needed
+            @param kind Kind of result ('image', 'asdf', or 'mesh')
+            @param make Function that makes the result
+            @param expr MathTree being rendered
+            @param region Render region
+            @param interrupt threading.Event for the render (results made while it is set are incomplete, so they aren't stored)
+            @param params Other options that affect the result
+            @returns The result
+        """
+        key = self.key(kind, expr, region, **params)
+        out = self.get(kind, key)
+        if out is not None:     return out
+
+        out = make()
+        if out is not None and not (interrupt and interrupt.is_set()):
+            self.put(kind, key, out)
+        return out
+
+
+    def entries(self):
+        """ @brief Lists cache entries
+            @details Temporary files count towards the cache's size (and can
+            be evicted like entries); stale ones are deleted along the way.
+            @returns List of (last use time, size, filename) tuples
+        """
+        out = []
+        now = time.time()
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                ext = os.path.splitext(f)[1]
+                temporary = ext in self.TEMPORARY
+                if ext not in self.SUFFIXES.values() and not temporary:
+                    continue
+                path = os.path.join(root, f)
+                try:                s = os.stat(path)
+                except OSError:     continue
+                if temporary and now - s.st_mtime > self.STALE:
+                    try:                os.remove(path)
+                    except OSError:     pass
+                    continue
+                out.append((s.st_mtime, s.st_size, path))
+        return out
+
+
+    def count(self):
+        """ @brief Returns the total size of cache entries in bytes
+        """
+        return sum(e[1] for e in self.entries())
+
+
+    def evict(self):
+        """ @brief Deletes least recently used entries
+            @details Deletes down to 90% of the limit, so that the directory
+            isn't scanned on every store once the cache is full.
+        """
+        entries = sorted(self.entries())
+        self.size = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if self.size <= 0.9*self.limit:   break
+            try:                os.remove(path)
+            except OSError:     pass
+            self.size -= size
+
+
+    def clear(self):
+        """ @brief Deletes all entries
+        """
+        with self.lock:
+            for mtime, size, path in self.entries():
+                try:                os.remove(path)
+                except OSError:     pass
+            self.size = 0
+
+########################################
+
+    @staticmethod
+    def save_image(img, filename):
+        import numpy as np
+        bounds = [img.xmin, img.xmax, img.ymin, img.ymax, img.zmin, img.zmax]
+        with open(filename, 'wb') as f:
+            np.savez(f, array=img.array, bounds=np.array(
+                [float('nan') if b is None else b for b in bounds]
+            ))
+
+    @staticmethod
+    def load_image(filename):
+        import numpy as np
+        from koko.fab.image import Image
+
+        with np.load(filename) as data:
+            img = Image(0, 0)
+            img.array = data['array']
+            bounds = data['bounds'].tolist()
+        for b, v in zip(['xmin','xmax','ymin','ymax','zmin','zmax'], bounds):
+            setattr(img, b, None if v != v else v)
+        return img
+
+    @staticmethod
+    def save_asdf(asdf, filename):
+        asdf.save(filename)
+
+    @staticmethod
+    def load_asdf(filename):
+        from koko.fab.asdf import ASDF
+        asdf = ASDF.load(filename)
+        asdf.filename = None
+        return asdf
+
+    @staticmethod
+    def save_mesh(mesh, filename):
+        mesh.save(filename)
+
+    @staticmethod
+    def load_mesh(filename):
+        from koko.fab.mesh import Mesh
+        return Mesh.load(filename)
+
+################################################################################
+
+_default = None
+
+def default_cache():
+    """ @brief Returns the cache shared by the GUI's render tasks and panels
+        @details Stored in $KOKO_CACHE_DIR (or kokopelli in the user's cache
+        directory), limited to $KOKO_CACHE_SIZE megabytes (default 1024,
+        0 to disable).
+    """
+    global _default
+    if _default is None:
+        directory = os.environ.get('KOKO_CACHE_DIR') or os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'),
+            'kokopelli'
+        )
+        limit = int(float(os.environ.get('KOKO_CACHE_SIZE', 1024)) * 2**20)
+        _default = DiskCache(directory, limit)
+    return _default
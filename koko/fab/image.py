@@ -2,13 +2,13 @@
 
 import  ctypes
 import  math
+import  os
 import  threading
 
-import  wx
 import  numpy as np
 
 from    koko.c.libfab       import libfab
-from    koko.c.multithread  import multithread
+from    koko.c.multithread  import multithread, threadmap
 from    koko.c.path         import Path as Path_
 
 from    koko.fab.path       import Path
@@ -123,6 +123,7 @@ class Image(object):
         """ @brief Returns (after constructing, if necessary) a wx.Image representation of this Image.
         """
         if self._wx is None:
+            import wx
             img = self.copy(channels=3, depth=8)
             self._wx = wx.ImageFromBuffer(img.width, img.height, img.array)
         return self._wx
@@ -254,29 +255,39 @@ class Image(object):
         """ @brief Creates a ctypes pixel array that looks into the NumPy array.
             @returns Pointer of type **dtype if channels is 1, **dtype[3] if channels is 3
         """
+        return self._row_pointers(flipped=False)
 
-        # Make sure that the array is contiguous in memory
-        if not self.array.flags['C_CONTIGUOUS']:
-            self.array = np.ascontiguousarray(self.array)
 
-        pixels = (self.row_ptype*self.height)()
+    @property
+    def flipped_pixels(self):
+        """ @brief Identical to self.pixels, but flipped on the y axis.
+        """
+        return self._row_pointers(flipped=True)
 
-        start = self.array.ctypes.data
-        stride = self.array.ctypes.strides[0]
 
-        for j in range(self.height):
-            pixels[self.height-j-1] = ctypes.cast(
-                start + j*stride, self.row_ptype
-            )
+    def _row_pointers(self, flipped):
+        """ @brief Builds an array of row pointers into the NumPy array.
+            @details Row addresses are computed in bulk and the ctypes array
+            is a view onto them (which it keeps alive).
+            @param flipped If False, the first pointer is the image's last row
+        """
 
-        return pixels
+        # Rows may be strided (e.g. a cropped view), but each row
+        # needs to be contiguous in memory
+        itemsize = self.array.itemsize
+        if (self.array.strides[2] != itemsize or
+                self.array.strides[1] != itemsize*self.channels):
+            self.array = np.ascontiguousarray(self.array)
 
+        start = self.array.ctypes.data
+        stride = self.array.ctypes.strides[0]
 
-    @property
-    def flipped_pixels(self):
-        """ @brief Identical to self.pixels, but flipped on the y axis.
-        """
-        return (self.row_ptype*self.height)(*self.pixels[::-1])
+        rows = np.arange(self.height, dtype=np.uintp)
+        if not flipped: rows = rows[::-1]
+        addresses = np.ascontiguousarray(start + rows*np.uintp(stride),
+                                         dtype=np.uintp)
+
+        return (self.row_ptype*self.height).from_buffer(addresses)
 
 
 
@@ -339,6 +350,42 @@ class Image(object):
         return out
 
 
+    @classmethod
+    def shade(cls, traces, camera):
+        """ @brief Shades a set of traced shapes into an RGB image.
+            @details Uses the same lighting as the 3D view's shaded
+            meshes; each pixel shows the nearest shape.  Pixels where
+            every ray missed are black.
+            @param traces List of (depth, normals) Image pairs from MathTree.trace
+            @param camera Camera that the shapes were traced with
+            @returns 8-bit 3-channel Image
+        """
+        if not traces:
+            raise TypeError('Invalid argument to shade')
+
+        height, width = traces[0][0].array.shape[:2]
+        out = cls(width, height, channels=3, depth=8)
+        nearest = np.full((height, width), np.inf, dtype=np.float32)
+
+        # Direction from the image plane towards the eye
+        r, u = camera.right, camera.up
+        view = np.array([r.y*u.z - r.z*u.y, r.z*u.x - r.x*u.z,
+                         r.x*u.y - r.y*u.x])
+        view /= np.linalg.norm(view)
+
+        for depth, normals in traces:
+            d = depth.array[:,:,0]
+            closer = d < nearest
+            nearest[closer] = d[closer]
+
+            light = np.clip(normals.array.dot(view), 0, 1)
+            color = np.array(depth.color if depth.color else (255, 255, 255))
+            rgb = 25.5 + 0.9*light[:,:,None]*color
+            out.array[closer] = rgb[closer].clip(0, 255)
+
+        return out
+
+
     @classmethod
     def load(cls, filename):
         """ @brief Loads a png from a file as a 16-bit heightmap.
@@ -383,7 +430,9 @@ class Image(object):
             raise ValueError('Image must be saved with .png extension')
 
         if self.channels == 3:
-            self.wximg.SaveFile(filename, wx.BITMAP_TYPE_PNG)
+            from PIL import Image as PILImage
+            img = self.copy(channels=3, depth=8)
+            PILImage.fromarray(img.array).save(filename)
         else:
             img = self.copy(channels=1, depth=16)
             bounds = (ctypes.c_float*6)(
@@ -417,24 +466,176 @@ class Image(object):
         return out
 
 
-    def finish_cut(self, bit_diameter, overlap, bit_type):
+    def finish_cut(self, bit_diameter, overlap, bit_type, threads=None):
         ''' Calculates xy and yz finish cuts on a 16-bit heightmap
+            (cut lines are split between threads)
         '''
 
         if self.depth != 16 or self.channels != 1:
             raise ValueError('Invalid image type for finish cut '+
                 '(requires 16-bit, 1-channel image)')
+        if threads is None:     threads = os.cpu_count() or 1
+
+        pixels = self.pixels
+        mm_per_pixel = np.float32(self.mm_per_pixel)
+
+        paths = []
+        # YZ cuts (lines of constant x), then XZ cuts (lines of constant y)
+        for axis, across, along in [(0, self.width, self.height),
+                                    (1, self.height, self.width)]:
+            count = libfab.finish_cut_lines(
+                across, mm_per_pixel, bit_diameter, overlap, None)
+            lines = np.zeros(count, dtype=np.int32)
+            libfab.finish_cut_lines(
+                across, mm_per_pixel, bit_diameter, overlap,
+                lines.ctypes.data_as(ctypes.POINTER(ctypes.c_int)))
+            z = np.zeros((count, along), dtype=np.float32)
+
+            bounds = [int(t/float(threads)*count) for t in range(threads)]
+            bounds = [b for b in zip(bounds, bounds[1:] + [count]) if b[1] > b[0]]
+            args = [(self.width, self.height, pixels, mm_per_pixel,
+                     self.mm_per_bit, bit_diameter, bit_type, axis, b[1] - b[0],
+                     lines[b[0]:].ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                     z[b[0]:].ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+                    for b in bounds]
+            multithread(libfab.finish_cut_heights, args)
+
+            run = np.arange(along, dtype=np.float32)*mm_per_pixel
+            for line, heights in zip(lines, z):
+                points = np.empty((along, 3))
+                points[:,1-axis] = run
+                points[:,axis] = np.float32(line)*mm_per_pixel
+                points[:,2] = heights
+                paths.append(Path(points))
 
-        ptr = ctypes.POINTER(ctypes.POINTER(Path_))()
-        path_count = libfab.finish_cut(
-            self.width, self.height, self.pixels,
-            self.mm_per_pixel, self.mm_per_bit,
-            bit_diameter, overlap, bit_type, ptr)
+        return paths
 
-        paths = [Path.from_ptr(ptr[i]) for i in range(path_count)]
-        libfab.free_paths(ptr, path_count)
 
-        return paths
+    def simulate_cut(self, paths, bit_diameter, bit_type, z0=0, stock=None):
+        """ @brief Simulates material removal by a set of toolpaths.
+            @details The end-mill is built exactly as for finish_cut, then
+            swept along each path (in C) on this image's pixel grid.
+            @param paths List of Paths, with x and y in mm from the image's corner
+            @param bit_diameter Tool diameter (in mm)
+            @param bit_type End-mill type (0 for flat, 1 for ball)
+            @param z0 Path z value that corresponds to this image's zmin
+            @param stock Floating-point Image holding the starting stock (modified in place), or None to start from a block of height dz
+            @returns A floating-point Image of remaining material heights (in mm above zmin)
+        """
+        if self.depth != 16 or self.channels != 1:
+            raise ValueError('Invalid image type for cut simulation '+
+                '(requires 16-bit, 1-channel image)')
+
+        if stock is None:
+            stock = self.__class__(self.width, self.height,
+                                   channels=1, depth='f')
+            stock.array[:] = self.dz
+            for b in ['xmin','xmax','ymin','ymax']:
+                setattr(stock, b, getattr(self, b))
+            stock.zmin = stock.zmax = None
+
+        pixels = stock.pixels
+        for p in paths:
+            points = np.ascontiguousarray(p.points[:,:3], dtype=np.float32)
+            if z0:  points[:,2] -= z0
+            libfab.simulate_cut(
+                self.width, self.height, pixels,
+                self.mm_per_pixel, self.mm_per_bit,
+                bit_diameter, bit_type, len(points),
+                points.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+
+        return stock
+
+
+    def rough_stock(self, bit_diameter, step, overlap=0.5, threads=None,
+                    count=-1, top=None, bottom=None):
+        """ @brief Simulates a flat end-mill rough cut of this heightmap.
+            @details Levels are spaced and contoured as in a PathPanel rough
+            cut, from top down to bottom.
+            @param bit_diameter Roughing tool diameter (in mm)
+            @param step Step height (in mm)
+            @param overlap Overlap between offsets
+            @param threads Number of threads used to find contours
+            @param count Number of offsets (or -1 to clear each level)
+            @param top Height of the first level (default zmax)
+            @param bottom Height of the last level (default zmin)
+            @returns A floating-point Image of remaining material heights (in mm above zmin)
+        """
+        if top is None:     top = self.zmax
+        if bottom is None:  bottom = self.zmin
+
+        heights = [top]
+        while heights[-1] > bottom:
+            heights.append(heights[-1] - step)
+        heights[-1] = bottom
+
+        layers = self.contour_layers(heights, bit_diameter, count, overlap,
+                                     threads=threads)
+        stock = None
+        for z, paths in zip(heights, layers):
+            stock = self.simulate_cut(paths, bit_diameter, 0,
+                                      z0=self.zmin - z, stock=stock)
+        return stock
+
+
+    def rest_paths(self, paths, stock, bit_diameter, tolerance=0):
+        """ @brief Trims finish cut paths to the regions where material remains.
+            @param paths List of Paths (from finish_cut)
+            @param stock Floating-point Image of remaining material (e.g. from rough_stock)
+            @param bit_diameter Finishing tool diameter (in mm)
+            @param tolerance Material (in mm) that can be left above the target
+            @returns A list of Paths, keeping only the points at which the tool's footprint touches remaining material
+        """
+        target = self.array.astype(np.float32)*np.float32(self.mm_per_bit)
+        left = self.__class__(self.width, self.height, channels=1, depth=8)
+        left.array[stock.array - target > tolerance] = 255
+        if not left.array.any():    return []
+        for b in ['xmin','xmax','ymin','ymax']:
+            setattr(left, b, getattr(self, b))
+
+        # Distance from each pixel to remaining material, indexed as (j, i)
+        reach = left.distance().array[::-1,:,0]
+        radius = bit_diameter/2 + self.mm_per_pixel
+
+        out = []
+        for p in paths:
+            i = np.clip(np.rint(p.points[:,0]/self.mm_per_pixel).astype(int),
+                        0, self.width - 1)
+            j = np.clip(np.rint(p.points[:,1]/self.mm_per_pixel).astype(int),
+                        0, self.height - 1)
+            out += p.split(reach[j, i] <= radius)
+        return out
+
+
+    def gouges(self, stock, tolerance=0):
+        """ @brief Compares simulated stock against this heightmap.
+            @param stock Floating-point Image from simulate_cut
+            @param tolerance Depth (in mm) below the target that is still acceptable
+            @returns A floating-point Image of gouge depth (in mm), which is zero wherever the stock wasn't cut below the target
+        """
+        target = self.array.astype(np.float32)*np.float32(self.mm_per_bit)
+        depth = target - stock.array
+        depth[depth <= tolerance] = 0
+
+        out = stock.copy()
+        out.array = depth
+        return out
+
+
+    def highlight(self, mask):
+        """ @brief Renders this heightmap in greyscale with a set of pixels marked in red.
+            @param mask Boolean array (or Image) selecting the pixels to mark
+            @returns A three-channel 8-bit Image
+        """
+        if isinstance(mask, Image):     mask = mask.array
+        mask = np.asarray(mask, dtype=bool).reshape(self.height, self.width)
+
+        out = self.copy(channels=3, depth=8)
+        grey = out.array[:,:,0]//2 + 64
+        out.array[:,:,0] = np.where(mask, 255, grey)
+        out.array[:,:,1] = np.where(mask, 0, grey)
+        out.array[:,:,2] = np.where(mask, 0, grey)
+        return out
 
 
     def contour(self, bit_diameter, count=1, overlap=0.5):
@@ -448,7 +649,7 @@ class Image(object):
             raise ValueError('Invalid image type for contour cut '+
                 '(requires floating-point, 1-channel image)')
 
-        max_distance = max(self.array.flatten())
+        max_distance = float(self.array.max())
         levels = [bit_diameter/2]
         step = bit_diameter * overlap
         if count == -1:
@@ -472,40 +673,192 @@ class Image(object):
         return Path.sort(paths)
 
 
-    def distance(self, threads=2):
+    def contour_layers(self, heights, bit_diameter, count=1, overlap=0.5,
+                       threads=None, progress=None):
+        """ @brief Finds offset contours of a heightmap sliced at many heights.
+            @details Equivalent to calling threshold, distance, and contour
+            at each height.  Slices which fill the same set of pixels
+            share one set of contours, and independent slices are processed
+            in parallel.  Slices with a fixed number of offsets are only
+            transformed around their filled pixels; with count = -1 the
+            offsets clear out to the edges of the image, so every other
+            slice is transformed in full.
+            @param heights List of z heights (in image units)
+            @param bit_diameter Tool diameter (in mm)
+            @param count Number of offsets (or -1 to clear the whole image)
+            @param overlap Overlap between offsets
+            @param threads Number of threads to use (default is one per core)
+            @param progress Callback, invoked as progress(done, total)
+            @returns A list of Path lists (one list per height)
+        """
+        if threads is None:     threads = os.cpu_count() or 1
+
+        if self.depth == 'f':
+            raise ValueError('Cannot take threshold of floating-point image')
+        scale = {8: 255, 16: 65535, 32: 4294967295}[self.depth]
+        ks = [int(scale*(z-self.zmin) / self.dz) for z in heights]
+
+        # Slices are filled at every pixel at or above their threshold,
+        # so two slices are identical if no pixel value lies between their
+        # thresholds.  Key each slice by the first pixel value it includes.
+        if self.channels == 1:
+            array = self.array[:,:,0]
+            if self.depth == 32:
+                values = np.unique(array)
+            else:
+                values = np.flatnonzero(np.bincount(array.ravel(),
+                                                    minlength=scale+1))
+            keys = list(np.searchsorted(values, ks))
+            empty = len(values)
+
+            # Row and column maxima give each slice's bounding box
+            row_max = array.max(axis=1)
+            col_max = array.max(axis=0)
+        else:
+            keys, empty = list(range(len(heights))), None
+
+        slices = {}
+        for i, key in enumerate(keys):
+            if key != empty:    slices.setdefault(key, i)
+
+        # With a fixed number of offsets, paths stay near filled pixels
+        # (clearing the whole image reaches its edges, so can't be cropped)
+        if count != -1 and self.channels == 1:
+            radius = bit_diameter/2 + bit_diameter*overlap*(count-1)
+            pad = int(math.ceil(radius*self.pixels_per_mm)) + 2
+        else:
+            pad = None
+
+        mm_per_pixel = 1./self.pixels_per_mm
+        inner = max(1, threads // max(1, len(slices)))
+
+        # Each thread reuses its own distance field buffer
+        local = threading.local()
+
+        def contour_slice(i):
+            z = heights[i]
+            img = self
+
+            if pad is not None:
+                rows = np.flatnonzero(row_max >= ks[i])
+                cols = np.flatnonzero(col_max >= ks[i])
+                r0 = max(0, rows[0] - pad)
+                r1 = min(self.height, rows[-1] + 1 + pad)
+                c0 = max(0, cols[0] - pad)
+                c1 = min(self.width, cols[-1] + 1 + pad)
+
+                # Work on a view of the neighborhood of this slice's
+                # filled pixels, with the same pixel scale.
+                if (r1 - r0)*(c1 - c0) < self.width*self.height:
+                    img = self.__class__(0, 0, channels=1, depth=self.depth)
+                    img.array = self.array[r0:r1, c0:c1]
+                    img.xmin, img.xmax = 0, img.width*mm_per_pixel
+                    img.ymin, img.ymax = 0, img.height*mm_per_pixel
+                    img.zmin, img.zmax = self.zmin, self.zmax
+
+            local.out = img.distance(inner, threshold=z,
+                                     out=getattr(local, 'out', None))
+            paths = local.out.contour(bit_diameter, count, overlap)
+
+            # Move cropped paths back into place, then sort them again
+            # (since the cutting order depends on where the paths are)
+            if img is not self:
+                for p in paths:
+                    p.points[:,0] += c0*mm_per_pixel
+                    p.points[:,1] += (self.height - r1)*mm_per_pixel
+                paths = Path.sort(paths)
+            return paths
+
+        todo = sorted(slices.values())
+        results = dict(zip(todo, threadmap(contour_slice, todo,
+                                           threads, progress)))
+
+        # Assemble the output in the original order, copying paths for
+        # slices that repeat an earlier one.
+        layers = []
+        for i, key in enumerate(keys):
+            if key == empty:
+                layers.append([])
+            elif slices[key] == i:
+                layers.append(results[i])
+            else:
+                layers.append([p.copy() for p in results[slices[key]]])
+        return layers
+
+
+    def distance(self, threads=None, threshold=None, out=None):
         """ @brief Finds the distance transform of an input image.
-            @param threads Number of threads to use
+            @details Columns are processed in cache-sized blocks, split
+            across threads; 8 and 16-bit heightmaps are read directly
+            (without making an intermediate copy).
+            @param threads Number of threads to use (default is one per core)
+            @param threshold Z height at or above which a pixel is considered filled (default is any non-zero pixel)
+            @param out Floating-point Image in which to store the results (reused if the size matches)
             @returns A one-channel floating-point image
         """
-        input = self.copy(depth=8)
+        if threads is None:     threads = os.cpu_count() or 1
+        threads = max(1, min(threads, self.width, self.height))
+
+        if threshold is not None and (self.depth != 16 or self.channels != 1):
+            return self.threshold(threshold).distance(threads, out=out)
+
+        # Pick a first-stage transform that reads this image as-is
+        if self.channels != 1 or self.depth not in (8, 16):
+            input, k = self.copy(channels=1, depth=8), None
+        elif self.depth == 8:
+            input, k = self, None
+        elif threshold is not None:
+            k = int(65535*(threshold-self.zmin) / self.dz)
+            if k > 65535:
+                # Nothing reaches the threshold, so every pixel is empty
+                input, k = self.__class__(self.width, self.height,
+                                          channels=1, depth=8), None
+            else:
+                input, k = self, max(0, k)
+        else:
+            # Matches the 8-bit conversion (which drops the low byte)
+            input, k = self, 256
+        pixels = input.pixels
 
         # Temporary storage for G lattice
         g = self.__class__(
             self.width, self.height,
             channels=1, depth=32
         )
-        ibounds = [int(t/float(threads)*self.width) for t in range(threads)]
-        ibounds = list(zip(ibounds, ibounds[1:] + [self.width]))
+        g_pixels = g.pixels
 
-        args1 = [(i[0], i[1], self.width, self.height, input.pixels, g.pixels)
-                 for i in ibounds]
+        # Split columns on block boundaries, so threads don't share cache lines
+        block = 64
+        ibounds = sorted(set(
+            int(t/float(threads)*self.width) // block * block
+            for t in range(threads)))
+        ibounds = list(zip(ibounds, ibounds[1:] + [self.width]))
 
-        multithread(libfab.distance_transform1, args1)
+        if k is None:
+            args1 = [(i[0], i[1], self.width, self.height, pixels, g_pixels)
+                     for i in ibounds]
+            multithread(libfab.distance_transform1, args1)
+        else:
+            args1 = [(i[0], i[1], self.width, self.height, pixels, k, g_pixels)
+                     for i in ibounds]
+            multithread(libfab.distance_transform1_16, args1)
 
-        del input
+        del input, pixels
 
-        output = self.copy(depth='f')
+        if (out is None or out.depth != 'f' or out.channels != 1 or
+                out.width != self.width or out.height != self.height):
+            out = self.__class__(self.width, self.height, channels=1, depth='f')
+        for b in ['xmin','xmax','ymin','ymax']:
+            setattr(out, b, getattr(self, b))
+        out.zmin = out.zmax = None
+        out.color = [c for c in self.color] if self.color else None
 
         jbounds = [int(t/float(threads)*self.height) for t in range(threads)]
         jbounds = list(zip(jbounds, jbounds[1:] + [self.height]))
 
         args2 = [(j[0], j[1], self.width, self.pixels_per_mm,
-                 g.pixels, output.pixels) for j in jbounds]
+                 g_pixels, out.pixels) for j in jbounds]
 
         multithread(libfab.distance_transform2, args2)
 
-        output.zmin = output.zmax = None
-
-        return output
-
-
+        return out
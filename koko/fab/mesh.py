@@ -5,6 +5,8 @@ import  operator
 import  os
 import  tempfile
 
+import  numpy as np
+
 from    koko.struct     import Struct
 from functools import reduce
 
@@ -38,11 +40,44 @@ class Mesh(object):
         # Array of mesh children (for multi-scale meshes)
         self.children = []
 
+        ## @var arrays
+        # Vertex and triangle arrays holding the C structure's data,
+        # or None if libfab allocated it
+        self.arrays = None
+
     def __del__(self):
         """ @brief Mesh destructor
         """
-        if libfab and self.ptr:
+        self.release()
+
+    def release(self):
+        """ @brief Frees the C mesh structure (unless its data belongs to
+            numpy arrays, which are freed along with them)
+        """
+        if libfab and self.ptr and self.arrays is None:
             libfab.free_mesh(self.ptr)
+        self.ptr = None
+        self.arrays = None
+
+    @classmethod
+    def from_arrays(cls, vertices, triangles, bounds, color=None):
+        """ @brief Makes a mesh that uses numpy arrays as its data, without copying them
+            @param vertices Array of 6 floats per vertex (position and normal)
+            @param triangles Array of 3 uint32 vertex indices per triangle
+            @param bounds X, Y, Z bounds as [xmin, xmax, ymin, ymax, zmin, zmax]
+            @param color Draw color (or None)
+        """
+        mesh = _Mesh(
+            vertices.ctypes.data_as(ctypes.POINTER(ctypes.c_float)),
+            len(vertices) // 6, len(vertices) // 6,
+            triangles.ctypes.data_as(ctypes.POINTER(ctypes.c_uint32)),
+            len(triangles) // 3, len(triangles) // 3,
+            Interval(*bounds[0:2]), Interval(*bounds[2:4]),
+            Interval(*bounds[4:6])
+        )
+        out = cls(ctypes.pointer(mesh), color)
+        out.arrays = vertices, triangles
+        return out
 
     @property
     def X(self):
@@ -95,21 +130,23 @@ class Mesh(object):
 
 ################################################################################
 
-    def refine(self):
+    def refine(self, event=None, c_event=None):
         """ @brief Attempts to refine the mesh object, saving this mesh
             in a temporary file.
+            @param event threading.Event that aborts refinement if set (leaving the mesh unchanged)
+            @param c_event threading.Event that halts rendering in C functions
         """
         if self.cached is None:
             self.cached = tempfile.NamedTemporaryFile()
             self.save(self.cached.name)
 
         if self.source.type is MathTree:
-            self.refine_math()
+            self.refine_math(event, c_event)
         elif self.source.type is ASDF:
-            self.refine_asdf()
+            self.refine_asdf(event, c_event)
 
 
-    def refine_math(self):
+    def refine_math(self, event=None, c_event=None):
         """ @brief Refines a mesh based on a math tree
             @details Splits the mesh's bounding box then renders both subregions
             at a higher detail level, saving them in self.children
@@ -128,9 +165,12 @@ class Mesh(object):
         meshes = []
         for s in subregions:
             asdf = self.source.expr.asdf(
-                region=s, mm_per_unit=self.source.scale
+                region=s, mm_per_unit=self.source.scale, interrupt=c_event
             )
-            mesh = asdf.triangulate()
+            if event is not None and event.is_set():    return
+            mesh = asdf.triangulate(interrupt=c_event)
+            if event is not None and event.is_set():    return
+            self.source.expr.normals(mesh, self.source.scale)
 
             mesh.source = Struct(
                 type=MathTree,
@@ -141,11 +181,10 @@ class Mesh(object):
             meshes.append(mesh)
 
         self.children = meshes
-        libfab.free_mesh(self.ptr)
-        self.ptr = None
+        self.release()
 
 
-    def refine_asdf(self):
+    def refine_asdf(self, event=None, c_event=None):
         """ @brief Refines a mesh from an .asdf file
             @details Attempts to load .asdf files at a higher recursion level
             and assigns them to self.children
@@ -154,15 +193,15 @@ class Mesh(object):
         for i in range(8):
             filename = self.source.file.replace('.asdf', '%i.asdf' % i)
             asdf = ASDF.load(filename)
-            mesh = asdf.triangulate()
+            mesh = asdf.triangulate(interrupt=c_event)
+            if event is not None and event.is_set():    return
             mesh.source = Struct(
                 type=ASDF, file=filename, depth=self.source.depth+1
             )
             meshes.append(mesh)
 
         self.children = meshes
-        libfab.free_mesh(self.ptr)
-        self.ptr = None
+        self.release()
 
 
     def expandable(self):
@@ -193,8 +232,8 @@ class Mesh(object):
             mesh = self.collapse_asdf()
 
         # Steal the mesh object by moving pointers around
-        self.ptr = mesh.ptr
-        mesh.ptr = None
+        self.ptr, self.arrays = mesh.ptr, mesh.arrays
+        mesh.ptr, mesh.arrays = None, None
         self.children = []
 
 
@@ -214,7 +253,9 @@ class Mesh(object):
         asdf = self.source.expr.asdf(
             region=region, mm_per_unit=self.source.scale
         )
-        return asdf.triangulate()
+        mesh = asdf.triangulate()
+        self.source.expr.normals(mesh, self.source.scale)
+        return mesh
 
 
     def collapse_asdf(self):
@@ -275,6 +316,62 @@ class Mesh(object):
         return m
 
 
+class STLWriter(object):
+    ''' @class STLWriter
+        @brief Streams meshes into a single binary STL file.
+        @details The triangle count is patched into the header when the
+        file is closed, so meshes can be written as they are generated.
+        The output matches Mesh.merge(meshes).save_stl(filename).
+        Use as a context manager or call close() when finished.
+    '''
+
+    ## @var header
+    # 80-byte binary STL header
+    header = (b'This is a binary STL file made in kokopelli    \n'
+              b'(github.com/mkeeter/kokopelli)\n\n')
+
+    ## @var dtype
+    # Binary STL triangle record (normal, vertices, attribute bytes)
+    dtype = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)),
+                      ('attribute', '<u2')])
+
+    def __init__(self, filename, buffering=1 << 20):
+        """ @brief Opens an STL file and writes a placeholder header
+            @param filename Target filename
+            @param buffering Output buffer size (in bytes)
+        """
+        self.file = open(filename, 'wb', buffering=buffering)
+        self.file.write(self.header + b'\0\0\0\0')
+        self.tcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, mesh):
+        """ @brief Appends a mesh's triangles to the file
+            @param mesh Mesh object
+        """
+        if not mesh.tcount:  return
+        vdata = np.ctypeslib.as_array(mesh.vdata, (mesh.vcount, 6))
+        tdata = np.ctypeslib.as_array(mesh.tdata, (mesh.tcount, 3))
+
+        out = np.zeros(mesh.tcount, dtype=self.dtype)
+        out['vertices'] = vdata[tdata, :3]
+        self.file.write(out.tobytes())
+        self.tcount += mesh.tcount
+
+    def close(self):
+        """ @brief Writes the triangle count and closes the file
+        """
+        if self.file.closed:    return
+        self.file.seek(len(self.header))
+        self.file.write(np.uint32(self.tcount).tobytes())
+        self.file.close()
+
+
 from    koko.c.libfab   import libfab
 from    koko.c.region   import Region
 from    koko.c.mesh     import Mesh as _Mesh
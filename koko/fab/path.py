@@ -16,6 +16,15 @@ class Path(object):
     def reverse(self):
         return Path(self.points[::-1], self.closed)
 
+    def split(self, mask):
+        ''' Splits this path into runs of points where mask is True.
+            Returns a list of open Paths.
+        '''
+        mask = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+        edges = np.flatnonzero(np.diff(mask))
+        return [Path(self.points[start:end].copy())
+                for start, end in zip(edges[::2], edges[1::2])]
+
     def __getitem__(self, i):
         return self.points[i]
 
@@ -26,36 +35,119 @@ class Path(object):
     def from_ptr(cls, ptr):
         ''' Imports a path from a path linked list structure.
         '''
-        xyz = lambda p: [[p.contents.x, p.contents.y, p.contents.z]]
-
         start = ptr
-        points = np.array(xyz(ptr))
+        points = []
+        closed = False
 
-        ptr = ptr.contents.next
-
-        while ptr.contents != start.contents:
-            points = np.vstack( (points, xyz(ptr)) )
+        # Collect coordinates in a list and convert once at the end
+        # (stacking one row at a time is quadratic in the path length)
+        while True:
+            p = ptr.contents
+            points.append((p.x, p.y, p.z))
 
             # Advance through the linked list
-            if bool(ptr.contents.next): ptr = ptr.contents.next
-            else:                       break
+            if not bool(p.next):    break
+            ptr = p.next
+            if ptr.contents == start.contents:
+                closed = True
+                break
+
+        return cls(np.array(points, dtype=float), closed)
+
+
+    def simplify(self, tolerance):
+        ''' Returns a simplified copy of this path.
+            Uses the Ramer-Douglas-Peucker algorithm, so no discarded
+            point is more than tolerance away from the simplified path.
+        '''
+        if tolerance <= 0 or len(self.points) < 3:
+            return self.copy()
+
+        # Closed paths are simplified as if they returned to their start
+        points = self.points
+        if self.closed:
+            points = np.vstack([points, points[:1]])
+
+        keep = _rdp(points[:,:3], tolerance)
+        if self.closed:     keep = keep[:-1]
+
+        return Path(self.points[keep], self.closed)
+
 
-        closed = (ptr.contents == start.contents)
+    def moves(self, tolerance=0, arcs=False, min_points=4):
+        ''' Converts the path into a list of machine moves.
 
-        return cls(points, closed)
+            Each move is a tuple (point, arc).  arc is None for linear
+            moves; otherwise it's a tuple (i, j, ccw) where (i, j) is the
+            arc center relative to the previous point and ccw is True for
+            counterclockwise motion in the XY plane.
+
+            Linear runs are simplified to the given tolerance.  If arcs
+            is True, runs of at least min_points points that lie (within
+            tolerance) on a circular arc at constant z are replaced by a
+            single arc move.
+        '''
+        moves = []
+        for points, arc in self.runs(tolerance, arcs, min_points):
+            if arc is None: moves.extend((pt, None) for pt in points)
+            else:           moves.append((points[0], arc))
+        return moves
+
+
+    def runs(self, tolerance=0, arcs=False, min_points=4):
+        ''' Converts the path into a list of runs of machine moves.
+
+            Equivalent to moves, but consecutive linear moves are grouped
+            into a single (points, None) tuple, where points is an n x 3
+            array.  Arc moves are (points, arc) tuples with a single point.
+        '''
+        points = self.points[:,:3]
+        if not arcs or tolerance <= 0:
+            if tolerance > 0:
+                points = points[_rdp(points, tolerance)]
+            return [(points, None)]
+
+        runs = []
+        def flush(start, end, first=False):
+            run = points[start:end+1]
+            if len(run) > 2:    run = run[_rdp(run, tolerance)]
+            if not first:       run = run[1:]
+            if len(run):        runs.append((run, None))
+
+        # Arcs can only start where their first min_points points fit one
+        starts = np.flatnonzero(_arc_windows(points, tolerance, min_points))
+
+        i = start = 0
+        while i < len(points) - 1:
+            n = np.searchsorted(starts, i)
+            if n == len(starts):    break
+            i = int(starts[n])
+            j, arc = _longest_arc(points, i, tolerance, min_points)
+            if arc is None:
+                i += 1
+                continue
+            flush(start, i, start == 0)
+            cx, cy, ccw = arc
+            runs.append(
+                (points[j:j+1], (cx - points[i][0], cy - points[i][1], ccw))
+            )
+            i = start = j
+        flush(start, len(points) - 1, start == 0)
+
+        return runs
 
 
     @property
-    def xmin(self): return float(min(self.points[:,0]))
+    def xmin(self): return float(self.points[:,0].min())
     @property
-    def xmax(self): return float(max(self.points[:,0]))
+    def xmax(self): return float(self.points[:,0].max())
     @property
     def dx(self):   return self.xmax - self.xmin
 
     @property
-    def ymin(self): return float(min(self.points[:,1]))
+    def ymin(self): return float(self.points[:,1].min())
     @property
-    def ymax(self): return float(max(self.points[:,1]))
+    def ymax(self): return float(self.points[:,1].max())
     @property
     def dy(self):   return self.ymax - self.ymin
 
@@ -79,22 +171,24 @@ class Path(object):
         ymax = np.array([[p.ymax for p in paths]]*len(paths))
         before &= ymax > ymax.transpose()
 
+        # Number of unfinished paths that need to be cut before each path
+        blockers = before.sum(axis=0)
+        starts = np.array([p.points[0][0:2] for p in paths]).reshape(-1, 2)
+
         sorted = []
 
-        done = [False]*len(paths)
-        pos = np.array([[0, 0]])
+        done = np.zeros(len(paths), dtype=bool)
+        pos = np.array([0, 0])
 
         for i in range(len(paths)):
             # Calculate the distances from our current path to the
             # startpoints of other paths (don't have anything before
             # them and aren't already done)
-            distances = [
-                float('inf') if (any(before[:,i]) or done[i])
-                else sum(pow(pos - paths[i].points[0][0:2], 2).flatten())
-                for i in range(len(paths))
-            ]
-            index = distances.index(min(distances))
+            distances = ((pos - starts)**2).sum(axis=1)
+            distances[(blockers > 0) | done] = float('inf')
+            index = int(np.argmin(distances))
             done[index] = True
+            blockers -= before[index,:]
             before[index,:] = False
             sorted.append(paths[index])
 
@@ -105,7 +199,7 @@ class Path(object):
         return sorted
 
     @classmethod
-    def save_merged_svg(cls, filename, paths, border=0):
+    def save_merged_svg(cls, filename, paths, border=0, relative=False):
         xmin = min(p.xmin for p in paths)
         xmax = max(p.xmax for p in paths)
         ymin = min(p.ymin for p in paths)
@@ -119,33 +213,21 @@ class Path(object):
             ymin -= dy * border
             ymax += dy * border
 
-        cls.write_svg_header(filename, xmax-xmin, ymax-ymin)
-        for p in paths:
-            p.write_svg_contour(filename, xmin, ymax)
-        cls.write_svg_footer(filename)
+        with SVGWriter(filename, xmax-xmin, ymax-ymin, relative) as svg:
+            for p in paths:
+                svg.write_path(p, xmin, ymax)
 
-    def save_svg(self, filename):
-        self.write_svg_header(filename, self.dx, self.dy)
-        self.write_svg_contour(filename, self.xmin, self.ymax)
-        self.write_svg_footer(filename)
+    def save_svg(self, filename, relative=False):
+        with SVGWriter(filename, self.dx, self.dy, relative) as svg:
+            svg.write_path(self, self.xmin, self.ymax)
 
     @classmethod
     def write_svg_header(cls, filename, dx, dy):
         ''' Writes the header to an SVG file.
             dx and dy should be in mm.
         '''
-        scale = 90 / 25.4
         with open(filename, 'w', encoding='utf-8') as f:
-            f.write(
-"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-<!-- Created with kokopelli (kokompe.cba.mit.edu) -->
-<svg
-    xmlns   = "http://www.w3.org/2000/svg"
-    version = "1.1"
-    width   = "{dx:g}mm"
-    height  = "{dy:g}mm"
-    viewBox = "0 0 {view_dx:g} {view_dy:g}"
->""".format(dx=dx, dy=dy, view_dx=dx*scale, view_dy=dy*scale))
+            f.write(SVGWriter.header(dx, dy))
 
 
     @classmethod
@@ -153,32 +235,328 @@ class Path(object):
         ''' Writes the footer to an SVG file.
         '''
         with open(filename, 'a', encoding='utf-8') as f:
-            f.write('</svg>')
+            f.write(SVGWriter.footer())
 
 
     def write_svg_contour(self, filename, xmin, ymax,
-                          stroke=0.1, color=(0,0,0)):
+                          stroke=0.1, color=(0,0,0), relative=False):
         ''' Saves a single SVG contour at 90 DPI.
+            When writing many contours, use an SVGWriter instead
+            (which keeps a single buffered stream open).
         '''
-        scale = 90/25.4
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(SVGWriter.element(self, xmin, ymax, stroke, color,
+                                      relative))
 
-        xy = lambda p: (scale*(p[0]-xmin), scale*(ymax-p[1]))
 
-        with open(filename, 'a', encoding='utf-8') as f:
+    def svg_data(self, xmin, ymax, relative=False, precision=3):
+        ''' Returns the SVG path data ("d" attribute) for this path.
 
-            # Write the opening statement for this path
-            f.write(
-'  <path style="stroke:rgb(%i,%i,%i); stroke-width:%g; fill:none"'
-                % (color[0], color[1], color[2], stroke*scale)
-            )
+            Coordinates are scaled to 90 DPI and formatted in bulk.
+            If relative is True, points after the first are written as
+            a single relative lineto with deltas quantized to the given
+            number of decimal places (so that rounding doesn't drift).
+        '''
+        scale = SVGWriter.scale
+        xy = np.empty((len(self.points), 2))
+        xy[:,0] = scale*(self.points[:,0] - xmin)
+        xy[:,1] = scale*(ymax - self.points[:,1])
+
+        if relative:
+            q = np.rint(xy * 10**precision).astype(np.int64)
+            deltas = np.diff(q, axis=0) / float(10**precision)
+            d = 'm%.10g %.10g' % tuple(q[0] / float(10**precision))
+            if len(deltas):
+                d += ' l' + ('%.10g %.10g ' * len(deltas))[:-1] % tuple(
+                    deltas.ravel())
+            if self.closed: d += ' z'
+        else:
+            d = 'M%g %g' % tuple(xy[0])
+            if len(xy) > 1:
+                d += (' L%g %g' * (len(xy) - 1)) % tuple(xy[1:].ravel())
+            if self.closed: d += ' Z'
+        return d
+
+################################################################################
+
+def _rdp(points, tolerance):
+    ''' Ramer-Douglas-Peucker simplification.
+        Returns a boolean mask of points to keep (endpoints are always kept).
+
+        Every unfinished interval is split in the same vectorized pass.
+        Any point farther than tolerance from the chord is a valid split,
+        so ties for the farthest point (as on zigzags) are broken towards
+        the middle of the interval.  If a split leaves a piece with most
+        of its parent's points, that piece is split within its middle
+        half (when it can be), so the number of passes stays logarithmic
+        rather than peeling one point per pass.
+    '''
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Constant coordinates (like z on a flat path) don't affect distances
+    coords = [np.ascontiguousarray(c, dtype=np.float64) for c in points.T
+              if c.size and c.min() != c.max()]
+    if not coords:  return keep
+    tolerance2 = tolerance*tolerance
+
+    start, end = np.array([0]), np.array([len(points) - 1])
+    lopsided = np.array([False])
+    while len(start):
+        # Interior points of every interval, grouped by interval
+        counts = end - start - 1
+        offsets = np.cumsum(counts) - counts
+        index = np.arange(counts.sum()) + np.repeat(start + 1 - offsets, counts)
+
+        # Squared distance from each point to its interval's chord
+        ab = [c[end] - c[start] for c in coords]
+        L2 = sum(v*v for v in ab)
+        scale = np.divide(1, L2, out=np.zeros_like(L2), where=L2 > 0)
+        ap = [c[index] - np.repeat(c[start], counts) for c in coords]
+        ab = [np.repeat(v, counts) for v in ab]
+        t = np.repeat(scale, counts)
+        t *= sum(u*v for u, v in zip(ap, ab))
+        np.clip(t, 0, 1, out=t)
+        d2 = sum((u - t*v)**2 for u, v in zip(ap, ab))
+
+        # Lopsided intervals only consider their middle half, if it
+        # has any points that need to be kept
+        score = np.abs(2*index - np.repeat(start + end, counts))
+        outer = score > np.repeat((end - start)//2, counts)
+        middle = np.logical_or.reduceat((d2 > tolerance2) & ~outer, offsets)
+        d2[outer & np.repeat(lopsided & middle, counts)] = 0
+
+        # Pick the point nearest the middle of each interval among those
+        # (nearly) tied for farthest from the chord
+        farthest = np.maximum.reduceat(d2, offsets)
+        candidate = d2 > tolerance2
+        candidate &= d2 >= 0.99**2*np.repeat(farthest, counts)
+        score[~candidate] = 2*len(points)
+        best = np.minimum.reduceat(score, offsets)
+        chosen = np.flatnonzero(candidate & (score == np.repeat(best, counts)))
+        group = np.searchsorted(offsets, chosen, side='right') - 1
+        first = np.r_[True, group[1:] != group[:-1]] if len(chosen) else []
+        split, k = group[first], index[chosen[first]]
+
+        keep[k] = True
+        size = 7*(end[split] - start[split])
+        start = np.concatenate([start[split], k])
+        end = np.concatenate([k, end[split]])
+        lopsided = 8*(end - start) > np.concatenate([size, size])
+        unfinished = end - start >= 2
+        start, end = start[unfinished], end[unfinished]
+        lopsided = lopsided[unfinished]
+
+    return keep
+
+
+def _fit_arc(points, tolerance):
+    ''' Checks whether a set of points lies on a circular arc in the XY plane.
+        Returns (cx, cy, ccw) or None.
+    '''
+    x, y, z = points[:,0], points[:,1], points[:,2]
+    if z.max() - z.min() > tolerance:   return None
+
+    # Circle through the first, middle, and last points
+    m = len(points)//2
+    ux, uy = _circle(x[0], y[0], x[m], y[m], x[-1], y[-1])
+    if ux is None:  return None
+
+    # Every point must be on the circle
+    rx, ry = x - ux, y - uy
+    radii = np.sqrt(rx*rx + ry*ry)
+    r = radii[0]
+    if max(radii.max() - r, r - radii.min()) > tolerance:   return None
+
+    # Nearly-straight runs are better left as lines
+    if r > 1e3 * max(tolerance, x.max() - x.min(), y.max() - y.min()):
+        return None
+
+    # The arc must sweep in a single direction and not overlap itself
+    cross = rx[:-1]*ry[1:] - ry[:-1]*rx[1:]
+    dot = rx[:-1]*rx[1:] + ry[:-1]*ry[1:]
+    if not ((cross > 0).all() or (cross < 0).all()):    return None
+    if np.abs(np.arctan2(cross, dot)).sum() >= 2*np.pi - 1e-3:
+        return None
+
+    # Chords between samples must stay close to the arc
+    dx, dy = x[1:] - x[:-1], y[1:] - y[:-1]
+    chord2 = (dx*dx + dy*dy).max()
+    if r - np.sqrt(max(r*r - chord2/4, 0)) > tolerance:    return None
+
+    return ux, uy, bool(cross[0] > 0)
+
+
+def _circle(ax, ay, bx, by, cx, cy):
+    ''' Finds the center of the circle through three points.
+        Returns (ux, uy), or (None, None) if the points are collinear.
+    '''
+    d = 2*(ax*(by - cy) + bx*(cy - ay) + cx*(ay - by))
+    if abs(d) < 1e-12:  return None, None
+    a2, b2, c2 = ax*ax + ay*ay, bx*bx + by*by, cx*cx + cy*cy
+    return ((a2*(by - cy) + b2*(cy - ay) + c2*(ay - by)) / d,
+            (a2*(cx - bx) + b2*(ax - cx) + c2*(bx - ax)) / d)
+
+
+def _arc_windows(points, tolerance, min_points):
+    ''' Checks every run of min_points consecutive points at once,
+        applying the same tests as _fit_arc.
+        Returns a boolean array with one entry per possible start point.
+    '''
+    n = len(points) - min_points + 1
+    if n <= 0:  return np.zeros(0, dtype=bool)
+
+    # Column k holds the k'th point of every window
+    x, y, z = [[points[k:k+n,a] for k in range(min_points)] for a in range(3)]
+    span = lambda c: np.maximum.reduce(c) - np.minimum.reduce(c)
+    ok = span(z) <= tolerance
+
+    m = min_points//2
+    ax, ay, bx, by, cx, cy = x[0], y[0], x[m], y[m], x[-1], y[-1]
+    d = 2*(ax*(by - cy) + bx*(cy - ay) + cx*(ay - by))
+    ok &= np.abs(d) >= 1e-12
+    d[~ok] = 1
+    a2, b2, c2 = ax*ax + ay*ay, bx*bx + by*by, cx*cx + cy*cy
+    ux = (a2*(by - cy) + b2*(cy - ay) + c2*(ay - by)) / d
+    uy = (a2*(cx - bx) + b2*(ax - cx) + c2*(bx - ax)) / d
+
+    rx = [c - ux for c in x]
+    ry = [c - uy for c in y]
+    radii = [np.sqrt(u*u + v*v) for u, v in zip(rx, ry)]
+    r = radii[0]
+    ok &= np.maximum.reduce([np.abs(v - r) for v in radii]) <= tolerance
+    ok &= r <= 1e3 * np.maximum(tolerance, np.maximum(span(x), span(y)))
+
+    cross = [rx[k]*ry[k+1] - ry[k]*rx[k+1] for k in range(min_points - 1)]
+    dot = [rx[k]*rx[k+1] + ry[k]*ry[k+1] for k in range(min_points - 1)]
+    ok &= (np.logical_and.reduce([c > 0 for c in cross]) |
+           np.logical_and.reduce([c < 0 for c in cross]))
+    ok &= sum(np.abs(np.arctan2(c, v)) for c, v in zip(cross, dot)) \
+          < 2*np.pi - 1e-3
+
+    chord2 = np.maximum.reduce([(x[k+1] - x[k])**2 + (y[k+1] - y[k])**2
+                                for k in range(min_points - 1)])
+    ok &= r - np.sqrt(np.maximum(r*r - chord2/4, 0)) <= tolerance
+    return ok
+
+
+def _longest_arc(points, i, tolerance, min_points):
+    ''' Finds the longest arc starting at point i.
+        Returns (j, arc) where j is the arc's final index, or (i, None).
+    '''
+    n = len(points)
+    lo = i + min_points - 1
+    if lo >= n:     return i, None
+    arc = _fit_arc(points[i:lo+1], tolerance)
+    if arc is None: return i, None
+
+    # Gallop forward, then bisect to find the last valid endpoint
+    step = min_points
+    hi = lo + step
+    while hi < n:
+        a = _fit_arc(points[i:hi+1], tolerance)
+        if a is None:   break
+        lo, arc = hi, a
+        step *= 2
+        hi = lo + step
+    hi = min(hi, n)
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        a = _fit_arc(points[i:mid+1], tolerance)
+        if a is None:   hi = mid
+        else:           lo, arc = mid, a
+
+    return lo, arc
+
+################################################################################
+
+class SVGWriter(object):
+    ''' @class SVGWriter
+        @brief Streams paths into a single SVG file at 90 DPI.
+        @details Keeps one buffered stream open for the whole file,
+        rather than reopening it for every contour.  Use as a context
+        manager or call close() when finished.
+    '''
+
+    ## @var scale
+    # SVG user units per mm (90 DPI)
+    scale = 90/25.4
+
+    def __init__(self, filename, dx, dy, relative=False, precision=3,
+                 buffering=1 << 20):
+        """ @brief Opens an SVG file and writes its header
+            @param filename Target filename
+            @param dx Width (in mm)
+            @param dy Height (in mm)
+            @param relative Boolean determining whether path data uses relative commands
+            @param precision Decimal places for relative path data
+            @param buffering Output buffer size (in bytes)
+        """
+        self.relative  = relative
+        self.precision = precision
+        self.file = open(filename, 'w', encoding='utf-8', buffering=buffering)
+        self.file.write(self.header(dx, dy))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
-            # Write the first point of the path
-            f.write(
-'        d="M%g %g' % xy(self.points[0])
-            )
+    @classmethod
+    def header(cls, dx, dy):
+        """ @brief Returns an SVG header string (dx and dy in mm)
+        """
+        return (
+"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!-- Created with kokopelli (kokompe.cba.mit.edu) -->
+<svg
+    xmlns   = "http://www.w3.org/2000/svg"
+    version = "1.1"
+    width   = "{dx:g}mm"
+    height  = "{dy:g}mm"
+    viewBox = "0 0 {view_dx:g} {view_dy:g}"
+>""".format(dx=dx, dy=dy, view_dx=dx*cls.scale, view_dy=dy*cls.scale))
 
-            # Write the rest of the points
-            for pt in self.points[1:]:  f.write(' L%g %g' % xy(pt))
+    @staticmethod
+    def footer():
+        return '</svg>'
 
-            if self.closed: f.write(' Z')
-            f.write('"/>\n')
+    @classmethod
+    def element(cls, path, xmin, ymax, stroke=0.1, color=(0,0,0),
+                relative=False, precision=3):
+        """ @brief Returns a single SVG path element as a string
+        """
+        return (
+'  <path style="stroke:rgb(%i,%i,%i); stroke-width:%g; fill:none"'
+            % (color[0], color[1], color[2], stroke*cls.scale) +
+'        d="%s"/>\n' % path.svg_data(xmin, ymax, relative, precision)
+        )
+
+    def write_path(self, path, xmin, ymax, stroke=0.1, color=(0,0,0)):
+        """ @brief Writes a single contour to the file
+            @param path Path to write
+            @param xmin Left edge of the drawing (in mm)
+            @param ymax Top edge of the drawing (in mm)
+            @param stroke Stroke width (in mm)
+            @param color Stroke color tuple
+        """
+        self.file.write(self.element(path, xmin, ymax, stroke, color,
+                                     self.relative, self.precision))
+
+    def write_paths(self, paths, xmin, ymax, stroke=0.1, color=(0,0,0)):
+        """ @brief Writes a list of contours to the file
+        """
+        self.file.write(''.join(
+            self.element(p, xmin, ymax, stroke, color,
+                         self.relative, self.precision)
+            for p in paths
+        ))
+
+    def close(self):
+        """ @brief Writes the footer and closes the file
+        """
+        if self.file.closed:    return
+        self.file.write(self.footer())
+        self.file.close()
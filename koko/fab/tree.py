@@ -4,6 +4,7 @@ import  ctypes
 import  os, sys
 import  threading
 import  math
+import  re
 import  queue
 
 from    koko.c.libfab       import libfab
@@ -13,6 +14,9 @@ from    koko.c.multithread  import multithread, threadsafe
 
 ################################################################################
 
+# An affine map (M followed by twelve constants) at the start of a math string
+_AFFINE = re.compile('M' + r'f(-?(?:inf|[0-9.]+(?:e[-+]?[0-9]+)?))'*12)
+
 def forcetree(f):
     ''' A decorator that forces function arguments to be
         of MathTree type using MathTree.wrap
@@ -74,6 +78,16 @@ class MathTree(object):
 
         self._str   = None
         self._ptr    = None
+        self._exact  = None
+
+        ## @var simplified
+        # Number of nodes removed when simplifying the parsed tree
+        self.simplified = 0
+        self._simplified_bounds = None
+
+        # Bounds before the affine map at the start of the math string,
+        # that map, and the bounds it gave (or None)
+        self._affine = None
 
         ## @var bounds
         # X, Y, Z bounds (or None)
@@ -84,17 +98,45 @@ class MathTree(object):
     @threadsafe
     def __del__(self):
         """ @brief MathTree destructor """
-        if self._ptr is not None and libfab is not None:
-            libfab.free_tree(self.ptr)
+        if libfab is None:  return
+        if self._ptr is not None:
+            libfab.free_tree(self._ptr)
+        if self._exact is not None:
+            libfab.free_tree(self._exact)
 
     @property
     def ptr(self):
         """ @brief Parses self.math and returns a pointer to a MathTree structure
+            @details The tree is simplified after parsing, dropping
+            branches that are dominated within the current bounds (and
+            storing the number of nodes removed in self.simplified).
+            If the bounds have changed since then, the tree is re-parsed.
         """
+        if self._ptr is not None and self._simplified_bounds != self.bounds:
+            libfab.free_tree(self._ptr)
+            self._ptr = self._str = None
         if self._ptr is None:
             self._ptr = libfab.parse(self.math)
+            self._simplified_bounds = self.bounds
+            if self._ptr:
+                inf = float('inf')
+                lower = [-inf if v is None else v for v in self.bounds[::2]]
+                upper = [inf if v is None else v for v in self.bounds[1::2]]
+                self.simplified = libfab.simplify_tree(
+                    self._ptr, *[Interval(*i) for i in zip(lower, upper)]
+                )
         return self._ptr
 
+    @property
+    def exact_ptr(self):
+        """ @brief Parses self.math (without simplifying it) and returns a pointer to a MathTree structure
+            @details Simplification only preserves the tree's value within
+            its bounds, so queries that may look outside them use this tree.
+        """
+        if self._exact is None:
+            self._exact = libfab.parse(self.math)
+        return self._exact
+
     ############################################################################
 
     @property
@@ -240,6 +282,14 @@ class MathTree(object):
     @forcetree
     def pow(cls, A, B): return cls('p'+A.math+B.math)
 
+    @classmethod
+    @forcetree
+    def mod(cls, A, B): return cls('%'+A.math+B.math)
+
+    @classmethod
+    @forcetree
+    def atan2(cls, A, B):   return cls('A'+A.math+B.math)
+
     @classmethod
     @forcetree
     def sqrt(cls, A):   return cls('r'+A.math)
@@ -276,6 +326,96 @@ class MathTree(object):
     @forcetree
     def atan(cls, A):   return cls('T'+A.math)
 
+    @classmethod
+    def union(cls, shapes):
+        """ @brief Combines many shapes into a single union
+            @details Shapes are grouped into a bounding volume hierarchy
+            (a balanced tree of min operations, split at the median of
+            their centers along the axis where the centers spread the
+            most).  Every group is tagged with its bounds, so renders
+            skip whole groups that miss the region being evaluated.
+            @param shapes List of shapes (None entries are ignored)
+            @returns A MathTree (or None if there are no shapes)
+        """
+        return cls._hierarchy(shapes, 'i', True)
+
+    @classmethod
+    def intersection(cls, shapes):
+        """ @brief Intersects many shapes, as a bounding volume hierarchy
+            @details See MathTree.union.  Each group's bounds are the
+            intersection of its members' bounds.
+            @param shapes List of shapes (None entries are ignored)
+            @returns A MathTree (or None if there are no shapes)
+        """
+        return cls._hierarchy(shapes, 'a', False)
+
+    @classmethod
+    def _hierarchy(cls, shapes, op, union):
+        """ @brief Builds a bounding volume hierarchy of shapes
+            @param shapes List of shapes
+            @param op Opcode combining pairs of shapes ('i' or 'a')
+            @param union Boolean selecting how bounds are merged
+            @returns A MathTree (or None if there are no shapes)
+        """
+        shapes = [cls.wrap(s) for s in shapes if s is not None]
+        if not shapes:  return None
+
+        def merge(boxes):
+            # Unions are unbounded if any member is; intersections
+            # are bounded if any member is.
+            out = []
+            picks = [min, max] if union else [max, min]
+            for i, pick in enumerate(picks*3):
+                b = [box[i] for box in boxes]
+                if union and None in b:     out.append(None)
+                else:
+                    b = [v for v in b if v is not None]
+                    out.append(pick(b) if b else None)
+            return out
+
+        def tag(math, box):
+            if all(b is None for b in box):    return math
+            # Pad the bounds outwards, since they're parsed as floats
+            pad = lambda v, s: (s*float('inf') if v is None else
+                                v + s*1e-6*(1 + abs(v)))
+            return 'B' + ''.join('f%.9g' % pad(v, 1 if i % 2 else -1)
+                                 for i, v in enumerate(box)) + math
+
+        def build(group):
+            if len(group) == 1:
+                return tag(group[0].math, group[0].bounds), group[0].bounds
+
+            # Split at the median center along the widest axis
+            spread = []
+            for a in range(3):
+                if all(s.bounds[2*a] is not None and
+                       s.bounds[2*a+1] is not None for s in group):
+                    c = [s.bounds[2*a] + s.bounds[2*a+1] for s in group]
+                    spread.append((max(c) - min(c), a))
+            if spread:
+                a = max(spread)[1]
+                group = sorted(group, key=lambda s: s.bounds[2*a] +
+                                                    s.bounds[2*a+1])
+            half = len(group) // 2
+            lhs, lbox = build(group[:half])
+            rhs, rbox = build(group[half:])
+
+            box = merge([lbox, rbox])
+            return tag(op + lhs + rhs, box), box
+
+        bounded = [s for s in shapes if any(b is not None for b in s.bounds)]
+        math, box = build(bounded) if bounded else (None, [None]*6)
+
+        # Shapes without any bounds are tacked onto the hierarchy's root
+        for s in shapes:
+            if any(b is not None for b in s.bounds):    continue
+            math = op + math + s.math if math else s.math
+            box = merge([box, s.bounds])
+
+        t = cls(math, True)
+        t.bounds = box
+        return t
+
     #########################
     #  MathTree Arithmetic  #
     #########################
@@ -528,6 +668,75 @@ class MathTree(object):
                            self.math,
                       shape=self.shape, color=self.color)
 
+    def map_affine(self, matrix):
+        """ @brief Applies an affine map to a tree
+            @param matrix Three rows of four coefficients, giving the new
+            X, Y, and Z as a*X + b*Y + c*Z + d
+            @returns A new MathTree, with exact bounds
+            @details If this tree is itself an affine map of another tree,
+            the two maps are composed into one.
+        """
+        outer = [[float(v) for v in row] for row in matrix]
+        bounds = self.bounds
+
+        inner = _AFFINE.match(self.math)
+        if inner:
+            # The inner map is applied to coordinates from the outer one
+            a = [[float(v) for v in inner.groups()[4*r:4*r+4]]
+                 for r in range(3)]
+            matrix = [[sum(a[r][k]*outer[k][c] for k in range(3)) +
+                       (a[r][3] if c == 3 else 0) for c in range(4)]
+                      for r in range(3)]
+            math = self.math[inner.end():]
+
+            # Remapping the inner map's bounds would widen rotated boxes
+            # at every step, so start from the bounds before it (unless
+            # they've been changed since)
+            if self._affine and self._affine[2] == bounds:
+                bounds, outer = self._affine[0], matrix
+        else:
+            matrix, math = outer, self.math
+
+        if matrix != [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0]]:
+            math = 'M' + ''.join('f%r' % v for row in matrix
+                                          for v in row) + math
+
+        t = MathTree(math, shape=self.shape, color=self.color)
+        t.bounds = self.affine_bounds(outer, bounds)
+        t._affine = (bounds, outer, t.bounds)
+        return t
+
+    def affine_bounds(self, matrix, bounds=None):
+        """ @brief Calculates bounds after an affine map
+            @param matrix Affine map, as passed to map_affine
+            @param bounds Bounds to remap (defaults to this tree's)
+            @returns Array of remapped bounds
+            @details Unmapped coordinates are linear functions of mapped
+            coordinates, so the bounds are exact.
+        """
+        if bounds is None:  bounds = self.bounds
+        m = matrix
+        cofactor = [[m[(c+1)%3][(r+1)%3]*m[(c+2)%3][(r+2)%3] -
+                     m[(c+1)%3][(r+2)%3]*m[(c+2)%3][(r+1)%3]
+                     for c in range(3)] for r in range(3)]
+        det = sum(m[0][k]*cofactor[k][0] for k in range(3))
+        if not det:     return [None]*6
+
+        result = []
+        for r in range(3):
+            lower = upper = 0
+            for k in range(3):
+                s = cofactor[r][k] / det
+                if not s:   continue
+                if bounds[2*k] is None or bounds[2*k+1] is None:
+                    lower = upper = None
+                    break
+                p, q = [s*(b - m[k][3]) for b in bounds[2*k:2*k+2]]
+                lower += min(p, q)
+                upper += max(p, q)
+            result += [lower, upper]
+        return result
+
     @forcetree
     def map_bounds(self, X=None, Y=None, Z=None):
         """ @brief Calculates remapped bounds
@@ -580,22 +789,73 @@ class MathTree(object):
     def clone(self):
         m = MathTree(self.math, shape=self.shape, color=self.color)
         m.bounds = [b for b in self.bounds]
+        m._affine = self._affine
         if self._ptr is not None:
             m._ptr = libfab.clone_tree(self._ptr)
+            m.simplified = self.simplified
+            m._simplified_bounds = self._simplified_bounds
         return m
 
+    def __getstate__(self):
+        """ @brief Pickles the math string, flags, and bounds
+            @details The parsed tree isn't pickled; it is rebuilt from the
+            math string when needed.
+        """
+        return {'math': self.math, 'shape': self.shape,
+                'color': self.color, 'bounds': self.bounds}
+
+    def __setstate__(self, state):
+        self.__init__(state['math'], state['shape'], state['color'])
+        self.bounds = list(state['bounds'])
+
     #################################
     #    Rendering functions        #
     #################################
 
+    @staticmethod
+    def set_mode(packed, affine):
+        """ @brief Chooses how packed trees bound regions
+            @param packed List of packed trees
+            @param affine Boolean determining whether to use affine arithmetic (rather than interval arithmetic)
+            @returns The current evaluation counts (see count_evaluations)
+        """
+        for p in packed:    libfab.set_affine(p, affine)
+        return MathTree.count_evaluations(packed)
+
+    @staticmethod
+    def count_evaluations(packed, stats=None, start=(0, 0)):
+        """ @brief Totals the evaluation counts of packed trees
+            @param packed List of packed trees
+            @param stats Dictionary to which counts since start are added (under 'intervals' and 'points'), or None
+            @param start Counts before the evaluation of interest
+            @returns (region evaluations, points evaluated) tuple
+        """
+        intervals, points = ctypes.c_uint64(), ctypes.c_uint64()
+        total = [0, 0]
+        for p in packed:
+            libfab.get_counts(p, intervals, points)
+            total[0] += intervals.value
+            total[1] += points.value
+        if stats is not None:
+            stats['intervals'] = (stats.get('intervals', 0) +
+                                  total[0] - start[0])
+            stats['points'] = stats.get('points', 0) + total[1] - start[1]
+        return tuple(total)
+
+
     def render(self, region=None, resolution=None, mm_per_unit=None,
-               threads=8, interrupt=None):
+               threads=8, interrupt=None, packed=None, affine=False,
+               stats=None):
         """ @brief Renders a math tree into an Image
             @param region Evaluation region (if None, taken from expression bounds)
             @param resolution Render resolution in voxels/unit
             @param mm_per_unit Real-world scale
             @param threads Number of threads to use
             @param interrupt threading.Event that aborts rendering if set
+            @param packed List of packed trees made from clones of this tree
+            (one per thread), which are reused rather than freed.
+            @param affine Boolean determining whether regions are bounded with affine arithmetic (tighter for rotated and mapped shapes)
+            @param stats Dictionary to which evaluation counts are added, or None
             @returns Image data structure
         """
 
@@ -615,6 +875,8 @@ class MathTree(object):
         except ValueError as TypeError:
             raise ValueError('mm_per_unit must be a number')
 
+        from koko.fab.image import Image
+
         if interrupt is None:   interrupt = threading.Event()
         halt = ctypes.c_int(0)  # flag to abort render
         image = Image(
@@ -622,8 +884,12 @@ class MathTree(object):
         )
 
         # Divide the task to share among multiple threads
-        clones = [self.clone() for i in range(threads)]
-        packed = [libfab.make_packed(c.ptr) for c in clones]
+        owned = packed is None
+        if owned:
+            clones = [self.clone() for i in range(threads)]
+            packed = [libfab.make_packed(c.ptr) for c in clones]
+        threads = len(packed)
+        start = self.set_mode(packed, affine)
 
         subregions = region.split_xy(threads)
 
@@ -631,8 +897,10 @@ class MathTree(object):
         args = list(zip(packed, subregions, [image.pixels]*threads, [halt]*threads))
 
         multithread(libfab.render16, args, interrupt, halt)
+        self.count_evaluations(packed, stats, start)
 
-        for p in packed:    libfab.free_packed(p)
+        if owned:
+            for p in packed:    libfab.free_packed(p)
 
         image.xmin = region.X[0]*mm_per_unit
         image.xmax = region.X[region.ni]*mm_per_unit
@@ -644,8 +912,53 @@ class MathTree(object):
         return image
 
 
+    def trace(self, camera, width, height, threads=8, interrupt=None,
+              affine=False, stats=None):
+        """ @brief Traces rays through a math tree, for a shaded 3D preview
+            @details Each thread traces a tile of the image.  If the tree
+            is bounded, rays are clipped to its bounds.
+            @param camera Camera (e.g. from Camera.view)
+            @param width Image width in pixels
+            @param height Image height in pixels
+            @param threads Number of threads to use
+            @param interrupt threading.Event that aborts tracing if set
+            @param affine Boolean determining whether regions are bounded with affine arithmetic
+            @param stats Dictionary to which evaluation counts are added, or None
+            @returns (depth, normals) tuple of floating-point Images: ray parameters of the first hit (infinite where rays miss) and unit normals
+        """
+        from koko.fab.image import Image
+
+        if interrupt is None:   interrupt = threading.Event()
+        halt = ctypes.c_int(0)  # flag to abort render
+
+        depth = Image(width, height, channels=1, depth='f')
+        depth.array[:] = float('inf')
+        normals = Image(width, height, channels=3, depth='f')
+        depth.color = self.color
+
+        if self.bounded:    camera = camera.clip(self.bounds)
+        if camera is None:  return depth, normals
+
+        clones = [self.clone() for i in range(threads)]
+        packed = [libfab.make_packed(c.ptr) for c in clones]
+        start = self.set_mode(packed, affine)
+
+        # Pixel coordinates are used as region coordinates
+        tiles = Region((0, 0, 0), (width, height, 0), 1).split_xy(threads)
+
+        args = list(zip(packed, [camera]*threads, tiles,
+                        [depth.pixels]*threads, [normals.pixels]*threads,
+                        [halt]*threads))
+        multithread(libfab.trace, args, interrupt, halt)
+        self.count_evaluations(packed, stats, start)
+
+        for p in packed:    libfab.free_packed(p)
+
+        return depth, normals
+
+
     def asdf(self, region=None, resolution=None, mm_per_unit=None,
-             merge_leafs=True, interrupt=None):
+             merge_leafs=True, interrupt=None, affine=False, stats=None):
         """ @brief Constructs an ASDF from a math tree.
             @details Runs in up to eight threads.
             @param region Evaluation region (if None, taken from expression bounds)
@@ -653,6 +966,8 @@ class MathTree(object):
             @param mm_per_unit Real-world scale
             @param merge_leafs Boolean determining whether leaf cells are combined
             @param interrupt threading.Event that aborts rendering if set
+            @param affine Boolean determining whether regions are bounded with affine arithmetic
+            @param stats Dictionary to which evaluation counts are added, or None
             @returns ASDF data structure
         """
 
@@ -667,6 +982,8 @@ class MathTree(object):
                 resolution
             )
 
+        from koko.fab.asdf import ASDF
+
         if interrupt is None:   interrupt = threading.Event()
 
         # Shared flag to interrupt rendering
@@ -680,6 +997,7 @@ class MathTree(object):
         threads = len(subregions)
         clones  = [self.clone() for i in range(threads)]
         packed  = [libfab.make_packed(c.ptr) for c in clones]
+        self.set_mode(packed, affine)
 
         # Generate a root for the tree
         asdf = ASDF(libfab.asdf_root(packed[0], region), color=self.color)
@@ -696,6 +1014,7 @@ class MathTree(object):
 
         # Run the constructor in parallel to make the branches
         multithread(construct_branch, args, interrupt, halt)
+        self.count_evaluations(packed, stats)
         for p in packed:    libfab.free_packed(p)
 
         # Attach the branches to the root
@@ -721,7 +1040,8 @@ class MathTree(object):
 
 
     def triangulate(self, region=None, resolution=None,
-                    mm_per_unit=None, merge_leafs=True, interrupt=None):
+                    mm_per_unit=None, merge_leafs=True, interrupt=None,
+                    affine=False):
         """ @brief Triangulates a math tree (via ASDF)
             @details Runs in up to eight threads
             @param region Evaluation region (if not, taken from expression)
@@ -729,10 +1049,58 @@ class MathTree(object):
             @param mm_per_unit Real-world scale
             @param merge_leafs Boolean determining whether leaf cells are combined
             @param interrupt threading.Event that aborts rendering if set
+            @param affine Boolean determining whether regions are bounded with affine arithmetic
             @returns Mesh data structure
         """
-        asdf = self.asdf(region, resolution, mm_per_unit, merge_leafs, interrupt)
-        return asdf.triangulate()
+        asdf = self.asdf(region, resolution, mm_per_unit, merge_leafs,
+                         interrupt, affine)
+        mesh = asdf.triangulate()
+        self.normals(mesh, mm_per_unit)
+        return mesh
+
+
+    @threadsafe
+    def gradient(self, x, y, z):
+        """ @brief Evaluates the tree and its gradient at a point
+            @details Uses forward-mode automatic differentiation, so the
+            gradient is exact and costs a single pass through the tree.
+            @returns Derivative with value v and gradient dx, dy, dz
+        """
+        packed = libfab.make_packed(self.exact_ptr)
+        result = libfab.eval_g(packed, x, y, z)
+        libfab.free_packed(packed)
+        return result
+
+
+    @threadsafe
+    def interval(self, x, y, z, affine=False):
+        """ @brief Bounds the tree over a region
+            @param x (xmin, xmax) tuple
+            @param y (ymin, ymax) tuple
+            @param z (zmin, zmax) tuple
+            @param affine Boolean determining whether to use affine arithmetic (which tracks correlations between subexpressions)
+            @returns Interval containing every value of the tree in the region
+        """
+        packed = libfab.make_packed(self.exact_ptr)
+        evaluate = libfab.eval_a if affine else libfab.eval_i
+        result = evaluate(packed, Interval(*x), Interval(*y), Interval(*z))
+        libfab.free_packed(packed)
+        return result
+
+
+    @threadsafe
+    def normals(self, mesh, mm_per_unit=None):
+        """ @brief Replaces a mesh's vertex normals with exact normals
+            @details The mesh must have been generated from this tree.
+            Normals are the normalized gradient of the tree, rather
+            than estimates from the ASDF's samples.
+            @param mesh Target mesh
+            @param mm_per_unit Real-world scale of the mesh
+        """
+        if mesh.ptr is None or not mesh.vcount:    return
+        packed = libfab.make_packed(self.ptr)
+        libfab.mesh_normals(packed, mesh.ptr, mm_per_unit or 1)
+        libfab.free_packed(packed)
 
 
     @staticmethod
@@ -752,6 +1120,3 @@ if libfab:
     Y = MathTree.Y()
     Z = MathTree.Z()
 
-
-from    koko.fab.image      import Image
-from    koko.fab.asdf       import ASDF
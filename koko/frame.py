@@ -205,12 +205,13 @@ class MainFrame(wx.Frame):
         shaders = wx.Menu()
         for s in [
             'Shaded', 'Wireframe',
-            'Normals', 'Subdivision'
+            'Normals', 'Subdivision',
+            'Traced'
         ]:
             m = shaders.AppendRadioItem(wx.ID_ANY, s)
             m.Enable(False)
             if s == 'Shaded':    m.Check(True)
-            self.Bind(wx.EVT_MENU, lambda e: self.Refresh(), m)
+            self.Bind(wx.EVT_MENU, app.shading_mode, m)
 
         view.AppendSubMenu(shaders, 'Shading mode')
 
@@ -230,6 +231,10 @@ class MainFrame(wx.Frame):
 
         attach(view, 'Re-render', app.mark_changed_design, 'Ctrl+Enter',
               'Re-render the output image')
+        attach(view, 'Render in separate process', app.use_worker,
+               help='Run scripts in a worker process, so that slow scripts '
+                    "don't freeze the editor",
+               attach_function=view.AppendCheckItem)
 
 
         menu_bar.Append(view, 'View')
@@ -9,6 +9,7 @@ from    wx import glcanvas
 
 import  koko
 from    koko.c.vec3f    import Vec3f
+from    koko.c.camera   import Camera
 from    koko.c.interval import Interval
 from    koko.c.libfab   import libfab
 from    koko.fab.mesh   import Mesh
@@ -79,6 +80,7 @@ class GLCanvas(glcanvas.GLCanvas):
         self.path_vbo   = None
 
         self.image      = None
+        self.preview    = None
 
         self.loaded     = False
         self.snap       = True
@@ -95,6 +97,7 @@ class GLCanvas(glcanvas.GLCanvas):
         self.mesh_vbos  = []
         self.path_vbo   = None
         self.image      = None
+        self.preview    = None
         self.Refresh()
 
     def clear_path(self):
@@ -112,6 +115,15 @@ class GLCanvas(glcanvas.GLCanvas):
             glDeleteTextures(self.texture)
         self._texture = value
         return self.texture
+
+    @property
+    def preview_texture(self):  return getattr(self, '_preview_texture', None)
+    @preview_texture.setter
+    def preview_texture(self, value):
+        if self.preview_texture is not None:
+            glDeleteTextures(self.preview_texture)
+        self._preview_texture = value
+        return self.preview_texture
 ################################################################################
 
     @property
@@ -141,6 +153,7 @@ class GLCanvas(glcanvas.GLCanvas):
             self.init_GL()
         else:
             self.update_viewport()
+            self.retrace()
 
 ################################################################################
 
@@ -193,6 +206,7 @@ class GLCanvas(glcanvas.GLCanvas):
         if self.drag_target:
             delta = pos - self.mouse
             self.drag_target.drag(delta.x, delta.y)
+            self.retrace()
         else:
             self.hover_target = self.query(evt.GetX(), evt.GetY())
         self.Refresh()
@@ -212,8 +226,28 @@ class GLCanvas(glcanvas.GLCanvas):
             for i in range(abs(evt.GetWheelRotation())):
                 self.scale *= dScale
         self.LOD_complete = False
+        self.retrace()
         self.Refresh()
 
+################################################################################
+
+    @property
+    def shading(self):
+        ''' The shading mode selected in the View menu. '''
+        shading = koko.FRAME.get_menu('View', 'Shading mode')
+        return [c.GetItemLabelText() for c in shading if c.IsChecked()][0]
+
+    def camera(self):
+        ''' Returns a Camera that sees what the current view shows. '''
+        w, h = self.Size
+        return Camera.view(self.alpha, self.beta, self.scale, self.center,
+                           w, h)
+
+    def retrace(self):
+        ''' Requests a new traced preview if the view has changed. '''
+        if self.IsShown() and self.shading == 'Traced':
+            koko.APP.mark_changed_view()
+
 ################################################################################
 
     def update_viewport(self):
@@ -552,16 +586,62 @@ class GLCanvas(glcanvas.GLCanvas):
         self._center = corner + Vec3f(image.dx, image.dy, 0)/2
         self._scale = 4/(Vec3f(image.dx, image.dy, 0)/2).length()
 
+    def load_preview(self, image, min_corner, max_corner):
+        ''' Loads a traced image of the view, along with the bounds
+            of the shapes that it shows. '''
+        center = (min_corner + max_corner) / 2
+        scale = 4/(min_corner - center).length()
+        wx.CallAfter(self._load_preview, image, scale, center)
+
+    def _load_preview(self, image, scale, center):
+        self._scale = scale
+        self._center = center
+
+        # The preview covers the whole window, in clip coordinates
+        self.preview_vbo = vbo.VBO((ctypes.c_float*30)(
+            -1, -1, 0, 0, 0,
+             1, -1, 0, 1, 0,
+             1,  1, 0, 1, 1,
+
+            -1, -1, 0, 0, 0,
+             1,  1, 0, 1, 1,
+            -1,  1, 0, 0, 1
+        ))
+
+        data = np.flipud(image.array)
+        self.preview_texture = glGenTextures(1)
+        self.preview = image
+
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glBindTexture(GL_TEXTURE_2D, self.preview_texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, image.width, image.height, 0,
+                     GL_RGB, GL_UNSIGNED_BYTE, data.flatten())
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+
+        # The first preview was traced before snapping to the shapes,
+        # so trace it again from the new view.
+        if self.snap:
+            self.snap_bounds()
+            self.snap = False
+            koko.APP.mark_changed_view()
+
+        self.Refresh()
+
 ################################################################################
 
     def draw(self, shader=None):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        shading = koko.FRAME.get_menu('View', 'Shading mode')
-        shader = [c.GetItemLabelText() for c in shading if c.IsChecked()][0]
+        shader = self.shading
 
         if shader == 'Subdivision':
             self.draw_flat(50)
+        elif shader == 'Traced':
+            if self.preview is not None:    self.draw_preview()
         else:
             self.draw_mesh(shader)
 
@@ -956,6 +1036,34 @@ class GLCanvas(glcanvas.GLCanvas):
         glPushMatrix()
 
         self.orient()
+        self.draw_texture(self.texture, self.tex_vbo)
+
+        glPopMatrix()
+
+    def draw_preview(self):
+
+        glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+
+        # Draw the preview straight into clip coordinates, without
+        # writing depths (so that paths and images are drawn over it)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glDepthMask(GL_FALSE)
+
+        self.draw_texture(self.preview_texture, self.preview_vbo)
+
+        glDepthMask(GL_TRUE)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    def draw_texture(self, texture, tex_vbo):
+        ''' Draws a textured pair of triangles with the image shader. '''
 
         # Set up various parameters
         shaders.glUseProgram(self.image_shader)
@@ -965,19 +1073,19 @@ class GLCanvas(glcanvas.GLCanvas):
             glEnableVertexAttribArray(attributes[a])
 
         glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glBindTexture(GL_TEXTURE_2D, texture)
         glUniform1i(
             glGetUniformLocation(self.image_shader, 'texture'), 0
         )
 
-        self.tex_vbo.bind()
+        tex_vbo.bind()
         glVertexAttribPointer(
             attributes['vertex_position'],
-            3, GL_FLOAT, False, 5*4, self.tex_vbo
+            3, GL_FLOAT, False, 5*4, tex_vbo
         )
         glVertexAttribPointer(
             attributes['vertex_texcoord'],
-            2, GL_FLOAT, False, 5*4, self.tex_vbo+3*4
+            2, GL_FLOAT, False, 5*4, tex_vbo+3*4
         )
 
 
@@ -986,11 +1094,9 @@ class GLCanvas(glcanvas.GLCanvas):
         # And disable all of those parameter
         for a in attributes.values():   glDisableVertexAttribArray(a)
 
-        self.tex_vbo.unbind()
+        tex_vbo.unbind()
         shaders.glUseProgram(0)
 
-        glPopMatrix()
-
 ################################################################################
 
     def draw_paths(self):
@@ -12,8 +12,7 @@ All physical values use the current model's units.  A label made with a
 from __future__ import annotations
 
 from dataclasses import dataclass
-from functools import reduce
-import operator
+import math
 import warnings
 
 from koko.lib.dotfont import (
@@ -25,7 +24,7 @@ from koko.lib.dotfont import (
     expand_character,
     glyph,
 )
-from koko.lib.shapes2d import circle
+from koko.lib.shapes2d import array_xy, circle, union
 
 
 @dataclass(frozen=True)
@@ -244,11 +243,55 @@ def pattern_points(*args, **kwargs) -> tuple[tuple[float, float], ...]:
     return layout_pattern(*args, **kwargs).points
 
 
-def _geometry(layout: DotLayout, dot_diameter: float):
+def _steps(values: list[float], pitch: float) -> list[tuple[float, int]]:
+    """Split sorted values into (start, count) runs spaced one pitch apart."""
+
+    runs: list[tuple[float, int]] = []
+    for value in values:
+        if runs:
+            start, count = runs[-1]
+            if math.isclose(value - start, count * pitch, rel_tol=1e-9, abs_tol=1e-12):
+                runs[-1] = (start, count + 1)
+                continue
+        runs.append((value, 1))
+    return runs
+
+
+def _blocks(points, pitch: float) -> list[tuple[float, float, int, int]]:
+    """Group dot centers into (x, y, columns, rows) blocks of a regular grid.
+
+    Each row is split into runs of neighboring dots, then identical runs in
+    neighboring rows are stacked, top to bottom.
+    """
+
+    rows: dict[float, list[float]] = {}
+    for x, y in points:
+        rows.setdefault(y, []).append(x)
+
+    stacks: dict[tuple[float, int], list[float]] = {}
+    for y, xs in rows.items():
+        for run in _steps(sorted(xs), pitch):
+            stacks.setdefault(run, []).append(-y)
+
+    return [
+        (x, -top, columns, count)
+        for (x, columns), ys in stacks.items()
+        for top, count in _steps(sorted(ys), pitch)
+    ]
+
+
+def _geometry(layout: DotLayout, dot_diameter: float, dot_spacing: float):
     if not layout.points:
         return None
     radius = float(dot_diameter) / 2
-    shape = reduce(operator.add, (circle(x, y, radius) for x, y in layout.points))
+    pitch = float(dot_diameter) + float(dot_spacing)
+
+    # Blocks of dots are repeated circles, so the tree's size depends on
+    # the number of blocks rather than the number of dots.
+    shape = union(
+        array_xy(circle(x, y, radius), columns, rows, pitch, -pitch)
+        for x, y, columns, rows in _blocks(layout.points, pitch)
+    )
     if layout.bounds is not None:
         shape.xmin, shape.xmax, shape.ymin, shape.ymax = layout.bounds
     return shape
@@ -279,7 +322,7 @@ def text(
         align=align,
         missing=missing,
     )
-    return _geometry(layout, dot_diameter)
+    return _geometry(layout, dot_diameter, dot_spacing)
 
 
 def pattern(
@@ -301,7 +344,7 @@ def pattern(
         dot_spacing=dot_spacing,
         align=align,
     )
-    return _geometry(layout, dot_diameter)
+    return _geometry(layout, dot_diameter, dot_spacing)
 
 
 label = text
@@ -1,9 +1,7 @@
-import operator
 from math import cos, sin, atan2, radians, degrees, sqrt
 
 import koko.lib.shapes2d as s2d
 from koko.lib.text import text
-from functools import reduce
 
 class AKA(type):
     """ 'Also Known As' metaclass to create aliases for a class. """
@@ -28,21 +26,21 @@ class PCB(object):
     @property
     def traces(self):
         L = [c.pads for c in self.components] + [c.traces for c in self.connections]
-        shape = reduce(operator.add, L) if L else None
+        shape = s2d.union(L)
         shape.bounds = self.cutout.bounds
         return shape
 
     @property
     def part_labels(self):
         L = [c.label for c in self.components if c.label is not None]
-        shape = reduce(operator.add, L) if L else None
+        shape = s2d.union(L)
         shape.bounds = self.cutout.bounds
         return shape
 
     @property
     def pin_labels(self):
         L = [c.pin_labels for c in self.components if c.pin_labels is not None]
-        shape = reduce(operator.add, L) if L else None
+        shape = s2d.union(L)
         shape.bounds = self.cutout.bounds
         return shape
 
@@ -137,8 +135,9 @@ class Component(object):
 
     @property
     def pads(self):
-        pads = reduce(operator.add, [p.pad for p in self.pins])
-        return s2d.move(s2d.rotate(pads, self.rot), self.x, self.y)
+        # Pads are placed one by one, so the union can skip distant pads
+        return s2d.union([s2d.move(s2d.rotate(p.pad, self.rot), self.x, self.y)
+                          for p in self.pins])
 
     @property
     def pin_labels(self):
@@ -147,7 +146,7 @@ class Component(object):
             p = BoundPin(p, self)
             if p.pin.name:
                 L.append(text(p.pin.name, p.x, p.y, 0.03))
-        return reduce(operator.add, L) if L else None
+        return s2d.union(L)
         #return s2d.rotate(reduce(operator.add, L) if L else None,self.plr)
 
     @property
@@ -228,7 +227,7 @@ class Connection(object):
             a = atan2(p2.y - p1.y, p2.x - p1.x)
             r = s2d.rectangle(0, d, -self.width/2, self.width/2)
             t.append(s2d.move(s2d.rotate(r, degrees(a)), p1.x, p1.y))
-        return reduce(operator.add, t)
+        return s2d.union(t)
 
 ################################################################################
 # Pad definitions
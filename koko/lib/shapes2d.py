@@ -111,14 +111,10 @@ def slot(x, y, width, height, angle=0, chamfer=0.2):
 ################################################################################
 
 def move(part, dx, dy, dz=0):
-    p = part.map('-Xf%g' % dx if dx else None,
-                 '-Yf%g' % dy if dy else None,
-                 '-Zf%g' % dz if dz else None)
-    if part.dx: p.xmin, p.xmax = part.xmin + dx, part.xmax + dx
-    if part.dy: p.ymin, p.ymax = part.ymin + dy, part.ymax + dy
-    if part.dz: p.zmin, p.zmax = part.zmin + dz, part.zmax + dz
-
-    return p
+    # X' = X-dx, Y' = Y-dy, Z' = Z-dz
+    return part.map_affine([[1, 0, 0, -dx],
+                            [0, 1, 0, -dy],
+                            [0, 0, 1, -dz]])
 
 translate = move
 
@@ -133,84 +129,59 @@ def rotate(part, angle):
 
     angle *= math.pi/180
     ca, sa = math.cos(angle), math.sin(angle)
-    nsa    = -sa
-
-    p = part.map(X='+*f%(ca)gX*f%(sa)gY'  % locals(),
-                 Y='+*f%(nsa)gX*f%(ca)gY' % locals())
-
-    ca, sa = math.cos(-angle), math.sin(-angle)
-    nsa    = -sa
-    p.bounds = part.map_bounds(X='+*f%(ca)gX*f%(sa)gY'  % locals(),
-                               Y='+*f%(nsa)gX*f%(ca)gY' % locals())
 
-    return p
+    # X' = cos(a)*X + sin(a)*Y
+    # Y' = cos(a)*Y - sin(a)*X
+    return part.map_affine([[ca,  sa, 0, 0],
+                            [-sa, ca, 0, 0],
+                            [0,   0,  1, 0]])
 
 ################################################################################
 
 def reflect_x(part, x0=0):
 
     # X' = 2*x0-X
-    p = part.map(X='-*f2f%gX' % x0 if x0 else 'nX')
-
-    # X  = 2*x0-X'
-    p.bounds = part.map_bounds(X='-*f2f%gX' % x0 if x0 else 'nX')
-    return p
+    return part.map_affine([[-1, 0, 0, 2*x0],
+                            [0,  1, 0, 0],
+                            [0,  0, 1, 0]])
 
 def reflect_y(part, y0=0):
 
     # Y' = 2*y0-Y
-    p = part.map(Y='-*f2f%gY' % y0 if y0 else 'nY')
-
-    # Y  = 2*y0-Y'
-    p.bounds = part.map_bounds(Y='-*f2f%gY' % y0 if y0 else 'nY')
-    return p
+    return part.map_affine([[1, 0,  0, 0],
+                            [0, -1, 0, 2*y0],
+                            [0, 0,  1, 0]])
 
 def reflect_xy(part):
-    p = part.map(X='Y', Y='X')
-    p.bounds = part.map_bounds(X='Y', Y='X')
-    return p
+
+    # X' = Y, Y' = X
+    return part.map_affine([[0, 1, 0, 0],
+                            [1, 0, 0, 0],
+                            [0, 0, 1, 0]])
 
 ################################################################################
 
 def scale_x(part, x0, sx):
 
     # X' = x0 + (X-x0)/sx
-    p = part.map(X='+f%(x0)g/-Xf%(x0)gf%(sx)g' % locals()
-                    if x0 else '/Xf%g' % sx)
-
-    # X  = (X'-x0)*sx + x0
-    p.bounds = part.map_bounds(X='+f%(x0)g*f%(sx)g-Xf%(x0)g' % locals()
-                               if x0 else '*Xf%g' % sx)
-    return p
+    return part.map_affine([[1./sx, 0, 0, x0 - x0/sx],
+                            [0,     1, 0, 0],
+                            [0,     0, 1, 0]])
 
 def scale_y(part, y0, sy):
 
     # Y' = y0 + (Y-y0)/sy
-    p = part.map(Y='+f%(y0)g/-Yf%(y0)gf%(sy)g' % locals()
-                    if y0 else '/Yf%g' % sy)
-
-    # Y  = (Y'-y0)*sy + y0
-    p.bounds = part.map_bounds(Y='+f%(y0)g*f%(sy)g-Yf%(y0)g' % locals()
-                               if y0 else '*Yf%g' % sy)
-
-    return p
+    return part.map_affine([[1, 0,     0, 0],
+                            [0, 1./sy, 0, y0 - y0/sy],
+                            [0, 0,     1, 0]])
 
 def scale_xy(part, x0, y0, sxy):
 
-    # X' = x0 + (X-x0)/sx
-    # Y' = y0 + (Y-y0)/sy
-    p = part.map(X='+f%(x0)g/-Xf%(x0)gf%(sxy)g' % locals()
-                    if x0 else '/Xf%g' % sxy,
-                 Y='+f%(y0)g/-Yf%(y0)gf%(sxy)g' % locals()
-                    if y0 else '/Yf%g' % sxy)
-
-    # X  = (X'-x0)*sx + x0
-    # Y  = (Y'-y0)*sy + y0
-    p.bounds = part.map_bounds(X='+f%(x0)g*f%(sxy)g-Xf%(x0)g' % locals()
-                               if x0 else '*Xf%g' % sxy,
-                               Y='+f%(y0)g*f%(sxy)g-Yf%(y0)g' % locals()
-                               if y0 else '*Yf%g' % sxy)
-    return p
+    # X' = x0 + (X-x0)/sxy
+    # Y' = y0 + (Y-y0)/sxy
+    return part.map_affine([[1./sxy, 0,      0, x0 - x0/sxy],
+                            [0,      1./sxy, 0, y0 - y0/sxy],
+                            [0,      0,      1, 0]])
 
 ################################################################################
 
@@ -220,12 +191,9 @@ def shear_x_y(part, y0, y1, dx0, dx1):
     dy = y1 - y0
 
     # X' = X-dx0-dx*(Y-y0)/dy
-    p = part.map(X='--Xf%(dx0)g/*f%(dx)g-Yf%(y0)gf%(dy)g' % locals())
-
-    # X  = X'+dx0+(dx)*(Y-y0)/dy
-    p.bounds = part.map_bounds(X='++Xf%(dx0)g/*f%(dx)g-Yf%(y0)gf%(dy)g'
-                                  % locals())
-    return p
+    return part.map_affine([[1, -dx/dy, 0, dx*y0/dy - dx0],
+                            [0, 1,      0, 0],
+                            [0, 0,      1, 0]])
 
 ################################################################################
 
@@ -249,6 +217,112 @@ def taper_x_y(part, x0, y0, y1, s0, s1):
 
 ################################################################################
 
+def fold(u, pitch, count=None):
+    ''' Returns a math string that folds the coordinate u (a math string)
+        into the cell around the nearest of count copies, spaced pitch
+        apart from u = 0 (or of endless copies, if count is None).
+
+        Each cell is pitch wide and centered on its copy, so a repeated
+        part should fit within the cell around u = 0.  Beyond the first
+        and last copies, u is left unfolded.'''
+    if count is not None and count < 1:
+        raise ValueError('Arrays need at least one copy')
+    elif count == 1:
+        return u
+    elif pitch < 0:
+        return 'n' + fold('n' + u, -pitch, count)
+
+    # mod(u + pitch/2, pitch) - pitch/2
+    half = pitch / 2.
+    f = '-%%+%(u)sf%(half)gf%(pitch)gf%(half)g' % locals()
+    if count is None:   return f
+
+    # max(min(fold(u), u), u - (count-1)*pitch)
+    end = (count - 1) * pitch
+    return 'ai%(f)s%(u)s-%(u)sf%(end)g' % locals()
+
+
+def array_axis(part, axis, count, pitch):
+    ''' Repeats a part count times along an axis ('x', 'y', or 'z'),
+        pitch apart, by folding coordinates rather than copying the
+        part (so the tree stays the same size for any count).'''
+    lower = getattr(part, axis + 'min')
+    upper = getattr(part, axis + 'max')
+    c = (lower + upper) / 2. if lower is not None else 0
+
+    # A' = c + fold(A - c)
+    A = axis.upper()
+    u = '-%sf%g' % (A, c) if c else A
+    p = part.map(**{A: ('+f%g' % c if c else '') + fold(u, pitch, count)})
+
+    p.bounds = part.bounds
+    if lower is not None:
+        end = (count - 1) * pitch
+        setattr(p, axis + 'min', lower + min(end, 0))
+        setattr(p, axis + 'max', upper + max(end, 0))
+    return p
+
+def array_x(part, nx, dx):
+    return array_axis(part, 'x', nx, dx)
+
+def array_y(part, ny, dy):
+    return array_axis(part, 'y', ny, dy)
+
+def array_xy(part, nx, ny, dx, dy):
+    return array_y(array_x(part, nx, dx), ny, dy)
+
+def array_polar(part, n, x0=0, y0=0):
+    ''' Repeats a part n times about (x0, y0).  The part should fit in
+        a wedge 360/n degrees wide, centered on the part itself.'''
+    if n < 1:
+        raise ValueError('Arrays need at least one copy')
+
+    # Fold angles about the part's center (or the +x axis)
+    phase = 0
+    if part.dx is not None and part.dy is not None:
+        cx, cy = (part.xmin + part.xmax) / 2., (part.ymin + part.ymax) / 2.
+        if cx != x0 or cy != y0:
+            phase = math.atan2(cy - y0, cx - x0)
+
+    # r = sqrt((X-x0)**2 + (Y-y0)**2)
+    # a = fold(atan2(Y-y0, X-x0) - phase) + phase
+    dx = '-Xf%g' % x0 if x0 else 'X'
+    dy = '-Yf%g' % y0 if y0 else 'Y'
+    r = 'r+q%sq%s' % (dx, dy)
+    a = 'A%s%s' % (dy, dx)
+    if phase:   a = '+f%g%s' % (phase, fold('-%sf%g' % (a, phase), 2*math.pi/n))
+    else:       a = fold(a, 2*math.pi/n)
+
+    # X' = x0 + r*cos(a)
+    # Y' = y0 + r*sin(a)
+    p = part.map(X=('+f%g' % x0 if x0 else '') + '*%sc%s' % (r, a),
+                 Y=('+f%g' % y0 if y0 else '') + '*%ss%s' % (r, a))
+
+    p.bounds = part.bounds
+    if part.dx is not None and part.dy is not None:
+        R = max(math.hypot(x - x0, y - y0)
+                for x in (part.xmin, part.xmax)
+                for y in (part.ymin, part.ymax))
+        p.xmin, p.xmax = x0 - R, x0 + R
+        p.ymin, p.ymax = y0 - R, y0 + R
+    return p
+
+################################################################################
+
+def union(parts):
+    ''' Combines many parts into one.  Nearby parts are grouped together,
+        and renders skip every group that misses the region at hand, so
+        this is much faster than adding the parts one by one.
+
+        None entries are ignored (returns None if there are no parts).'''
+    return MathTree.union(parts)
+
+def intersection(parts):
+    ''' Intersects many parts, grouped together as in union.'''
+    return MathTree.intersection(parts)
+
+################################################################################
+
 @matching
 def blend(p0, p1, amount):
     if not p0.shape or not p1.shape:
@@ -51,32 +51,23 @@ def rotate_x(part, angle):
 
     angle *= math.pi/180
     ca, sa = math.cos(angle), math.sin(angle)
-    nsa    = -sa
 
-    p = part.map(Y='+*f%(ca)gY*f%(sa)gZ'  % locals(),
-                 Z='+*f%(nsa)gY*f%(ca)gZ' % locals())
-
-    ca, sa = math.cos(-angle), math.sin(-angle)
-    nsa    = -sa
-    p.bounds = part.map_bounds(Y='+*f%(ca)gY*f%(sa)gZ' % locals(),
-                               Z='+*f%(nsa)gY*f%(ca)gZ' % locals())
-    return p
+    # Y' = cos(a)*Y + sin(a)*Z
+    # Z' = cos(a)*Z - sin(a)*Y
+    return part.map_affine([[1, 0,   0,  0],
+                            [0, ca,  sa, 0],
+                            [0, -sa, ca, 0]])
 
 def rotate_y(part, angle):
 
     angle *= math.pi/180
     ca, sa = math.cos(angle), math.sin(angle)
-    nsa    = -sa
-
-    p = part.map(X='+*f%(ca)gX*f%(sa)gZ'  % locals(),
-                 Z='+*f%(nsa)gX*f%(ca)gZ' % locals())
 
-    ca, sa = math.cos(-angle), math.sin(-angle)
-    nsa    = -sa
-
-    p.bounds = part.map_bounds(X='+*f%(ca)gX*f%(sa)gZ' % locals(),
-                               Z='+*f%(nsa)gX*f%(ca)gZ' % locals())
-    return p
+    # X' = cos(a)*X + sin(a)*Z
+    # Z' = cos(a)*Z - sin(a)*X
+    return part.map_affine([[ca,  0, sa, 0],
+                            [0,   1, 0,  0],
+                            [-sa, 0, ca, 0]])
 
 rotate_z = s2d.rotate
 
@@ -86,20 +77,23 @@ reflect_x = s2d.reflect_x
 reflect_y = s2d.reflect_y
 
 def reflect_z(part, z0=0):
-    p = part.map(Z='-*f2f%gZ' % z0 if z0 else 'nZ')
-    p.bounds = part.map_bounds(Z='-*f2f%gZ' % z0 if z0 else 'nZ')
-    return p
+    # Z' = 2*z0-Z
+    return part.map_affine([[1, 0, 0,  0],
+                            [0, 1, 0,  0],
+                            [0, 0, -1, 2*z0]])
 
 reflect_xy = s2d.reflect_xy
 def reflect_xz(part):
-    p = part.map(X='Z', Z='X')
-    p.bounds = part.map_bounds(X='Z', Z='X')
-    return p
+    # X' = Z, Z' = X
+    return part.map_affine([[0, 0, 1, 0],
+                            [0, 1, 0, 0],
+                            [1, 0, 0, 0]])
 
 def reflect_yz(part):
-    p = part.map(Y='Z', Z='Y')
-    p.bounds = part.map_bounds(Y='Z', Z='Y')
-    return p
+    # Y' = Z, Z' = Y
+    return part.map_affine([[1, 0, 0, 0],
+                            [0, 0, 1, 0],
+                            [0, 1, 0, 0]])
 
 ################################################################################
 
@@ -107,11 +101,10 @@ scale_x = s2d.scale_x
 scale_y = s2d.scale_y
 
 def scale_z(part, z0, sz):
-    p = part.map(Z='+f%(z0)g/-Zf%(z0)gf%(sz)g' % locals()
-                    if z0 else '/Zf%g' % sz)
-    p.bounds = part.map_bounds(Z='+f%(z0)g*f%(sz)g-Zf%(z0)g' % locals()
-                               if z0 else '*Zf%g' % sz)
-    return p
+    # Z' = z0 + (Z-z0)/sz
+    return part.map_affine([[1, 0, 0,     0],
+                            [0, 1, 0,     0],
+                            [0, 0, 1./sz, z0 - z0/sz]])
 
 ################################################################################
 
@@ -119,13 +112,31 @@ shear_x_y = s2d.shear_x_y
 
 def shear_x_z(part, z0, z1, dx0, dx1):
 
+    dx = dx1 - dx0
+    dz = z1 - z0
+
     #   X' = X-dx0-(dx1-dx0)*(Z-z0)/(z1-z0)
-    p = part.map(X='--Xf%(dx0)g/*f%(dx)g-Zf%(z0)gf%(dz)g' % locals())
+    return part.map_affine([[1, 0, -dx/dz, dx*z0/dz - dx0],
+                            [0, 1, 0,      0],
+                            [0, 0, 1,      0]])
 
-    #   X = X'+dx0+(dx1-dx0)*(Z-z0)/(z1-z0)
-    p.bounds = part.map_bounds(X='++Xf%(dx0)g/*f%(dx)g-Zf%(z0)gf%(dz)g'
-                                  % locals())
-    return p
+################################################################################
+
+union           = s2d.union
+intersection    = s2d.intersection
+
+################################################################################
+
+array_x     = s2d.array_x
+array_y     = s2d.array_y
+array_xy    = s2d.array_xy
+array_polar = s2d.array_polar
+
+def array_z(part, nz, dz):
+    return s2d.array_axis(part, 'z', nz, dz)
+
+def array_xyz(part, nx, ny, nz, dx, dy, dz):
+    return array_z(array_xy(part, nx, ny, dx, dy), nz, dz)
 
 ################################################################################
 
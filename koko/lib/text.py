@@ -13,50 +13,45 @@ from koko.lib.shapes2d import *
 def text(text, x, y, height = 1, align = 'CC'):
 
     dx, dy = 0, -1
-    text_shape = None
+    placed = []
 
     for line in text.split('\n'):
-        line_shape = None
+        line_start = len(placed)
 
         for c in line:
             if not c in list(_glyphs.keys()):
                 print('Warning:  Unknown character "%s" in koko.lib.text' % c)
             else:
-                chr_math = move(_glyphs[c], dx, dy)
-                if line_shape is None:  line_shape  = chr_math
-                else:                   line_shape += chr_math
+                placed.append([_glyphs[c], dx, dy])
                 dx += _glyphs[c].width + 0.1
         dx -= 0.1
 
-        if line_shape is not None:
-            if align[0] == 'L':
-                pass
-            elif align[0] == 'C':
-                line_shape = move(line_shape, -dx / 2, 0)
-            elif align[0] == 'R':
-                line_shape = move(line_shape, -dx, 0)
-
-            text_shape += line_shape
+        shift = 0
+        if align[0] == 'C':     shift = -dx / 2
+        elif align[0] == 'R':   shift = -dx
+        for p in placed[line_start:]:
+            p[1] += shift
 
         dy -= 1.55
         dx = 0
 
     dy += 1.55
-    if text_shape is None:  return None
-
-    if align[1] == 'T':
-        pass
-    elif align[1] == 'B':
-        text_shape = move(text_shape, 0, -dy,)
-    elif align[1] == 'C':
-        text_shape = move(text_shape, 0, -dy/2)
-
-    if height != 1:
-        text_shape = scale_xy(text_shape, 0, 0, height)
-        dx *= height
-        dy *= height
-
-    return move(text_shape, x, y)
+    if not placed:  return None
+
+    shift = 0
+    if align[1] == 'B':     shift = -dy
+    elif align[1] == 'C':   shift = -dy/2
+
+    # Each glyph is moved into place on its own (rather than moving
+    # the whole block of text), so that the union can skip glyphs
+    # that are far from the region being rendered.
+    glyphs = []
+    for glyph, gx, gy in placed:
+        if height != 1:
+            glyph = scale_xy(glyph, 0, 0, height)
+        glyphs.append(move(glyph, x + gx*height, y + (gy + shift)*height))
+
+    return union(glyphs)
 
 
 _glyphs = {}
@@ -1,67 +1,57 @@
 from    datetime    import datetime
-import  queue
-import  re
-import  io
-import  sys
 import  threading
-import  traceback
 
 import  wx
 
 import  koko
-from    koko.struct         import Struct
-from    koko.fab.asdf       import ASDF
-from    koko.fab.tree       import MathTree
-from    koko.fab.fabvars    import FabVars
-from    koko.fab.mesh       import Mesh
+from    koko.worker         import RenderJob
 
-from    koko.c.region       import Region
 
-
-class RenderTask(object):
+class RenderTask(RenderJob):
     """ @class RenderTask
         @brief A render job running in a separate thread
     """
 
-    def __init__(self, view, script=None, cad=None):
+    def __init__(self, view, script=None, cad=None, evaluator=None):
         """ @brief Constructs and starts a render task.
             @param view Render view (Struct with xmin, xmax, ymin, ymax, zmin, zmax, and pixels_per_unit member variables)
             @param script Source script to render
             @param cad Data structure from previous run
+            @param evaluator ScriptEvaluator holding the previous run of the script (if None, the script is run from scratch)
         """
+        RenderJob.__init__(self, view, script, cad, evaluator)
 
-        if not (bool(script) ^ bool(cad)):
-            raise Exception('RenderTask must be initialized with either a script or a cad structure.')
-
-        ## @var view
-        # Struct representing render view
-        self.view    = view
+        ## @var thread
+        # threading.Thread that actually runs the task
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
 
-        ## @var script
-        # String containing design script
-        self.script  = script
+########################################
 
-        ## @var cad
-        # FabVars structure containing pre-computed results
-        self.cad     = cad
+    def set_status(self, status):
+        """ @brief Shows a status message in the frame
+        """
+        RenderJob.set_status(self, status)
+        koko.FRAME.status = status
 
-        ## @var event
-        # threading.Event used to halt rendering
-        self.event   = threading.Event()
 
-        ## @var c_event
-        # threading.Event used to halt rendering in C functions
-        self.c_event = threading.Event()
+    def publish(self):
+        """ @brief Shows the output so far in the output pane
+        """
+        koko.FRAME.output = self.output
 
-        ## @var output
-        # String holding text to be loaded into the output panel
-        self.output  = ''
 
-        ## @var thread
-        # threading.Thread that actually runs the task
-        self.thread = threading.Thread(target=self.run)
-        self.thread.daemon = True
-        self.thread.start()
+    def fail(self, status, error_line=None):
+        """ @brief Shows a failure: a status message, red borders
+            around the canvases, and an error mark in the text editor
+        """
+        koko.FRAME.status = status
+        koko.CANVAS.border   = (255, 0, 0)
+        koko.GLCANVAS.border = (255, 0, 0)
+        if error_line is not None:
+            koko.EDITOR.error_marker = error_line
+        koko.FRAME.output = self.output
 
 ########################################
 
@@ -69,16 +59,7 @@ class RenderTask(object):
         """ @brief Runs the given task
             @details Renders file and loads results into canvas(es) if successful.
         """
-        start = datetime.now()
-
-        # Clear markings from previous runs
-        koko.CANVAS.border   = None
-        koko.GLCANVAS.border = None
-        koko.FRAME.status = ''
-        koko.EDITOR.error_marker = None
-
-        # Add the top-level header to the output pane
-        self.output += '####       Rendering image      ####\n'
+        start = self.begin()
 
         # Run cad_math to generate a cad structure
         make_mesh = self.cad is None or koko.GLCANVAS.loaded is False
@@ -86,36 +67,7 @@ class RenderTask(object):
         # Try to generate the cad structure, aborting if failed
         if not self.cad and not self.cad_math():     return
 
-        # If the cad structure defines a render mode, then enforce it.
-        height = koko.FRAME.get_menu('View','2D')
-        shaded = koko.FRAME.get_menu('View', '3D')
-        dual = koko.FRAME.get_menu('View', 'Both')
-
-        # If the cad file overrides the render mode, then disable
-        # the menu items so that the user can't change render mode.
-        if self.cad.render_mode is None:
-            wx.CallAfter(height.Enable, True)
-            wx.CallAfter(shaded.Enable, True)
-            wx.CallAfter(dual.Enable,   True)
-        else:
-            wx.CallAfter(height.Enable, False)
-            wx.CallAfter(shaded.Enable, False)
-            wx.CallAfter(dual.Enable,   False)
-
-        if self.cad.render_mode == '3D' and not shaded.IsChecked():
-            render_mode = '3D'
-            wx.CallAfter(shaded.Check, True)
-            wx.CallAfter(koko.APP.render_mode, '3D')
-        elif self.cad.render_mode == '2D' and not height.IsChecked():
-            render_mode = '2D'
-            wx.CallAfter(height.Check,True)
-            wx.CallAfter(koko.APP.render_mode, '2D')
-        elif shaded.IsChecked():
-            render_mode = '3D'
-        elif height.IsChecked():
-            render_mode = '2D'
-        else:
-            render_mode = ('3D','2D')
+        render_mode = self.set_render_mode()
 
         # Render and load a height-map image
         if '2D' in render_mode:
@@ -127,49 +79,81 @@ class RenderTask(object):
             koko.CANVAS.load_images(imgs, self.cad.mm_per_unit)
 
 
+        # Trace a preview of the 3D view
+        if '3D' in render_mode and koko.GLCANVAS.shading == 'Traced':
+            if not self.trace_preview():    return
+
         # Render and load a triangulated mesh
-        if make_mesh and '3D' in render_mode:
+        elif make_mesh and '3D' in render_mode:
             koko.GLCANVAS.loaded = False
 
-            images = []
-            meshes = []
-            try:
-                image_scale = max(
-                    (1e6/expr.dx*expr.dy)**0.5 for expr in self.cad.shapes
-                    if not expr.dz
-                )
-            except ValueError:
-                image_scale = 1
+            shapes = self.make_shapes()
+            if shapes is None:  return
+            elif shapes is False:
+                self.fail(self.status)
+                return
+            self.load_shapes(*shapes)
 
-            for e in self.cad.shapes:
-                if self.event.is_set(): return
+        self.finish(start)
+
+
+    def begin(self):
+        """ @brief Clears markings from previous runs
+            @returns The start time
+        """
+        koko.CANVAS.border   = None
+        koko.GLCANVAS.border = None
+        koko.FRAME.status = ''
+        koko.EDITOR.error_marker = None
 
-                # If this is a full 3D model, then render it
-                if e.bounded:
-                    meshes.append(self.make_mesh(e))
+        # Add the top-level header to the output pane
+        self.output += '####       Rendering image      ####\n'
+        return datetime.now()
 
-                # If it is a 2D model, then render it as an image
-                elif (self.cad.dx is not None and
-                      self.cad.dy is not None):
-                    images.append(self.make_flat_image(e, image_scale))
 
-                else:
-                    koko.FRAME.status = (
-                        'Error:  Objects must have valid bounds!'
-                    )
-                    koko.GLCANVAS.border = (255, 0, 0)
-                    return
+    def load_shapes(self, images, meshes):
+        """ @brief Loads flat images and meshes into the 3D canvas
+        """
+        if self.event.is_set(): return
 
+        koko.GLCANVAS.clear()
+        if images:  koko.GLCANVAS.load_images(images)
+        if meshes:  koko.GLCANVAS.load_meshes(meshes)
 
-            if not self.event.is_set():
-                koko.GLCANVAS.clear()
-                if images:  koko.GLCANVAS.load_images(images)
-                if meshes:  koko.GLCANVAS.load_meshes(meshes)
+        koko.GLCANVAS.loaded = True
 
-                koko.GLCANVAS.loaded = True
 
+    def trace_preview(self):
+        """ @brief Traces the shapes from the 3D canvas's current view
+            and loads the results
+            @returns True if success, False or None otherwise
+        """
+        width, height = koko.GLCANVAS.Size
+        shapes = self.make_preview(koko.GLCANVAS.camera(), width, height)
+        if shapes is None:  return
+        elif shapes is False:
+            self.fail(self.status)
+            return False
+        self.load_preview(*shapes)
+        return True
+
+
+    def load_preview(self, images, preview, bounds):
+        """ @brief Loads flat images and a traced preview into the 3D canvas
+            @details Any meshes are cleared, so they're regenerated if
+            the shading mode changes.
+        """
+        if self.event.is_set(): return
 
-        # Update the output pane
+        koko.GLCANVAS.clear()
+        koko.GLCANVAS.loaded = False
+        if images:  koko.GLCANVAS.load_images(images)
+        if preview: koko.GLCANVAS.load_preview(preview, *bounds)
+
+
+    def finish(self, start):
+        """ @brief Clears the status line and shows the output
+        """
         koko.GLCANVAS.border = None
         koko.CANVAS.border   = None
         koko.FRAME.status = ''
@@ -187,230 +171,99 @@ class RenderTask(object):
             @details Stores results in self.cad and modifies UI accordingly.
             @returns True if success, False or None otherwise
         """
+        ok = self.evaluate(koko.PRIMS.dict, env=koko.PRIMS.to_script())
+        if ok is False:
+            self.fail(self.status, self.error_line)
+        return ok
 
-        koko.FRAME.status = "Converting to math string"
-        now = datetime.now()
-
-        vars = koko.PRIMS.dict
-        vars['cad'] = FabVars()
-        self.output += '>>  Compiling to math file\n'
-
-        if self.event.is_set(): return
-
-        # Modify stdout to record messages
-        buffer = io.StringIO()
-        sys.stdout = buffer
-
-        try:
-            exec(self.script, vars)
-        except:
-            sys.stdout = sys.__stdout__
-
-            # If we've failed, color the border(s) red
-            koko.CANVAS.border   = (255, 0, 0)
-            koko.GLCANVAS.border = (255, 0, 0)
-
-            # Figure out where the error occurred
-            errors = traceback.format_exc().split('\n')
-            errors = errors[0]+'\n'+'\n'.join(errors[3:])
-            for m in re.findall(r'File "<string>", line (\d+)', errors):
-                error_line = int(m) - 1
-            errors = errors.replace(koko.BASE_DIR, '')
-
-            self.output += buffer.getvalue() + errors
-
-            # Update the status line and add an error mark in the text editor
-            try:
-                koko.EDITOR.error_marker = error_line
-                koko.FRAME.status = "cad_math failed (line %i)" % (error_line+1)
-            except NameError:
-                koko.FRAME.status = "cad_math failed"
-        else:
-            try:                self.cad = vars['cad']
-            except KeyError:    self.cad = None
-
-            self.output += buffer.getvalue()
-            dT = datetime.now() - now
-            self.output += "#   cad_math time: %s \n" % dT
-
-        # Put stdout back in place
-        sys.stdout = sys.__stdout__
-
-        koko.FRAME.output = self.output
-
-        if not self.cad:
-            koko.FRAME.states = 'Error: cad_math failed'
-            koko.CANVAS.border = (255, 0, 0)
-            koko.GLCANVAS.border = (255, 0, 0)
-            return
-        elif self.cad.shapes == []:
-            koko.FRAME.status = ('Error:  No shape defined!')
-            koko.CANVAS.border = (255, 0, 0)
-            koko.GLCANVAS.border = (255, 0, 0)
-            return
-
-        # Parse the math expression into a tree
-        koko.FRAME.status = 'Converting to tree'
-        for e in self.cad.shapes:
-            self.output += ">>  Parsing string into tree\n"
-            start = datetime.now()
-            if bool(e.ptr):
-                self.output += '#   parse time: %s\n' % (datetime.now() - start)
-            # If we failed to parse the math expression, note the failure
-            # and return False to indicate
-            else:
-                self.output += "Invalid math string!\n"
-                koko.FRAME.status = ('Error:  Invalid math string.')
-                koko.CANVAS.border = (255, 0, 0)
-                self.cad = None
-                return False
 
-
-        koko.FRAME.output = self.output
-
-        # Return True if we succeeded, false otherwise.
-        return self.cad != None
-
-########################################
-
-    def make_images(self):
-        """ @brief Renders a set of images from self.cad.shapes
-            @returns List of Image objects
+    def checked_mode(self):
+        """ @brief Returns the render mode selected in the View menu
+            ('2D', '3D', or 'Both')
         """
-        zmin = self.cad.zmin if self.cad.zmin is not None else 0
-        zmax = self.cad.zmax if self.cad.zmax is not None else 0
-
-        imgs = []
-        for e in self.cad.shapes:
-            if self.event.is_set(): return
-            imgs.append(self.make_image(e, zmin, zmax))
+        for m in ('2D', '3D'):
+            if koko.FRAME.get_menu('View', m).IsChecked():  return m
+        return 'Both'
 
-        return imgs
 
-
-    def make_flat_image(self, expr, scale):
-        """ @brief Renders a flat single image
-            @param expr MathTree expression
-            @returns An Image object
-        """
-        region = Region(
-            (expr.xmin-self.cad.border*expr.dx,
-             expr.ymin-self.cad.border*expr.dy,
-             0),
-            (expr.xmax+self.cad.border*expr.dx,
-             expr.ymax+self.cad.border*expr.dy,
-             0),
-            scale
-        )
-
-        koko.FRAME.status = 'Rendering with libfab'
-        self.output += ">>  Rendering image with libfab\n"
-
-        start = datetime.now()
-        img = expr.render(region, interrupt=self.c_event,
-                          mm_per_unit=self.cad.mm_per_unit)
-        img.color = expr.color
-
-        dT = datetime.now() - start
-        self.output += "#   libfab render time: %s\n" % dT
-        return img
-
-
-    def make_image(self, expr, zmin, zmax):
-        """ @brief Renders an expression
-            @param expr MathTree expression
-            @param zmin Minimum Z value (arbitrary units)
-            @param zmax Maximum Z value (arbitrary units)
-            @returns None for a null image, False for a failure, the Image if success.
+    def set_render_mode(self):
+        """ @brief Picks the render mode, enforcing the cad structure's
+            render mode in the View menu
+            @returns '2D', '3D', or ('3D', '2D')
         """
+        items = dict((m, koko.FRAME.get_menu('View', m))
+                     for m in ('2D', '3D', 'Both'))
 
-        # Adjust view bounds based on cad file scale
-        # (since view bounds are in mm, we have to convert to the cad
-        #  expression's unitless measure)
-        xmin = self.view.xmin
-        xmax = self.view.xmax
-        ymin = self.view.ymin
-        ymax = self.view.ymax
-
-        if expr.xmin is None:   xmin = xmin
-        else:   xmin = max(xmin, expr.xmin - self.cad.border*expr.dx)
-
-        if expr.xmax is None:   xmax = xmax
-        else:   xmax = min(xmax, expr.xmax + self.cad.border*expr.dx)
-
-        if expr.ymin is None:   ymin = ymin
-        else:   ymin = max(ymin, expr.ymin - self.cad.border*expr.dy)
-
-        if expr.ymax is None:   ymax = ymax
-        else:   ymax = min(ymax, expr.ymax + self.cad.border*expr.dy)
-
-        region = Region( (xmin, ymin, zmin), (xmax, ymax, zmax),
-                         self.view.pixels_per_unit )
-
-        koko.FRAME.status = 'Rendering with libfab'
-        self.output += ">>  Rendering image with libfab\n"
-
-        start = datetime.now()
-        img = expr.render(region, interrupt=self.c_event,
-                          mm_per_unit=self.cad.mm_per_unit)
+        # If the cad file overrides the render mode, then disable
+        # the menu items so that the user can't change render mode.
+        for m in items.values():
+            wx.CallAfter(m.Enable, self.cad.render_mode is None)
 
-        img.color = expr.color
-        dT = datetime.now() - start
-        self.output += "#   libfab render time: %s\n" % dT
-        return img
+        checked = self.checked_mode()
+        render_mode = self.pick_mode(checked)
+        if self.cad.render_mode is not None and render_mode != checked:
+            wx.CallAfter(items[render_mode].Check, True)
+            wx.CallAfter(koko.APP.render_mode, render_mode)
+        return render_mode
 
 ################################################################################
 
-    def make_mesh(self, expr):
-        """ @brief Converts an expression into a mesh.
-            @returns The mesh, or False if failure.
-        """
-
-        self.output += '>>  Generating triangulated mesh\n'
-
-        DEPTH = 0
-        while DEPTH <= 4:
+class ProcessRenderTask(RenderTask):
+    """ @class ProcessRenderTask
+        @brief A render job running in a worker process
+        @details A thread in this process waits for the results and loads
+        them into the canvas(es).  Setting the task's events cancels the job.
+    """
 
-            region = Region(
-                (expr.xmin - self.cad.border*expr.dx,
-                 expr.ymin - self.cad.border*expr.dy,
-                 expr.zmin - self.cad.border*expr.dz),
-                (expr.xmax + self.cad.border*expr.dx,
-                 expr.ymax + self.cad.border*expr.dy,
-                 expr.zmax + self.cad.border*expr.dz),
-                 depth=DEPTH
-            )
+    def __init__(self, view, script, worker):
+        """ @brief Constructs and starts a render task.
+            @param view Render view
+            @param script Source script to render
+            @param worker RenderWorker that runs the job
+        """
+        ## @var worker
+        # RenderWorker that runs the job
+        self.worker = worker
 
-            koko.FRAME.status = 'Rendering to ASDF'
+        RenderTask.__init__(self, view, script=script)
 
-            start = datetime.now()
-            asdf = expr.asdf(region=region, mm_per_unit=self.cad.mm_per_unit,
-                             interrupt=self.c_event)
 
-            self.output += '#   ASDF render time: %s\n' % (datetime.now() - start)
-            if self.event.is_set(): return
-            koko.FRAME.output = self.output
+    def run(self):
+        """ @brief Runs the job in the worker, then loads its results
+        """
+        start = self.begin()
+        koko.FRAME.status = 'Running script in worker process'
 
-            koko.FRAME.status = 'Triangulating'
-            start = datetime.now()
-            mesh = asdf.triangulate(interrupt=self.c_event)
+        # Traced previews need the view, so they're made in this process
+        traced = koko.GLCANVAS.shading == 'Traced'
+        job = dict(script=self.script, view=self.view,
+                   mode=self.checked_mode(), make_mesh=not traced)
+        try:
+            result = self.worker.run(job, self.event)
+        except Exception as e:
+            self.output += '%s\n' % e
+            self.fail('Error:  %s' % e)
+            return
+        if result is None:  return
 
-            if mesh.vcount: break
-            else:           DEPTH += 1
+        self.output += result['output']
+        if not result['ok']:
+            self.fail(result['status'], result['error_line'])
+            return
 
-        mesh.source = Struct(
-            type=MathTree, expr=expr.clone(),
-            depth=DEPTH, scale=self.cad.mm_per_unit
-        )
+        self.cad = result['cad']
+        render_mode = self.set_render_mode()
 
-        if self.event.is_set(): return
+        if result['images'] is not None:
+            koko.CANVAS.load_images(result['images'], self.cad.mm_per_unit)
 
-        self.output += '#   Meshing time: %s\n' % (datetime.now() - start)
-        self.output += "Generated {:,} vertices and {:,} triangles\n".format(
-            mesh.vcount if mesh else 0, mesh.tcount if mesh else 0)
+        if result['meshes'] is not None:
+            koko.GLCANVAS.loaded = False
+            self.load_shapes(result['flat'], result['meshes'])
+        elif traced and '3D' in render_mode:
+            if not self.trace_preview():    return
 
-        koko.FRAME.output = self.output
-        return mesh
+        self.finish(start)
 
 ################################################################################
 
@@ -446,8 +299,8 @@ class RefineTask(object):
         """
 
         koko.FRAME.status = 'Refining mesh'
-        self.mesh.refine()
-        koko.GLCANVAS.reload_vbos()
+        self.mesh.refine(self.event, self.c_event)
+        if not self.event.is_set():     koko.GLCANVAS.reload_vbos()
 
 ################################################################################
 
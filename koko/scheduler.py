@@ -0,0 +1,212 @@
+""" Module defining a priority scheduler for background tasks. """
+
+import  os
+import  threading
+
+## @var PREVIEW
+# Priority of interactive renders (runs first)
+PREVIEW = 0
+
+## @var REFINE
+# Priority of mesh refinement
+REFINE  = 1
+
+## @var BACKGROUND
+# Priority of exports and CAM toolpath generation
+BACKGROUND = 2
+
+
+class Job(object):
+    """ @class Job
+        @brief A task waiting for (or holding) a place in the Scheduler
+    """
+
+    def __init__(self, start, priority, key=None, preempt=False, done=None):
+        """ @brief Constructs a job.
+            @param start Function that creates and starts a task (an object with thread, event, and c_event members)
+            @param priority Priority (lower numbers run first)
+            @param key Jobs with the same key are redundant: submitting one replaces any that is queued and cancels any that is running
+            @param preempt Boolean determining whether this job is cancelled when a higher-priority job is submitted
+            @param done Function called with the task once it finishes (unless it was cancelled)
+        """
+        ## @var start
+        # Function that creates and starts the task
+        self.start = start
+
+        ## @var priority
+        # Job priority (lower numbers run first)
+        self.priority = priority
+
+        ## @var key
+        # Coalescing key (or None)
+        self.key = key
+
+        ## @var preempt
+        # Boolean determining whether higher-priority jobs cancel this one
+        self.preempt = preempt
+
+        ## @var done
+        # Callback for finished tasks (or None)
+        self.done = done
+
+        ## @var task
+        # Running task (None until started)
+        self.task = None
+
+        ## @var cancelled
+        # Boolean indicating that the job was cancelled
+        self.cancelled = False
+
+
+    def cancel(self):
+        """ @brief Cancels the job, telling its task to stop if running
+        """
+        self.cancelled = True
+        if self.task is not None:
+            self.task.event.set()
+            self.task.c_event.set()
+
+################################################################################
+
+class ThreadTask(object):
+    """ @class ThreadTask
+        @brief Runs a function in a thread, as a task that the Scheduler can start
+    """
+
+    def __init__(self, target):
+        """ @brief Starts running a function in a separate thread.
+            @param target Function to run
+        """
+        ## @var event
+        # threading.Event (unused by the target, so this task can't be cancelled)
+        self.event   = threading.Event()
+
+        ## @var c_event
+        # threading.Event (unused by the target)
+        self.c_event = threading.Event()
+
+        ## @var thread
+        # threading.Thread that actually runs the task
+        self.thread = threading.Thread(target=target)
+        self.thread.daemon = True
+        self.thread.start()
+
+################################################################################
+
+class Scheduler(object):
+    """ @class Scheduler
+        @brief Runs jobs in priority order, coalescing redundant ones
+        @details A job waits while a job with the same key is still running
+        (so a burst of redundant requests collapses into the latest one) and
+        while any higher-priority job is running or waiting.  Each priority
+        level may run up to slots jobs at once; lower-priority jobs don't
+        count against that limit, so they never delay interactive work.
+    """
+
+    def __init__(self, slots=None, wake=None):
+        """ @brief Constructs a scheduler.
+            @param slots Number of jobs to run at once in each priority level (defaults to the number of cores)
+            @param wake Function called (from another thread) when a task finishes, so that the caller knows to poll
+        """
+        ## @var slots
+        # Number of jobs to run at once in each priority level
+        self.slots = slots if slots else (os.cpu_count() or 1)
+
+        ## @var wake
+        # Function called when a task finishes (or None)
+        self.wake = wake
+
+        ## @var queue
+        # List of jobs waiting to run, in order of submission
+        self.queue = []
+
+        ## @var running
+        # List of started jobs
+        self.running = []
+
+        ## @var coalesced
+        # Number of queued jobs that were replaced by later ones
+        self.coalesced = 0
+
+        ## @var preempted
+        # Number of running jobs cancelled for higher-priority work
+        self.preempted = 0
+
+
+    def submit(self, job):
+        """ @brief Adds a job, cancelling any it supersedes or preempts
+            @param job Job to run
+            @returns The job
+        """
+        if job.key is not None:
+            for j in [j for j in self.queue if j.key == job.key]:
+                self.queue.remove(j)
+                j.cancelled = True
+                self.coalesced += 1
+            for j in self.running:
+                if j.key == job.key:    j.cancel()
+
+        for j in self.running:
+            if j.preempt and j.priority > job.priority and not j.cancelled:
+                j.cancel()
+                self.preempted += 1
+
+        self.queue.append(job)
+        self.poll()
+        return job
+
+
+    def cancel(self, key=None):
+        """ @brief Cancels jobs
+            @param key Key of jobs to cancel (or None to cancel all of them)
+        """
+        for j in [j for j in self.queue if key is None or j.key == key]:
+            self.queue.remove(j)
+            j.cancelled = True
+        for j in self.running:
+            if key is None or j.key == key:     j.cancel()
+
+
+    def jobs(self, key=None):
+        """ @brief Lists queued and running jobs that haven't been cancelled
+            @param key Key of jobs to list (or None to list all of them)
+        """
+        return [j for j in self.running + self.queue
+                if not j.cancelled and (key is None or j.key == key)]
+
+
+    def poll(self):
+        """ @brief Collects finished jobs, then starts queued jobs if possible.
+            @details Must be called from the thread that submits jobs.
+        """
+        for j in [j for j in self.running if not j.task.thread.is_alive()]:
+            j.task.thread.join()
+            self.running.remove(j)
+            if j.done and not j.cancelled:    j.done(j.task)
+
+        waiting = []
+        for j in sorted(self.queue, key=lambda j: j.priority):
+            if (any(w.priority < j.priority for w in waiting) or
+                any(r.priority < j.priority for r in self.running) or
+                (j.key is not None and
+                 any(r.key == j.key for r in self.running)) or
+                len([r for r in self.running if r.priority == j.priority])
+                    >= self.slots):
+                waiting.append(j)
+                continue
+
+            self.queue.remove(j)
+            j.task = j.start()
+            self.running.append(j)
+            if self.wake:   self.watch(j.task)
+
+
+    def watch(self, task):
+        """ @brief Calls self.wake once a task's thread finishes
+        """
+        def wait():
+            task.thread.join()
+            self.wake()
+        watcher = threading.Thread(target=wait)
+        watcher.daemon = True
+        watcher.start()
@@ -0,0 +1,418 @@
+"""Long-lived render daemon with warm caches.
+
+``kokopelli serve`` listens on a local Unix socket and runs render and
+export jobs, sent as one JSON object per line:
+
+    {"script": "part.ko", "format": "png", "output": "part.png",
+     "params": {"width": 2}, "view": {"xmin": 0, ..., "pixels_per_unit": 20}}
+
+and answers each with one JSON line (``{"ok": true, "output": ...}`` or
+``{"ok": false, "error": ...}``).  Between jobs the daemon keeps parsed
+math trees, packed trees and rendered per-shape images, so re-rendering a
+parameter variant only evaluates the shapes whose math has changed.
+
+``kokopelli submit`` is the matching client.  Like koko.batch, nothing here
+imports wx.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import socket
+import stat
+import sys
+import tempfile
+import time
+
+FORMATS = ("png", "svg", "stl", "asdf", "dot")
+
+
+def default_socket() -> str:
+    """Returns the per-user socket path used when none is given."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, f"kokopelli-{os.getuid()}.sock")
+
+
+class LRUCache:
+    """A least-recently-used cache bounded by total size.
+
+    size(value) gives each entry's cost (1 by default); evict(value) is
+    called on entries as they are dropped, to release native memory.
+    """
+
+    def __init__(self, capacity, size=None, evict=None):
+        self.capacity = capacity
+        self.size = size or (lambda value: 1)
+        self.evict = evict
+        self.entries: OrderedDict = OrderedDict()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key, make):
+        """Returns the cached value for key, calling make() on a miss."""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        value = make()
+        self.entries[key] = value
+        self.total += self.size(value)
+        while self.total > self.capacity and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.total -= self.size(old)
+            if self.evict:
+                self.evict(old)
+        return value
+
+    def clear(self) -> None:
+        while self.entries:
+            _, old = self.entries.popitem(last=False)
+            if self.evict:
+                self.evict(old)
+        self.total = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class Renderer:
+    """Runs jobs against warm caches of trees and rendered images."""
+
+    def __init__(self, threads: int = 8, tile_bytes: int = 256 << 20):
+        from koko.c.libfab import libfab
+
+        self.threads = threads
+        self.libfab = libfab
+
+        # Math string -> parsed MathTree
+        self.trees = LRUCache(512)
+        # Math string -> (clones, packed trees), one pair per render thread
+        self.packed = LRUCache(64, evict=self._free_packed)
+        # (math, region) -> rendered 16-bit Image
+        self.tiles = LRUCache(tile_bytes, size=lambda img: img.array.nbytes)
+
+    def _free_packed(self, entry) -> None:
+        clones, packed = entry
+        for p in packed:
+            self.libfab.free_packed(p)
+
+    def close(self) -> None:
+        self.tiles.clear()
+        self.packed.clear()
+        self.trees.clear()
+
+    def stats(self) -> dict:
+        return {"trees": self.trees.stats(), "packed": self.packed.stats(), "tiles": self.tiles.stats()}
+
+    ############################################################################
+
+    def tree(self, expr):
+        """Swaps an expression for the cached, already-parsed tree with the
+        same math (keeping the expression's own bounds and color).
+        """
+        tree = self.trees.get(expr.math, lambda: self._parse(expr))
+        if tree is expr:
+            return tree
+        out = tree.clone()
+        out.bounds = list(expr.bounds)
+        out.color = expr.color
+        out.shape = expr.shape
+        return out
+
+    @staticmethod
+    def _parse(expr):
+        if not expr.ptr:
+            raise ValueError("invalid math string")
+        return expr
+
+    def render(self, expr, region, mm_per_unit):
+        """Renders one shape over a region, reusing cached results."""
+        key = (
+            expr.math,
+            region.imin, region.jmin, region.kmin, region.ni, region.nj, region.nk,
+            region.X[0], region.X[region.ni], region.Y[0], region.Y[region.nj],
+            region.Z[0], region.Z[region.nk], mm_per_unit,
+        )
+
+        def make():
+            tree = self.trees.get(expr.math, lambda: self._parse(expr))
+            clones, packed = self.packed.get(
+                expr.math, lambda: self._pack(tree)
+            )
+            return tree.render(region, mm_per_unit=mm_per_unit, packed=packed)
+
+        img = self.tiles.get(key, make).copy()
+        img.color = expr.color
+        return img
+
+    def _pack(self, tree):
+        clones = [tree.clone() for i in range(self.threads)]
+        return clones, [self.libfab.make_packed(c.ptr) for c in clones]
+
+    ############################################################################
+
+    def run(self, job: dict) -> dict:
+        """Runs one job, returning a JSON-friendly result."""
+        from koko.batch import check_bounds, load_script
+
+        start = time.perf_counter()
+        filename = job["script"]
+        fmt = job.get("format", "png")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format {fmt!r}")
+        output = job.get("output") or os.fspath(Path(filename).with_suffix("." + fmt))
+
+        cad = load_script(filename, job.get("source"), job.get("params"))
+        # Views bring their own bounds
+        if not (fmt == "png" and job.get("view")):
+            check_bounds(cad, fmt)
+
+        if fmt == "png":
+            self.render_png(cad, output, job)
+        else:
+            from koko.exporter import CadExporter
+
+            cad.shapes = [self.tree(e) for e in cad.shapes]
+            options = {k: job[k] for k in ("resolution", "use_cms", "svg_relative", "dot_arrays") if k in job}
+            CadExporter(output, cad, **options).run()
+
+        return {"ok": True, "output": output, "seconds": time.perf_counter() - start}
+
+    def render_png(self, cad, output: str, job: dict) -> None:
+        """Renders a png, either as a heightmap over the design's bounds
+        (like a .png export) or as colored shapes within a view (like the
+        GUI's 2D canvas).
+        """
+        import numpy as np
+
+        from koko.c.region import Region
+        from koko.fab.image import Image
+
+        view = job.get("view")
+        resolution = job.get("resolution", 10)
+        zmin = cad.zmin if cad.zmin is not None else 0
+        zmax = cad.zmax if cad.zmax is not None else 0
+
+        if view is None:
+            region = Region(
+                (cad.xmin, cad.ymin, zmin), (cad.xmax, cad.ymax, zmax), resolution * cad.mm_per_unit
+            )
+            imgs = [self.render(e, region, cad.mm_per_unit) for e in cad.shapes]
+        else:
+            imgs = []
+            for e in cad.shapes:
+                xmin, xmax, ymin, ymax = view["xmin"], view["xmax"], view["ymin"], view["ymax"]
+                if e.xmin is not None:
+                    xmin = max(xmin, e.xmin - cad.border * e.dx)
+                if e.xmax is not None:
+                    xmax = min(xmax, e.xmax + cad.border * e.dx)
+                if e.ymin is not None:
+                    ymin = max(ymin, e.ymin - cad.border * e.dy)
+                if e.ymax is not None:
+                    ymax = min(ymax, e.ymax + cad.border * e.dy)
+                region = Region((xmin, ymin, zmin), (xmax, ymax, zmax), view["pixels_per_unit"])
+                imgs.append(self.render(e, region, cad.mm_per_unit))
+
+        if view is None and job.get("heightmap", True):
+            # A union's heightmap is the pixelwise maximum of its shapes'
+            out = imgs[0]
+            for img in imgs[1:]:
+                np.maximum(out.array, img.array, out=out.array)
+        else:
+            out = Image.merge(imgs)
+        out.save(output)
+
+
+################################################################################
+
+
+async def serve(path: str, renderer: Renderer) -> None:
+    """Serves jobs on a Unix socket until a shutdown request arrives."""
+    claim_socket(path)
+    loop = asyncio.get_running_loop()
+    # Jobs share the caches, so they run one at a time off the event loop
+    executor = ThreadPoolExecutor(max_workers=1)
+    stop = asyncio.Event()
+
+    def handle(job: dict) -> dict:
+        command = job.get("command", "run")
+        if command == "stats":
+            return {"ok": True, "stats": renderer.stats()}
+        if command == "shutdown":
+            return {"ok": True}
+        if command != "run":
+            raise ValueError(f"unknown command {command!r}")
+        return renderer.run(job)
+
+    async def client(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    job = json.loads(line)
+                    result = await loop.run_in_executor(executor, handle, job)
+                except Exception as exc:
+                    result = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+                writer.write(json.dumps(result).encode() + b"\n")
+                await writer.drain()
+                if result.get("ok") and job.get("command") == "shutdown":
+                    stop.set()
+        finally:
+            writer.close()
+
+    # Clients can run arbitrary scripts, so only this user may connect
+    umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(client, path=path)
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    inode = os.stat(path).st_ino
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        executor.shutdown(wait=True)
+        # Leave the path alone if something else has replaced our socket
+        try:
+            if os.stat(path).st_ino == inode:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def claim_socket(path: str) -> None:
+    """Removes a stale socket left at path by a daemon that has exited.
+
+    Raises FileExistsError if path is something other than a socket, and
+    RuntimeError if a daemon is still answering on it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise RuntimeError(f"a daemon is already serving on {path}")
+
+
+def submit(jobs: list[dict], path: str | None = None, timeout: float | None = None) -> list[dict]:
+    """Sends jobs to a running daemon, returning one result per job."""
+    results = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path or default_socket())
+        stream = s.makefile("rwb")
+        for job in jobs:
+            stream.write(json.dumps(job).encode() + b"\n")
+            stream.flush()
+            results.append(json.loads(stream.readline()))
+    return results
+
+
+################################################################################
+
+
+def serve_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="kokopelli serve",
+        description="Run a render daemon that keeps trees and images cached between jobs.",
+    )
+    parser.add_argument("--socket", "-s", default=default_socket(), help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=8, help="render threads per job (default: 8)")
+    args = parser.parse_args(argv)
+
+    try:
+        claim_socket(args.socket)
+    except (FileExistsError, RuntimeError) as exc:
+        print(f"kokopelli serve: {exc}", file=sys.stderr)
+        return 1
+
+    renderer = Renderer(threads=args.threads)
+    print(f"kokopelli serving on {args.socket}", flush=True)
+    try:
+        asyncio.run(serve(args.socket, renderer))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+    return 0
+
+
+def submit_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="kokopelli submit",
+        description="Send render and export jobs to a running `kokopelli serve` daemon.",
+    )
+    parser.add_argument("files", nargs="*", help="design scripts (.ko)")
+    parser.add_argument("--format", "-f", choices=FORMATS, default="png", help="output format (default: png)")
+    parser.add_argument("--output", "-o", help="output file (with a single input)")
+    parser.add_argument("--resolution", "-r", type=float, help="resolution in pixels per mm")
+    parser.add_argument(
+        "--param", "-p", action="append", default=[], metavar="NAME=VALUE",
+        help="script variable, as a Python literal (may be repeated)",
+    )
+    parser.add_argument("--socket", "-s", default=default_socket(), help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--stats", action="store_true", help="print cache statistics")
+    parser.add_argument("--shutdown", action="store_true", help="stop the daemon")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.files) > 1:
+        parser.error("--output can only be used with a single input file")
+
+    import ast
+
+    params = {}
+    for p in args.param:
+        name, _, value = p.partition("=")
+        try:
+            params[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            params[name] = value
+
+    jobs = []
+    for filename in args.files:
+        job = {"script": os.path.abspath(filename), "format": args.format, "params": params}
+        if args.output:
+            job["output"] = os.path.abspath(args.output)
+        if args.resolution is not None:
+            job["resolution"] = args.resolution
+        jobs.append(job)
+    if args.stats:
+        jobs.append({"command": "stats"})
+    if args.shutdown:
+        jobs.append({"command": "shutdown"})
+
+    try:
+        results = submit(jobs, args.socket)
+    except OSError as exc:
+        print(f"kokopelli submit: can't reach daemon at {args.socket}: {exc}", file=sys.stderr)
+        return 1
+
+    failed = 0
+    for job, result in zip(jobs, results):
+        if not result["ok"]:
+            failed += 1
+            print(f"{job.get('script', job.get('command'))}: {result['error']}", file=sys.stderr)
+        elif "output" in result:
+            print(f"{job['script']} -> {result['output']} ({result['seconds'] * 1000:.0f} ms)")
+        elif "stats" in result:
+            print(json.dumps(result["stats"], indent=2))
+    return 1 if failed else 0
@@ -2,17 +2,24 @@ import threading
 import operator
 import random
 
+import wx
+
 import koko
-from   koko.render import RenderTask, RefineTask, CollapseTask
+from   koko.render import RenderTask, ProcessRenderTask, RefineTask, CollapseTask
 from   koko.export import ExportTaskCad, ExportTaskASDF
 
 from   koko.fab.fabvars import FabVars
+from   koko.evaluator import ScriptEvaluator
+from   koko.worker import RenderWorker
+from   koko.scheduler import (Scheduler, Job, ThreadTask,
+                              PREVIEW, REFINE, BACKGROUND)
 
 class TaskBot(object):
     """ @class TaskBot
         @brief Manages various application threads
-        @details It may hold multiple render threads, up to one export thread,
-        and up to one fab subprocess.  It also keeps track of the current cad structure.
+        @details Render, refine, export, and CAM tasks are run by a Scheduler,
+        which runs interactive renders first and collapses bursts of render
+        requests into the latest one.  It also keeps track of the current cad structure.
     """
 
     def __init__(self):
@@ -23,33 +30,76 @@ class TaskBot(object):
         # Saved FabVars cad structure
         self.cached_cad     = None
 
-        ## @var export_task
-        # An ExportTask exporting the current model
-        self.export_task    = None
+        ## @var scheduler
+        # Scheduler running the tasks
+        self.scheduler = Scheduler(wake=wx.WakeUpIdle)
+
+        ## @var evaluator
+        # ScriptEvaluator that keeps the last run of the script, so that
+        # unchanged statements can be reused
+        self.evaluator = ScriptEvaluator()
 
-        ## @var cam_task
-        # A threading.Thread generating a CAM toolpath
-        self.cam_task       = None
+        ## @var worker
+        # RenderWorker that runs scripts in a separate process
+        # (or None to run them on threads in this one)
+        self.worker = None
 
-        ## @var refine_task
-        # A RefineTask or CollapseTask modifying the displayed mesh
-        self.refine_task    = None
+    @property
+    def export_task(self):
+        """ @brief The export job that's queued or running (or None)
+        """
+        jobs = self.scheduler.jobs('export')
+        return jobs[0] if jobs else None
 
-        ## @var tasks
-        # A list of RenderTask objects
-        self.tasks = []
 
     def render(self, view, script=''):
-        """ @brief Begins a new render task
+        """ @brief Queues a new render task, replacing any earlier one
             @param view View Struct (from Canvas.view)
             @param script Script text (if blank, uses cached result)
         """
+        # If this replaces a render of a new script, the new script still
+        # needs to be run (with the latest view)
+        if not script:
+            for j in self.scheduler.jobs('render'):
+                script = j.script or script
+
+        def start():
+            # Scripts that use GUI primitives run here, since the
+            # primitives are defined with wx
+            if script and self.worker and not koko.PRIMS.shapes:
+                return ProcessRenderTask(view, script, self.worker)
+            elif script:
+                return RenderTask(view, script=script,
+                                  evaluator=self.evaluator)
+            else:
+                return RenderTask(view, cad=self.cached_cad)
+
+        job = Job(start, PREVIEW, key='render', done=self.rendered)
+        job.script = script
+        self.scheduler.submit(job)
+
+
+    def rendered(self, task):
+        """ @brief Stores the cad structure from a finished render task
+        """
+        self.cached_cad = task.cad
+        if task.script:    koko.FAB.set_input(task.cad)
 
-        self.stop_threads()
-        self.join_threads()
 
-        if script:  self.tasks += [RenderTask(view, script=script)]
-        else:       self.tasks += [RenderTask(view, cad=self.cached_cad)]
+    def use_worker(self, enable):
+        """ @brief Chooses whether scripts run in a worker process
+            @param enable If True, starts a worker process; otherwise, stops it
+        """
+        if enable and self.worker is None:
+            self.worker = RenderWorker()
+            self.worker.start()
+        elif not enable and self.worker is not None:
+            # Closing waits for the current job, so don't block on it here
+            self.scheduler.cancel('render')
+            closer = threading.Thread(target=self.worker.close)
+            closer.daemon = True
+            closer.start()
+            self.worker = None
 
 
     def export(self, obj, path, **kwargs):
@@ -58,64 +108,42 @@ class TaskBot(object):
             @param path Filename (extension is used to determine export function)
         """
         if isinstance(obj, FabVars):
-            self.export_task = ExportTaskCad(path, obj, **kwargs)
+            start = lambda: ExportTaskCad(path, obj, **kwargs)
         else:
-            self.export_task = ExportTaskASDF(path, obj, **kwargs)
+            start = lambda: ExportTaskASDF(path, obj, **kwargs)
+        self.scheduler.submit(Job(start, BACKGROUND, key='export'))
 
 
     def start_cam(self):
-        """ @brief Starts a CAM path generation task
-            @details The CAM thread is stored in self.cam_task.
+        """ @brief Queues a CAM path generation task
         """
-        self.cam_task = threading.Thread(target=koko.FAB.run)
-        self.cam_task.daemon = True
-        self.cam_task.start()
+        self.scheduler.submit(
+            Job(lambda: ThreadTask(koko.FAB.run), BACKGROUND, key='cam')
+        )
 
     def reset(self):
         """ @brief Attempts to halt all threads and clears cached cad data.
         """
         self.cached_cad = None
+        self.evaluator.reset()
+        if self.worker:     self.worker.reset()
         self.stop_threads()
 
     def stop_threads(self):
-        """ @brief Informs each thread that it should stop.
-            @details Threads are collected in join_threads once they obey.
+        """ @brief Cancels render and refine tasks.
+            @details Tasks are collected in join_threads once they obey.
         """
-        for task in self.tasks:
-            task.event.set()
-            task.c_event.set()
-
-        if self.refine_task:
-            self.refine_task.event.set()
-            self.refine_task.c_event.set()
+        self.scheduler.cancel('render')
+        self.scheduler.cancel('refine')
 
 
     def join_threads(self):
-        """ @brief Joins any thread whose work is finished.
+        """ @brief Collects finished tasks and starts queued ones.
 
-            @details Grabs the cad data structure from render threads, storing
-            it as cached_cad (for later re-use).
+            @details Finished render tasks store their cad data structure
+            as cached_cad (for later re-use).
         """
-
-        for task in [t for t in self.tasks if not t.thread.is_alive()]:
-            self.cached_cad = task.cad
-            if task.script:    koko.FAB.set_input(task.cad)
-            task.thread.join()
-            task.thread = None
-
-        self.tasks = [t for t in self.tasks if t.thread is not None]
-
-        if self.cam_task and not self.cam_task.is_alive():
-            self.cam_task.join()
-            self.cam_task = None
-
-        if self.export_task and not self.export_task.thread.is_alive():
-            self.export_task.thread.join()
-            self.export_task = None
-
-        if self.refine_task and not self.refine_task.thread.is_alive():
-            self.refine_task.thread.join()
-            self.refine_task = None
+        self.scheduler.poll()
 
 
     def refine(self):
@@ -123,9 +151,8 @@ class TaskBot(object):
         """
         if not koko.GLCANVAS.IsShown(): return
 
-        if (self.export_task is not None or self.refine_task is not None or
-            self.cam_task is not None):
-            return
+        # Wait for any other task (renders replace the meshes anyway)
+        if self.scheduler.jobs():   return
 
         if koko.GLCANVAS.border:    return
         if koko.GLCANVAS.LOD_complete:  return
@@ -175,10 +202,12 @@ class TaskBot(object):
 
         if worst is not None:
             mesh = [d for d in collapsible if collapsible[d] == worst][0]
-            self.refine_task = CollapseTask(mesh)
+            self.scheduler.submit(Job(lambda: CollapseTask(mesh), REFINE,
+                                      key='refine', preempt=True))
         elif best is not None:
             mesh = [d for d in expandable if expandable[d] == best][0]
-            self.refine_task = RefineTask(mesh)
+            self.scheduler.submit(Job(lambda: RefineTask(mesh), REFINE,
+                                      key='refine', preempt=True))
         else:
             koko.FRAME.status = ''
             koko.GLCANVAS.LOD_complete = True
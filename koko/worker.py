@@ -0,0 +1,815 @@
+"""
+@namespace worker
+@brief Runs design scripts and renders outside the GUI process.
+
+@details RenderJob holds the parts of a render that don't touch the GUI:
+running the script, parsing its shapes, and rendering images and meshes.
+koko.render.RenderTask runs it on a thread in the GUI process.  A
+RenderWorker runs it in a separate process instead, so a script that
+spends a long time in Python (building text or PCB expressions, say) can't
+hold the GIL and freeze the editor and canvas.
+
+The worker sends images and meshes back in shared memory blocks
+(multiprocessing.shared_memory), which are mapped here as numpy arrays
+without copying.  Everything else, including the cad structure (whose
+MathTrees pickle as their math strings), comes back through a pipe.
+"""
+
+from    datetime    import datetime
+import  io
+import  multiprocessing
+from    multiprocessing.shared_memory import SharedMemory
+import  re
+import  sys
+import  threading
+import  time
+import  traceback
+
+import  numpy as np
+
+import  koko
+from    koko.struct         import Struct
+from    koko.evaluator      import ScriptEvaluator
+from    koko.fab.cache      import default_cache
+from    koko.fab.fabvars    import FabVars
+from    koko.fab.image      import Image
+from    koko.fab.mesh       import Mesh
+from    koko.fab.tree       import MathTree
+
+from    koko.c.region       import Region
+from    koko.c.vec3f        import Vec3f
+
+
+class RenderJob(object):
+    """ @class RenderJob
+        @brief Runs a script and renders its shapes, without touching the GUI
+    """
+
+    def __init__(self, view, script=None, cad=None, evaluator=None):
+        """ @brief Constructs a render job.
+            @param view Render view (Struct with xmin, xmax, ymin, ymax, zmin, zmax, and pixels_per_unit member variables)
+            @param script Source script to render
+            @param cad Data structure from previous run
+            @param evaluator ScriptEvaluator holding the previous run of the script (if None, the script is run from scratch)
+        """
+
+        if not (bool(script) ^ bool(cad)):
+            raise Exception('RenderTask must be initialized with either a script or a cad structure.')
+
+        ## @var view
+        # Struct representing render view
+        self.view    = view
+
+        ## @var script
+        # String containing design script
+        self.script  = script
+
+        ## @var cad
+        # FabVars structure containing pre-computed results
+        self.cad     = cad
+
+        ## @var evaluator
+        # ScriptEvaluator used to run the script
+        self.evaluator = evaluator if evaluator else ScriptEvaluator()
+
+        ## @var cache
+        # DiskCache holding results of earlier renders
+        self.cache = default_cache()
+
+        ## @var event
+        # threading.Event used to halt rendering
+        self.event   = threading.Event()
+
+        ## @var c_event
+        # threading.Event used to halt rendering in C functions
+        self.c_event = threading.Event()
+
+        ## @var output
+        # String holding text to be loaded into the output panel
+        self.output  = ''
+
+        ## @var status
+        # Most recent status message
+        self.status = ''
+
+        ## @var error_line
+        # Script line (counting from 0) where evaluation failed, or None
+        self.error_line = None
+
+########################################
+
+    def set_status(self, status):
+        """ @brief Records a status message
+        """
+        self.status = status
+
+
+    def publish(self):
+        """ @brief Called when self.output has new text to show
+        """
+        pass
+
+########################################
+
+    def evaluate(self, initial, env=None):
+        """ @brief Evaluates the script to generate a FabVars data structure
+            @param initial Dictionary of names to define before running the script (besides cad)
+            @param env Key describing anything else the initial names depend on
+            @details Stores results in self.cad.  On failure, self.status describes the error, and self.error_line is set if it was in the script.
+            @returns True if success, False if failure, None if interrupted
+        """
+
+        self.set_status("Converting to math string")
+        now = datetime.now()
+
+        initial = dict(initial)
+        initial['cad'] = FabVars()
+        self.output += '>>  Compiling to math file\n'
+
+        if self.event.is_set(): return None
+
+        # Modify stdout to record messages
+        buffer = io.StringIO()
+        sys.stdout = buffer
+
+        # Statements before the first edit are reused from the last run
+        # (unless the names that they read have changed)
+        try:
+            vars = self.evaluator.run(self.script, initial, env=env,
+                                      interrupt=self.event)
+        except:
+            sys.stdout = sys.__stdout__
+
+            # Figure out where the error occurred, skipping the frames
+            # that lead up to the script itself
+            etype, value, tb = sys.exc_info()
+            while tb and tb.tb_frame.f_code.co_filename != '<string>':
+                tb = tb.tb_next
+            errors = ''.join(traceback.format_exception(etype, value, tb))
+            for m in re.findall(r'File "<string>", line (\d+)', errors):
+                self.error_line = int(m) - 1
+            errors = errors.replace(getattr(koko, 'BASE_DIR', ''), '')
+
+            self.output += buffer.getvalue() + errors
+            self.publish()
+
+            if self.error_line is None:
+                self.set_status("cad_math failed")
+            else:
+                self.set_status("cad_math failed (line %i)" %
+                                (self.error_line + 1))
+            return False
+
+        # Put stdout back in place
+        sys.stdout = sys.__stdout__
+        if vars is None:    return None
+
+        self.cad = vars.get('cad')
+
+        self.output += buffer.getvalue()
+        dT = datetime.now() - now
+        self.output += "#   cad_math time: %s \n" % dT
+        if self.evaluator.reused:
+            self.output += "#   reused %i of %i statements\n" % (
+                self.evaluator.reused,
+                self.evaluator.reused + self.evaluator.executed
+            )
+        self.publish()
+
+        if not self.cad:
+            self.set_status('Error: cad_math failed')
+            return False
+        elif self.cad.shapes == []:
+            self.set_status('Error:  No shape defined!')
+            return False
+
+        # Parse the math expression into a tree
+        self.set_status('Converting to tree')
+        for e in self.cad.shapes:
+            self.output += ">>  Parsing string into tree\n"
+            start = datetime.now()
+            if bool(e.ptr):
+                self.output += '#   parse time: %s\n' % (datetime.now() - start)
+                self.output += '#   simplified: removed %i of %i nodes\n' % (
+                    e.simplified, e.simplified + e.node_count
+                )
+            # If we failed to parse the math expression, note the failure
+            # and return False to indicate
+            else:
+                self.output += "Invalid math string!\n"
+                self.set_status('Error:  Invalid math string.')
+                self.cad = None
+                return False
+
+        self.publish()
+        return True
+
+
+    def pick_mode(self, checked):
+        """ @brief Picks the render mode
+            @param checked Selected render mode ('2D', '3D', or 'Both')
+            @returns '2D', '3D', or ('3D', '2D'); the cad structure's render mode overrides the selection.
+        """
+        if self.cad.render_mode is not None:
+            return self.cad.render_mode
+        elif checked in ('2D', '3D'):
+            return checked
+        return ('3D', '2D')
+
+########################################
+
+    def render(self, expr, region):
+        """ @brief Renders an expression, or loads it from the cache
+            @param expr MathTree expression
+            @param region Render region
+            @returns An Image object
+        """
+        return self.cache.fetch(
+            'image', lambda: expr.render(region, interrupt=self.c_event,
+                                         mm_per_unit=self.cad.mm_per_unit),
+            expr, region, self.c_event, mm_per_unit=self.cad.mm_per_unit
+        )
+
+
+    def make_images(self):
+        """ @brief Renders a set of images from self.cad.shapes
+            @returns List of Image objects
+        """
+        zmin = self.cad.zmin if self.cad.zmin is not None else 0
+        zmax = self.cad.zmax if self.cad.zmax is not None else 0
+
+        imgs = []
+        for e in self.cad.shapes:
+            if self.event.is_set(): return
+            imgs.append(self.make_image(e, zmin, zmax))
+
+        return imgs
+
+
+    def make_shapes(self):
+        """ @brief Renders self.cad.shapes for the 3D view
+            @details Bounded shapes are triangulated, and flat shapes are rendered as images.
+            @returns (images, meshes) tuple, False if a shape has invalid bounds, or None if interrupted
+        """
+        images = []
+        meshes = []
+        image_scale = self.flat_scale()
+
+        for e in self.cad.shapes:
+            if self.event.is_set(): return None
+
+            # If this is a full 3D model, then render it
+            if e.bounded:
+                meshes.append(self.make_mesh(e))
+
+            # If it is a 2D model, then render it as an image
+            elif (self.cad.dx is not None and
+                  self.cad.dy is not None):
+                images.append(self.make_flat_image(e, image_scale))
+
+            else:
+                self.set_status('Error:  Objects must have valid bounds!')
+                return False
+
+        if self.event.is_set(): return None
+        return images, meshes
+
+
+    def make_preview(self, camera, width, height):
+        """ @brief Ray-traces self.cad.shapes for a quick 3D preview
+            @details Bounded shapes are traced straight from their math
+            trees and shaded into a single image, skipping the ASDF and
+            mesh; flat shapes are rendered as images (as in make_shapes).
+            @param camera Camera to trace from
+            @param width Image width in pixels
+            @param height Image height in pixels
+            @returns (images, preview, bounds) tuple, where preview is None if no shapes are bounded and bounds is a (min, max) pair of Vec3f corners; False if a shape has invalid bounds, or None if interrupted
+        """
+        images = []
+        traces = []
+        image_scale = self.flat_scale()
+
+        self.set_status('Tracing 3D preview')
+        self.output += '>>  Tracing 3D preview\n'
+        start = datetime.now()
+
+        for e in self.cad.shapes:
+            if self.event.is_set(): return None
+
+            if e.bounded:
+                traces.append(e.trace(camera, width, height,
+                                      interrupt=self.c_event))
+
+            elif (self.cad.dx is not None and
+                  self.cad.dy is not None):
+                images.append(self.make_flat_image(e, image_scale))
+
+            else:
+                self.set_status('Error:  Objects must have valid bounds!')
+                return False
+
+        if self.event.is_set(): return None
+
+        preview, bounds = None, None
+        if traces:
+            preview = Image.shade(traces, camera)
+            shapes = [e for e in self.cad.shapes if e.bounded]
+            bounds = (Vec3f(min(e.xmin for e in shapes),
+                            min(e.ymin for e in shapes),
+                            min(e.zmin for e in shapes)),
+                      Vec3f(max(e.xmax for e in shapes),
+                            max(e.ymax for e in shapes),
+                            max(e.zmax for e in shapes)))
+
+        self.output += '#   Trace time: %s\n' % (datetime.now() - start)
+        return images, preview, bounds
+
+
+    def flat_scale(self):
+        """ @brief Picks a resolution for flat shapes shown in the 3D view
+            @returns Scale in pixels per unit
+        """
+        try:
+            return max(
+                (1e6/expr.dx*expr.dy)**0.5 for expr in self.cad.shapes
+                if not expr.dz
+            )
+        except ValueError:
+            return 1
+
+
+    def make_flat_image(self, expr, scale):
+        """ @brief Renders a flat single image
+            @param expr MathTree expression
+            @returns An Image object
+        """
+        region = Region(
+            (expr.xmin-self.cad.border*expr.dx,
+             expr.ymin-self.cad.border*expr.dy,
+             0),
+            (expr.xmax+self.cad.border*expr.dx,
+             expr.ymax+self.cad.border*expr.dy,
+             0),
+            scale
+        )
+
+        self.set_status('Rendering with libfab')
+        self.output += ">>  Rendering image with libfab\n"
+
+        start = datetime.now()
+        img = self.render(expr, region)
+        img.color = expr.color
+
+        dT = datetime.now() - start
+        self.output += "#   libfab render time: %s\n" % dT
+        return img
+
+
+    def make_image(self, expr, zmin, zmax):
+        """ @brief Renders an expression
+            @param expr MathTree expression
+            @param zmin Minimum Z value (arbitrary units)
+            @param zmax Maximum Z value (arbitrary units)
+            @returns None for a null image, False for a failure, the Image if success.
+        """
+
+        # Adjust view bounds based on cad file scale
+        # (since view bounds are in mm, we have to convert to the cad
+        #  expression's unitless measure)
+        xmin = self.view.xmin
+        xmax = self.view.xmax
+        ymin = self.view.ymin
+        ymax = self.view.ymax
+
+        if expr.xmin is None:   xmin = xmin
+        else:   xmin = max(xmin, expr.xmin - self.cad.border*expr.dx)
+
+        if expr.xmax is None:   xmax = xmax
+        else:   xmax = min(xmax, expr.xmax + self.cad.border*expr.dx)
+
+        if expr.ymin is None:   ymin = ymin
+        else:   ymin = max(ymin, expr.ymin - self.cad.border*expr.dy)
+
+        if expr.ymax is None:   ymax = ymax
+        else:   ymax = min(ymax, expr.ymax + self.cad.border*expr.dy)
+
+        region = Region( (xmin, ymin, zmin), (xmax, ymax, zmax),
+                         self.view.pixels_per_unit )
+
+        self.set_status('Rendering with libfab')
+        self.output += ">>  Rendering image with libfab\n"
+
+        start = datetime.now()
+        img = self.render(expr, region)
+
+        img.color = expr.color
+        dT = datetime.now() - start
+        self.output += "#   libfab render time: %s\n" % dT
+        return img
+
+################################################################################
+
+    def make_mesh(self, expr):
+        """ @brief Converts an expression into a mesh.
+            @returns The mesh, or False if failure.
+        """
+
+        self.output += '>>  Generating triangulated mesh\n'
+
+        DEPTH = 0
+        while DEPTH <= 4:
+
+            region = Region(
+                (expr.xmin - self.cad.border*expr.dx,
+                 expr.ymin - self.cad.border*expr.dy,
+                 expr.zmin - self.cad.border*expr.dz),
+                (expr.xmax + self.cad.border*expr.dx,
+                 expr.ymax + self.cad.border*expr.dy,
+                 expr.zmax + self.cad.border*expr.dz),
+                 depth=DEPTH
+            )
+
+            start = datetime.now()
+            mesh = self.cache.fetch(
+                'mesh', lambda: self.triangulate(expr, region), expr, region,
+                self.c_event, mm_per_unit=self.cad.mm_per_unit
+            )
+            if self.event.is_set() or mesh is None: return
+
+            if mesh.vcount: break
+            else:           DEPTH += 1
+
+        mesh.source = Struct(
+            type=MathTree, expr=expr.clone(),
+            depth=DEPTH, scale=self.cad.mm_per_unit
+        )
+
+        if self.event.is_set(): return
+
+        self.output += '#   Meshing time: %s\n' % (datetime.now() - start)
+        self.output += "Generated {:,} vertices and {:,} triangles\n".format(
+            mesh.vcount if mesh else 0, mesh.tcount if mesh else 0)
+
+        self.publish()
+        return mesh
+
+
+    def triangulate(self, expr, region):
+        """ @brief Renders an expression to an ASDF and triangulates it
+            @returns The mesh, or None if interrupted
+        """
+        self.set_status('Rendering to ASDF')
+
+        start = datetime.now()
+        asdf = expr.asdf(region=region, mm_per_unit=self.cad.mm_per_unit,
+                         interrupt=self.c_event)
+
+        self.output += '#   ASDF render time: %s\n' % (datetime.now() - start)
+        if self.event.is_set() or asdf is None: return None
+        self.publish()
+
+        self.set_status('Triangulating')
+        mesh = asdf.triangulate(interrupt=self.c_event)
+        if self.event.is_set(): return None
+        expr.normals(mesh, self.cad.mm_per_unit)
+        return mesh
+
+################################################################################
+
+class SharedArray(np.ndarray):
+    """ @class SharedArray
+        @brief numpy array whose data is in a shared memory block
+        @details The block is unmapped when the array (and any views of it, which keep it alive) are deleted.
+    """
+    pass
+
+
+def share(array, blocks):
+    """ @brief Copies an array into a new shared memory block
+        @param array numpy array
+        @param blocks List to which the block is added (it must stay open until the other process has mapped it)
+        @returns (name, shape, dtype) tuple, which can be passed to attach
+    """
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return block.name, array.shape, array.dtype.str
+
+
+def attach(shared):
+    """ @brief Maps a shared memory block as a numpy array, without copying
+        @details Unlinks the block, so its memory is freed once the array is deleted.
+        @param shared (name, shape, dtype) tuple from share
+        @returns A SharedArray
+    """
+    name, shape, dtype = shared
+    block = SharedMemory(name)
+    block.unlink()
+    array = SharedArray(shape, dtype, buffer=block.buf)
+    array.block = block
+    return array
+
+
+def unlink(shared):
+    """ @brief Frees a shared memory block without mapping its data
+    """
+    try:                SharedMemory(shared[0]).unlink()
+    except OSError:     pass
+
+
+def share_image(img, blocks):
+    """ @brief Packs an image into shared memory
+        @returns Description to pass to attach_image
+    """
+    return dict(
+        array=share(img.array, blocks), color=img.color,
+        bounds=[img.xmin, img.xmax, img.ymin, img.ymax, img.zmin, img.zmax]
+    )
+
+
+def attach_image(shared):
+    """ @brief Rebuilds an image from shared memory
+    """
+    img = Image(0, 0)
+    img.array = attach(shared['array'])
+    img.color = shared['color']
+    for b, v in zip(['xmin','xmax','ymin','ymax','zmin','zmax'],
+                    shared['bounds']):
+        setattr(img, b, v)
+    return img
+
+
+def share_mesh(mesh, shapes, blocks):
+    """ @brief Packs a mesh into shared memory
+        @param shapes List of shapes, one of which is the mesh's source
+        @returns Description to pass to attach_mesh
+    """
+    def array(ptr, count):
+        if not count:   return np.zeros(0, dtype=ptr._type_)
+        return np.ctypeslib.as_array(ptr, shape=(count,))
+
+    source = mesh.source
+    return dict(
+        vertices=share(array(mesh.vdata, mesh.vcount*6), blocks),
+        triangles=share(array(mesh.tdata, mesh.tcount*3), blocks),
+        bounds=[mesh.X.lower, mesh.X.upper, mesh.Y.lower, mesh.Y.upper,
+                mesh.Z.lower, mesh.Z.upper],
+        color=mesh.color,
+        source=[i for i, s in enumerate(shapes) if s.math == source.expr.math][0],
+        depth=source.depth, scale=source.scale
+    )
+
+
+def attach_mesh(shared, shapes):
+    """ @brief Rebuilds a mesh from shared memory
+        @param shapes List of shapes that the mesh's source is taken from
+    """
+    mesh = Mesh.from_arrays(
+        attach(shared['vertices']), attach(shared['triangles']),
+        shared['bounds'], shared['color']
+    )
+    mesh.source = Struct(
+        type=MathTree, expr=shapes[shared['source']].clone(),
+        depth=shared['depth'], scale=shared['scale']
+    )
+    return mesh
+
+
+def shared_blocks(result):
+    """ @brief Lists the shared memory blocks in a worker's result
+    """
+    out = []
+    for img in (result.get('images') or []) + (result.get('flat') or []):
+        out.append(img['array'])
+    for mesh in result.get('meshes') or []:
+        out += [mesh['vertices'], mesh['triangles']]
+    return out
+
+################################################################################
+
+def run_job(job, evaluator, event, c_event, blocks):
+    """ @brief Runs a render job in the worker process
+        @param job Dictionary with script, view, mode ('2D', '3D' or 'Both'), and make_mesh entries
+        @param evaluator ScriptEvaluator kept between jobs
+        @param event threading.Event used to halt rendering
+        @param c_event threading.Event used to halt rendering in C functions
+        @param blocks List of shared memory blocks, to which new blocks are added
+        @returns Dictionary of results, or None if interrupted
+    """
+    task = RenderJob(job['view'], script=job['script'], evaluator=evaluator)
+    task.event, task.c_event = event, c_event
+
+    result = dict(ok=task.evaluate({}), cad=None,
+                  images=None, flat=None, meshes=None)
+    if result['ok'] is None or event.is_set():  return None
+
+    if result['ok']:
+        result['cad'] = task.cad
+        mode = task.pick_mode(job['mode'])
+
+        if '2D' in mode:
+            imgs = task.make_images()
+            if event.is_set():  return None
+            result['images'] = [share_image(i, blocks) for i in imgs]
+
+        if job['make_mesh'] and '3D' in mode:
+            shapes = task.make_shapes()
+            if shapes is None:  return None
+            elif shapes is False:
+                result['ok'] = False
+            else:
+                images, meshes = shapes
+                result['flat'] = [share_image(i, blocks) for i in images]
+                result['meshes'] = [share_mesh(m, task.cad.shapes, blocks)
+                                    for m in meshes]
+
+    result.update(output=task.output, status=task.status,
+                  error_line=task.error_line)
+    return result
+
+
+def serve(conn, stop, base_dir=None):
+    """ @brief Main loop of the worker process
+        @param conn multiprocessing Connection that jobs arrive on (None stops the loop)
+        @param stop multiprocessing.Event that interrupts the current job
+        @param base_dir koko.BASE_DIR of the parent process
+    """
+    if base_dir is not None:    koko.BASE_DIR = base_dir
+    evaluator = ScriptEvaluator()
+    blocks = []
+
+    def watch(done, event, c_event):
+        while not done.is_set():
+            if stop.wait(0.05):
+                event.set()
+                c_event.set()
+                return
+
+    while True:
+        try:                job = conn.recv()
+        except EOFError:    break
+
+        # By now the parent has mapped the previous job's blocks
+        for b in blocks:    b.close()
+        blocks = []
+
+        if job is None:     break
+        if job.get('reset'):    evaluator.reset()
+
+        done = threading.Event()
+        event, c_event = threading.Event(), threading.Event()
+        watcher = threading.Thread(target=watch, args=(done, event, c_event))
+        watcher.daemon = True
+        watcher.start()
+
+        try:
+            result = run_job(job, evaluator, event, c_event, blocks)
+        except Exception:
+            result = dict(ok=False, output=traceback.format_exc(),
+                          status='Error: render worker failed', error_line=None)
+        finally:
+            done.set()
+
+        try:
+            conn.send(result)
+        except Exception:
+            for b in blocks:    b.unlink()
+            conn.send(dict(ok=False, output=traceback.format_exc(),
+                           status="Error: couldn't send results from worker",
+                           error_line=None))
+
+
+class RenderWorker(object):
+    """ @class RenderWorker
+        @brief Runs render jobs in a separate process
+        @details The process is started on first use and kept running, so the script evaluator in it can reuse work between runs.
+    """
+
+    def __init__(self, grace=1.0):
+        """ @brief Constructs a worker (the process isn't started yet)
+            @param grace Seconds to let a cancelled job stop by itself before the process is killed
+        """
+        ## @var grace
+        # Seconds to let a cancelled job stop before killing the process
+        self.grace = grace
+
+        ## @var process
+        # multiprocessing.Process running serve (or None)
+        self.process = None
+
+        ## @var conn
+        # Connection to the worker process
+        self.conn = None
+
+        ## @var stop
+        # multiprocessing.Event that interrupts the worker's current job
+        self.stop = None
+
+        ## @var fresh
+        # True if the worker should forget its previous run of the script
+        self.fresh = False
+
+        self.lock = threading.Lock()
+
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+    def start(self):
+        """ @brief Starts the worker process, if it isn't running
+        """
+        if self.alive:  return
+
+        # A spawned process, since forking the GUI process isn't safe
+        context = multiprocessing.get_context('spawn')
+        self.conn, child = context.Pipe()
+        self.stop = context.Event()
+        self.process = context.Process(
+            target=serve, args=(child, self.stop, getattr(koko, 'BASE_DIR', None))
+        )
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+
+    def run(self, job, event):
+        """ @brief Runs a job in the worker process
+            @param job Job dictionary (see run_job)
+            @param event threading.Event that cancels the job when set
+            @returns Dictionary of results, with shared images and meshes mapped, or None if cancelled
+        """
+        with self.lock:
+            self.start()
+            self.stop.clear()
+
+            job = dict(job, reset=self.fresh)
+            self.fresh = False
+            self.conn.send(job)
+
+            deadline = None
+            while not self.conn.poll(0.02):
+                if not self.process.is_alive():
+                    code = self.process.exitcode
+                    self.kill()
+                    raise RuntimeError('render worker exited (code %s)' % code)
+                if event.is_set():
+                    if deadline is None:
+                        self.stop.set()
+                        deadline = time.time() + self.grace
+                    elif time.time() > deadline:
+                        self.kill()
+                        return None
+
+            try:                result = self.conn.recv()
+            except EOFError:
+                self.kill()
+                raise RuntimeError('render worker exited')
+
+            if result is None:  return None
+            if event.is_set():
+                for s in shared_blocks(result):     unlink(s)
+                return None
+
+            # Map images and meshes while the worker is waiting for its
+            # next job (which is when it closes its side of the blocks)
+            cad = result.setdefault('cad', None)
+            for k in ('images', 'flat'):
+                if result.setdefault(k, None) is not None:
+                    result[k] = [attach_image(i) for i in result[k]]
+            if result.setdefault('meshes', None) is not None:
+                result['meshes'] = [attach_mesh(m, cad.shapes)
+                                    for m in result['meshes']]
+            return result
+
+
+    def reset(self):
+        """ @brief Makes the next job run its script from scratch
+        """
+        self.fresh = True
+
+
+    def kill(self):
+        """ @brief Stops the worker process immediately
+        """
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        if self.conn is not None:
+            self.conn.close()
+        self.process = self.conn = None
+
+
+    def close(self):
+        """ @brief Asks the worker process to exit, killing it if it doesn't
+            @details Waits for the current job to finish.
+        """
+        with self.lock:
+            if self.alive:
+                try:
+                    self.conn.send(None)
+                    self.process.join(self.grace)
+                except OSError:
+                    pass
+            self.kill()
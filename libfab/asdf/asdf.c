@@ -102,7 +102,7 @@ ASDF* build_asdf(
     if (region.voxels == 1) {
         recurse = false;
     } else {
-        const Interval result = eval_i(tree, asdf->X, asdf->Y, asdf->Z);
+        const Interval result = eval_bounds(tree, asdf->X, asdf->Y, asdf->Z);
         if (result.lower >= 0 || result.upper < 0) {
             recurse = false;
         }
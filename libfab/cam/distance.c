@@ -19,27 +19,56 @@ unsigned sep_edt(const int i, const int u, const int32_t*const g)
 }
 
 
+/*  Columns are swept in blocks of this many pixels, so that each row
+ *  access touches a contiguous run of memory rather than one pixel.
+ */
+#define EDT_BLOCK 64
+
+/*  COLUMN_PASS
+ *
+ *  Blocked first stage of the transform over columns imin to imax.
+ *  FILLED(j, i) is a macro that is true where pixel (i, j) is filled.
+ */
+#define COLUMN_PASS(FILLED)                                                 \
+    for (int i0=imin; i0 < imax; i0 += EDT_BLOCK) {                         \
+        const int i1 = (i0 + EDT_BLOCK < imax) ? i0 + EDT_BLOCK : imax;     \
+                                                                            \
+        /* Sweep down */                                                    \
+        for (int i=i0; i < i1; ++i) {                                       \
+            g[0][i] = (FILLED(0, i)) ? 0 : (ni+nj);                         \
+        }                                                                   \
+        for (int j=1; j < nj; ++j) {                                        \
+            for (int i=i0; i < i1; ++i) {                                   \
+                g[j][i] = (FILLED(j, i)) ? 0 : (g[j-1][i]+1);               \
+            }                                                               \
+        }                                                                   \
+                                                                            \
+        /* Sweep up */                                                      \
+        for (int j=nj-2; j >= 0; --j) {                                     \
+            for (int i=i0; i < i1; ++i) {                                   \
+                if (g[j+1][i] < g[j][i])    g[j][i] = g[j+1][i]+1;          \
+            }                                                               \
+        }                                                                   \
+    }
+
 void distance_transform1(const int imin, const int imax,
                          const int ni, const int nj,
                          uint8_t const*const*const img, int32_t** const g)
 {
-//    printf("Running G on %i %i\n", imin, imax);
-    for (int i=imin; i < imax; ++i) {
-        g[0][i] = img[0][i] ? 0 : (ni+nj);
+#define FILLED(j, i) img[j][i]
+    COLUMN_PASS(FILLED)
+#undef FILLED
+}
 
-        // Sweep down
-        for (int j=1; j < nj; ++j) {
-            g[j][i] = img[j][i] ? 0 : (g[j-1][i]+1);
-        }
 
-        // Sweep up
-        for (int j=nj-2; j >= 0; --j) {
-            if (g[j+1][i] < g[j][i]) {
-                g[j][i] = g[j+1][i]+1;
-            }
-        }
-    }
-//    printf("Done running G on %i %i\n", imin, imax);
+void distance_transform1_16(const int imin, const int imax,
+                            const int ni, const int nj,
+                            uint16_t const*const*const img,
+                            const uint16_t threshold, int32_t** const g)
+{
+#define FILLED(j, i) (img[j][i] >= threshold)
+    COLUMN_PASS(FILLED)
+#undef FILLED
 }
 
 void distance_transform2(const int jmin, const int jmax,
@@ -47,11 +76,10 @@ void distance_transform2(const int jmin, const int jmax,
                          int32_t** const g,
                          float* const*const distances)
 {
-//    printf("Running D on %i %i\n", jmin, jmax);
-
-    // Starting points of each region
-    unsigned t[ni];
-    unsigned s[ni];
+    // Starting points of each region (allocated on the heap, since
+    // wide images would overflow the stack of a worker thread)
+    unsigned* const t = malloc(ni*sizeof(unsigned));
+    unsigned* const s = malloc(ni*sizeof(unsigned));
 
     for (int j=jmin; j < jmax; ++j) {
         int q=0; // Number of regions found so far
@@ -90,7 +118,9 @@ void distance_transform2(const int jmin, const int jmax,
             if (u == t[q]) q--;
         }
     }
-//    printf("Done running D on %i %i\n", jmin, jmax);
+
+    free(t);
+    free(s);
 }
 
 
@@ -22,6 +22,7 @@ void distance_transform(const int ni, const int nj,
 
 /** @brief Performs the first stage of the Meijster distance transform.
     @details Non-zero parts of the input image are considered filled.
+    Columns are processed in cache-sized blocks.
 
     @param imin Start of region to process (column number)
     @param imax End of region (column number)
@@ -34,6 +35,25 @@ void distance_transform1(const int imin, const int imax,
                          const int ni, const int nj,
                          uint8_t const*const*const img, int32_t** const g);
 
+/** @brief Performs the first stage of the Meijster distance transform
+    on a 16-bit heightmap.
+    @details Pixels at or above the threshold are considered filled, so a
+    heightmap can be sliced at a given depth without making a thresholded
+    copy.  Columns are processed in cache-sized blocks.
+
+    @param imin Start of region to process (column number)
+    @param imax End of region (column number)
+    @param ni Image width
+    @param nj Image height
+    @param img Heightmap lattice
+    @param threshold Minimum height of a filled pixel
+    @param g Output lattice (minimum vertical distance)
+*/
+void distance_transform1_16(const int imin, const int imax,
+                            const int ni, const int nj,
+                            uint16_t const*const*const img,
+                            const uint16_t threshold, int32_t** const g);
+
 /** @brief Performs the second stage of the Meijster distance transform.
     @details Output values in the distances array are in mm, scaled based on the
     pixels_per_mm input argument.
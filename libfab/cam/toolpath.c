@@ -84,36 +84,31 @@ void fill_ptrs(const int ni, const int nj,
     for (int j=0; j < nj-1; ++j) {
         for (int i=0; i < ni-1; ++i) {
 
-            int level;          // selected contour level
-            uint8_t lookup = 0; // particular case for marching squares
-
-            // Search up through the contour levels, halting when we either
-            // find a contour that intersects this cell or we get out of range.
-            for (level=0; level < num_contours; ++level) {
-                lookup =
-                    ((distances[j][i] <= contour_levels[level]) ? 1 : 0) |
-                    ((distances[j+1][i] <= contour_levels[level]) ? 2 : 0) |
-                    ((distances[j][i+1] <= contour_levels[level]) ? 4 : 0) |
-                    ((distances[j+1][i+1] <= contour_levels[level]) ? 8 : 0);
-
-                // If this cell is entirely below the given contour level,
-                // then set d to "out of range" and break (since
-                // contour_levels are in increasing order, we won't
-                // ever find a contour in this cell).
-                if (lookup == 0xf) {
-                    level = num_contours;
-                    break;
-                }
-
-                // Otherwise, we've found the appropriate level for this
-                // cell, so we can go ahead and contour it!
-                else if (lookup != 0) {
-                    break;
-                }
+            const float d00 = distances[j][i],   d10 = distances[j+1][i],
+                        d01 = distances[j][i+1], d11 = distances[j+1][i+1];
+            const float dmin = fminf(fminf(d00, d10), fminf(d01, d11)),
+                        dmax = fmaxf(fmaxf(d00, d10), fmaxf(d01, d11));
+
+            // The selected contour level is the lowest one at or above
+            // this cell's smallest sample (found by binary search, since
+            // contour_levels are in increasing order).  If that level is
+            // also at or above the largest sample, then the cell is
+            // entirely below it and there's nothing to contour.
+            int lo = 0, hi = num_contours;
+            while (lo < hi) {
+                const int mid = (lo + hi) / 2;
+                if (contour_levels[mid] < dmin)     lo = mid + 1;
+                else                                hi = mid;
             }
+            const int level = lo;
+            if (level == num_contours || contour_levels[level] >= dmax)
+                continue;
 
-            // If we didn't find a matching contour, then keep going
-            if (level == num_contours)  continue;
+            const uint8_t lookup =  // particular case for marching squares
+                ((d00 <= contour_levels[level]) ? 1 : 0) |
+                ((d10 <= contour_levels[level]) ? 2 : 0) |
+                ((d01 <= contour_levels[level]) ? 4 : 0) |
+                ((d11 <= contour_levels[level]) ? 8 : 0);
 
             // Generate the (up to two) edges within this cell
             for (int e=0; e < 2; ++e) {
@@ -353,37 +348,227 @@ void free_endmill(_Bool** mask, uint16_t** endmill, int side)
 }
 
 
-/*  get_max
+/*  make_chords
+ *
+ *  Splits an end-mill mask into chords parallel to a cut line.  The mask is
+ *  sampled at offsets [-side/2, side/2) on both axes, and is symmetric about
+ *  its diagonal, so the same chords apply to cuts along either axis.
  *
- *  Finds the highest point in a region defined by the mask and endmill
- *  arrays, centered on point i,j in a height-map of size ni by nj.
+ *  For each perpendicular offset q (stored at index q + side/2), lo and hi
+ *  are set to the first and last in-line offsets covered by the mask; rows
+ *  that the mask doesn't touch have lo > hi.
  */
 _STATIC_
-float get_max(const int i, const int j, const int ni, const int nj,
-              const int side, const float mm_per_bit,
-              uint16_t const*const*const heights,
-              _Bool **const mask,
-              uint16_t **const endmill)
+void make_chords(const int side, _Bool **const mask,
+                 int* const lo, int* const hi)
 {
+    const int h = side / 2;
+    for (int d=0; d < 2*h; ++d) {
+        lo[d] = h;
+        hi[d] = -h - 1;
+        for (int c=0; c < 2*h; ++c) {
+            if (!mask[d][c])    continue;
+            if (c - h < lo[d])  lo[d] = c - h;
+            if (c - h > hi[d])  hi[d] = c - h;
+        }
+    }
+}
 
-    int max = 0;
-
-    for (int b = j-side/2; b < j+side/2; ++b) {
-        for (int a = i-side/2; a < i+side/2; ++a) {
-            if (a < 0 || a >= ni || b < 0 || b >= nj)    continue;
 
-            // Find positions within end-mill image
-            int c = a-i+side/2, d = b-j+side/2;
+/*  sliding_max
+ *
+ *  van Herk / Gil-Werman running maximum:  sets out[x] to the largest of
+ *  in[x] through in[x+k-1], for x in [0, n-k], using about three comparisons
+ *  per sample regardless of k.  g and h are scratch arrays of length n.
+ */
+_STATIC_
+void sliding_max(const int n, const int k, const int* const in,
+                 int* const g, int* const h, int* const out)
+{
+    for (int x=0; x < n; ++x) {
+        g[x] = (x % k == 0 || in[x] > g[x-1]) ? in[x] : g[x-1];
+    }
+    for (int x=n-1; x >= 0; --x) {
+        h[x] = (x == n-1 || x % k == k-1 || in[x] > h[x+1]) ? in[x] : h[x+1];
+    }
+    for (int x=0; x + k <= n; ++x) {
+        out[x] = h[x] > g[x+k-1] ? h[x] : g[x+k-1];
+    }
+}
 
-            if (!mask[d][c])    continue;
 
-            int height = heights[b][a] - endmill[d][c];
+/*  offset_line
+ *
+ *  Finds the tool-compensated height along a single cut line, i.e. the
+ *  highest point of the heightmap minus the end-mill profile in the
+ *  end-mill's footprint, as the end-mill is centered at each pixel of the
+ *  line.  Samples outside the image are ignored, and heights are clamped
+ *  to be non-negative.
+ *
+ *  The footprint is split into chords parallel to the line, and the
+ *  maximum along each chord is found with a running maximum.  For a flat
+ *  end-mill that is the whole answer; for a ball end-mill, the chord
+ *  maxima bound each chord's contribution, so chords (and the ends of
+ *  chords) that can't beat the best value so far are skipped.
+ *
+ *  axis is 0 for a line of constant i (running along j) or 1 for a line of
+ *  constant j (running along i); pos is that constant.  With n as the line
+ *  length and h as side/2, scratch needs to hold (4*h + 3)*(n + 2*h) ints.
+ */
+_STATIC_
+void offset_line(const int ni, const int nj,
+                 uint16_t const*const*const heights,
+                 const int side, _Bool **const mask,
+                 uint16_t **const endmill, const _Bool flat,
+                 const int* const lo, const int* const hi,
+                 const int axis, const int pos,
+                 int* const scratch, int* const out)
+{
+    const int n = axis ? ni : nj;
+    const int h = side / 2;
+    const int len = n + 2*h;
+
+    // Padded copies of each row parallel to the line, and the running
+    // maxima along each of their chords
+    int* const rows  = scratch;
+    int* const maxes = scratch + 2*h*len;
+    int* const g     = maxes + 2*h*len;
+    int* const hh    = g + len;
+    int* const tmp   = hh + len;
+
+    for (int x=0; x < n; ++x)   out[x] = 0;
+
+    for (int d=0; d < 2*h; ++d) {
+        const int q = d - h;
+        if (lo[d] > hi[d])  continue;
+        if (axis && (pos + q < 0 || pos + q >= nj)) continue;
+        if (!axis && (pos + q < 0 || pos + q >= ni)) continue;
+
+        // Zero-padded copy of this row (zero never beats the clamp)
+        int* const row = rows + d*len;
+        for (int x=0; x < h; ++x)   row[x] = row[n + h + x] = 0;
+        if (axis)   for (int x=0; x < n; ++x)   row[x+h] = heights[pos+q][x];
+        else        for (int x=0; x < n; ++x)   row[x+h] = heights[x][pos+q];
+
+        const int k = hi[d] - lo[d] + 1;
+        sliding_max(len, k, row, g, hh, tmp);
+
+        int* const m = maxes + d*len;
+        for (int x=0; x < n; ++x) {
+            m[x] = tmp[x + lo[d] + h];
+            if (flat && m[x] > out[x])  out[x] = m[x];
+        }
+    }
 
-            if (height > max)    max = height;
+    if (flat)   return;
+
+    for (int x=0; x < n; ++x) {
+        int best = 0;
+
+        // Visit chords from the center outwards, since the ball's profile
+        // is lowest there
+        for (int t=0; t < 2*h; ++t) {
+            const int d = h + ((t % 2) ? -(t+1)/2 : t/2);
+            if (d < 0 || d >= 2*h || lo[d] > hi[d])   continue;
+            if (axis && (pos + d - h < 0 || pos + d - h >= nj)) continue;
+            if (!axis && (pos + d - h < 0 || pos + d - h >= ni)) continue;
+
+            const int m = maxes[d*len + x];
+            if (m - endmill[d][h] <= best)  continue;
+
+            // Walk outwards along the chord; the profile only rises, so
+            // stop once the chord's maximum can't beat the best value.
+            const int* const row = rows + d*len + x + h;
+            const int reach = (hi[d] > -lo[d]) ? hi[d] : -lo[d];
+            for (int c=0; c <= reach; ++c) {
+                const int e = endmill[d][h-c];
+                if (m - e <= best)  break;
+                if ( c <= hi[d] && row[c] - e > best)   best = row[c] - e;
+                if (-c >= lo[d] && row[-c] - e > best)  best = row[-c] - e;
+            }
         }
+        out[x] = best;
     }
+}
+
 
-    return max*mm_per_bit;
+/*  make_endmill
+ *
+ *  Builds the mask and profile for the given end-mill type, returning the
+ *  side length (or 0 for an unknown type).
+ */
+_STATIC_
+int make_endmill(const float diameter, const float mm_per_pixel,
+                 const float mm_per_bit, const int mill_type,
+                 _Bool*** const mask, uint16_t*** const endmill)
+{
+    if (mill_type == 0) {
+        return make_flat_mill(diameter, mm_per_pixel, mm_per_bit,
+                              mask, endmill);
+    } else if (mill_type == 1) {
+        return make_ball_mill(diameter, mm_per_pixel, mm_per_bit,
+                              mask, endmill);
+    } else {
+        printf("Unknown end-mill type (expected 0 or 1, got %i)\n",
+               mill_type);
+        *mask = NULL;
+        *endmill = NULL;
+        return 0;
+    }
+}
+
+
+int finish_cut_lines(const int n, const float mm_per_pixel,
+                     const float diameter, const float overlap,
+                     int* const lines)
+{
+    int count = 0;
+    for (int i=(diameter/2)/mm_per_pixel; i < n - (diameter/2)/mm_per_pixel;)
+    {
+        if (lines)  lines[count] = i;
+        count++;
+
+        // Always make progress, even if the step is under a pixel
+        const int next = i + (diameter*overlap)/mm_per_pixel;
+        i = (next > i) ? next : i + 1;
+    }
+    return count;
+}
+
+
+void finish_cut_heights(const int ni, const int nj,
+                        uint16_t const*const*const heights,
+                        const float mm_per_pixel, const float mm_per_bit,
+                        const float diameter, const int mill_type,
+                        const int axis, const int count,
+                        const int* const lines, float* const out)
+{
+    _Bool** mask = NULL;
+    uint16_t** endmill = NULL;
+    const int side = make_endmill(diameter, mm_per_pixel, mm_per_bit,
+                                  mill_type, &mask, &endmill);
+    const int h = side / 2;
+    const int n = axis ? ni : nj;
+    const int len = n + 2*h;
+
+    int* const lo = malloc((2*h + 1)*sizeof(int));
+    int* const hi = malloc((2*h + 1)*sizeof(int));
+    make_chords(side, mask, lo, hi);
+
+    int* const scratch = malloc((4*h*len + 3*len)*sizeof(int));
+    int* const line = malloc(n*sizeof(int));
+
+    for (int c=0; c < count; ++c) {
+        offset_line(ni, nj, heights, side, mask, endmill, mill_type == 0,
+                    lo, hi, axis, lines[c], scratch, line);
+        for (int x=0; x < n; ++x)   out[c*n + x] = line[x]*mm_per_bit;
+    }
+
+    free(line);
+    free(scratch);
+    free(lo);
+    free(hi);
+    if (mask)   free_endmill(mask, endmill, side);
 }
 
 
@@ -393,74 +578,132 @@ int finish_cut(const int ni, const int nj,
                const float diameter, const float overlap,
                const int mill_type, Path*** paths)
 {
+    int path_count = 0;
 
-    _Bool** mask = NULL;
-    uint16_t** endmill = NULL;
-    int side = 0;
-    if (mill_type == 0) {
-        side = make_flat_mill(diameter, mm_per_pixel, mm_per_bit,
-                              &mask, &endmill);
-    } else if (mill_type == 1) {
-        side = make_ball_mill(diameter, mm_per_pixel, mm_per_bit,
-                              &mask, &endmill);
-    } else {
-        printf("Unknown end-mill type (expected 0 or 1, got %i)\n",
-               mill_type);
+    // YZ cuts (axis 0, one line per column), then XZ cuts (axis 1)
+    for (int axis=0; axis < 2; ++axis) {
+        const int n = axis ? ni : nj;
+        const int count = finish_cut_lines(axis ? nj : ni, mm_per_pixel,
+                                           diameter, overlap, NULL);
+        int* const lines = malloc(count*sizeof(int));
+        finish_cut_lines(axis ? nj : ni, mm_per_pixel,
+                         diameter, overlap, lines);
+
+        float* const z = malloc(count*n*sizeof(float));
+        finish_cut_heights(ni, nj, heights, mm_per_pixel, mm_per_bit,
+                           diameter, mill_type, axis, count, lines, z);
+
+        *paths = realloc(*paths, (path_count + count)*sizeof(Path*));
+        for (int c=0; c < count; ++c) {
+            // Create a new path for each line
+            Path*  prev    = NULL;
+            Path** current = &(*paths)[path_count++];
+
+            // And fill it with points
+            for (int x=0; x < n; ++x) {
+                const int i = axis ? x : lines[c];
+                const int j = axis ? lines[c] : x;
+                *current = malloc(sizeof(Path));
+                **current = (Path) {
+                    .prev=prev, .next=NULL,
+                    .x=i*mm_per_pixel, .y=j*mm_per_pixel, .z=z[c*n + x],
+                    .ptrs=NULL, .ptr_count=0
+                };
+                if (prev)   prev->next = *current;
+                prev = *current;
+                current = &((*current)->next);
+            }
+        }
+
+        free(z);
+        free(lines);
     }
 
-    int path_count = 0;
+    return path_count;
+}
 
-    // YZ cuts
-    for (int i=(diameter/2)/mm_per_pixel; i < ni - (diameter/2)/mm_per_pixel;
-             i += (diameter*overlap)/mm_per_pixel)
-    {
-        *paths = realloc(*paths, (++path_count)*sizeof(Path*));
-
-        // Create a new path for each column
-        Path*  prev    = NULL;
-        Path** current = &(*paths)[path_count-1];
-
-        // And fill it with points
-        for (int j=0; j < nj; ++j) {
-            float z = get_max(i, j, ni, nj, side, mm_per_bit,
-                              heights, mask, endmill);
-
-            *current = malloc(sizeof(Path));
-            **current = (Path) {
-                .prev=prev, .next=NULL,
-                .x=i*mm_per_pixel, .y=j*mm_per_pixel, .z=z,
-                .ptrs=NULL, .ptr_count=0
-            };
-            if (prev)   prev->next = *current;
-            prev = *current;
-            current = &((*current)->next);
+
+/*  stamp_endmill
+ *
+ *  Lowers the stock to the end-mill's surface with its tip at height z
+ *  above pixel (i, j).  profile holds the end-mill profile (in mm) on the
+ *  same 2h x 2h grid as the mask, and lo / hi are its chords along i.
+ */
+_STATIC_
+void stamp_endmill(const int ni, const int nj, float* const*const stock,
+                   const int h, const float* const profile,
+                   const int* const lo, const int* const hi,
+                   const int i, const int j, const float z)
+{
+    for (int d=0; d < 2*h; ++d) {
+        const int jj = j + d - h;
+        if (jj < 0 || jj >= nj || lo[d] > hi[d])    continue;
+
+        const int c0 = (i + lo[d] < 0) ? -i : lo[d];
+        const int c1 = (i + hi[d] >= ni) ? ni - 1 - i : hi[d];
+
+        float* const row = stock[jj] + i;
+        const float* const p = profile + d*2*h + h;
+        for (int c=c0; c <= c1; ++c) {
+            const float v = z + p[c];
+            if (v < row[c])     row[c] = v;
         }
     }
+}
 
-    // XZ cuts
-    for (int j=(diameter/2)/mm_per_pixel; j < nj - (diameter/2)/mm_per_pixel;
-             j += (diameter*overlap)/mm_per_pixel)
-    {
-        *paths = realloc(*paths, (++path_count)*sizeof(Path*));
-        Path* prev = NULL;
-        Path** current = &(*paths)[path_count-1];
 
-        for (int i=0; i < ni; ++i) {
-            float z = get_max(i, j, ni, nj, side, mm_per_bit,
-                              heights, mask, endmill);
-
-            *current = malloc(sizeof(Path));
-            **current = (Path) {
-                .prev=prev, .next=NULL,
-                .x=i*mm_per_pixel, .y=j*mm_per_pixel, .z=z,
-                .ptrs=NULL, .ptr_count=0
-            };
-            if (prev)   prev->next = *current;
-            prev = *current;
-            current = &((*current)->next);
+void simulate_cut(const int ni, const int nj, float* const*const stock,
+                  const float mm_per_pixel, const float mm_per_bit,
+                  const float diameter, const int mill_type,
+                  const int count, const float* const points)
+{
+    _Bool** mask = NULL;
+    uint16_t** endmill = NULL;
+    const int side = make_endmill(diameter, mm_per_pixel, mm_per_bit,
+                                  mill_type, &mask, &endmill);
+    if (!mask)  return;
+    const int h = side / 2;
+
+    int* const lo = malloc((2*h + 1)*sizeof(int));
+    int* const hi = malloc((2*h + 1)*sizeof(int));
+    make_chords(side, mask, lo, hi);
+
+    float* const profile = malloc((4*h*h + 1)*sizeof(float));
+    for (int d=0; d < 2*h; ++d) {
+        for (int c=0; c < 2*h; ++c) {
+            profile[d*2*h + c] = endmill[d][c]*mm_per_bit;
         }
     }
 
+    // Sweep the end-mill along each move, stamping it at every pixel
+    if (count) {
+        stamp_endmill(ni, nj, stock, h, profile, lo, hi,
+                      lround(points[0] / mm_per_pixel),
+                      lround(points[1] / mm_per_pixel), points[2]);
+    }
+    for (int k=1; k < count; ++k) {
+        const float* const a = points + 3*(k - 1);
+        const float* const b = points + 3*k;
+
+        const float x0 = a[0] / mm_per_pixel, y0 = a[1] / mm_per_pixel;
+        const float dx = b[0] / mm_per_pixel - x0;
+        const float dy = b[1] / mm_per_pixel - y0;
+        const float dz = b[2] - a[2];
+
+        // One stamp per pixel (ignoring rounding error in the coordinates,
+        // which would otherwise add half-pixel stamps at interpolated z)
+        const float span = fabs(dx) > fabs(dy) ? fabs(dx) : fabs(dy);
+        const int steps = span > 1 ? (int)ceil(span - 1e-3) : 1;
+        for (int s=1; s <= steps; ++s) {
+            const float t = s / (float)steps;
+            stamp_endmill(ni, nj, stock, h, profile, lo, hi,
+                          lround(x0 + t*dx), lround(y0 + t*dy),
+                          a[2] + t*dz);
+        }
+    }
+
+    free(profile);
+    free(lo);
+    free(hi);
     free_endmill(mask, endmill, side);
-    return path_count;
 }
@@ -1,6 +1,8 @@
 #ifndef TOOLPATH_H
 #define TOOLPATH_H
 
+#include <stdint.h>
+
 struct Path_;
 
 /** @brief Extracts a set of contours from a distance image
@@ -21,4 +23,59 @@ int find_paths(const int ni, const int nj,
                const float* const contour_levels,
                struct Path_*** const paths);
 
+/** @brief Picks the cut lines for a finish cut.
+    @param n Number of pixels across the cuts
+    @param mm_per_pixel Lattice scale factor
+    @param diameter Tool diameter (in mm)
+    @param overlap Overlap between cuts (as a fraction of the diameter)
+    @param lines Array in which to store line positions (or NULL)
+    @returns The number of lines
+*/
+int finish_cut_lines(const int n, const float mm_per_pixel,
+                     const float diameter, const float overlap,
+                     int* const lines);
+
+/** @brief Finds tool-compensated heights along a set of finish cut lines.
+    @details At each pixel of a line, this is the lowest height at which
+    the end-mill clears the heightmap.  The end-mill footprint is split
+    into chords parallel to the line and reduced with running maxima, so
+    cost grows with the tool's width rather than its area.
+    @param ni Image width
+    @param nj Image height
+    @param heights Heightmap
+    @param mm_per_pixel Lattice scale factor
+    @param mm_per_bit Height scale factor
+    @param diameter Tool diameter (in mm)
+    @param mill_type End-mill type (0 for flat, 1 for ball)
+    @param axis 0 for lines of constant i, 1 for lines of constant j
+    @param count Number of lines
+    @param lines Line positions (from finish_cut_lines)
+    @param out Output array (count rows of nj or ni heights, in mm)
+*/
+void finish_cut_heights(const int ni, const int nj,
+                        uint16_t const*const*const heights,
+                        const float mm_per_pixel, const float mm_per_bit,
+                        const float diameter, const int mill_type,
+                        const int axis, const int count,
+                        const int* const lines, float* const out);
+
+/** @brief Removes material from a stock heightmap by replaying a toolpath.
+    @details The end-mill (built exactly as for finish cuts) is swept along
+    each move and stamped at every pixel it passes over, lowering the stock
+    to the end-mill's surface wherever that is below it.
+    @param ni Image width
+    @param nj Image height
+    @param stock Stock heightmap (in mm), modified in place
+    @param mm_per_pixel Lattice scale factor
+    @param mm_per_bit Height scale factor used to build the end-mill profile
+    @param diameter Tool diameter (in mm)
+    @param mill_type End-mill type (0 for flat, 1 for ball)
+    @param count Number of points in the path
+    @param points Path points (count x 3, in mm, with z on the stock's scale)
+*/
+void simulate_cut(const int ni, const int nj, float* const*const stock,
+                  const float mm_per_pixel, const float mm_per_bit,
+                  const float diameter, const int mill_type,
+                  const int count, const float* const points);
+
 #endif
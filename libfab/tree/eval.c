@@ -8,10 +8,13 @@
 #include "tree/math/math_f.h"
 #include "tree/math/math_i.h"
 #include "tree/math/math_r.h"
+#include "tree/math/math_g.h"
+#include "tree/math/math_a.h"
 
 float eval_f(PackedTree* tree, const float x, const float y, const float z)
 {
     Node* node = NULL;
+    tree->point_count++;
 
     for (unsigned level=0; level < tree->num_levels; ++level) {
         for (unsigned n=0; n < tree->active[level]; ++n) {
@@ -29,6 +32,8 @@ float eval_f(PackedTree* tree, const float x, const float y, const float z)
                 case OP_MIN:    node->results.f = min_f(A, B); break;
                 case OP_MAX:    node->results.f = max_f(A, B); break;
                 case OP_POW:    node->results.f = pow_f(A, B); break;
+                case OP_MOD:    node->results.f = mod_f(A, B); break;
+                case OP_ATAN2:  node->results.f = atan2_f(A, B); break;
 
                 case OP_ABS:    node->results.f = abs_f(A); break;
                 case OP_SQUARE: node->results.f = square_f(A); break;
@@ -61,6 +66,10 @@ Interval eval_i(PackedTree* tree, const Interval X,
                                   const Interval Z)
 {
     Node* node = NULL;
+    tree->interval_count++;
+    tree->region[0] = X;
+    tree->region[1] = Y;
+    tree->region[2] = Z;
 
     for (unsigned level=0; level < tree->num_levels; ++level) {
         for (unsigned n=0; n < tree->active[level]; ++n) {
@@ -80,6 +89,8 @@ Interval eval_i(PackedTree* tree, const Interval X,
                 case OP_MIN:    node->results.i = min_i(A, B); break;
                 case OP_MAX:    node->results.i = max_i(A, B); break;
                 case OP_POW:    node->results.i = pow_i(A, B); break;
+                case OP_MOD:    node->results.i = mod_i(A, B); break;
+                case OP_ATAN2:  node->results.i = atan2_i(A, B); break;
 
                 case OP_ABS:    node->results.i = abs_i(A); break;
                 case OP_SQUARE: node->results.i = square_i(A); break;
@@ -107,10 +118,97 @@ Interval eval_i(PackedTree* tree, const Interval X,
 
 ////////////////////////////////////////////////////////////////////////////////
 
+Interval eval_a(PackedTree* tree, const Interval X,
+                                  const Interval Y,
+                                  const Interval Z)
+{
+    Node* node = NULL;
+    tree->interval_count++;
+    tree->region[0] = X;
+    tree->region[1] = Y;
+    tree->region[2] = Z;
+
+    const Interval zero = {.upper=0, .lower=0};
+
+    for (unsigned level=0; level < tree->num_levels; ++level) {
+        for (unsigned n=0; n < tree->active[level]; ++n) {
+
+            node = tree->nodes[level][n];
+
+            Interval A = node->lhs ? node->lhs->results.i : zero,
+                     B = node->rhs ? node->rhs->results.i : zero;
+            Affine  FA = node->lhs ? node->lhs->results.a : interval_a(zero),
+                    FB = node->rhs ? node->rhs->results.a : interval_a(zero);
+
+            // Find the result with interval arithmetic as well, to fall
+            // back on for operations without a good affine approximation
+            Interval I;
+            Affine   F;
+
+            switch (node->opcode) {
+                case OP_ADD:    I = add_i(A, B); F = add_a(FA, FB); break;
+                case OP_SUB:    I = sub_i(A, B); F = sub_a(FA, FB); break;
+                case OP_MUL:    I = mul_i(A, B); F = mul_a(FA, FB); break;
+                case OP_DIV:    I = div_i(A, B); F = div_a(FA, FB, I); break;
+                case OP_MIN:    I = min_i(A, B); F = min_a(FA, FB, I); break;
+                case OP_MAX:    I = max_i(A, B); F = max_a(FA, FB, I); break;
+                case OP_POW:    I = pow_i(A, B); F = interval_a(I); break;
+                case OP_MOD:    I = mod_i(A, B); F = interval_a(I); break;
+                case OP_ATAN2:  I = atan2_i(A, B); F = interval_a(I); break;
+
+                case OP_ABS:    I = abs_i(A); F = abs_a(FA, I); break;
+                case OP_SQUARE: I = square_i(A); F = square_a(FA); break;
+                case OP_SQRT:   I = sqrt_i(A); F = sqrt_a(FA, I); break;
+                case OP_SIN:    I = sin_i(A); F = interval_a(I); break;
+                case OP_COS:    I = cos_i(A); F = interval_a(I); break;
+                case OP_TAN:    I = tan_i(A); F = interval_a(I); break;
+                case OP_ASIN:   I = asin_i(A); F = interval_a(I); break;
+                case OP_ACOS:   I = acos_i(A); F = interval_a(I); break;
+                case OP_ATAN:   I = atan_i(A); F = interval_a(I); break;
+                case OP_NEG:    I = neg_i(A); F = neg_a(FA); break;
+
+                case OP_CONST:  continue;
+                case OP_X:      I = X_i(X); F = X_a(X); break;
+                case OP_Y:      I = Y_i(Y); F = Y_a(Y); break;
+                case OP_Z:      I = Z_i(Z); F = Z_a(Z); break;
+                default:
+                    printf("Unknown opcode!\n");
+                    continue;
+            }
+
+            // Keep the tighter of the two bounds (unless rounding
+            // made them disjoint, in which case keep the interval)
+            const Interval H = hull_a(F);
+            if (H.lower <= I.upper && H.upper >= I.lower) {
+                if (H.lower > I.lower)  I.lower = H.lower;
+                if (H.upper < I.upper)  I.upper = H.upper;
+            }
+
+            node->results.i = I;
+            node->results.a = F;
+        }
+    }
+
+    return tree->head->results.i;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Interval eval_bounds(PackedTree* tree, const Interval X,
+                                       const Interval Y,
+                                       const Interval Z)
+{
+    if (tree->affine)   return eval_a(tree, X, Y, Z);
+    else                return eval_i(tree, X, Y, Z);
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
 float* eval_r(PackedTree* tree, const Region r)
 {
     Node* node = NULL;
     int c = r.voxels;
+    tree->point_count += c;
 
     for (unsigned level=0; level < tree->num_levels; ++level) {
         for (unsigned n=0; n < tree->active[level]; ++n) {
@@ -129,6 +227,8 @@ float* eval_r(PackedTree* tree, const Region r)
                 case OP_MIN:    min_r(A, B, R, c); break;
                 case OP_MAX:    max_r(A, B, R, c); break;
                 case OP_POW:    pow_r(A, B, R, c); break;
+                case OP_MOD:    mod_r(A, B, R, c); break;
+                case OP_ATAN2:  atan2_r(A, B, R, c); break;
 
                 case OP_ABS:    abs_r(A, R, c); break;
                 case OP_SQUARE: square_r(A, R, c); break;
@@ -153,3 +253,103 @@ float* eval_r(PackedTree* tree, const Region r)
 
     return tree->head->results.r;
 }
+
+////////////////////////////////////////////////////////////////////////////////
+
+Derivative eval_g(PackedTree* tree, const float x, const float y, const float z)
+{
+    Node* node = NULL;
+
+    for (unsigned level=0; level < tree->num_levels; ++level) {
+        for (unsigned n=0; n < tree->active[level]; ++n) {
+
+            node = tree->nodes[level][n];
+
+            Derivative A = node->lhs ? node->lhs->results.g : (Derivative){0},
+                       B = node->rhs ? node->rhs->results.g : (Derivative){0};
+
+            switch (node->opcode) {
+                case OP_ADD:    node->results.g = add_g(A, B); break;
+                case OP_SUB:    node->results.g = sub_g(A, B); break;
+                case OP_MUL:    node->results.g = mul_g(A, B); break;
+                case OP_DIV:    node->results.g = div_g(A, B); break;
+                case OP_MIN:    node->results.g = min_g(A, B); break;
+                case OP_MAX:    node->results.g = max_g(A, B); break;
+                case OP_POW:    node->results.g = pow_g(A, B); break;
+                case OP_MOD:    node->results.g = mod_g(A, B); break;
+                case OP_ATAN2:  node->results.g = atan2_g(A, B); break;
+
+                case OP_ABS:    node->results.g = abs_g(A); break;
+                case OP_SQUARE: node->results.g = square_g(A); break;
+                case OP_SQRT:   node->results.g = sqrt_g(A); break;
+                case OP_SIN:    node->results.g = sin_g(A); break;
+                case OP_COS:    node->results.g = cos_g(A); break;
+                case OP_TAN:    node->results.g = tan_g(A); break;
+                case OP_ASIN:   node->results.g = asin_g(A); break;
+                case OP_ACOS:   node->results.g = acos_g(A); break;
+                case OP_ATAN:   node->results.g = atan_g(A); break;
+                case OP_NEG:    node->results.g = neg_g(A); break;
+
+                case OP_X:      node->results.g = X_g(x); break;
+                case OP_Y:      node->results.g = Y_g(y); break;
+                case OP_Z:      node->results.g = Z_g(z); break;
+
+                case OP_CONST:  break;
+                default:
+                    printf("Unknown opcode!\n");
+            }
+        }
+    }
+    return tree->head->results.g;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Derivative* eval_gr(PackedTree* tree, const Region r)
+{
+    Node* node = NULL;
+    int c = r.voxels;
+
+    for (unsigned level=0; level < tree->num_levels; ++level) {
+        for (unsigned n=0; n < tree->active[level]; ++n) {
+
+            node = tree->nodes[level][n];
+
+            Derivative *A = node->lhs ? node->lhs->results.gr : NULL,
+                       *B = node->rhs ? node->rhs->results.gr : NULL,
+                       *R = node->results.gr;
+
+            switch (node->opcode) {
+                case OP_ADD:    add_gr(A, B, R, c); break;
+                case OP_SUB:    sub_gr(A, B, R, c); break;
+                case OP_MUL:    mul_gr(A, B, R, c); break;
+                case OP_DIV:    div_gr(A, B, R, c); break;
+                case OP_MIN:    min_gr(A, B, R, c); break;
+                case OP_MAX:    max_gr(A, B, R, c); break;
+                case OP_POW:    pow_gr(A, B, R, c); break;
+                case OP_MOD:    mod_gr(A, B, R, c); break;
+                case OP_ATAN2:  atan2_gr(A, B, R, c); break;
+
+                case OP_ABS:    abs_gr(A, R, c); break;
+                case OP_SQUARE: square_gr(A, R, c); break;
+                case OP_SQRT:   sqrt_gr(A, R, c); break;
+                case OP_SIN:    sin_gr(A, R, c); break;
+                case OP_COS:    cos_gr(A, R, c); break;
+                case OP_TAN:    tan_gr(A, R, c); break;
+                case OP_ASIN:   asin_gr(A, R, c); break;
+                case OP_ACOS:   acos_gr(A, R, c); break;
+                case OP_ATAN:   atan_gr(A, R, c); break;
+                case OP_NEG:    neg_gr(A, R, c); break;
+
+                case OP_CONST:  break;
+                case OP_X:      X_gr(r.X, R, c); break;
+                case OP_Y:      Y_gr(r.Y, R, c); break;
+                case OP_Z:      Z_gr(r.Z, R, c); break;
+                default:
+                    printf("Unknown opcode!\n");
+            }
+        }
+    }
+
+    return tree->head->results.gr;
+}
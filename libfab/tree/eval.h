@@ -2,6 +2,8 @@
 #define EVAL_H
 
 #include "util/interval.h"
+#include "util/derivative.h"
+#include "util/affine.h"
 #include "util/region.h"
 #include "util/switches.h"
 
@@ -27,4 +29,46 @@ Interval  eval_i(struct PackedTree_* n, const Interval X,
 */
 float*  eval_r(struct PackedTree_* n, const Region r);
 
+
+/** @brief Evaluates a math expression over an interval region
+    with affine arithmetic
+    @details Each node's affine form is stored in results.a, and the
+    intersection of its bounds with the interval arithmetic result is
+    stored in results.i (so that nodes can be pruned as with eval_i).
+    Affine forms keep track of how values depend on X, Y, and Z,
+    which gives much tighter bounds for rotated and mapped shapes.
+    @returns The bounds of the head node
+*/
+Interval  eval_a(struct PackedTree_* n, const Interval X,
+                                        const Interval Y,
+                                        const Interval Z);
+
+
+/** @brief Bounds a math expression over an interval region
+    @details Calls eval_a if the tree's affine flag is set
+    and eval_i otherwise.
+*/
+Interval  eval_bounds(struct PackedTree_* n, const Interval X,
+                                             const Interval Y,
+                                             const Interval Z);
+
+
+/** @brief Evaluates a math expression and its gradient at a given position
+    @details Uses forward-mode automatic differentiation, so the gradient
+    is exact and found in the same pass as the value.
+    Results are stored in n->head->results.g
+*/
+Derivative  eval_g(struct PackedTree_* n, const float x,
+                                          const float y,
+                                          const float z);
+
+
+/** @brief Evaluates a math expression and its gradient over a set of
+    many positions
+    @details Positions are stored in the X, Y, Z arrays of r, and
+    r.voxels must be no larger than MIN_VOLUME.
+    Results are stored in n->head->results.gr
+*/
+Derivative*  eval_gr(struct PackedTree_* n, const Region r);
+
 #endif
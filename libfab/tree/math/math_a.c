@@ -0,0 +1,178 @@
+#include <math.h>
+
+#include "tree/math/math_a.h"
+
+/*  ROUNDING
+ *
+ *  Relative error added to every result, to cover floating-point
+ *  rounding (which would otherwise make bounds slightly too tight
+ *  where a shape's surface passes through a sample point).
+ */
+#define ROUNDING 1e-6
+
+/*  radius
+ *
+ *  Returns the total deviation of an affine form from its center.
+ */
+static inline float radius(Affine A)
+{
+    return fabs(A.x) + fabs(A.y) + fabs(A.z) + A.e;
+}
+
+/*  rounded
+ *
+ *  Widens an affine form to cover rounding error.
+ */
+static inline Affine rounded(Affine A)
+{
+    A.e += ROUNDING*(fabs(A.c) + radius(A));
+    return A;
+}
+
+/*  linear
+ *
+ *  Returns alpha*A + beta +/- delta.
+ */
+static inline Affine linear(Affine A, float alpha, float beta, float delta)
+{
+    return rounded((Affine){.c=alpha*A.c + beta, .x=alpha*A.x, .y=alpha*A.y,
+                            .z=alpha*A.z, .e=fabs(alpha)*A.e + delta});
+}
+
+Affine interval_a(Interval I)
+{
+    return rounded((Affine){.c=(I.lower + I.upper)/2, .x=0, .y=0, .z=0,
+                            .e=(I.upper - I.lower)/2});
+}
+
+Interval hull_a(Affine A)
+{
+    const float r = radius(A);
+    return (Interval){.lower=A.c - r, .upper=A.c + r};
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Affine add_a(Affine A, Affine B)
+{
+    return rounded((Affine){.c=A.c+B.c, .x=A.x+B.x, .y=A.y+B.y, .z=A.z+B.z,
+                            .e=A.e+B.e});
+}
+
+Affine sub_a(Affine A, Affine B)
+{
+    return rounded((Affine){.c=A.c-B.c, .x=A.x-B.x, .y=A.y-B.y, .z=A.z-B.z,
+                            .e=A.e+B.e});
+}
+
+Affine mul_a(Affine A, Affine B)
+{
+    // The product of the two deviations is bounded by
+    // the product of their radii
+    return rounded((Affine){
+        .c=A.c*B.c,
+        .x=A.c*B.x + B.c*A.x,
+        .y=A.c*B.y + B.c*A.y,
+        .z=A.c*B.z + B.c*A.z,
+        .e=fabs(A.c)*B.e + fabs(B.c)*A.e + radius(A)*radius(B)});
+}
+
+/*  recip_a
+ *
+ *  Min-range approximation of 1/A, for A that doesn't contain zero.
+ */
+static Affine recip_a(Affine A)
+{
+    const Interval H = hull_a(A);
+    const float a = fabs(H.lower) < fabs(H.upper) ? fabs(H.lower)
+                                                  : fabs(H.upper),
+                b = fabs(H.lower) < fabs(H.upper) ? fabs(H.upper)
+                                                  : fabs(H.lower);
+
+    // On [a, b], 1/x - alpha*x is decreasing for alpha = -1/b^2
+    const float alpha = -1/(b*b),
+                hi = 1/a - alpha*a,
+                lo = 1/b - alpha*b;
+    const float s = H.lower > 0 ? 1 : -1;
+    return linear(A, alpha, s*(hi + lo)/2, (hi - lo)/2);
+}
+
+Affine div_a(Affine A, Affine B, Interval I)
+{
+    const Interval H = hull_a(B);
+    if (H.lower > 0 || H.upper < 0)     return mul_a(A, recip_a(B));
+    else                                return interval_a(I);
+}
+
+Affine min_a(Affine A, Affine B, Interval I)
+{
+    const Interval HA = hull_a(A), HB = hull_a(B);
+    if (HA.upper <= HB.lower)       return A;
+    else if (HB.upper <= HA.lower)  return B;
+    else                            return interval_a(I);
+}
+
+Affine max_a(Affine A, Affine B, Interval I)
+{
+    const Interval HA = hull_a(A), HB = hull_a(B);
+    if (HA.lower >= HB.upper)       return A;
+    else if (HB.lower >= HA.upper)  return B;
+    else                            return interval_a(I);
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Affine abs_a(Affine A, Interval I)
+{
+    const Interval H = hull_a(A);
+    if (H.lower >= 0)       return A;
+    else if (H.upper <= 0)  return neg_a(A);
+    else                    return interval_a(I);
+}
+
+Affine square_a(Affine A)
+{
+    // (c + d)^2 = c^2 + 2cd + d^2, where d^2 is in [0, r^2]
+    const float r = radius(A);
+    Affine out = linear(A, 2*A.c, -A.c*A.c, r*r/2);
+    out.c += r*r/2;
+    return out;
+}
+
+Affine sqrt_a(Affine A, Interval I)
+{
+    const Interval H = hull_a(A);
+    if (H.lower <= 0 || H.upper <= H.lower)     return interval_a(I);
+
+    // On [a, b], sqrt(x) - alpha*x is increasing for alpha = 1/(2 sqrt(b))
+    const float a = H.lower, b = H.upper;
+    const float alpha = 1/(2*sqrt(b)),
+                lo = sqrt(a) - alpha*a,
+                hi = sqrt(b) - alpha*b;
+    return linear(A, alpha, (hi + lo)/2, (hi - lo)/2);
+}
+
+Affine neg_a(Affine A)
+{
+    return (Affine){.c=-A.c, .x=-A.x, .y=-A.y, .z=-A.z, .e=A.e};
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Affine X_a(Interval X)
+{
+    return rounded((Affine){.c=(X.lower + X.upper)/2,
+                            .x=(X.upper - X.lower)/2, .y=0, .z=0, .e=0});
+}
+
+Affine Y_a(Interval Y)
+{
+    return rounded((Affine){.c=(Y.lower + Y.upper)/2, .x=0,
+                            .y=(Y.upper - Y.lower)/2, .z=0, .e=0});
+}
+
+Affine Z_a(Interval Z)
+{
+    return rounded((Affine){.c=(Z.lower + Z.upper)/2, .x=0, .y=0,
+                            .z=(Z.upper - Z.lower)/2, .e=0});
+}
@@ -0,0 +1,40 @@
+#ifndef MATH_A_H
+#define MATH_A_H
+
+#include "util/affine.h"
+#include "util/interval.h"
+
+/** @file tree/math/math_a.h
+    @brief Functions for doing math on affine forms.
+    @details These functions take in input affine forms A and B
+    and return an affine form enclosing the result.  Operations that
+    have no useful affine approximation over the given range take
+    the result's interval I (found with interval arithmetic) and
+    return an affine form covering it.
+*/
+
+// Conversions
+Affine  interval_a(Interval I);
+Interval hull_a(Affine A);
+
+// Binary functions
+Affine add_a(Affine A, Affine B);
+Affine sub_a(Affine A, Affine B);
+Affine mul_a(Affine A, Affine B);
+Affine div_a(Affine A, Affine B, Interval I);
+
+Affine min_a(Affine A, Affine B, Interval I);
+Affine max_a(Affine A, Affine B, Interval I);
+
+// Unary functions
+Affine abs_a(Affine A, Interval I);
+Affine square_a(Affine A);
+Affine sqrt_a(Affine A, Interval I);
+Affine neg_a(Affine A);
+
+// Variables
+Affine X_a(Interval X);
+Affine Y_a(Interval Y);
+Affine Z_a(Interval Z);
+
+#endif
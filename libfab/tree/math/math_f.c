@@ -37,6 +37,17 @@ float pow_f(float A, float B)
     return pow(A, B);
 }
 
+float mod_f(float A, float B)
+{
+    if (B == 0)     return A;
+    else            return A - B*floor(A/B);
+}
+
+float atan2_f(float A, float B)
+{
+    return atan2(A, B);
+}
+
 ////////////////////////////////////////////////////////////////////////////////
 
 float abs_f(float A)
@@ -17,6 +17,8 @@ float min_f(float A, float B);
 float max_f(float A, float B);
 
 float pow_f(float A, float B);
+float mod_f(float A, float B);
+float atan2_f(float A, float B);
 
 // Unary functions
 float abs_f(float A);
@@ -0,0 +1,204 @@
+#include <math.h>
+
+#include "tree/math/math_g.h"
+
+/*  chain
+ *
+ *  Applies the chain rule: returns a result with value v and
+ *  gradient d times the gradient of A.
+ */
+static inline Derivative chain(Derivative A, float v, float d)
+{
+    return (Derivative){.v=v, .dx=d*A.dx, .dy=d*A.dy, .dz=d*A.dz};
+}
+
+Derivative add_g(Derivative A, Derivative B)
+{
+    return (Derivative){.v=A.v+B.v, .dx=A.dx+B.dx,
+                        .dy=A.dy+B.dy, .dz=A.dz+B.dz};
+}
+
+Derivative sub_g(Derivative A, Derivative B)
+{
+    return (Derivative){.v=A.v-B.v, .dx=A.dx-B.dx,
+                        .dy=A.dy-B.dy, .dz=A.dz-B.dz};
+}
+
+Derivative mul_g(Derivative A, Derivative B)
+{
+    return (Derivative){.v=A.v*B.v, .dx=A.dx*B.v + A.v*B.dx,
+                                    .dy=A.dy*B.v + A.v*B.dy,
+                                    .dz=A.dz*B.v + A.v*B.dz};
+}
+
+Derivative div_g(Derivative A, Derivative B)
+{
+    const float q = B.v*B.v;
+    return (Derivative){.v=A.v/B.v, .dx=(A.dx*B.v - A.v*B.dx) / q,
+                                    .dy=(A.dy*B.v - A.v*B.dy) / q,
+                                    .dz=(A.dz*B.v - A.v*B.dz) / q};
+}
+
+Derivative min_g(Derivative A, Derivative B)
+{
+    return A.v < B.v ? A : B;
+}
+
+Derivative max_g(Derivative A, Derivative B)
+{
+    return A.v > B.v ? A : B;
+}
+
+Derivative pow_g(Derivative A, Derivative B)
+{
+    const float v = pow(A.v, B.v);
+
+    // d/dx A^B = B A^(B-1) dA + A^B ln(A) dB
+    // (the second term only exists for positive A)
+    const float a = B.v * pow(A.v, B.v - 1),
+                b = A.v > 0 ? v * log(A.v) : 0;
+    return (Derivative){.v=v, .dx=a*A.dx + b*B.dx,
+                              .dy=a*A.dy + b*B.dy,
+                              .dz=a*A.dz + b*B.dz};
+}
+
+Derivative mod_g(Derivative A, Derivative B)
+{
+    if (B.v == 0)   return A;
+
+    // A mod B = A - B floor(A/B), where floor(A/B) is locally constant
+    const float k = floor(A.v / B.v);
+    return (Derivative){.v=A.v - B.v*k, .dx=A.dx - k*B.dx,
+                                        .dy=A.dy - k*B.dy,
+                                        .dz=A.dz - k*B.dz};
+}
+
+Derivative atan2_g(Derivative A, Derivative B)
+{
+    const float v = atan2(A.v, B.v),
+                r = A.v*A.v + B.v*B.v;
+    if (r == 0)     return (Derivative){.v=v, .dx=0, .dy=0, .dz=0};
+
+    // d/dx atan2(A, B) = (B dA - A dB) / (A^2 + B^2)
+    return (Derivative){.v=v, .dx=(B.v*A.dx - A.v*B.dx) / r,
+                              .dy=(B.v*A.dy - A.v*B.dy) / r,
+                              .dz=(B.v*A.dz - A.v*B.dz) / r};
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Derivative abs_g(Derivative A)
+{
+    return A.v < 0 ? chain(A, -A.v, -1) : A;
+}
+
+Derivative square_g(Derivative A)
+{
+    return chain(A, A.v*A.v, 2*A.v);
+}
+
+Derivative sqrt_g(Derivative A)
+{
+    if (A.v <= 0)   return chain(A, 0, 0);
+    const float v = sqrt(A.v);
+    return chain(A, v, 0.5/v);
+}
+
+Derivative sin_g(Derivative A)
+{
+    return chain(A, sin(A.v), cos(A.v));
+}
+
+Derivative cos_g(Derivative A)
+{
+    return chain(A, cos(A.v), -sin(A.v));
+}
+
+Derivative tan_g(Derivative A)
+{
+    const float v = tan(A.v);
+    return chain(A, v, 1 + v*v);
+}
+
+Derivative asin_g(Derivative A)
+{
+    if (A.v <= -1)      return chain(A, -M_PI_2, 0);
+    else if (A.v >= 1)  return chain(A, M_PI_2, 0);
+    else                return chain(A, asin(A.v), 1/sqrt(1 - A.v*A.v));
+}
+
+Derivative acos_g(Derivative A)
+{
+    if (A.v <= -1)      return chain(A, M_PI, 0);
+    else if (A.v >= 1)  return chain(A, 0, 0);
+    else                return chain(A, acos(A.v), -1/sqrt(1 - A.v*A.v));
+}
+
+Derivative atan_g(Derivative A)
+{
+    return chain(A, atan(A.v), 1/(1 + A.v*A.v));
+}
+
+Derivative neg_g(Derivative A)
+{
+    return chain(A, -A.v, -1);
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+Derivative X_g(float X)
+{ return (Derivative){.v=X, .dx=1, .dy=0, .dz=0}; }
+
+Derivative Y_g(float Y)
+{ return (Derivative){.v=Y, .dx=0, .dy=1, .dz=0}; }
+
+Derivative Z_g(float Z)
+{ return (Derivative){.v=Z, .dx=0, .dy=0, .dz=1}; }
+
+////////////////////////////////////////////////////////////////////////////////
+
+#define BINARY_GR(name) \
+Derivative* name##_gr(Derivative* A, Derivative* B, Derivative* R, int c) \
+{                                                                         \
+    for (int q=0; q < c; ++q)   R[q] = name##_g(A[q], B[q]);              \
+    return R;                                                             \
+}
+
+#define UNARY_GR(name) \
+Derivative* name##_gr(Derivative* A, Derivative* R, int c) \
+{                                                          \
+    for (int q=0; q < c; ++q)   R[q] = name##_g(A[q]);     \
+    return R;                                              \
+}
+
+#define VARIABLE_GR(name) \
+Derivative* name##_gr(float* V, Derivative* R, int c)  \
+{                                                      \
+    for (int q=0; q < c; ++q)   R[q] = name##_g(V[q]); \
+    return R;                                          \
+}
+
+BINARY_GR(add)
+BINARY_GR(sub)
+BINARY_GR(mul)
+BINARY_GR(div)
+BINARY_GR(min)
+BINARY_GR(max)
+BINARY_GR(pow)
+BINARY_GR(mod)
+BINARY_GR(atan2)
+
+UNARY_GR(abs)
+UNARY_GR(square)
+UNARY_GR(sqrt)
+UNARY_GR(sin)
+UNARY_GR(cos)
+UNARY_GR(tan)
+UNARY_GR(asin)
+UNARY_GR(acos)
+UNARY_GR(atan)
+UNARY_GR(neg)
+
+VARIABLE_GR(X)
+VARIABLE_GR(Y)
+VARIABLE_GR(Z)
@@ -0,0 +1,76 @@
+#ifndef MATH_G_H
+#define MATH_G_H
+
+#include "util/derivative.h"
+
+/** @file tree/math/math_g.h
+    @brief Functions for doing math on dual numbers (forward-mode
+    automatic differentiation).
+    @details The scalar functions take in inputs A and B and return
+    the result's value and gradient.  The array functions take in input
+    arrays A and B and point count c, storing results in the array R.
+*/
+
+// Binary functions
+Derivative add_g(Derivative A, Derivative B);
+Derivative sub_g(Derivative A, Derivative B);
+Derivative mul_g(Derivative A, Derivative B);
+Derivative div_g(Derivative A, Derivative B);
+
+Derivative min_g(Derivative A, Derivative B);
+Derivative max_g(Derivative A, Derivative B);
+
+Derivative pow_g(Derivative A, Derivative B);
+Derivative mod_g(Derivative A, Derivative B);
+Derivative atan2_g(Derivative A, Derivative B);
+
+// Unary functions
+Derivative abs_g(Derivative A);
+Derivative square_g(Derivative A);
+Derivative sqrt_g(Derivative A);
+Derivative sin_g(Derivative A);
+Derivative cos_g(Derivative A);
+Derivative tan_g(Derivative A);
+Derivative asin_g(Derivative A);
+Derivative acos_g(Derivative A);
+Derivative atan_g(Derivative A);
+Derivative neg_g(Derivative A);
+
+// Variables
+Derivative X_g(float X);
+Derivative Y_g(float Y);
+Derivative Z_g(float Z);
+
+////////////////////////////////////////////////////////////////////////////////
+
+// Binary functions
+Derivative* add_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* sub_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* mul_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* div_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+
+Derivative* min_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* max_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+
+Derivative* pow_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* mod_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+Derivative* atan2_gr(Derivative* A, Derivative* B, Derivative* R, int c);
+
+// Unary functions
+Derivative* abs_gr(Derivative* A, Derivative* R, int c);
+Derivative* square_gr(Derivative* A, Derivative* R, int c);
+Derivative* sqrt_gr(Derivative* A, Derivative* R, int c);
+Derivative* sin_gr(Derivative* A, Derivative* R, int c);
+Derivative* cos_gr(Derivative* A, Derivative* R, int c);
+Derivative* tan_gr(Derivative* A, Derivative* R, int c);
+Derivative* asin_gr(Derivative* A, Derivative* R, int c);
+Derivative* acos_gr(Derivative* A, Derivative* R, int c);
+Derivative* atan_gr(Derivative* A, Derivative* R, int c);
+Derivative* neg_gr(Derivative* A, Derivative* R, int c);
+
+// Variables
+Derivative* X_gr(float* X, Derivative* R, int c);
+Derivative* Y_gr(float* Y, Derivative* R, int c);
+Derivative* Z_gr(float* Z, Derivative* R, int c);
+
+#endif
@@ -92,6 +92,61 @@ Interval pow_i(Interval A, Interval B)
     return i;
 }
 
+Interval mod_i(Interval A, Interval B)
+{
+    Interval i;
+
+    // With a constant divisor, the result is exact unless A wraps
+    // around from one multiple of B to the next.
+    if (B.lower == B.upper && B.lower != 0) {
+        const float b = B.lower, k = floor(A.lower / b);
+        if (k == floor(A.upper / b)) {
+            i.lower = A.lower - b*k;
+            i.upper = A.upper - b*k;
+            if (b > 0)  i.lower = fmax(i.lower, 0), i.upper = fmin(i.upper, b);
+            else        i.lower = fmax(i.lower, b), i.upper = fmin(i.upper, 0);
+            return i;
+        }
+    }
+
+    if (B.lower > 0) {
+        i.lower = 0;
+        i.upper = B.upper;
+    } else if (B.upper < 0) {
+        i.lower = B.lower;
+        i.upper = 0;
+    } else {
+        // A mod 0 is A, so fall back to including A itself
+        i.lower = fmin(fmin(A.lower, B.lower), 0);
+        i.upper = fmax(fmax(A.upper, B.upper), 0);
+    }
+    return i;
+}
+
+Interval atan2_i(Interval A, Interval B)
+{
+    Interval i;
+
+    // Angles jump across the negative x axis (and are undefined at
+    // the origin), so regions touching it may have any angle.
+    if (B.lower <= 0 && A.lower <= 0 && A.upper >= 0) {
+        i.lower = -M_PI;
+        i.upper = M_PI;
+        return i;
+    }
+
+    // Otherwise, the angle is continuous over the region and its
+    // extremes are at the corners.
+    const float c1 = atan2(A.lower, B.lower),
+                c2 = atan2(A.lower, B.upper),
+                c3 = atan2(A.upper, B.lower),
+                c4 = atan2(A.upper, B.upper);
+
+    i.lower = fmin(fmin(c1, c2), fmin(c3, c4));
+    i.upper = fmax(fmax(c1, c2), fmax(c3, c4));
+    return i;
+}
+
 ////////////////////////////////////////////////////////////////////////////////
 
 Interval abs_i(Interval A)
@@ -135,6 +190,33 @@ Interval sqrt_i(Interval A)
     return i;
 }
 
+/*  periodic_i
+ *
+ *  Bounds a sinusoid over A, given its values at A's ends and the
+ *  phase at which it peaks (it bottoms out half a period later).
+ */
+static Interval periodic_i(Interval A, float lower, float upper, float peak)
+{
+    Interval i;
+
+    if (!(A.upper - A.lower < 2*M_PI)) {
+        i.lower = -1;
+        i.upper = 1;
+        return i;
+    }
+
+    i.lower = fmin(lower, upper);
+    i.upper = fmax(lower, upper);
+
+    if (ceil((A.lower - peak) / (2*M_PI))*2*M_PI + peak <= A.upper)
+        i.upper = 1;
+    if (ceil((A.lower - peak - M_PI) / (2*M_PI))*2*M_PI + peak + M_PI
+            <= A.upper)
+        i.lower = -1;
+
+    return i;
+}
+
 Interval sin_i(Interval A)
 {
     Interval i;
@@ -143,8 +225,7 @@ Interval sin_i(Interval A)
         i.lower = sin(A.lower);
         i.upper = i.lower;
     } else {
-        i.lower = -1;
-        i.upper = 1;
+        i = periodic_i(A, sin(A.lower), sin(A.upper), M_PI_2);
     }
     return i;
 }
@@ -157,8 +238,7 @@ Interval cos_i(Interval A)
         i.lower = cos(A.lower);
         i.upper = i.lower;
     } else {
-        i.lower = -1;
-        i.upper = 1;
+        i = periodic_i(A, cos(A.lower), cos(A.upper), 0);
     }
     return i;
 }
@@ -19,6 +19,8 @@ Interval min_i(Interval A, Interval B);
 Interval max_i(Interval A, Interval B);
 
 Interval pow_i(Interval A, Interval B);
+Interval mod_i(Interval A, Interval B);
+Interval atan2_i(Interval A, Interval B);
 
 // Unary functions
 Interval abs_i(Interval A);
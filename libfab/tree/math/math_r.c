@@ -52,6 +52,20 @@ float* pow_r(float* A, float* B, float* R, int c)
     return R;
 }
 
+float* mod_r(float* A, float* B, float* R, int c)
+{
+    for (int q = 0; q < c; ++q)
+        R[q] = B[q] ? A[q] - B[q]*floor(A[q]/B[q]) : A[q];
+    return R;
+}
+
+float* atan2_r(float* A, float* B, float* R, int c)
+{
+    for (int q = 0; q < c; ++q)
+        R[q] = atan2(A[q], B[q]);
+    return R;
+}
+
 ////////////////////////////////////////////////////////////////////////////////
 
 float* abs_r(float* A, float* R, int c)
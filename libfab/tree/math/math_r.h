@@ -17,6 +17,8 @@ float* min_r(float* A, float* B, float* R, int c);
 float* max_r(float* A, float* B, float* R, int c);
 
 float* pow_r(float* A, float* B, float* R, int c);
+float* mod_r(float* A, float* B, float* R, int c);
+float* atan2_r(float* A, float* B, float* R, int c);
 
 // Unary functions
 float* abs_r(float* A, float* R, int c);
@@ -60,6 +60,8 @@ Node* div_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, div_f, OP_DIV); }
 Node* min_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, min_f, OP_MIN); }
 Node* max_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, max_f, OP_MAX); }
 Node* pow_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, pow_f, OP_POW); }
+Node* mod_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, mod_f, OP_MOD); }
+Node* atan2_n(Node* lhs, Node* rhs) { return binary_n(lhs, rhs, atan2_f, OP_ATAN2); }
 
 
 ////////////////////////////////////////////////////////////////////////////////
@@ -47,6 +47,14 @@ typedef struct Node_ {
     Most recent place to which this node was cloned
     */
     struct Node_* clone_address;
+
+    /** @var bounded
+    True if bounds contains every point where this node is negative */
+    _Bool bounded;
+
+    /** @var bounds
+    X, Y, and Z bounds of this node's shape (if bounded is set) */
+    Interval bounds[3];
 } Node;
 
 
@@ -71,6 +79,8 @@ Node* div_n(Node* left, Node* right);
 Node* min_n(Node* left, Node* right);
 Node* max_n(Node* left, Node* right);
 Node* pow_n(Node* left, Node* right);
+Node* mod_n(Node* left, Node* right);
+Node* atan2_n(Node* left, Node* right);
 
 // Unary arithmetic operators
 Node* abs_n(Node* n);
@@ -8,6 +8,8 @@ const char* OPCODE_NAMES[] = {
     "OP_MIN",
     "OP_MAX",
     "OP_POW",
+    "OP_MOD",
+    "OP_ATAN2",
 
     "OP_ABS",
     "OP_SQUARE",
@@ -37,6 +39,8 @@ const char* dot_symbol(Opcode op) {
         case OP_MIN:    return "min";
         case OP_MAX:    return "max";
         case OP_POW:    return "pow";
+        case OP_MOD:    return "mod";
+        case OP_ATAN2:  return "atan2";
         case OP_ABS:    return "abs";
         case OP_SQUARE: return "square";
         case OP_SQRT:   return "sqrt";
@@ -62,6 +66,8 @@ const char* dot_color(Opcode op) {
         case OP_MUL:
         case OP_DIV:
         case OP_POW:
+        case OP_MOD:
+        case OP_ATAN2:
         case OP_ABS:
         case OP_SQUARE:
         case OP_SQRT:
@@ -102,6 +108,8 @@ int dot_fontsize(Opcode op) {
         case OP_MIN:
         case OP_MAX:
         case OP_POW:
+        case OP_MOD:
+        case OP_ATAN2:
         case OP_ABS:
         case OP_SQUARE:
         case OP_SQRT:
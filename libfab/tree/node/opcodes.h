@@ -12,6 +12,8 @@ typedef enum Opcode_ {
     OP_MIN,
     OP_MAX,
     OP_POW,
+    OP_MOD,
+    OP_ATAN2,
 
     OP_ABS,
     OP_SQUARE,
@@ -57,6 +57,24 @@ static void max_p(Node* n, FILE* f)
     fprintf(f, ")");
 }
 
+static void mod_p(Node* n, FILE* f)
+{
+    fprintf(f, "mod(");
+    fprint_node(n->lhs, f);
+    fprintf(f, ", ");
+    fprint_node(n->rhs, f);
+    fprintf(f, ")");
+}
+
+static void atan2_p(Node* n, FILE* f)
+{
+    fprintf(f, "atan2(");
+    fprint_node(n->lhs, f);
+    fprintf(f, ", ");
+    fprint_node(n->rhs, f);
+    fprintf(f, ")");
+}
+
 static void pow_p(Node* n, FILE* f)
 {
     fprintf(f, "pow(");
@@ -176,6 +194,8 @@ void fprint_node(Node* n, FILE* f)
         case OP_MIN:    min_p(n, f); break;
         case OP_MAX:    max_p(n, f); break;
         case OP_POW:    pow_p(n, f); break;
+        case OP_MOD:    mod_p(n, f); break;
+        case OP_ATAN2:  atan2_p(n, f); break;
 
         case OP_SQUARE: square_p(n, f); break;
         case OP_SQRT:   sqrt_p(n, f); break;
@@ -7,8 +7,12 @@ void fill_results(Node* n, float value)
 {
     n->results.f = value;
     n->results.i = (Interval) { .lower=value, .upper=value};
+    n->results.g = (Derivative) { .v=value, .dx=0, .dy=0, .dz=0};
+    n->results.a = (Affine) { .c=value, .x=0, .y=0, .z=0, .e=0};
 
     // Fill the region cache
-    for (int q = 0; q < MIN_VOLUME; ++q)
+    for (int q = 0; q < MIN_VOLUME; ++q) {
         n->results.r[q] = value;
+        n->results.gr[q] = n->results.g;
+    }
 }
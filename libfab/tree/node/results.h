@@ -2,6 +2,8 @@
 #define CACHE_H
 
 #include "util/interval.h"
+#include "util/derivative.h"
+#include "util/affine.h"
 #include "util/region.h"
 #include "util/switches.h"
 
@@ -12,14 +14,18 @@ struct Node_;
 */
 typedef struct Results_
 {
-    float    f;
-    Interval i;
-    float    r[MIN_VOLUME];
+    float      f;
+    Interval   i;
+    float      r[MIN_VOLUME];
+    Derivative g;
+    Derivative gr[MIN_VOLUME];
+    Affine     a;
 } Results;
 
 
 /** @brief Fills node results with a constant
-    @details n->results.{f,i,r} are all set equal to the constant
+    @details n->results.{f,i,r,g,gr,a} are all set equal to the constant
+    (with zero gradients)
     @param n Target node
     @param value Constant to fill
 */
@@ -0,0 +1,38 @@
+#include <math.h>
+
+#include "tree/eval.h"
+#include "tree/normals.h"
+#include "tree/packed.h"
+
+#include "formats/mesh.h"
+#include "util/switches.h"
+
+void mesh_normals(PackedTree* tree, Mesh* mesh, const float scale)
+{
+    float X[MIN_VOLUME], Y[MIN_VOLUME], Z[MIN_VOLUME];
+    Region r = {.X=X, .Y=Y, .Z=Z};
+
+    // Evaluate vertices in batches that fit in the results arrays
+    for (uint32_t start=0; start < mesh->vcount; start += MIN_VOLUME) {
+        uint32_t count = mesh->vcount - start;
+        if (count > MIN_VOLUME)     count = MIN_VOLUME;
+
+        float* v = &mesh->vdata[start*6];
+        for (uint32_t q=0; q < count; ++q) {
+            X[q] = v[q*6]   / scale;
+            Y[q] = v[q*6+1] / scale;
+            Z[q] = v[q*6+2] / scale;
+        }
+        r.voxels = count;
+
+        const Derivative* g = eval_gr(tree, r);
+        for (uint32_t q=0; q < count; ++q) {
+            const float norm = sqrt(g[q].dx*g[q].dx + g[q].dy*g[q].dy +
+                                    g[q].dz*g[q].dz);
+            if (!(norm > 0) || isinf(norm))   continue;
+            v[q*6+3] = g[q].dx / norm;
+            v[q*6+4] = g[q].dy / norm;
+            v[q*6+5] = g[q].dz / norm;
+        }
+    }
+}
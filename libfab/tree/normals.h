@@ -0,0 +1,20 @@
+#ifndef TREE_NORMALS_H
+#define TREE_NORMALS_H
+
+struct PackedTree_;
+struct Mesh_;
+
+/** @brief Sets a mesh's vertex normals to the exact gradient of a tree
+    @details Gradients are found with forward-mode automatic
+    differentiation (eval_gr), so each vertex costs one evaluation
+    of the tree.  Vertices where the gradient vanishes keep their
+    existing normals.
+    @param tree Tree from which the mesh was generated
+    @param mesh Target mesh
+    @param scale Mesh units per tree unit (vertex positions are divided
+    by this before evaluating the tree)
+*/
+void mesh_normals(struct PackedTree_* tree, struct Mesh_* mesh,
+                  const float scale);
+
+#endif
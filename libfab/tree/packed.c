@@ -1,3 +1,4 @@
+#include <math.h>
 #include <stdlib.h>
 
 #include "tree/packed.h"
@@ -55,6 +56,17 @@ void free_packed(PackedTree* packed)
     free(packed);
 }
 
+void set_affine(PackedTree* packed, _Bool affine)
+{
+    packed->affine = affine;
+}
+
+void get_counts(PackedTree* packed, uint64_t* intervals, uint64_t* points)
+{
+    *intervals = packed->interval_count;
+    *points = packed->point_count;
+}
+
 ////////////////////////////////////////////////////////////////////////////////
 
 _STATIC_
@@ -78,6 +90,27 @@ void disable_node(PackedTree* tree, int level, int n)
 }
 
 
+/*  outside_bounds
+ *
+ *  Checks whether a node's bounds miss the most recently evaluated
+ *  region (in which case the node is positive throughout the region).
+ */
+_STATIC_
+_Bool outside_bounds(const PackedTree* tree, const Node* node)
+{
+    if (!node->bounded)     return false;
+
+    for (int a=0; a < 3; ++a) {
+        if (node->bounds[a].lower > tree->region[a].upper ||
+            node->bounds[a].upper < tree->region[a].lower)
+        {
+            return true;
+        }
+    }
+    return false;
+}
+
+
 void disable_nodes_binary(PackedTree* tree)
 {
     for (int level=0; level < tree->num_levels; ++level) {
@@ -91,7 +124,16 @@ void disable_nodes_binary(PackedTree* tree)
         for (int n=0; n < tree->active[level]; ++n) {
             Node* node = tree->nodes[level][n];
 
-            if ((node->flags & NODE_BOOLEAN) &&
+            if ((node->flags & NODE_BOOLEAN) && outside_bounds(tree, node))
+            {
+                // Only the sign matters here, so the node's value can be
+                // anything positive (and infinity passes through min,
+                // max, and negation without changing any other branch).
+                node->results.i.upper = INFINITY;
+                disable_node(tree, level, n--);
+                node->flags = 0;
+            }
+            else if ((node->flags & NODE_BOOLEAN) &&
                 (node->results.i.lower >= 0 || node->results.i.upper < 0))
             {
                 disable_node(tree, level, n--);
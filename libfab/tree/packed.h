@@ -4,6 +4,7 @@
 #include <stdint.h>
 
 #include "tree/tree.h"
+#include "util/interval.h"
 
 /** @struct ustack_
     @brief A simple FIFO stack of unsigned integers.
@@ -41,6 +42,23 @@ typedef struct PackedTree_ {
     /** @var head
     Root of this tree */
     struct Node_* head;
+
+    /** @var affine
+    If true, render functions bound regions with affine arithmetic
+    (eval_a) rather than interval arithmetic (eval_i) */
+    _Bool affine;
+
+    /** @var interval_count
+    Number of region evaluations (eval_i or eval_a) */
+    uint64_t interval_count;
+
+    /** @var region
+    X, Y, and Z intervals of the most recent region evaluation */
+    Interval region[3];
+
+    /** @var point_count
+    Number of points evaluated (by eval_f or eval_r) */
+    uint64_t point_count;
 } PackedTree;
 
 
@@ -59,6 +77,19 @@ PackedTree* make_packed(struct MathTree_* tree);
 void free_packed(PackedTree* packed);
 
 
+/** @brief Chooses how render functions bound regions
+    @param affine If true, use affine arithmetic; otherwise, interval arithmetic
+*/
+void set_affine(PackedTree* packed, _Bool affine);
+
+
+/** @brief Reads a packed tree's evaluation counts
+    @param intervals Set to the number of region evaluations
+    @param points Set to the number of points evaluated
+*/
+void get_counts(PackedTree* packed, uint64_t* intervals, uint64_t* points);
+
+
 /** @brief Travels down the tree, disabling nodes whose values will not matter
     upon further spatial subdivision
 
@@ -77,6 +108,10 @@ void disable_nodes(PackedTree* tree);
     (i.e. whether it is larger or smaller than zero)
 
     @details
+    Bounded nodes whose bounds miss the most recently evaluated region
+    are positive throughout that region, so they are disabled as well
+    (even if interval arithmetic couldn't prove it).
+
     Must be called after disable_nodes, otherwise the stacks won't be
     in place to store the number of disabled nodes.
 */
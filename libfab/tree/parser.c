@@ -6,6 +6,8 @@
     OP_MIN  i
     OP_MAX  a
     OP_POW  p
+    OP_MOD  %
+    OP_ATAN2 A
 
     OP_SIN  s
     OP_COS  c
@@ -23,6 +25,17 @@
     OP_Y    Y
     OP_Z    Z
     OP_CONST    f (followed by value)
+
+    Maps are written as m followed by X, Y, and Z substitutions (or spaces,
+    to leave an axis unchanged) and the mapped expression.
+
+    Affine maps are written as M followed by twelve constants (a 3x4
+    matrix, row by row, giving the new X, Y, and Z as linear functions
+    of X, Y, Z, and 1) and the mapped expression.
+
+    Bounds are written as B followed by six constants (xmin, xmax, ymin,
+    ymax, zmin, zmax) and the bounded expression, which must be negative
+    only within those bounds.
 */
 #include <stdlib.h>
 #include <stdio.h>
@@ -32,12 +45,20 @@
 
 #include "tree/tree.h"
 #include "tree/parser.h"
+#include "tree/packed.h"
+#include "tree/eval.h"
 
 #include "tree/node/node.h"
 #include "tree/node/opcodes.h"
 
 ////////////////////////////////////////////////////////////////////////////////
 
+/* Scratch flags used while simplifying a tree */
+#define NODE_SEEN       16
+#define NODE_SHARED     32
+#define NODE_EVEN       64
+#define NODE_ODD        128
+
 /* Linked list of Nodes */
 typedef struct NodeList_
 {
@@ -52,6 +73,14 @@ typedef struct NodeCache_
     int levels;
     NodeList* (*nodes)[LAST_OP];
     NodeList* constants;
+
+    /* Unmapped X, Y, and Z nodes */
+    Node* vars[3];
+
+    /* Affine map (as a 3x4 matrix) from unmapped coordinates to the
+       coordinates of the expression being parsed, or NULL within
+       a general map. */
+    double* frame;
 } NodeCache;
 
 
@@ -72,6 +101,93 @@ Node* get_token(const char** input, _Bool* const failed,
                         Node* X, Node* Y, Node* Z,
                         NodeCache* const cache);
 
+/** @brief Reads an affine map and the expression it maps
+    @details Within other affine maps, the maps are composed and the new
+    coordinates are built directly from the unmapped X, Y, and Z nodes,
+    so that nested affine maps collapse into a single layer.
+    @param input Input stream, incremented as we go
+    @param failed Flag set if we fail
+    @param X Node to use for 'X' token
+    @param Y Node to use for 'Y' token
+    @param Z Node to use for 'Z' token
+    @param cache Node cache
+    @returns The mapped expression
+*/
+_STATIC_
+Node* get_affine(const char** input, _Bool* const failed,
+                 Node* X, Node* Y, Node* Z,
+                 NodeCache* const cache);
+
+/** @brief Reads a bounding box and the expression it bounds
+    @details Bounds are stored in unmapped coordinates, since they are
+    tested against the region being evaluated.  Within affine maps, they
+    are mapped back into unmapped coordinates; within general maps, they
+    are only recorded on axes that aren't remapped.
+    @param input Input stream, incremented as we go
+    @param failed Flag set if we fail
+    @param X Node to use for 'X' token
+    @param Y Node to use for 'Y' token
+    @param Z Node to use for 'Z' token
+    @param cache Node cache
+    @returns The bounded expression
+*/
+_STATIC_
+Node* get_bounded(const char** input, _Bool* const failed,
+                  Node* X, Node* Y, Node* Z,
+                  NodeCache* const cache);
+
+/** @brief Makes a node cache containing X, Y, and Z nodes
+    @param frame Affine map from unmapped coordinates (see NodeCache)
+*/
+_STATIC_
+NodeCache* new_node_cache(double* frame);
+
+/** @brief Returns the simplified version of a node, building it
+    (and its children) in the given cache
+    @details Results are stored in clone_address, so each node is only
+    simplified once.
+    @param n Node to simplify (from an evaluated tree)
+    @param cache Node cache
+*/
+_STATIC_
+Node* simplify_node(Node* const n, NodeCache* const cache);
+
+/** @brief Builds a node with the given opcode and (simplified) children,
+    applying algebraic identities where possible
+    @param op Opcode
+    @param lhs Left-hand child
+    @param rhs Right-hand child (or NULL)
+    @param cache Node cache
+*/
+_STATIC_
+Node* simplify_op(const Opcode op, Node* const lhs, Node* const rhs,
+                  NodeCache* const cache);
+
+/** @brief Simplifies a chain of min or max operations, dropping
+    dominated and duplicate operands and rebalancing it
+    @param n Head of the chain
+    @param cache Node cache
+*/
+_STATIC_
+Node* simplify_chain(Node* const n, NodeCache* const cache);
+
+/** @brief Marks a node as bounded, intersecting with any existing bounds
+    @param n Target node (left unbounded if it's a constant)
+    @param bounds X, Y, and Z bounds (modified in place)
+*/
+_STATIC_
+void bound_node(Node* const n, Interval bounds[3]);
+
+/** @brief Reads a fixed number of constants ('f' tokens) into an array
+    @param input Input stream (incremented as we go)
+    @param failed Flag (set to True if something goes wrong)
+    @param out Array in which to store the values
+    @param count Number of constants to read
+*/
+_STATIC_
+void get_floats(const char** input, _Bool* const failed,
+                float* out, int count);
+
 /** @brief Gets a float from the input stream
     @param input Input stream (incremented as we go)
     @param failed Flag (set to True if something goes wrong)
@@ -113,16 +229,13 @@ MathTree* parse(const char* input)
     _Bool failed = false;
 
     // Create a cache in which nodes will be stored
-    NodeCache* cache = malloc(sizeof(NodeCache));
-    *cache = (NodeCache){ .levels=0, .constants=NULL };
-
-    // Throw X, Y, and Z nodes into the cache
-    Node* X = get_cached_node(cache, X_n());
-    Node* Y = get_cached_node(cache, Y_n());
-    Node* Z = get_cached_node(cache, Z_n());
+    // (starting with the identity map)
+    double identity[12] = {1, 0, 0, 0,  0, 1, 0, 0,  0, 0, 1, 0};
+    NodeCache* cache = new_node_cache(identity);
 
     // Parse the string, storing nodes in the cache and receiving the head
-    Node* head = get_token(&input, &failed, X, Y, Z, cache);
+    Node* head = get_token(&input, &failed, cache->vars[0],
+                           cache->vars[1], cache->vars[2], cache);
 
     //  Abort if:
     //      The parser failed
@@ -144,6 +257,111 @@ MathTree* parse(const char* input)
     return T;
 }
 
+int simplify_tree(MathTree* tree, const Interval X,
+                                  const Interval Y,
+                                  const Interval Z)
+{
+    if (tree == NULL)   return 0;
+
+    // Evaluate the tree over its region, so that dominated branches
+    // of min and max operations can be found.
+    PackedTree* packed = make_packed(tree);
+    eval_i(packed, X, Y, Z);
+    free_packed(packed);
+
+    // Clear scratch flags and pointers
+    for (unsigned c=0; c < tree->num_constants; ++c) {
+        tree->constants[c]->flags &= ~(NODE_SEEN | NODE_SHARED |
+                                       NODE_EVEN | NODE_ODD);
+        tree->constants[c]->clone_address = NULL;
+    }
+    for (unsigned level=0; level < tree->num_levels; ++level) {
+        for (unsigned op=0; op < LAST_OP; ++op) {
+            for (unsigned n=0; n < tree->active[level][op]; ++n) {
+                Node* const node = tree->nodes[level][op][n];
+                node->flags &= ~(NODE_SEEN | NODE_SHARED |
+                                 NODE_EVEN | NODE_ODD);
+                node->clone_address = NULL;
+            }
+        }
+    }
+
+    // Mark nodes with more than one parent
+    for (unsigned level=0; level < tree->num_levels; ++level) {
+        for (unsigned op=0; op < LAST_OP; ++op) {
+            for (unsigned n=0; n < tree->active[level][op]; ++n) {
+                Node* const children[2] = {tree->nodes[level][op][n]->lhs,
+                                           tree->nodes[level][op][n]->rhs};
+                for (int c=0; c < 2; ++c) {
+                    if (!children[c])   continue;
+                    children[c]->flags |= (children[c]->flags & NODE_SEEN)
+                                          ? NODE_SHARED : NODE_SEEN;
+                }
+            }
+        }
+    }
+
+    // Work out how each node affects the head, going down from the top.
+    // A node marked NODE_EVEN (or NODE_ODD) only reaches the head through
+    // min, max, and an even (or odd) number of negations, so the head
+    // grows as it grows (or shrinks).  Bounded nodes below the head are
+    // left alone, since their bounds must hold everywhere.
+    tree->head->flags |= NODE_EVEN;
+    for (int level=tree->num_levels - 1; level >= 0; --level) {
+        for (unsigned op=0; op < LAST_OP; ++op) {
+            for (unsigned n=0; n < tree->active[level][op]; ++n) {
+                Node* const node = tree->nodes[level][op][n];
+                uint8_t p = node->flags & (NODE_EVEN | NODE_ODD);
+                if (node->bounded && node != tree->head) {
+                    p = NODE_EVEN | NODE_ODD;
+                } else if (op == OP_NEG) {
+                    p = ((p & NODE_EVEN) ? NODE_ODD : 0) |
+                        ((p & NODE_ODD) ? NODE_EVEN : 0);
+                } else if (op != OP_MIN && op != OP_MAX) {
+                    p = NODE_EVEN | NODE_ODD;
+                }
+                if (node->lhs)  node->lhs->flags |= p;
+                if (node->rhs)  node->rhs->flags |= p;
+            }
+        }
+    }
+
+    // Rebuild the tree in a fresh cache
+    double identity[12] = {1, 0, 0, 0,  0, 1, 0, 0,  0, 0, 1, 0};
+    NodeCache* cache = new_node_cache(identity);
+    Node* head = simplify_node(tree->head, cache);
+
+    flag_in_tree(head);
+    MathTree* T = cache_to_tree(cache);
+    T->head = head;
+    free_node_cache(cache);
+
+    // Swap the new tree's contents into place and free the old nodes
+    const int removed = count_nodes(tree) - count_nodes(T);
+    const MathTree old = *tree;
+    *tree = *T;
+    *T = old;
+    free_tree(T);
+
+    return removed;
+}
+
+
+_STATIC_
+NodeCache* new_node_cache(double* frame)
+{
+    NodeCache* cache = malloc(sizeof(NodeCache));
+    *cache = (NodeCache){ .levels=0, .constants=NULL, .frame=frame };
+
+    // Throw X, Y, and Z nodes into the cache
+    cache->vars[0] = get_cached_node(cache, X_n());
+    cache->vars[1] = get_cached_node(cache, Y_n());
+    cache->vars[2] = get_cached_node(cache, Z_n());
+
+    return cache;
+}
+
+
 _STATIC_
 void flag_in_tree(Node* n)
 {
@@ -163,6 +381,7 @@ Node* get_token(const char** const input, _Bool* const failed,
 {
     Node *lhs = NULL, *rhs = NULL, *out = NULL;
     Node *X_ = NULL, *Y_ = NULL, *Z_ = NULL;
+    double* frame = NULL;
 
     char c = *((*input)++);
 
@@ -178,16 +397,22 @@ Node* get_token(const char** const input, _Bool* const failed,
         case 'Y':   out = Y; break;
         case 'Z':   out = Z; break;
         case 'f':   out = get_float(input, failed); break;
+        case 'B':   out = get_bounded(input, failed, X, Y, Z, cache); break;
+
+        case 'M':   out = get_affine(input, failed, X, Y, Z, cache); break;
 
         case 'm':
             X_ = get_token(input, failed, X, Y, Z, cache);
             Y_ = get_token(input, failed, X, Y, Z, cache);
             Z_ = get_token(input, failed, X, Y, Z, cache);
+            frame = cache->frame;
+            cache->frame = NULL;
             out = get_token(input, failed,
                             X_ ? X_ : X,
                             Y_ ? Y_ : Y,
                             Z_ ? Z_ : Z,
                             cache);
+            cache->frame = frame;
             break;
 
         case '+':
@@ -197,6 +422,8 @@ Node* get_token(const char** const input, _Bool* const failed,
         case 'i':
         case 'a':
         case 'p':
+        case '%':
+        case 'A':
             lhs = get_token(input, failed, X, Y, Z, cache);
             rhs = get_token(input, failed, X, Y, Z, cache);
             break;
@@ -226,6 +453,8 @@ Node* get_token(const char** const input, _Bool* const failed,
         case 'Y':
         case 'Z':
         case 'f':
+        case 'B':
+        case 'M':
         case 'm':   break;
 
         case '+':   out = add_n(lhs, rhs); break;
@@ -235,6 +464,8 @@ Node* get_token(const char** const input, _Bool* const failed,
         case 'i':   out = min_n(lhs, rhs); break;
         case 'a':   out = max_n(lhs, rhs); break;
         case 'p':   out = pow_n(lhs, rhs); break;
+        case '%':   out = mod_n(lhs, rhs); break;
+        case 'A':   out = atan2_n(lhs, rhs); break;
 
         case 's':   out = sin_n(lhs); break;
         case 'c':   out = cos_n(lhs); break;
@@ -255,6 +486,189 @@ Node* get_token(const char** const input, _Bool* const failed,
 }
 
 
+/*  affine_node
+ *
+ *  Builds a linear combination of three nodes plus a constant,
+ *  skipping terms with zero coefficients.
+ */
+_STATIC_
+Node* affine_node(NodeCache* const cache, Node* const vars[3],
+                  const double row[4])
+{
+    Node* sum = NULL;
+    for (int k=0; k < 3; ++k) {
+        if (row[k] == 0)    continue;
+
+        Node* term = vars[k];
+        if (row[k] == -1) {
+            term = get_cached_node(cache, neg_n(term));
+        } else if (row[k] != 1) {
+            Node* c = get_cached_node(cache, constant_n(row[k]));
+            term = get_cached_node(cache, mul_n(c, term));
+        }
+        sum = sum ? get_cached_node(cache, add_n(sum, term)) : term;
+    }
+
+    if (row[3] != 0 || !sum) {
+        Node* c = get_cached_node(cache, constant_n(row[3]));
+        sum = sum ? get_cached_node(cache, add_n(sum, c)) : c;
+    }
+    return sum;
+}
+
+
+_STATIC_
+Node* get_affine(const char** const input, _Bool* const failed,
+                 Node* X, Node* Y, Node* Z,
+                 NodeCache* const cache)
+{
+    float m[12];
+    get_floats(input, failed, m, 12);
+    if (*failed)    return NULL;
+
+    double* const outer = cache->frame;
+    double frame[12];
+    Node* vars[3] = {X, Y, Z};
+
+    if (outer) {
+        // Compose this map with the enclosing affine map
+        for (int r=0; r < 3; ++r) {
+            for (int c=0; c < 4; ++c) {
+                frame[4*r + c] = (c == 3) ? m[4*r + 3] : 0;
+                for (int k=0; k < 3; ++k) {
+                    frame[4*r + c] += m[4*r + k] * outer[4*k + c];
+                }
+            }
+        }
+        for (int a=0; a < 3; ++a)   vars[a] = cache->vars[a];
+    } else {
+        for (int i=0; i < 12; ++i)  frame[i] = m[i];
+    }
+
+    Node* X_ = affine_node(cache, vars, frame);
+    Node* Y_ = affine_node(cache, vars, frame + 4);
+    Node* Z_ = affine_node(cache, vars, frame + 8);
+
+    cache->frame = outer ? frame : NULL;
+    Node* out = get_token(input, failed, X_, Y_, Z_, cache);
+    cache->frame = outer;
+
+    return out;
+}
+
+
+/*  unmap_bounds
+ *
+ *  Finds the box (in unmapped coordinates) containing every point
+ *  that an affine map sends into the given box.  Returns false if
+ *  the map is singular.
+ */
+_STATIC_
+_Bool unmap_bounds(const double* f, const float b[6], Interval out[3])
+{
+    // Invert the linear part of the map (by cofactors)
+    double inv[3][3];
+    for (int r=0; r < 3; ++r) {
+        for (int c=0; c < 3; ++c) {
+            const int r1 = (c + 1) % 3, r2 = (c + 2) % 3,
+                      c1 = (r + 1) % 3, c2 = (r + 2) % 3;
+            inv[r][c] = f[4*r1 + c1]*f[4*r2 + c2] - f[4*r1 + c2]*f[4*r2 + c1];
+        }
+    }
+    const double det = f[0]*inv[0][0] + f[1]*inv[1][0] + f[2]*inv[2][0];
+    if (det == 0)   return false;
+
+    // Each unmapped coordinate is a linear function of the mapped
+    // ones, so summing the extremes of each term gives an exact box.
+    for (int a=0; a < 3; ++a) {
+        double lower = 0, upper = 0;
+        for (int k=0; k < 3; ++k) {
+            const double s = inv[a][k] / det;
+            if (s == 0)     continue;
+            const double p = s * (b[2*k] - f[4*k + 3]),
+                         q = s * (b[2*k + 1] - f[4*k + 3]);
+            lower += p < q ? p : q;
+            upper += p < q ? q : p;
+        }
+        // Round outwards, since the box is stored as floats
+        out[a] = (Interval){nextafterf(lower, -INFINITY),
+                            nextafterf(upper, INFINITY)};
+    }
+    return true;
+}
+
+
+_STATIC_
+Node* get_bounded(const char** const input, _Bool* const failed,
+                  Node* X, Node* Y, Node* Z,
+                  NodeCache* const cache)
+{
+    float b[6];
+    get_floats(input, failed, b, 6);
+    if (*failed)    return NULL;
+
+    // The frame may change while parsing the expression,
+    // so the bounds are found first.
+    Interval bounds[3];
+    if (!cache->frame || !unmap_bounds(cache->frame, b, bounds)) {
+        Node* const vars[3] = {X, Y, Z};
+        for (int a=0; a < 3; ++a) {
+            bounds[a] = (cache->frame == NULL &&
+                         vars[a] == cache->vars[a])
+                ? (Interval){b[2*a], b[2*a + 1]}
+                : (Interval){-INFINITY, INFINITY};
+        }
+    }
+
+    Node* out = get_token(input, failed, X, Y, Z, cache);
+    if (*failed || !out)    return out;
+
+    bound_node(out, bounds);
+    return out;
+}
+
+
+_STATIC_
+void bound_node(Node* const n, Interval bounds[3])
+{
+    if (n->flags & NODE_CONSTANT)   return;
+
+    for (int a=0; a < 3; ++a) {
+        // A node may be bounded more than once (if it's shared),
+        // in which case both boxes contain it.
+        if (n->bounded) {
+            if (n->bounds[a].lower > bounds[a].lower) {
+                bounds[a].lower = n->bounds[a].lower;
+            }
+            if (n->bounds[a].upper < bounds[a].upper) {
+                bounds[a].upper = n->bounds[a].upper;
+            }
+        }
+        n->bounds[a] = bounds[a];
+    }
+    n->bounded = true;
+}
+
+
+_STATIC_
+void get_floats(const char** const input, _Bool* const failed,
+                float* out, int count)
+{
+    // Constants are read directly (rather than through the cache),
+    // since they aren't part of the tree.
+    for (int i=0; i < count; ++i) {
+        if (*((*input)++) != 'f') {
+            *failed = true;
+            return;
+        }
+        Node* n = get_float(input, failed);
+        if (*failed)    return;
+        out[i] = n->results.f;
+        free(n);
+    }
+}
+
+
 _STATIC_
 Node* get_float(const char** const input, _Bool* const failed)
 {
@@ -273,6 +687,11 @@ Node* get_float(const char** const input, _Bool* const failed)
         (*input)++;
     }
 
+    if (!strncmp(*input, "inf", 3)) {
+        *input += 3;
+        return constant_n(neg ? -INFINITY : INFINITY);
+    }
+
     while ((**input >= '0' && **input <= '9') || **input == '.') {
         if (**input == '.') {
             divider = 10;
@@ -470,3 +889,269 @@ void free_node_cache(NodeCache* const c)
     free(c->nodes);
     free(c);
 }
+
+
+_STATIC_
+Node* simplify_node(Node* const n, NodeCache* const cache)
+{
+    if (n->clone_address)   return n->clone_address;
+
+    Node* out;
+    switch (n->opcode) {
+        case OP_CONST:
+            out = get_cached_node(cache, constant_n(n->results.f));
+            break;
+        case OP_X:  out = cache->vars[0]; break;
+        case OP_Y:  out = cache->vars[1]; break;
+        case OP_Z:  out = cache->vars[2]; break;
+
+        case OP_MIN:
+        case OP_MAX:
+            out = simplify_chain(n, cache);
+            break;
+
+        default:
+            out = simplify_op(
+                n->opcode,
+                n->lhs ? simplify_node(n->lhs, cache) : NULL,
+                n->rhs ? simplify_node(n->rhs, cache) : NULL,
+                cache);
+    }
+
+    if (n->bounded) {
+        Interval bounds[3] = {n->bounds[0], n->bounds[1], n->bounds[2]};
+        bound_node(out, bounds);
+    }
+
+    n->clone_address = out;
+    return out;
+}
+
+
+/*  is_constant
+ *
+ *  Checks whether a node is a constant with the given value.
+ */
+static inline _Bool is_constant(const Node* const n, const float value)
+{
+    return (n->flags & NODE_CONSTANT) && n->results.f == value;
+}
+
+
+/*  is_var
+ *
+ *  Checks whether a node is one of the X, Y, Z variables.  Rewrites never
+ *  replace another node with a variable: render-time pruning can replace a
+ *  node of its own with its bounds, but not a variable that the rest of the
+ *  tree shares, so doing so would change how ties on the surface resolve.
+ */
+static inline _Bool is_var(const Node* const n)
+{
+    return n->opcode == OP_X || n->opcode == OP_Y || n->opcode == OP_Z;
+}
+
+
+_STATIC_
+Node* simplify_op(const Opcode op, Node* const lhs, Node* const rhs,
+                  NodeCache* const cache)
+{
+    switch (op) {
+        case OP_ADD:
+            if (is_constant(lhs, 0) && !is_var(rhs))    return rhs;
+            if (is_constant(rhs, 0) && !is_var(lhs))    return lhs;
+            break;
+        case OP_SUB:
+            if (is_constant(rhs, 0) && !is_var(lhs))    return lhs;
+            if (is_constant(lhs, 0))
+                return simplify_op(OP_NEG, rhs, NULL, cache);
+            break;
+        case OP_MUL:
+            if (is_constant(lhs, 1) && !is_var(rhs))    return rhs;
+            if (is_constant(rhs, 1) && !is_var(lhs))    return lhs;
+            if (is_constant(lhs, -1))
+                return simplify_op(OP_NEG, rhs, NULL, cache);
+            if (is_constant(rhs, -1))
+                return simplify_op(OP_NEG, lhs, NULL, cache);
+            break;
+        case OP_DIV:
+            if (is_constant(rhs, 1) && !is_var(lhs))    return lhs;
+            if (is_constant(rhs, -1))
+                return simplify_op(OP_NEG, lhs, NULL, cache);
+            break;
+        case OP_POW:
+            if (is_constant(rhs, 1) && !is_var(lhs))    return lhs;
+            break;
+        case OP_MIN:
+        case OP_MAX:
+            if (lhs == rhs && !is_var(lhs))     return lhs;
+            break;
+        case OP_NEG:
+            if (lhs->opcode == OP_NEG && !is_var(lhs->lhs))
+                return lhs->lhs;
+            break;
+        case OP_ABS:
+            if (lhs->opcode == OP_ABS)  return lhs;
+            // fallthrough
+        case OP_SQUARE:
+            if (lhs->opcode == OP_NEG)
+                return simplify_op(op, lhs->lhs, NULL, cache);
+            break;
+        default: break;
+    }
+
+    Node* out = NULL;
+    switch (op) {
+        case OP_ADD:    out = add_n(lhs, rhs); break;
+        case OP_SUB:    out = sub_n(lhs, rhs); break;
+        case OP_MUL:    out = mul_n(lhs, rhs); break;
+        case OP_DIV:    out = div_n(lhs, rhs); break;
+        case OP_MIN:    out = min_n(lhs, rhs); break;
+        case OP_MAX:    out = max_n(lhs, rhs); break;
+        case OP_POW:    out = pow_n(lhs, rhs); break;
+        case OP_MOD:    out = mod_n(lhs, rhs); break;
+        case OP_ATAN2:  out = atan2_n(lhs, rhs); break;
+
+        case OP_SIN:    out = sin_n(lhs); break;
+        case OP_COS:    out = cos_n(lhs); break;
+        case OP_TAN:    out = tan_n(lhs); break;
+        case OP_ASIN:   out = asin_n(lhs); break;
+        case OP_ACOS:   out = acos_n(lhs); break;
+        case OP_ATAN:   out = atan_n(lhs); break;
+        case OP_ABS:    out = abs_n(lhs); break;
+        case OP_SQUARE: out = square_n(lhs); break;
+        case OP_SQRT:   out = sqrt_n(lhs); break;
+        case OP_NEG:    out = neg_n(lhs); break;
+        default: break;
+    }
+
+    return get_cached_node(cache, out);
+}
+
+
+/*  gather_chain
+ *
+ *  Collects the operands of a chain of min (or max) operations,
+ *  descending into nodes with the same opcode that have no other
+ *  parents and no bounds of their own.
+ */
+_STATIC_
+void gather_chain(Node* const n, Node*** const leaves,
+                  unsigned* const count, unsigned* const size)
+{
+    Node* const children[2] = {n->lhs, n->rhs};
+    for (int c=0; c < 2; ++c) {
+        Node* const child = children[c];
+        if (child->opcode == n->opcode && !child->bounded &&
+            !(child->flags & NODE_SHARED))
+        {
+            gather_chain(child, leaves, count, size);
+        } else {
+            if (*count == *size) {
+                *size *= 2;
+                *leaves = realloc(*leaves, *size * sizeof(Node*));
+            }
+            (*leaves)[(*count)++] = child;
+        }
+    }
+}
+
+
+_STATIC_
+Node* simplify_chain(Node* const n, NodeCache* const cache)
+{
+    unsigned count = 0, size = 4;
+    Node** leaves = malloc(size * sizeof(Node*));
+    gather_chain(n, &leaves, &count, &size);
+
+    // If growing this node can only grow the head, then operands of a min
+    // that are never the smallest within the region can be dropped: the
+    // tree is unchanged within the region and can only grow outside it,
+    // so its sign is preserved everywhere.  The same goes for max operands
+    // that are never the largest, if shrinking this node grows the head.
+    const uint8_t p = n->flags & (NODE_EVEN | NODE_ODD);
+    if ((n->opcode == OP_MIN && p == NODE_EVEN) ||
+        (n->opcode == OP_MAX && p == NODE_ODD))
+    {
+        const _Bool is_min = n->opcode == OP_MIN;
+
+        // Find the operand whose interval dominates the others
+        unsigned best = 0;
+        for (unsigned i=1; i < count; ++i) {
+            if (is_min ? leaves[i]->results.i.upper <
+                         leaves[best]->results.i.upper
+                       : leaves[i]->results.i.lower >
+                         leaves[best]->results.i.lower)
+            {
+                best = i;
+            }
+        }
+        const float limit = is_min ? leaves[best]->results.i.upper
+                                   : leaves[best]->results.i.lower;
+
+        // (unless that would leave a bare variable in place of the chain)
+        unsigned kept = 0;
+        for (unsigned i=0; i < count; ++i) {
+            kept += i == best || !(is_min ? leaves[i]->results.i.lower >= limit
+                                          : leaves[i]->results.i.upper <= limit);
+        }
+        if (kept > 1 || !is_var(leaves[best])) {
+            kept = 0;
+            for (unsigned i=0; i < count; ++i) {
+                if (i == best ||
+                    !(is_min ? leaves[i]->results.i.lower >= limit
+                             : leaves[i]->results.i.upper <= limit))
+                {
+                    leaves[kept++] = leaves[i];
+                }
+            }
+            count = kept;
+        }
+    }
+
+    // Simplify the operands, dropping duplicates (but keeping a pair of
+    // operands if the chain would otherwise become a bare variable)
+    unsigned unique = 0;
+    for (unsigned i=0; i < count; ++i) {
+        Node* const leaf = simplify_node(leaves[i], cache);
+        _Bool found = false;
+        for (unsigned j=0; j < unique && !found; ++j) {
+            found = leaves[j] == leaf;
+        }
+        if (!found)     leaves[unique++] = leaf;
+    }
+    if (unique == 1 && count > 1 && is_var(leaves[0])) {
+        leaves[unique++] = leaves[0];
+    }
+    count = unique;
+
+    // Rebuild the chain as a balanced tree, repeatedly joining the
+    // two lowest-ranked operands.
+    while (count > 1) {
+        unsigned a = 0, b = 1;
+        if (leaves[b]->rank < leaves[a]->rank) {
+            a = 1;
+            b = 0;
+        }
+        for (unsigned i=2; i < count; ++i) {
+            if (leaves[i]->rank < leaves[a]->rank) {
+                b = a;
+                a = i;
+            } else if (leaves[i]->rank < leaves[b]->rank) {
+                b = i;
+            }
+        }
+        if (b < a) {
+            const unsigned t = a;
+            a = b;
+            b = t;
+        }
+
+        leaves[a] = simplify_op(n->opcode, leaves[a], leaves[b], cache);
+        for (unsigned i=b + 1; i < count; ++i)  leaves[i - 1] = leaves[i];
+        --count;
+    }
+
+    Node* const out = leaves[0];
+    free(leaves);
+    return out;
+}
@@ -1,6 +1,8 @@
 #ifndef PARSER_H
 #define PARSER_H
 
+#include "util/interval.h"
+
 struct MathTree_;
 
 /** @brief Parses a prefix-notation math string
@@ -9,4 +11,22 @@ struct MathTree_;
 */
 struct MathTree_* parse(const char* input);
 
+/** @brief Simplifies a parsed tree in place
+    @details Cancels double negations, drops identity operations (adding
+    zero, multiplying by one, and so on) and duplicate min and max operands,
+    and flattens chains of min and max operations into balanced trees.
+    Operands of min and max that are dominated within the given region are
+    removed where that can only make the tree larger outside the region,
+    which keeps its sign if it's only negative within the region.
+    Unbounded axes should be given as infinite intervals.
+    @param tree Target tree
+    @param X X bounds of the region
+    @param Y Y bounds of the region
+    @param Z Z bounds of the region
+    @returns Number of nodes removed
+*/
+int simplify_tree(struct MathTree_* tree, const Interval X,
+                                          const Interval Y,
+                                          const Interval Z);
+
 #endif
@@ -62,7 +62,7 @@ void render8(PackedTree* tree, Region region,
              Y = {region.Y[0], region.Y[region.nj]},
              Z = {region.Z[0], region.Z[region.nk]};
 
-    Interval result = eval_i(tree, X, Y, Z);
+    Interval result = eval_bounds(tree, X, Y, Z);
 
     // If we're inside the object, fill with color.
     if (result.upper < 0) {
@@ -182,7 +182,7 @@ void render16(PackedTree* tree, Region region,
              Y = {region.Y[0], region.Y[region.nj]},
              Z = {region.Z[0], region.Z[region.nk]};
 
-    Interval result = eval_i(tree, X, Y, Z);
+    Interval result = eval_bounds(tree, X, Y, Z);
 
     // If we're inside the object, fill with color.
     if (result.upper < 0) {
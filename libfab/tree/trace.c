@@ -0,0 +1,195 @@
+#include <math.h>
+#include <stdbool.h>
+#include <stdlib.h>
+
+#include "tree/eval.h"
+#include "tree/packed.h"
+#include "tree/trace.h"
+
+#include "util/switches.h"
+
+/*  ray
+ *
+ *  Returns the ray direction at image coordinates (i, j), where
+ *  pixel centers are at (col + 0.5, row + 0.5).
+ */
+static inline Vec3f ray(const Camera* c, const float i, const float j)
+{
+    return (Vec3f){.x=c->corner.x + i*c->right.x + j*c->up.x,
+                   .y=c->corner.y + i*c->right.y + j*c->up.y,
+                   .z=c->corner.z + i*c->right.z + j*c->up.z};
+}
+
+static inline Vec3f along(const Camera* c, const Vec3f d, const float t)
+{
+    return (Vec3f){.x=c->eye.x + t*d.x, .y=c->eye.y + t*d.y,
+                   .z=c->eye.z + t*d.z};
+}
+
+static inline float length(const Vec3f v)
+{
+    return sqrt(v.x*v.x + v.y*v.y + v.z*v.z);
+}
+
+/*  slab
+ *
+ *  Finds a box containing the rays through a tile of pixels between
+ *  t0 and t1.  The rays fill a truncated pyramid, so the bounding box
+ *  of its eight corners contains all of them.
+ */
+_STATIC_
+void slab(const Camera* c, const Region r, const float t0, const float t1,
+          Interval* X, Interval* Y, Interval* Z)
+{
+    for (int q=0; q < 8; ++q) {
+        const Vec3f p = along(c, ray(c, r.imin + ((q & 1) ? r.ni : 0),
+                                        r.jmin + ((q & 2) ? r.nj : 0)),
+                              (q & 4) ? t1 : t0);
+        if (!q || p.x < X->lower)   X->lower = p.x;
+        if (!q || p.x > X->upper)   X->upper = p.x;
+        if (!q || p.y < Y->lower)   Y->lower = p.y;
+        if (!q || p.y > Y->upper)   Y->upper = p.y;
+        if (!q || p.z < Z->lower)   Z->lower = p.z;
+        if (!q || p.z > Z->upper)   Z->upper = p.z;
+    }
+}
+
+/*  hit
+ *
+ *  Stores a hit at parameter t for the ray through pixel (col, row),
+ *  with the tree's gradient as its normal (or a normal facing the
+ *  camera where the gradient vanishes).
+ */
+_STATIC_
+void hit(PackedTree* tree, const Camera* c, const int col, const int row,
+         const float t, float** depth, float (**normal)[3])
+{
+    const Vec3f d = ray(c, col + 0.5, row + 0.5);
+    const Vec3f p = along(c, d, t);
+    const Derivative g = eval_g(tree, p.x, p.y, p.z);
+
+    float norm = sqrt(g.dx*g.dx + g.dy*g.dy + g.dz*g.dz);
+    Vec3f n = {g.dx, g.dy, g.dz};
+    if (!(norm > 0) || isinf(norm)) {
+        n = (Vec3f){-d.x, -d.y, -d.z};
+        norm = length(d);
+    }
+
+    depth[row][col] = t;
+    normal[row][col][0] = n.x / norm;
+    normal[row][col][1] = n.y / norm;
+    normal[row][col][2] = n.z / norm;
+}
+
+/*  trace_slab
+ *
+ *  Recursively traces a tile of rays between t0 and t1.
+ */
+_STATIC_
+void trace_slab(PackedTree* tree, const Camera* c, const Region r,
+                const float t0, const float t1,
+                float** depth, float (**normal)[3], volatile int* halt)
+{
+    if (*halt)  return;
+
+    // Slabs are traced front to back, so rays that have
+    // already hit something are finished.
+    bool done = true;
+    for (int row = r.jmin; done && row < r.jmin + r.nj; ++row) {
+        for (int col = r.imin; col < r.imin + r.ni; ++col) {
+            if (isinf(depth[row][col])) {
+                done = false;
+                break;
+            }
+        }
+    }
+    if (done)   return;
+
+    Interval X, Y, Z;
+    slab(c, r, t0, t1, &X, &Y, &Z);
+    const Interval result = eval_bounds(tree, X, Y, Z);
+
+    // Empty slabs are skipped entirely
+    if (result.lower >= 0)  return;
+
+    // Rays that start inside the shape hit it right away
+    if (result.upper < 0) {
+        for (int row = r.jmin; row < r.jmin + r.nj; ++row) {
+            for (int col = r.imin; col < r.imin + r.ni; ++col) {
+                if (isinf(depth[row][col])) {
+                    hit(tree, c, col, row, t0, depth, normal);
+                }
+            }
+        }
+        return;
+    }
+
+    // Compare the tile's width to the slab's length
+    const float width = (r.ni > r.nj ? r.ni : r.nj) * t1 * length(c->right),
+                len = (t1 - t0) * length(ray(c, r.imin + r.ni/2.0,
+                                                r.jmin + r.nj/2.0));
+    const bool pixel = r.ni == 1 && r.nj == 1;
+
+#if PRUNE
+    disable_nodes(tree);
+    disable_nodes_binary(tree);
+#endif
+
+    // Once the slab is a pixel wide and deep, check whether the ray
+    // is inside the shape at its far end (and interpolate the surface
+    // position between the two ends).
+    if (pixel && len <= width) {
+        const Vec3f d = ray(c, r.imin + 0.5, r.jmin + 0.5);
+        const Vec3f p1 = along(c, d, t1);
+        const float f1 = eval_f(tree, p1.x, p1.y, p1.z);
+        if (f1 < 0) {
+            const Vec3f p0 = along(c, d, t0);
+            const float f0 = eval_f(tree, p0.x, p0.y, p0.z);
+            const float t = f0 > 0 ? t0 + (t1 - t0) * f0 / (f0 - f1) : t0;
+            hit(tree, c, r.imin, r.jmin, t, depth, normal);
+        }
+    }
+
+    // Split wide tiles into halves, and deep slabs into near and far halves
+    else if (!pixel && width > len) {
+        Region A = r, B = r;
+        if (r.ni >= r.nj) {
+            A.ni = r.ni / 2;
+            B.imin += A.ni;
+            B.ni -= A.ni;
+        } else {
+            A.nj = r.nj / 2;
+            B.jmin += A.nj;
+            B.nj -= A.nj;
+        }
+        trace_slab(tree, c, A, t0, t1, depth, normal, halt);
+        trace_slab(tree, c, B, t0, t1, depth, normal, halt);
+    } else {
+        const float tm = (t0 + t1) / 2;
+        trace_slab(tree, c, r, t0, tm, depth, normal, halt);
+        trace_slab(tree, c, r, tm, t1, depth, normal, halt);
+    }
+
+#if PRUNE
+    enable_nodes(tree);
+#endif
+}
+
+////////////////////////////////////////////////////////////////////////////////
+
+void trace(PackedTree* tree, const Camera camera, Region region,
+           float** depth, float (**normal)[3], volatile int* halt)
+{
+    for (int row = region.jmin; row < region.jmin + region.nj; ++row) {
+        for (int col = region.imin; col < region.imin + region.ni; ++col) {
+            depth[row][col] = INFINITY;
+            normal[row][col][0] = 0;
+            normal[row][col][1] = 0;
+            normal[row][col][2] = 0;
+        }
+    }
+
+    if (tree == NULL || !region.ni || !region.nj)   return;
+    trace_slab(tree, &camera, region, camera.near, camera.far,
+               depth, normal, halt);
+}
@@ -0,0 +1,50 @@
+#ifndef TREE_TRACE_H
+#define TREE_TRACE_H
+
+#include "util/region.h"
+#include "util/vec3f.h"
+
+struct PackedTree_;
+
+/** @struct Camera_
+    @brief A pinhole camera.
+    @details The ray through the center of pixel (i, j) is
+    eye + t*(corner + (i+0.5)*right + (j+0.5)*up), for near <= t <= far.
+*/
+typedef struct Camera_ {
+    /** @var eye
+    Origin of every ray */
+    Vec3f eye;
+    /** @var corner
+    Ray direction through the outer corner of pixel (0, 0) */
+    Vec3f corner;
+    /** @var right
+    Change in ray direction from one column to the next */
+    Vec3f right;
+    /** @var up
+    Change in ray direction from one row to the next */
+    Vec3f up;
+    /** @var near
+    Smallest ray parameter */
+    float near;
+    /** @var far
+    Largest ray parameter */
+    float far;
+} Camera;
+
+/** @brief Traces rays through a tree, finding where they first hit it
+    @details Tiles of rays are marched front to back in slabs.  Each slab
+    is bounded with interval (or affine) arithmetic, so empty slabs are
+    skipped in a single step; ambiguous slabs are split (in pixels or in
+    depth) until they're a pixel wide.  Normals are exact gradients.
+    @param tree Target tree
+    @param camera Camera
+    @param region Tile of pixels to trace (imin, jmin, ni, and nj are used)
+    @param depth Image of ray parameters at the first hit (INFINITY where rays miss)
+    @param normal Image of unit normals at the first hit
+    @param halt Flag to abort (if *halt becomes true)
+*/
+void trace(struct PackedTree_* tree, const Camera camera, Region region,
+           float** depth, float (**normal)[3], volatile int* halt);
+
+#endif
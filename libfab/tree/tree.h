@@ -47,6 +47,10 @@ void free_tree(MathTree* tree);
 
 
 
+/** @brief Counts the nodes (including constants) in a tree */
+unsigned count_nodes(MathTree* tree);
+
+
 /** @brief Prints a math tree to stdout. */
 void print_tree(MathTree* tree);
 /** @brief Verbosely prints a math tree to stdout. */
@@ -0,0 +1,19 @@
+#ifndef AFFINE_H
+#define AFFINE_H
+
+/*  Affine (struct)
+ *
+ *  Affine form c + x*ex + y*ey + z*ez +/- e, where ex, ey, and ez are
+ *  noise symbols in [-1, 1] standing for the position along each axis
+ *  (shared by every node in a tree, so correlations between them
+ *  are kept) and e bounds all other error.
+ */
+typedef struct Affine_{
+    float c;
+    float x;
+    float y;
+    float z;
+    float e;
+} Affine;
+
+#endif
@@ -0,0 +1,16 @@
+#ifndef DERIVATIVE_H
+#define DERIVATIVE_H
+
+/*  Derivative (struct)
+ *
+ *  Dual number holding a value and its partial derivatives
+ *  with respect to x, y, and z.
+ */
+typedef struct Derivative_{
+    float v;
+    float dx;
+    float dy;
+    float dz;
+} Derivative;
+
+#endif
@@ -0,0 +1,153 @@
+import os
+from pathlib import Path
+import threading
+
+from koko.c.region import Region
+from koko.exporter import CadExporter
+from koko.fab.cache import DiskCache
+from koko.fab.fabvars import FabVars
+from koko.lib.shapes2d import circle
+from koko.lib.shapes3d import sphere
+
+
+def entries(directory: Path) -> list:
+    return sorted(p.name for p in directory.rglob("*") if p.is_file())
+
+
+def test_images_asdfs_and_meshes_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    shape = sphere(0, 0, 0, 1)
+    region = Region((-1.1, -1.1, -1.1), (1.1, 1.1, 1.1), 10)
+
+    img = cache.fetch("image", lambda: shape.render(region, mm_per_unit=2),
+                      shape, region, mm_per_unit=2)
+    asdf = cache.fetch("asdf", lambda: shape.asdf(region, mm_per_unit=2),
+                       shape, region, mm_per_unit=2)
+    mesh = cache.fetch("mesh", asdf.triangulate, shape, region, mm_per_unit=2)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    # Only complete entries are left in the directory
+    assert sorted(os.path.splitext(n)[1] for n in entries(tmp_path)) == [".asdf", ".mesh", ".npz"]
+
+    fail = lambda: 1 / 0
+    cached = cache.fetch("image", fail, shape, region, mm_per_unit=2)
+    assert (cached.array == img.array).all() and cached.depth == 16
+    assert (cached.xmin, cached.zmax) == (img.xmin, img.zmax)
+
+    cached = cache.fetch("asdf", fail, shape, region, mm_per_unit=2)
+    assert cached.cell_count == asdf.cell_count
+    assert (cached.X.lower, cached.X.upper) == (asdf.X.lower, asdf.X.upper)
+    assert cached.triangulate().vcount == mesh.vcount
+
+    cached = cache.fetch("mesh", fail, shape, region, mm_per_unit=2)
+    assert (cached.vcount, cached.tcount) == (mesh.vcount, mesh.tcount)
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    # Any change to the math, region or options is a different entry
+    other = Region((-1.1, -1.1, -1.1), (1.1, 1.1, 1.1), 11)
+    keys = {
+        cache.key("image", shape, region, mm_per_unit=2),
+        cache.key("image", sphere(0, 0, 0, 1.01), region, mm_per_unit=2),
+        cache.key("image", shape, other, mm_per_unit=2),
+        cache.key("image", shape, region, mm_per_unit=1),
+        cache.key("asdf", shape, region, mm_per_unit=2),
+    }
+    assert len(keys) == 5
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    region = Region((-1, -1, 0), (1, 1, 0), 20)
+    shapes = [circle(0, 0, r / 10) for r in range(1, 5)]
+
+    for s in shapes[:3]:
+        cache.fetch("image", lambda: s.render(region, mm_per_unit=1), s, region)
+    size = cache.count()
+    assert size == cache.size
+
+    # Use the first entry again, then store a fourth, which evicts down
+    # to 90% of the limit (room for two)
+    paths = sorted(Path(e[2]) for e in cache.entries())
+    for i, p in enumerate(paths):
+        os.utime(p, (1000 + i, 1000 + i))
+    first = cache.path("image", cache.key("image", shapes[0], region))
+    os.utime(first)
+
+    cache.limit = size * 1.1
+    s = shapes[3]
+    cache.fetch("image", lambda: s.render(region, mm_per_unit=1), s, region)
+
+    kept = {e[2] for e in cache.entries()}
+    assert first in kept and len(kept) == 2
+    assert cache.size == cache.count() <= 0.9 * cache.limit
+
+
+def test_interrupted_renders_are_not_stored(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    shape = circle(0, 0, 1)
+    region = Region((-1, -1, 0), (1, 1, 0), 10)
+    interrupt = threading.Event()
+    interrupt.set()
+
+    cache.fetch("image", lambda: shape.render(region, mm_per_unit=1),
+                shape, region, interrupt)
+    assert entries(tmp_path) == []
+
+    # A disabled cache never stores anything
+    off = DiskCache(str(tmp_path), limit=0)
+    off.fetch("image", lambda: shape.render(region, mm_per_unit=1), shape, region)
+    assert entries(tmp_path) == []
+
+
+def test_exports_reuse_cached_renders(tmp_path):
+    cad = FabVars()
+    cad.mm_per_unit = 1
+    cad.shapes = [sphere(0, 0, 0, 1), sphere(2, 0, 0, 0.5)]
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    outputs = []
+    for i in range(2):
+        for fmt in ("png", "stl"):
+            target = tmp_path / f"{i}.{fmt}"
+            CadExporter(str(target), cad, resolution=8, cache=cache).run()
+            outputs.append(target.read_bytes())
+
+    # The heightmap and both meshes (and their ASDFs) were rendered once
+    assert (cache.hits, cache.misses) == (3, 5)
+    assert outputs[0] == outputs[2] and outputs[1] == outputs[3]
+
+
+def test_cache_failures_fall_back_to_rendering(tmp_path):
+    shape = circle(0, 0, 1)
+    region = Region((-1, -1, 0), (1, 1, 0), 10)
+    render = lambda: shape.render(region, mm_per_unit=1)
+
+    # The cache directory can't be created
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = DiskCache(str(blocker / "cache"))
+    assert cache.fetch("image", render, shape, region) is not None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Corrupt entries are misses, and are replaced
+    cache = DiskCache(str(tmp_path / "cache"))
+    cache.fetch("image", render, shape, region)
+    path = cache.path("image", cache.key("image", shape, region))
+    with open(path, "wb") as f:
+        f.write(b"garbage")
+    img = cache.fetch("image", render, shape, region)
+    assert (img.array == render().array).all()
+    assert cache.fetch("image", lambda: 1 / 0, shape, region) is not None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_stale_temporary_files_are_removed(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    (tmp_path / "ab").mkdir()
+    old, new = tmp_path / "ab" / "old.tmp", tmp_path / "ab" / "new.npz.1.2.read"
+    old.write_bytes(b"x" * 100)
+    new.write_bytes(b"x" * 10)
+    os.utime(old, (1000, 1000))
+
+    assert cache.count() == 10
+    assert entries(tmp_path) == ["new.npz.1.2.read"]
@@ -141,3 +141,11 @@ def test_invalid_pixel_matrix_is_rejected():
         layout_pattern(("10", "1"))
     with pytest.raises(ValueError):
         layout_pattern(("10", "x1"))
+
+
+def test_pattern_repeats_blocks_of_dots():
+    large = pattern(("1" * 80,) * 50, dot_diameter=1, dot_spacing=0.2)
+
+    # 4000 separate circles would take over 16000 nodes
+    assert large.node_count < 40
+    assert large.bounds == pytest.approx([-47.9, 47.9, -29.9, 29.9, None, None])
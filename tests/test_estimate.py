@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from koko.cam.estimate import describe, estimate, junction_speeds, trapezoid_time
+from koko.fab.path import Path
+
+
+def test_trapezoid_time_matches_closed_form():
+    # Long enough to cruise: ramp up and down plus constant-speed travel
+    assert trapezoid_time([100.0], 20, 500)[0] == pytest.approx(100 / 20 + 20 / 500)
+    # Too short to reach cruise speed: triangular profile
+    assert trapezoid_time([0.1], 20, 500)[0] == pytest.approx(2 * np.sqrt(0.1 / 500))
+    assert trapezoid_time([0.0], 20, 500)[0] == 0
+
+
+def test_junction_speeds_match_sequential_passes():
+    points = np.cumsum(np.random.default_rng(1).normal(size=(200, 3)), axis=0)
+    feed, accel, deviation = 20.0, 500.0, 0.05
+    lengths, v = junction_speeds(points, feed, accel, deviation)
+
+    # Reference: per-corner limit, then a forward and a backward loop
+    d = np.diff(points, axis=0)
+    u = d / lengths[:, None]
+    limit = [0.0]
+    for a, b in zip(u[:-1], u[1:]):
+        s = np.sqrt((1 + a.dot(b)) / 2)
+        limit.append(min(feed, np.sqrt(accel * deviation * s / (1 - s))))
+    limit.append(0.0)
+    for i in range(1, len(limit)):
+        limit[i] = min(limit[i], np.sqrt(limit[i - 1] ** 2 + 2 * accel * lengths[i - 1]))
+    for i in range(len(limit) - 2, -1, -1):
+        limit[i] = min(limit[i], np.sqrt(limit[i + 1] ** 2 + 2 * accel * lengths[i]))
+
+    assert np.allclose(v, limit)
+
+
+def test_estimate_splits_cutting_and_rapid_moves():
+    square = np.array([[0, 0, -1], [10, 0, -1], [10, 10, -1], [0, 10, -1], [0, 0, -1]], dtype=float)
+    paths = [Path(square), Path(square + [20, 0, 0])]
+    result = estimate(paths, feed=20, plunge=5, jog=5, rapid=50)
+
+    assert result.cut == pytest.approx(80)
+    assert result.plunge == pytest.approx(12)
+    assert result.rapid == pytest.approx(12 + 20)
+    assert result.time == pytest.approx(result.cut_time + result.plunge_time + result.rapid_time)
+    # Square corners slow the cut below the straight-line time
+    assert result.cut_time > 80 / 20
+
+    assert estimate([], feed=20, plunge=5, jog=5).time == 0
+
+
+def test_estimate_follows_arc_moves():
+    # An octagon fit as arcs (seven eighths of the circle, then the
+    # closing chord) is cut along its arc length, not its chords
+    a = np.linspace(0, 2 * np.pi, 9)
+    circle = np.stack([10 * np.cos(a), 10 * np.sin(a), -np.ones_like(a)], axis=1)
+    paths = [Path(circle)]
+
+    chords = estimate(paths, feed=20, plunge=5, jog=5, rapid=50, tolerance=1)
+    arcs = estimate(paths, feed=20, plunge=5, jog=5, rapid=50, tolerance=1, arcs=True)
+    chord = 20 * np.sin(np.pi / 8)
+    assert chords.cut == pytest.approx(8 * chord)
+    assert arcs.cut == pytest.approx(7 / 8 * 2 * np.pi * 10 + chord, rel=1e-4)
+
+    # Without a rapid rate, the result is labelled approximate
+    assert not arcs.approximate
+    assert 'Approximate' in describe(estimate(paths, feed=20, plunge=5, jog=5))
@@ -0,0 +1,122 @@
+import contextlib
+import io
+import traceback
+
+import pytest
+
+from koko.evaluator import ScriptEvaluator
+from koko.fab.fabvars import FabVars
+
+
+SCRIPT = """\
+from koko.lib.shapes2d import circle, rectangle
+print("building")
+body = circle(0, 0, 1) + rectangle(0, 2, -0.5, 0.5)
+body.color = 'red'
+hole = circle(0, 0, 0.25)
+cad.shapes = [body - hole]
+cad.mm_per_unit = 1
+"""
+
+
+def run(evaluator, script, **initial):
+    initial.setdefault("cad", FabVars())
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        ns = evaluator.run(script, initial)
+    return ns, out.getvalue()
+
+
+def fresh(script):
+    ns = {"cad": FabVars()}
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(compile(script, "<string>", "exec"), ns)
+    return ns
+
+
+def signature(cad):
+    return [(e.math, e.color, tuple(e.bounds)) for e in cad.shapes], cad.mm_per_unit
+
+
+def test_unchanged_statements_are_reused_with_their_parsed_trees():
+    evaluator = ScriptEvaluator()
+    first, output = run(evaluator, SCRIPT)
+    body = first["body"]
+    body.ptr
+
+    edited = SCRIPT.replace("cad.mm_per_unit = 1", "cad.mm_per_unit = 2")
+    second, replayed = run(evaluator, edited)
+
+    # Everything up to the first use of cad is reused, and its output replayed
+    assert (evaluator.reused, evaluator.executed) == (5, 2)
+    assert replayed == output == "building\n"
+    assert second["body"] is body and body._ptr is not None
+    assert signature(second["cad"]) == signature(fresh(edited)["cad"])
+
+
+def test_objects_modified_in_place_are_rebuilt():
+    evaluator = ScriptEvaluator()
+    run(evaluator, SCRIPT)
+
+    # body.color modifies body, so the statement that built it runs again
+    edited = SCRIPT.replace("'red'", "'blue'")
+    ns, _ = run(evaluator, edited)
+    assert evaluator.reused == 2
+    assert signature(ns["cad"]) == signature(fresh(edited)["cad"])
+
+    # Bare calls to functions could do anything, so edits above them
+    # re-run the whole script
+    run(evaluator, edited + "rebuild()\n", rebuild=lambda: None)
+    edited = edited.replace("cad.mm_per_unit = 1", "cad.mm_per_unit = 3")
+    run(evaluator, edited + "rebuild()\n", rebuild=lambda: None)
+    assert evaluator.reused == 0
+
+
+def test_objects_modified_through_aliases_are_rebuilt():
+    evaluator = ScriptEvaluator()
+    script = "a = [1]\nb = a\nn = 1\nb.append(2)\nr = len(a)\n"
+    run(evaluator, script)
+
+    # b.append modifies the list that a was bound to
+    ns, _ = run(evaluator, script.replace("n = 1", "n = 2"))
+    assert evaluator.reused == 0
+    assert ns["r"] == 2
+
+
+@pytest.mark.parametrize("container, item", [
+    ("[pts]", "segs[0]"),
+    ("(pts,)", "segs[0]"),
+    ("{'pts': pts}", "segs['pts']"),
+    ("dict(pts=pts)", "segs['pts']"),
+])
+def test_objects_modified_through_containers_are_rebuilt(container, item):
+    evaluator = ScriptEvaluator()
+    script = f"pts = [(0, 0)]\nsegs = {container}\n{item}.append((1, 1))\n"
+    run(evaluator, script)
+
+    edited = script.replace("(1, 1))", "(3, 3))")
+    ns, _ = run(evaluator, edited)
+    assert ns["pts"] == fresh(edited)["pts"] == [(0, 0), (3, 3)]
+
+
+def test_objects_modified_through_loop_targets_are_rebuilt():
+    evaluator = ScriptEvaluator()
+    script = "pts = [(0, 0)]\nsegs = [pts]\nfor s in segs: s.append((1, 1))\n"
+    run(evaluator, script)
+
+    edited = script.replace("(1, 1))", "(3, 3))")
+    ns, _ = run(evaluator, edited)
+    assert ns["pts"] == fresh(edited)["pts"] == [(0, 0), (3, 3)]
+
+
+def test_failed_runs_keep_the_statements_that_succeeded():
+    evaluator = ScriptEvaluator()
+    broken = SCRIPT.replace("hole = circle(0, 0, 0.25)", "hole = circle(0, 0)")
+
+    with pytest.raises(TypeError) as error:
+        run(evaluator, broken)
+    frames = traceback.extract_tb(error.value.__traceback__)
+    assert [f.lineno for f in frames if f.filename == "<string>"] == [5]
+
+    run(evaluator, SCRIPT)
+    assert (evaluator.reused, evaluator.executed) == (4, 3)
@@ -1,29 +1,23 @@
 from collections import Counter
 from pathlib import Path
-from types import SimpleNamespace
 import threading
 import xml.etree.ElementTree as ET
 
 import numpy as np
+import pytest
 from PIL import Image as PILImage
 
-from koko.export import ExportTaskCad
+from koko.exporter import CadExporter, pipeline
 from koko.fab.fabvars import FabVars
+from koko.fab.mesh import Mesh, STLWriter
 from koko.lib.shapes2d import circle, rectangle
+from koko.lib.shapes3d import cube, sphere
 
 
-def export_task(filename: Path, cad: FabVars, **settings) -> ExportTaskCad:
-    """Build a synchronous export task without constructing a GUI window."""
-    task = object.__new__(ExportTaskCad)
-    task.filename = str(filename)
-    task.extension = filename.suffix.removeprefix(".")
-    task.cad = cad
-    task.resolution = settings.get("resolution", 12)
-    task.make_heightmap = settings.get("make_heightmap", True)
-    task.event = threading.Event()
-    task.c_event = threading.Event()
-    task.window = SimpleNamespace(progress=0)
-    return task
+def export_task(filename: Path, cad: FabVars, **settings) -> CadExporter:
+    """Build a synchronous export task, which needs no GUI."""
+    settings.setdefault("resolution", 12)
+    return CadExporter(str(filename), cad, **settings)
 
 
 def circle_cad() -> FabVars:
@@ -99,3 +93,108 @@ def test_svg_export_has_physical_size_color_and_closed_contour(tmp_path):
     assert paths[0].attrib["d"].startswith("M")
     assert paths[0].attrib["d"].endswith(" Z")
     assert paths[0].attrib["d"].count("L") == 91
+
+
+def test_svg_export_with_relative_commands_matches_absolute(tmp_path):
+    absolute = tmp_path / "absolute.svg"
+    relative = tmp_path / "relative.svg"
+    export_task(absolute, circle_cad()).export_svg()
+    export_task(relative, circle_cad(), svg_relative=True).export_svg()
+
+    def points(target):
+        d = list(ET.parse(target).getroot())[0].attrib["d"]
+        return d, [
+            [float(v) for v in pair.split()]
+            for pair in d.replace("M", "|").replace("L", "|").strip("| Z").split("|")
+        ]
+
+    absolute_d, expected = points(absolute)
+    relative_d = list(ET.parse(relative).getroot())[0].attrib["d"]
+
+    assert relative_d.startswith("m") and relative_d.endswith(" z")
+    assert len(relative_d) < len(absolute_d)
+
+    values = [float(v) for v in relative_d[1:-2].replace("l", " ").split()]
+    xy = np.cumsum(np.array(values).reshape(-1, 2), axis=0)
+    assert np.allclose(xy, expected, atol=1e-3)
+
+
+def test_cancelled_svg_export_leaves_no_file(tmp_path):
+    target = tmp_path / "cancelled.svg"
+    task = export_task(target, circle_cad())
+    task.event.set()
+    task.export_svg()
+
+    assert not target.exists()
+
+
+def test_stl_export_streams_meshes_in_shape_order(tmp_path):
+    cad = FabVars()
+    cad.mm_per_unit = 1
+    cad.border = 0.05
+    cad.shapes = [sphere(0, 0, 0, 1), cube(1.5, 3, -1, 1, -1, 1)]
+
+    target = tmp_path / "shapes.stl"
+    task = export_task(target, cad, resolution=8)
+    task.export_stl()
+
+    expected = tmp_path / "expected.stl"
+    Mesh.merge(
+        [task.make_mesh(task.make_asdf(e)) for e in cad.shapes]
+    ).save_stl(str(expected))
+
+    # Triangulation is multithreaded, so compare triangles as sets
+    def triangles(path):
+        data = path.read_bytes()
+        assert len(data) == 84 + 50 * int(np.frombuffer(data[80:84], np.uint32)[0])
+        records = np.frombuffer(data[84:], dtype=STLWriter.dtype)
+        return np.unique(records["vertices"].reshape(-1, 9), axis=0)
+
+    assert target.read_bytes()[:80] == expected.read_bytes()[:80]
+    assert np.array_equal(triangles(target), triangles(expected))
+    assert task.window.progress == 100
+
+
+def test_failed_stl_export_leaves_no_file(tmp_path):
+    cad = FabVars()
+    cad.mm_per_unit = 1
+    cad.border = 0.05
+    cad.shapes = [sphere(0, 0, 0, 1), cube(1.5, 3, -1, 1, -1, 1)]
+
+    target = tmp_path / "failed.stl"
+    task = export_task(target, cad, resolution=8)
+
+    def make_mesh(asdf, interrupt=None):
+        raise MemoryError("out of memory")
+    task.make_mesh = make_mesh
+
+    with pytest.raises(MemoryError):
+        task.export_stl()
+    assert not target.exists()
+
+
+def test_pipeline_keeps_order_and_stops_when_cancelled():
+    started = []
+
+    def first(item, interrupt):
+        started.append(item)
+        return item * 2
+
+    def second(value, interrupt):
+        assert not interrupt.is_set()
+        return value + 1
+
+    fractions = []
+    event = threading.Event()
+    assert pipeline(range(6), [first, second], event, fractions.append) == [1, 3, 5, 7, 9, 11]
+    assert fractions[-1] == 1 and fractions == sorted(fractions)
+
+    def cancel(value, interrupt):
+        if value == 4:
+            event.set()
+            assert interrupt.wait(1)
+        return value
+
+    started.clear()
+    assert pipeline(range(20), [first, cancel], event) is None
+    assert len(started) < 20
@@ -1,7 +1,9 @@
 import numpy as np
+import pytest
 
 from koko.c.interval import Interval
 from koko.c.vec3f import Vec3f
+from koko.fab.image import Image
 from koko.fab.path import Path
 from koko.fab.tree import MathTree
 from koko.lib.shapes2d import circle
@@ -30,3 +32,490 @@ def test_path_sort_works_with_current_numpy():
     inner = Path(np.array([[2, 2, 0], [3, 3, 0]], dtype=float))
 
     assert Path.sort([outer, inner]) == [inner, outer]
+
+
+def test_path_simplify_respects_tolerance():
+    x = np.linspace(0, 10, 101)
+    path = Path(np.stack([x, 0.001 * np.sin(x), np.zeros_like(x)], axis=1))
+
+    simplified = path.simplify(0.01)
+
+    assert len(simplified.points) == 2
+    assert len(path.simplify(0.0001).points) > 2
+    assert np.array_equal(simplified.points[[0, -1]], path.points[[0, -1]])
+
+
+def test_path_moves_fit_arcs_between_lines():
+    t = np.linspace(0, np.pi, 100)
+    arc = np.stack([10 * np.cos(t), 10 * np.sin(t), np.zeros_like(t)], axis=1)
+    line = np.stack([np.linspace(-10, -30, 20), np.zeros(20), np.zeros(20)], axis=1)
+    path = Path(np.vstack([arc, line[1:]]))
+
+    moves = path.moves(0.01, arcs=True)
+
+    assert [arc is not None for _, arc in moves] == [False, True, False]
+    i, j, ccw = moves[1][1]
+    assert (i, j, ccw) == pytest.approx((-10, 0, True))
+    assert moves[-1][0] == pytest.approx([-30, 0, 0])
+
+
+def test_path_runs_scale_to_dense_zigzags():
+    import time
+
+    n = 200000
+    x = np.arange(n, dtype=float)
+    zigzag = Path(np.stack([0.01 * x, 0.1 * (x % 2), np.zeros(n)], axis=1))
+    sawtooth = Path(np.stack([0.01 * x, 0.05 * (x % 10), np.zeros(n)], axis=1))
+
+    start = time.perf_counter()
+    assert len(zigzag.simplify(0.01).points) == n
+    runs = sawtooth.runs(0.01, arcs=True)
+    # Peeling one point per pass off these took minutes
+    assert time.perf_counter() - start < 20
+
+    assert all(arc is None for _, arc in runs)
+    points = np.vstack([p for p, _ in runs])
+    assert 2 * n // 10 <= len(points) < n // 4
+
+
+def test_distance_transform_reads_heightmap_threshold_directly():
+    height, width = 90, 130
+    y, x = np.mgrid[0:height, 0:width]
+    heightmap = Image(width, height, depth=16)
+    heightmap.array[:, :, 0] = np.clip(
+        65535 - ((x - 60) ** 2 + (y - 40) ** 2) * 20, 0, 65535
+    ).astype(np.uint16)
+    heightmap.xmin, heightmap.xmax = 0, 13
+    heightmap.ymin, heightmap.ymax = 0, 9
+    heightmap.zmin, heightmap.zmax = -2, 0
+
+    out = Image(width, height, depth="f")
+    for z in (-1.5, -0.5):
+        expected = heightmap.threshold(z).distance(threads=1)
+        result = heightmap.distance(threads=3, threshold=z, out=out)
+
+        assert result is out
+        assert np.array_equal(result.array, expected.array)
+        assert result.array.max() > 0
+
+    # Thresholds above the top of the heightmap leave every pixel empty
+    above = heightmap.distance(threads=3, threshold=1)
+    assert not heightmap.threshold(1).array.any()
+    assert np.array_equal(above.array, heightmap.threshold(1).distance(threads=1).array)
+
+
+def test_contour_layers_match_per_slice_contours():
+    height, width = 120, 160
+    y, x = np.mgrid[0:height, 0:width]
+    heightmap = Image(width, height, depth=16)
+    heightmap.array[:, :, 0] = np.clip(
+        65535 - ((x - 50) ** 2 + (y - 70) ** 2) * 30, 0, 65535
+    ).astype(np.uint16)
+    heightmap.xmin, heightmap.xmax = 0, 16
+    heightmap.ymin, heightmap.ymax = 0, 12
+    heightmap.zmin, heightmap.zmax = -2, 0
+
+    heights = [0.5, -0.5, -0.5, -1, -2]
+    for count in (2, -1):
+        layers = heightmap.contour_layers(heights, 0.8, count, 0.5, threads=2)
+
+        assert len(layers) == len(heights)
+        assert layers[0] == []
+        assert layers[2] and layers[2][0] is not layers[1][0]
+        for z, paths in zip(heights[1:], layers[1:]):
+            expected = heightmap.threshold(z).distance().contour(0.8, count, 0.5)
+            assert len(paths) == len(expected)
+            for p, e in zip(
+                sorted(paths, key=lambda p: p.xmin),
+                sorted(expected, key=lambda p: p.xmin),
+            ):
+                assert p.closed == e.closed
+                assert [p.xmin, p.xmax, p.ymin, p.ymax] == pytest.approx(
+                    [e.xmin, e.xmax, e.ymin, e.ymax], abs=0.1
+                )
+
+        # Clearing the whole image cuts out to its edges, which is why
+        # those slices aren't cropped to their filled pixels
+        extent = [f(getattr(p, a) for p in layers[1])
+                  for f, a in [(min, "xmin"), (max, "xmax"), (min, "ymin"), (max, "ymax")]]
+        if count == -1:
+            assert extent == pytest.approx([0, 16, 0, 12], abs=0.1)
+        else:
+            assert extent[1] < 10 and extent[3] < 10
+
+
+def test_contour_layers_keep_the_cutting_order_of_whole_slices():
+    # Two islands whose order depends on where the origin is, so cropped
+    # slices must be sorted in image coordinates.
+    height, width = 120, 200
+    y, x = np.mgrid[0:height, 0:width]
+    heightmap = Image(width, height, depth=16)
+    bumps = [65535 - ((x - cx) ** 2 + (y - cy) ** 2) * 300
+             for cx, cy in ((100, 19), (150, 107))]
+    heightmap.array[:, :, 0] = np.clip(np.maximum(*bumps), 0, 65535).astype(np.uint16)
+    heightmap.xmin, heightmap.xmax = 0, 20
+    heightmap.ymin, heightmap.ymax = 0, 12
+    heightmap.zmin, heightmap.zmax = -2, 0
+
+    paths = heightmap.contour_layers([-1], 0.4, 1, 0.5, threads=1)[0]
+    expected = heightmap.threshold(-1).distance().contour(0.4, 1, 0.5)
+    assert [p.xmin for p in paths] == pytest.approx([e.xmin for e in expected], abs=0.2)
+    assert paths[0].xmin < paths[1].xmin
+
+
+def test_finish_cut_offsets_heights_by_tool_footprint():
+    width, height = 120, 80
+    heightmap = Image(width, height, depth=16)
+    heightmap.array[40, 60, 0] = 65535
+    heightmap.xmin, heightmap.xmax = 0, 12
+    heightmap.ymin, heightmap.ymax = 0, 8
+    heightmap.zmin, heightmap.zmax = 0, 2
+
+    for tool in (0, 1):
+        paths = heightmap.finish_cut(2.0, 0.5, tool, threads=3)
+        assert [p.points.tolist() for p in paths] == [
+            p.points.tolist() for p in heightmap.finish_cut(2.0, 0.5, tool, threads=1)
+        ]
+
+        # The cut that passes over the spike lifts while the tool touches it
+        x = min(paths, key=lambda p: abs(p.points[0, 0] - 6)).points
+        lifted = x[x[:, 2] > 0]
+        assert lifted[:, 2].max() == pytest.approx(2, abs=1e-3)
+        assert lifted[:, 1].max() - lifted[:, 1].min() == pytest.approx(2, abs=0.25)
+        if tool == 0:
+            assert np.all(lifted[:, 2] == lifted[:, 2].max())
+        else:
+            assert lifted[:, 2].min() < 1.5
+
+
+def test_deproject_array_matches_per_point_deproject():
+    points = np.random.default_rng(0).uniform(-50, 50, (40, 3))
+    for alpha, beta in [(0, 0), (90, 90), (-37.5, 61)]:
+        expected = [list(Vec3f(p).deproject(alpha, beta)) for p in points]
+        assert np.array_equal(Vec3f.deproject_array(points, alpha, beta), expected)
+
+
+def test_path_split_keeps_runs_inside_mask():
+    path = Path(np.arange(24, dtype=float).reshape(8, 3))
+    pieces = path.split([True, True, False, False, True, False, True, True])
+
+    assert [p.points[:, 0].tolist() for p in pieces] == [[0, 3], [12], [18, 21]]
+    assert not any(p.closed for p in pieces)
+    assert path.split(np.zeros(8, dtype=bool)) == []
+
+
+def test_simulate_cut_replays_finish_cut_without_gouges():
+    n = 160
+    y, x = np.mgrid[0:n, 0:n] / n * 16 - 8
+    heightmap = Image(n, n, depth=16)
+    heightmap.array[:, :, 0] = np.clip(6 - np.hypot(x, y), 0, 4) / 4 * 65535
+    heightmap.xmin, heightmap.xmax = 0, 16
+    heightmap.ymin, heightmap.ymax = 0, 16
+    heightmap.zmin, heightmap.zmax = 0, 4
+
+    for tool in (0, 1):
+        paths = heightmap.finish_cut(1.6, 0.25, tool)
+        stock = heightmap.simulate_cut(paths, 1.6, tool)
+        assert stock.depth == "f"
+        assert heightmap.gouges(stock, 1e-4).array.max() == 0
+
+        # Material was removed down to the part around the cone
+        target = heightmap.array[:, :, 0] * heightmap.mm_per_bit
+        assert (stock.array[40:120, 40:120, 0] - target[40:120, 40:120]).max() < 1
+
+        # Dropping one pass into the part gouges it along that line
+        paths[len(paths) // 4].points[:, 2] -= 0.5
+        gouges = heightmap.gouges(heightmap.simulate_cut(paths, 1.6, tool), 1e-4)
+        assert gouges.array.max() == pytest.approx(0.5, abs=1e-3)
+
+        marked = heightmap.highlight(gouges.array > 0)
+        assert marked.channels == 3
+        assert np.all(marked.array[gouges.array[:, :, 0] > 0] == [255, 0, 0])
+
+
+def test_rest_paths_skip_material_removed_by_roughing():
+    n = 200
+    y, x = np.mgrid[0:n, 0:n] / n * 20 - 10
+    heights = np.where(np.hypot(x, y) < 3, 0.0, 4.95)
+    heights[(abs(x - 6) < 2) & (abs(y - 6) < 2)] = 10
+    heightmap = Image(n, n, depth=16)
+    heightmap.array[:, :, 0] = heights / 10 * 65535
+    heightmap.xmin, heightmap.xmax = 0, 20
+    heightmap.ymin, heightmap.ymax = 0, 20
+    heightmap.zmin, heightmap.zmax = 0, 10
+
+    # Roughing in 2.5 mm steps clears the 4.95 mm plateau to within 0.05 mm
+    stock = heightmap.rough_stock(1.6, 2.5)
+    target = heightmap.array * heightmap.mm_per_bit
+    assert (stock.array - target)[150:190, 10:50].max() == pytest.approx(0.05, abs=1e-3)
+
+    paths = heightmap.finish_cut(0.8, 0.5, 1)
+    rest = heightmap.rest_paths(paths, stock, 0.8, 0.1)
+    assert 0 < sum(len(p.points) for p in rest) < sum(len(p.points) for p in paths) / 4
+
+    # Finishing only the rest leaves the same material as a full finish pass
+    full = heightmap.simulate_cut(paths, 0.8, 1, stock=stock.copy())
+    partial = heightmap.simulate_cut(rest, 0.8, 1, stock=stock.copy())
+    assert np.abs(partial.array - full.array).max() <= 0.1
+
+    # A rough cut with a single offset per level leaves more material
+    outline = heightmap.rough_stock(1.6, 2.5, count=1, top=10, bottom=0)
+    assert (outline.array >= stock.array - 1e-4).all()
+    assert (outline.array > stock.array + 1).any()
+
+
+def test_gradients_match_finite_differences():
+    from koko.lib.shapes3d import cylinder, rotate_x, sphere, taper_xy_z
+
+    shape = taper_xy_z(rotate_x(cylinder(0, 0, -1, 1, 0.5), 30), 0, 0, -1, 1, 1, 0.5)
+    shape = (shape - sphere(0.3, 0, 0, 0.4)) | sphere(0, 0.8, 0.2, 0.3)
+
+    h = 1e-3
+    for p in np.random.default_rng(1).uniform(-1, 1, (20, 3)):
+        fd = [
+            (shape.gradient(*(p + d)).v - shape.gradient(*(p - d)).v) / (2 * h)
+            for d in np.eye(3) * h
+        ]
+        assert shape.gradient(*p).gradient == pytest.approx(fd, abs=2e-2)
+
+
+def test_meshes_get_exact_normals():
+    from koko.lib.shapes3d import sphere
+
+    mesh = sphere(0, 0, 0, 1).triangulate(resolution=8, mm_per_unit=2)
+    v = np.ctypeslib.as_array(mesh.vdata, (mesh.vcount, 6))
+
+    # Sphere normals point straight out from the center
+    radial = v[:, :3] / np.linalg.norm(v[:, :3], axis=1)[:, None]
+    assert np.allclose(np.linalg.norm(v[:, 3:], axis=1), 1, atol=1e-5)
+    assert np.allclose((radial * v[:, 3:]).sum(axis=1), 1, atol=1e-4)
+
+
+def test_affine_bounds_track_correlated_terms():
+    x, y = MathTree.X(), MathTree.Y()
+    shape = (x + y) - (x + y) * 0.5 - 1
+    box = [(-1, 1), (-1, 1), (0, 0)]
+
+    i = shape.interval(*box)
+    a = shape.interval(*box, affine=True)
+    assert (i.lower, i.upper) == (-4, 2)
+    assert (a.lower, a.upper) == pytest.approx((-2, 0), abs=1e-4)
+
+
+def test_affine_renders_match_with_fewer_evaluations():
+    from koko.c.region import Region
+    from koko.lib.shapes2d import rectangle, rotate, taper_x_y
+
+    shape = rotate(rectangle(-1, 1, -0.5, 0.5), 30) | circle(1, 0, 0.5)
+    shape = taper_x_y(shape, 0, -2, 2, 1, 0.5)
+    region = Region((-2, -2, 0), (2, 2, 0), 50)
+
+    counts = [{}, {}]
+    images = [
+        shape.render(region, mm_per_unit=1, affine=affine, stats=stats)
+        for affine, stats in zip((False, True), counts)
+    ]
+    assert (images[0].array == images[1].array).all()
+    assert counts[1]["intervals"] < counts[0]["intervals"]
+    assert counts[1]["points"] <= counts[0]["points"]
+
+
+def test_traced_sphere_hits_surface_with_radial_normals():
+    from koko.c.camera import Camera
+    from koko.lib.shapes3d import sphere
+
+    shape = sphere(0, 0, 0, 1)
+    shape.color = (255, 0, 0)
+    camera = Camera.view(30, 60, 2, Vec3f(0, 0, 0), 64, 48)
+    depth, normals = shape.trace(camera, 64, 48)
+
+    # Array rows run from the top of the image down
+    d = depth.array[::-1, :, 0]
+    n = normals.array[::-1]
+    j, i = np.nonzero(np.isfinite(d))
+    assert 0 < len(i) < d.size
+
+    eye = np.array(list(camera.eye))
+    rays = np.array([list(camera.corner)]) + \
+        (i[:, None] + 0.5) * list(camera.right) + \
+        (j[:, None] + 0.5) * list(camera.up)
+    hits = eye + d[j, i][:, None] * rays
+    radius = np.linalg.norm(hits, axis=1)
+    assert np.allclose(radius, 1, atol=1e-3)
+    assert np.allclose((hits / radius[:, None] * n[j, i]).sum(axis=1), 1,
+                       atol=1e-3)
+
+    shaded = Image.shade([(depth, normals)], camera).array[::-1]
+    assert (shaded[j, i, 0] > 0).all()
+    assert not shaded[~np.isfinite(d)].any()
+
+
+def test_arrays_match_unions_with_constant_tree_size():
+    from functools import reduce
+    import operator
+
+    from koko.c.region import Region
+    from koko.lib.shapes2d import array_polar, array_xy, move, rectangle, rotate
+
+    part = circle(0, 0, 0.4) + rectangle(0.5, 0.8, -0.1, 0.1)
+    cases = [
+        (array_xy(part, 4, 3, 2, -1.5),
+         [move(part, 2 * i, -1.5 * j) for i in range(4) for j in range(3)]),
+        (array_polar(move(part, 3, 1), 5, 1, 1),
+         [move(rotate(move(part, 2, 0), 72 * i), 1, 1) for i in range(5)]),
+    ]
+    for array, copies in cases:
+        union = reduce(operator.add, copies)
+        assert array.bounds[:4] == pytest.approx(union.bounds[:4], abs=0.4)
+        assert array.node_count < union.node_count
+
+        # Sample off the pixel grid's exact dot tangents
+        b = union.bounds
+        region = Region((b[0] - 0.513, b[2] - 0.517, 0),
+                        (b[1] + 0.5, b[3] + 0.5, 0), 20)
+        images = [s.render(region, mm_per_unit=1).array for s in (array, union)]
+        assert ((images[0] > 0) != (images[1] > 0)).mean() < 1e-3
+
+    big = array_xy(part, 100, 100, 2, -1.5)
+    assert big.node_count == cases[0][0].node_count
+
+
+def test_mod_and_atan2_intervals_are_tight():
+    x, y = MathTree.X(), MathTree.Y()
+
+    wrapped = MathTree.mod(x, 2)
+    assert wrapped.interval((4.5, 5), (0, 0), (0, 0)).lower == pytest.approx(0.5)
+    assert wrapped.interval((4.5, 5), (0, 0), (0, 0)).upper == pytest.approx(1)
+    assert wrapped.interval((1, 3), (0, 0), (0, 0)).lower == 0
+    assert wrapped.interval((1, 3), (0, 0), (0, 0)).upper == 2
+
+    angle = MathTree.atan2(y, x)
+    quadrant = angle.interval((1, 2), (1, 2), (0, 0))
+    assert (quadrant.lower, quadrant.upper) == pytest.approx(
+        (np.arctan2(1, 2), np.arctan2(2, 1)))
+    cut = angle.interval((-2, -1), (-1, 1), (0, 0))
+    assert (cut.lower, cut.upper) == pytest.approx((-np.pi, np.pi))
+
+
+def test_unions_skip_features_outside_their_bounds():
+    from functools import reduce
+    import operator
+
+    from koko.c.region import Region
+    from koko.lib.shapes2d import intersection, move, rectangle, rotate, union
+
+    rng = np.random.default_rng(4)
+    parts = [
+        move(rotate(rectangle(0, 0.8, -0.05, 0.05), angle), x, y)
+        for x, y, angle in zip(rng.uniform(0, 10, 200),
+                               rng.uniform(0, 10, 200),
+                               rng.uniform(0, 180, 200))
+    ]
+    chain, tree = reduce(operator.add, parts), union(parts)
+    assert tree.bounds == chain.bounds
+    assert tree.node_count == chain.node_count
+
+    region = Region((-0.513, -0.517, 0), (10.5, 10.5, 0), 20)
+    counts = [{}, {}]
+    images = [
+        s.render(region, mm_per_unit=1, stats=stats).array
+        for s, stats in zip((chain, tree), counts)
+    ]
+    assert (images[0] == images[1]).all()
+    assert counts[1]["points"] < counts[0]["points"]
+
+    # Intersections keep the overlap of every part's bounds
+    lens = intersection([circle(0, 0, 1), circle(1, 0, 1), None])
+    assert lens.bounds[:4] == [0, 1, -1, 1]
+    assert lens.interval((0.4, 0.6), (-0.1, 0.1), (0, 0)).upper < 0
+    assert union([None]) is None
+
+
+def test_affine_maps_fuse_with_exact_bounds():
+    from koko.c.region import Region
+    from koko.lib.shapes2d import move, rectangle, rotate, scale_xy
+
+    square = rectangle(-1, 1, -1, 1)
+    turned = rotate(square, 45)
+    assert turned.bounds[:4] == pytest.approx([-2**0.5, 2**0.5] * 2, rel=1e-12)
+
+    part = square + circle(1, 0, 0.5)
+    shape = move(rotate(scale_xy(part, 0.5, 0, 2), 30), 1, -2)
+    assert shape.math.count('M') == 1
+
+    # The same map, as nested substitutions
+    ca, sa = np.cos(np.pi / 6), np.sin(np.pi / 6)
+    nested = part.map('+f0.25*f0.5X', '*f0.5Y').map(
+        '+*f%gX*f%gY' % (ca, sa), '-*f%gY*f%gX' % (ca, sa)).map('-Xf1', '+Yf2')
+    assert shape.node_count < nested.node_count
+
+    # Chained maps are bounded from the unmapped shape, not the last box
+    box = rectangle(-1, 2, -0.5, 1.5)
+    assert rotate(rotate(box, 45), -45).bounds[:4] == pytest.approx([-1, 2, -0.5, 1.5])
+    assert rotate(rotate(box, 30), 60).bounds[:4] == pytest.approx(rotate(box, 90).bounds[:4])
+    widened = rotate(box, 45)
+    widened.xmin = -5
+    assert rotate(widened, -45).bounds[0] < -2
+
+    b = shape.bounds
+    region = Region((b[0], b[2], 0), (b[1], b[3], 0), 30)
+    images = [s.render(region, mm_per_unit=1).array for s in (shape, nested)]
+    assert (np.abs(images[0].astype(int) - images[1]) <= 1).all()
+
+
+def test_simplified_trees_drop_redundant_nodes():
+    from koko.c.region import Region
+
+    # max(1*(--X^2), Y^2+0, --X^2) is max(X^2, Y^2)
+    tree = MathTree('aa*f1nnqX+qYf0nnqX')
+    assert str(tree) == 'max(pow(X, 2), pow(Y, 2))'
+    assert tree.simplified == 7
+
+    # but nodes aren't replaced by bare variables, which render-time
+    # pruning couldn't replace with their bounds
+    assert str(MathTree('aa*f1nnX+Yf0nnX')) == 'max(--X, (Y+0))'
+
+    # Chains of unions are rebalanced
+    shapes = [circle(i, 0, 0.6) for i in range(8)]
+    chain = shapes[0]
+    for s in shapes[1:]:
+        chain = chain + s
+    assert str(chain).startswith('min(' * 3 + '(')
+
+    # Branches are dropped if they're dominated within the bounds,
+    # and restored if the bounds change.
+    pair = circle(0, 0, 1) + circle(5, 0, 1)
+    pair.bounds = [-1, 1, -1, 1, None, None]
+    assert pair.node_count == circle(0, 0, 1).node_count
+
+    region = Region((-1, -1, 0), (1, 1, 0), 20)
+    images = [s.render(region, mm_per_unit=1).array
+              for s in (pair, circle(0, 0, 1))]
+    assert (images[0] == images[1]).all()
+
+    # Explicit queries outside the bounds see the whole tree
+    assert pair.interval((4.5, 5.5), (-0.1, 0.1), (0, 0)).upper < 0
+    assert pair.gradient(5.5, 0, 0).v == pytest.approx(-0.5)
+
+    pair.bounds = [-1, 6, -1, 1, None, None]
+    assert pair.node_count > circle(0, 0, 1).node_count
+
+
+def test_simplified_trees_render_like_the_original(monkeypatch):
+    from pathlib import Path as FilePath
+    from koko.batch import load_script
+    from koko.c.libfab import libfab
+
+    # Simplification mustn't change how ties on the surface resolve,
+    # e.g. on the plane where bearing.ko's cutout meets its balls.
+    design = FilePath(__file__).parent.parent / 'examples' / 'bearing.ko'
+    shapes = load_script(str(design)).shapes
+    simplified = [s.clone() for s in shapes]
+    assert all(s.ptr and s.simplified for s in simplified)
+    images = [s.render(resolution=800, mm_per_unit=25.4).array
+              for s in simplified[:6]]
+
+    monkeypatch.setattr(libfab, 'simplify_tree', lambda *args: 0)
+    for s, image in zip(shapes, images):
+        assert (s.clone().render(resolution=800, mm_per_unit=25.4).array
+                == image).all()
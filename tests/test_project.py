@@ -68,6 +68,128 @@ def test_development_launcher_help():
     assert "Script-based CAD/CAM" in result.stdout
 
 
+def test_batch_export_runs_without_gui(tmp_path):
+    designs = []
+    for name, size in (("small", 1), ("large", 2)):
+        design = tmp_path / f"{name}.ko"
+        design.write_text(
+            "from koko.lib.shapes2d import circle\n"
+            f"cad.shape = circle(0, 0, {size})\n"
+        )
+        designs.append(design)
+
+    # Block wx so that any GUI import fails loudly
+    script = (
+        "import sys; sys.modules['wx'] = None; "
+        "from koko.cli import main; sys.exit(main(sys.argv[1:]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, "export", *map(str, designs),
+         "--format", "svg", "--resolution", "5", "--jobs", "2",
+         "--output-dir", str(tmp_path / "out")],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    for name in ("small", "large"):
+        assert "<svg" in (tmp_path / "out" / f"{name}.svg").read_text()
+
+    result = subprocess.run(
+        [sys.executable, "-c", script, "render", str(designs[0]),
+         "--output", str(tmp_path / "small.png")],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    with Image.open(tmp_path / "small.png") as image:
+        width, height = image.size
+        assert width == height > 0
+
+
+def test_batch_export_reports_unbounded_designs(tmp_path):
+    design = tmp_path / "halfplane.ko"
+    design.write_text(
+        "from koko.lib.shapes2d import circle\n"
+        "cad.function = circle(0, 0, 1)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, str(ROOT / "kokopelli"), "export", str(design), "-f", "stl"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert "bounded" in result.stderr
+
+
+# koko's own import time may be at most this multiple of the time taken to
+# import asyncio afterwards in the same interpreter, which slows down just
+# as much on a busy machine
+IMPORT_BUDGET = 2
+
+
+def import_profile(tmp_path, code):
+    """Runs code in a fresh interpreter under -X importtime, returning its
+    result, the set of modules imported by the time it exited, and the
+    cumulative import times (ms) of koko's own top-level imports and of
+    the asyncio baseline.
+    """
+    listing = tmp_path / "modules.txt"
+    # atexit handlers run in reverse, so asyncio is imported after the listing
+    prologue = (
+        "import atexit, sys\n"
+        "atexit.register(__import__, 'asyncio')\n"
+        f"atexit.register(lambda: open({str(listing)!r}, 'w').write('\\n'.join(sys.modules)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", prologue + code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    top = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            top[name.strip()] = int(cumulative) / 1000
+    own = sum(ms for name, ms in top.items() if name == "koko" or name.startswith("koko."))
+    return result, set(listing.read_text().splitlines()), own, top.get("asyncio")
+
+
+def test_runtime_check_stays_light(tmp_path):
+    result, modules, own, baseline = import_profile(
+        tmp_path, "import koko.cli\nsys.exit(koko.cli.main(['--check']))"
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "koko.c.libfab" in modules
+    assert not [m for m in modules if m.startswith(("koko.app", "koko.cam", "koko.lib", "koko.fab"))]
+    assert own < IMPORT_BUDGET * baseline
+
+
+def test_headless_evaluation_stays_light(tmp_path):
+    design = tmp_path / "part.ko"
+    design.write_text("from koko.lib.shapes import *\ncad.shape = circle(0, 0, 1)\n")
+    result, modules, own, baseline = import_profile(
+        tmp_path, f"from koko.batch import load_script\nload_script({str(design)!r})"
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "koko.lib.shapes" in modules
+    for module in ("wx", "numpy", "PIL", "OpenGL", "concurrent.futures", "koko.cam"):
+        assert module not in modules
+    assert own < IMPORT_BUDGET * baseline
+
+
+def test_machine_menu_names_match_machine_modules():
+    from koko.cam import machines
+
+    assert [m.NAME for m in machines.MACHINES] == [name for _, name in machines.NAMES]
+
+
 def test_notarization_tool_help():
     result = subprocess.run(
         [sys.executable, str(ROOT / "util" / "app" / "notarize_app.py"), "--help"],
@@ -0,0 +1,84 @@
+import threading
+
+from koko.scheduler import BACKGROUND, PREVIEW, REFINE, Job, Scheduler
+
+
+class Task:
+    """Stands in for a render task: runs until released or cancelled."""
+
+    def __init__(self, name, log):
+        self.name = name
+        self.event = threading.Event()
+        self.c_event = threading.Event()
+        self.release = threading.Event()
+        log.append(name)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not (self.release.is_set() or self.event.is_set()):
+            self.release.wait(0.01)
+
+
+def finish(scheduler, *jobs):
+    for j in jobs:
+        j.task.release.set()
+        j.task.thread.join()
+    scheduler.poll()
+
+
+def test_bursts_of_renders_collapse_into_the_latest():
+    started, done = [], []
+    scheduler = Scheduler(slots=1)
+
+    def render(name):
+        return scheduler.submit(Job(lambda: Task(name, started), PREVIEW,
+                                    key="render", done=done.append))
+
+    first = render("first")
+    middle = [render(n) for n in ("a", "b", "c")]
+    last = render("last")
+
+    # The running render is cancelled and only the latest request waits
+    assert first.cancelled and first.task.event.is_set()
+    assert all(j.cancelled and j.task is None for j in middle)
+    assert scheduler.coalesced == 3 and scheduler.jobs() == [last]
+    assert started == ["first"]
+
+    first.task.thread.join()
+    scheduler.poll()
+    assert started == ["first", "last"]
+
+    finish(scheduler, last)
+    assert [t.name for t in done] == ["last"] and scheduler.jobs() == []
+
+
+def test_previews_preempt_refines_and_run_before_background_work():
+    started = []
+    woken = threading.Event()
+    scheduler = Scheduler(slots=1, wake=woken.set)
+
+    def job(name, priority, key, preempt=False):
+        return Job(lambda: Task(name, started), priority, key, preempt)
+
+    export = scheduler.submit(job("export", BACKGROUND, "export"))
+    refine = scheduler.submit(job("refine", REFINE, "refine", preempt=True))
+    assert started == ["export", "refine"]
+
+    # Previews start right away, cancelling refinement but not the export
+    preview = scheduler.submit(job("preview", PREVIEW, "render"))
+    assert started == ["export", "refine", "preview"]
+    assert refine.cancelled and not export.cancelled
+    assert scheduler.preempted == 1
+
+    # Background work waits for the preview
+    cam = scheduler.submit(job("cam", BACKGROUND, "cam"))
+    finish(scheduler, export)
+    assert cam.task is None
+
+    refine.task.thread.join()
+    finish(scheduler, preview)
+    assert woken.is_set()
+    assert started[-1] == "cam"
+    finish(scheduler, cam)
+    assert scheduler.running == [] and scheduler.queue == []
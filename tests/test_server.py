@@ -0,0 +1,108 @@
+import asyncio
+import os
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image as PILImage
+
+from koko.server import LRUCache, Renderer, serve, submit
+
+
+DESIGN = """\
+from koko.lib.shapes2d import circle, rectangle
+cad.mm_per_unit = 1
+cad.shapes = [circle(0, 0, r), rectangle(-3, 3, -2, -1.5), rectangle(-3, 3, 1.5, 2)]
+"""
+
+
+def test_lru_cache_evicts_least_recently_used_entries():
+    evicted = []
+    cache = LRUCache(3, size=len, evict=evicted.append)
+
+    cache.get("a", lambda: "a")
+    cache.get("b", lambda: "bb")
+    cache.get("a", lambda: "?")
+    cache.get("c", lambda: "c")
+
+    assert evicted == ["bb"]
+    assert list(cache.entries) == ["a", "c"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_daemon_reuses_unchanged_shapes_between_parameter_variants(tmp_path):
+    script = tmp_path / "part.ko"
+    script.write_text(DESIGN)
+    path = str(tmp_path / "koko.sock")
+
+    renderer = Renderer(threads=2)
+    thread = threading.Thread(target=asyncio.run, args=(serve(path, renderer),))
+    thread.start()
+    try:
+        for _ in range(100):
+            try:
+                submit([{"command": "stats"}], path)
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        jobs = [
+            {"script": str(script), "params": {"r": r}, "resolution": 20,
+             "output": str(tmp_path / f"{i}.png")}
+            for i, r in enumerate([0.5, 0.8, 0.5])
+        ]
+        jobs.append({"script": str(script), "format": "svg", "params": {"r": 1},
+                     "output": str(tmp_path / "part.svg")})
+        jobs.append({"script": str(tmp_path / "missing.ko")})
+        results = submit(jobs + [{"command": "stats"}], path)
+    finally:
+        submit([{"command": "shutdown"}], path)
+        thread.join()
+        renderer.close()
+
+    assert all(r["ok"] for r in results[:4]), results
+    assert "missing.ko" in results[4]["error"]
+
+    # The rectangles were rendered once, and the repeated variant hit the cache
+    stats = results[-1]["stats"]
+    assert stats["tiles"] == {"entries": 4, "hits": 5, "misses": 4}
+
+    first, second, repeat = (
+        np.asarray(PILImage.open(tmp_path / f"{i}.png")) for i in range(3)
+    )
+    assert (first == repeat).all()
+    assert (first != second).any()
+    assert "<svg" in (tmp_path / "part.svg").read_text()
+
+
+def test_daemon_refuses_to_replace_live_sockets_and_other_files(tmp_path):
+    path = str(tmp_path / "koko.sock")
+    with open(path, "w") as f:
+        f.write("not a socket")
+    with pytest.raises(FileExistsError):
+        asyncio.run(serve(path, None))
+    assert open(path).read() == "not a socket"
+    os.unlink(path)
+
+    renderer = Renderer(threads=1)
+    thread = threading.Thread(target=asyncio.run, args=(serve(path, renderer),))
+    thread.start()
+    try:
+        for _ in range(100):
+            try:
+                submit([{"command": "stats"}], path)
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        with pytest.raises(RuntimeError):
+            asyncio.run(serve(path, renderer))
+        assert submit([{"command": "stats"}], path)[0]["ok"]
+    finally:
+        submit([{"command": "shutdown"}], path)
+        thread.join()
+        renderer.close()
+    assert not os.path.exists(path)
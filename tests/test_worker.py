@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import koko.fab.cache
+from koko.evaluator import ScriptEvaluator
+from koko.struct import Struct
+from koko.worker import RenderJob, RenderWorker, SharedArray
+
+
+SCRIPT = """\
+from koko.lib.shapes3d import sphere
+print("building")
+cad.shapes = [sphere(0, 0, 0, 1), sphere(2, 0, 0, 0.5)]
+cad.mm_per_unit = 1
+"""
+
+VIEW = Struct(xmin=-1, xmax=1, ymin=-1, ymax=1, zmin=-1, zmax=1,
+              pixels_per_unit=10)
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setenv("KOKO_CACHE_SIZE", "0")
+    monkeypatch.setattr(koko.fab.cache, "_default", None)
+    w = RenderWorker()
+    yield w
+    w.close()
+
+
+def job(script, mode="Both"):
+    return dict(script=script, view=VIEW, mode=mode, make_mesh=True)
+
+
+def test_results_come_back_through_shared_memory(worker):
+    result = worker.run(job(SCRIPT), threading.Event())
+    assert result["ok"] and "building" in result["output"]
+
+    local = RenderJob(VIEW, script=SCRIPT, evaluator=ScriptEvaluator())
+    assert local.evaluate({})
+    assert [s.math for s in result["cad"].shapes] == [
+        s.math for s in local.cad.shapes
+    ]
+    images = local.make_images()
+    _, meshes = local.make_shapes()
+
+    assert len(result["images"]) == 2
+    for shared, img in zip(result["images"], images):
+        assert isinstance(shared.array, SharedArray)
+        assert (shared.array == img.array).all()
+        assert (shared.xmin, shared.zmax) == (img.xmin, img.zmax)
+
+    assert len(result["meshes"]) == 2
+    for shared, mesh in zip(result["meshes"], meshes):
+        assert (shared.vcount, shared.tcount) == (mesh.vcount, mesh.tcount)
+        assert shared.X.lower == mesh.X.lower
+        assert shared.source.expr.math == mesh.source.expr.math
+
+
+def test_cancelled_jobs_return_none(worker):
+    busy = "while True: pass\n"
+    event = threading.Event()
+    threading.Timer(0.5, event.set).start()
+
+    start = time.time()
+    assert worker.run(job(busy), event) is None
+    assert time.time() - start < 0.5 + worker.grace + 1
+
+    # The next job starts a fresh process if the old one had to be killed
+    result = worker.run(job(SCRIPT, mode="2D"), threading.Event())
+    assert result["ok"] and len(result["images"]) == 2
+    assert result["meshes"] is None
+
+
+def test_script_errors_are_reported(worker):
+    result = worker.run(job(SCRIPT + "1/0\n"), threading.Event())
+    assert not result["ok"]
+    assert result["error_line"] == 4
+    assert "ZeroDivisionError" in result["output"]
+    assert result["images"] is None and result["meshes"] is None
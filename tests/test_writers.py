@@ -0,0 +1,51 @@
+from pathlib import Path as FilePath
+
+import numpy as np
+
+from koko.cam.writers import GCodeWriter, ModelaWriter, UniversalWriter, format_rows
+from koko.fab.path import Path
+
+
+def square(z=-1.0) -> Path:
+    points = np.array([[0, 0, z], [10, 0, z], [10, 10, z], [0, 10, z]], dtype=float)
+    return Path(points)
+
+
+def test_format_rows_matches_per_row_formatting():
+    rows = np.random.default_rng(0).uniform(-100, 100, (1000, 3))
+    expected = "".join("X%0.4fY%0.4fZ%0.4f\n" % tuple(r) for r in rows)
+
+    assert format_rows("X%0.4fY%0.4fZ%0.4f\n", rows, chunk=64) == expected
+    assert format_rows("%d,%d;", np.zeros((0, 2))) == ""
+
+
+def test_gcode_writer_streams_program_to_file(tmp_path: FilePath):
+    filename = tmp_path / "square.g"
+    with GCodeWriter(str(filename), feed=20, plunge=2.5, spindle=10000, jog=5) as writer:
+        writer.write([square(), square(-2)])
+
+    lines = filename.read_text().splitlines()
+    assert lines[0] == "%" and lines[-1] == "%"
+    assert lines.count("G00Z0.1969") == 1
+    assert "X0.3937Y0.3937Z-0.0787" in lines
+    assert lines.count("Z0.1969") == 2
+
+
+def test_modela_writer_uses_pen_moves_for_flat_paths(tmp_path: FilePath):
+    filename = tmp_path / "square.rml"
+    with ModelaWriter(str(filename), speed=4, jog=1, xmin=20, ymin=20) as writer:
+        writer.write([square()])
+
+    text = filename.read_text()
+    assert text.startswith("PA;PA;VS4.0;!VZ4.0!PZ-40,40;!MC1;\n")
+    assert "PU800,800;PD800,800;PD1200,800;PD1200,1200;PD800,1200;PU800,1200;" in text
+
+
+def test_universal_writer_writes_raw_bytes(tmp_path: FilePath):
+    filename = tmp_path / "square.uni"
+    with UniversalWriter(str(filename), power=25, speed=75, rate=500, xmin=0, ymin=0) as writer:
+        writer.write([square()])
+
+    data = filename.read_bytes()
+    assert data.startswith(b"\x1bZ\x1btuntitled~;IN;DF;PS0;DT~\x1bs2\x1bv\xbd\xd8")
+    assert data.endswith(b"PA0,393;\n\x1be")
@@ -22,7 +22,12 @@ a = Analysis(
         (str(ROOT / "THIRD_PARTY_NOTICES.md"), "Documentation"),
         *LIBRARY_SOURCES,
     ],
-    hiddenimports=[*collect_submodules("koko.lib"), "PIL"],
+    hiddenimports=[
+        *collect_submodules("koko.lib"),
+        # Machine and input modules are imported by name when first used
+        *collect_submodules("koko.cam"),
+        "PIL",
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
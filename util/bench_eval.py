@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compares interval and affine arithmetic when rendering the bundled examples.
+
+For each example, every shape is rendered to a height-map in both modes and
+the number of region (interval or affine) evaluations, point evaluations and
+the render time are printed, along with the evaluations that affine
+arithmetic saves.  Examples that can't be loaded headlessly (e.g. because
+their primitives need wx) are skipped.
+
+    python util/bench_eval.py [--resolution R] [FILE...]
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from koko.batch import load_script  # noqa: E402
+from koko.c.region import Region  # noqa: E402
+
+
+def bench(cad, resolution: float, affine: bool) -> tuple:
+    """Renders every shape, returning (intervals, points, seconds, images)."""
+    region = Region(
+        (cad.xmin, cad.ymin, cad.zmin or 0),
+        (cad.xmax, cad.ymax, cad.zmax or 0),
+        resolution * cad.mm_per_unit,
+    )
+    stats: dict = {}
+    start = time.perf_counter()
+    images = [
+        e.render(region, mm_per_unit=cad.mm_per_unit, affine=affine, stats=stats)
+        for e in cad.shapes
+    ]
+    return stats["intervals"], stats["points"], time.perf_counter() - start, images
+
+
+def saved(before: int, after: int) -> str:
+    return f"{100 * (before - after) / before:5.1f}%" if before else "    -"
+
+
+def main(argv: list[str]) -> int:
+    root = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="design scripts (default: examples/*.ko)")
+    parser.add_argument(
+        "--resolution", "-r", type=float, default=10, help="resolution in pixels per mm (default: 10)"
+    )
+    args = parser.parse_args(argv)
+    files = args.files or sorted(str(f) for f in (root / "examples").glob("*.ko"))
+
+    print(f"{'example':<16}{'intervals':>22}{'saved':>8}{'points':>26}{'saved':>8}{'seconds':>16}")
+    totals = [0, 0, 0, 0]
+    for filename in files:
+        name = Path(filename).stem
+        try:
+            cad = load_script(filename)
+        except Exception as exc:
+            print(f"{name:<16}skipped ({type(exc).__name__}: {exc})")
+            continue
+        if any(getattr(cad, a) is None for a in ("xmin", "xmax", "ymin", "ymax")):
+            print(f"{name:<16}skipped (unbounded)")
+            continue
+
+        ib, pb, tb, before = bench(cad, args.resolution, affine=False)
+        ia, pa, ta, after = bench(cad, args.resolution, affine=True)
+        if any((b.array != a.array).any() for b, a in zip(before, after)):
+            print(f"{name:<16}renders differ!")
+            return 1
+
+        totals = [totals[0] + ib, totals[1] + ia, totals[2] + pb, totals[3] + pa]
+        print(
+            f"{name:<16}{ib:>10} -> {ia:<10}{saved(ib, ia)}"
+            f"{pb:>12} -> {pa:<12}{saved(pb, pa)}{tb:>7.2f} -> {ta:<6.2f}"
+        )
+
+    print(
+        f"{'total':<16}{totals[0]:>10} -> {totals[1]:<10}{saved(totals[0], totals[1])}"
+        f"{totals[2]:>12} -> {totals[3]:<12}{saved(totals[2], totals[3])}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))